@@ -13,6 +13,9 @@ from fastapi.routing import APIRoute
 load_dotenv()
 
 # Import your new routers AFTER loading env variables
+from .utils.email_service import email_service
+from .services.sequence_allocator import release_leases
+from .services import image_forensics, llm_client, receipt_verification
 from .routers import clients, team, events, leave, auth as auth_router, invoices, messages, deliverables, equipment_inventory, contracts, budgets, milestones, approvals, client_dashboard, attendance, salaries, financial_client_revenue, financial_hub, ar, ap, period_close, adjustments, sequences, receipts, intake, postprod, postprod_availability, postprod_assignments, data_submissions, reviews
 
 # --- Setup & Middleware ---
@@ -42,6 +45,21 @@ async def startup_event():
         logger.info(f"Firebase Admin SDK initialized with bucket: {storage_bucket}")
     except Exception as e:
         logger.error(f"Firebase Init Error: {e}")
+    # Pick up receipt verifications left unfinished, now and periodically.
+    receipt_verification.start_recovery()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Give queued outbound email a chance to reach the provider before the process exits.
+    if not email_service.flush(timeout=10):
+        logger.warning("Email queue did not drain before shutdown")
+    # Hand unused leased document numbers back so they do not show up as gaps.
+    release_leases()
+    image_forensics.shutdown()
+    # Unfinished verifications stay QUEUED/PROCESSING in Firestore and are recovered on the next start.
+    receipt_verification.shutdown()
+    await llm_client.close()
 
 
 # --- Include Routers ---
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
 from firebase_admin import firestore
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
@@ -9,8 +9,11 @@ import io
 from decimal import Decimal, ROUND_HALF_UP
 
 from ..dependencies import get_current_user
-from ..utils.pdf_generator import PDFGenerator
+from ..utils.pdf_cache import render_invoice_pdf, render_quote_pdf
 from ..utils.email_service import email_service
+from ..services.aging_ledger import AR_LEDGER, record_transition
+from ..services import reminder_pipeline
+from ..services import sequence_allocator
 
 router = APIRouter(
     prefix="/financial",
@@ -144,31 +147,8 @@ def calculate_totals(items: List[LineItem], discount: Discount, tax_mode: str, s
 
 def generate_number(db, org_id: str, doc_type: str) -> str:
     """Generate sequential document numbers"""
-    current_year = get_ist_now().year
-    prefix = f"{doc_type}-{current_year}-"
-    
-    @firestore.transactional
-    def update_sequence(transaction, seq_ref):
-        seq_doc = transaction.get(seq_ref)
-        if seq_doc.exists:
-            current_num = seq_doc.to_dict().get('next', 1)
-        else:
-            current_num = 1
-        
-        new_num = current_num + 1
-        transaction.set(seq_ref, {
-            'orgId': org_id,
-            'type': doc_type,
-            'year': current_year,
-            'prefix': prefix,
-            'next': new_num
-        })
-        
-        return f"{prefix}{str(current_num).zfill(4)}"
-    
-    seq_ref = db.collection('organizations', org_id, 'numberSequences').document(f"{doc_type}_{current_year}")
-    transaction = db.transaction()
-    return update_sequence(transaction, seq_ref)
+    sequence_type = {"INV": "INVOICE", "QUO": "QUOTE"}.get(doc_type, doc_type)
+    return sequence_allocator.next_number(db, org_id, sequence_type, get_ist_now().year)
 
 def is_authorized_for_ar(current_user: dict) -> bool:
     """Check if user has AR access"""
@@ -507,6 +487,7 @@ async def update_invoice(
         update_data["totals"] = totals.dict()
     
     invoice_ref.update(update_data)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, **update_data})
     
     return {"status": "success"}
 
@@ -642,6 +623,10 @@ async def create_payment(
     
     # Update invoice status
     update_invoice_status(db, org_id, req.invoiceId)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {
+        **invoice_data,
+        'totals': {**invoice_data.get('totals', {}), 'amountPaid': new_amount_paid, 'amountDue': new_amount_due}
+    })
     
     return {"status": "success", "paymentId": payment_ref.id}
 
@@ -878,16 +863,12 @@ async def get_invoice_pdf(
         org_doc = db.collection('organizations').document(org_id).get()
         org_data = org_doc.to_dict() if org_doc.exists else {}
         
-        # Generate PDF
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.generate_invoice_pdf(invoice_data, client_data, org_data)
-        
-        # Return PDF response
-        pdf_buffer.seek(0)
+        # Generate PDF (cached by content, rendered off the event loop)
+        pdf_bytes = await render_invoice_pdf(invoice_data, client_data, org_data)
         filename = f"Invoice-{invoice_data.get('number', invoice_id)}.pdf"
         
         return Response(
-            content=pdf_buffer.read(),
+            content=pdf_bytes,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -928,16 +909,12 @@ async def get_quote_pdf(
         org_doc = db.collection('organizations').document(org_id).get()
         org_data = org_doc.to_dict() if org_doc.exists else {}
         
-        # Generate PDF
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.generate_quote_pdf(quote_data, client_data, org_data)
-        
-        # Return PDF response
-        pdf_buffer.seek(0)
+        # Generate PDF (cached by content, rendered off the event loop)
+        pdf_bytes = await render_quote_pdf(quote_data, client_data, org_data)
         filename = f"Quote-{quote_data.get('number', quote_id)}.pdf"
         
         return Response(
-            content=pdf_buffer.read(),
+            content=pdf_bytes,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -984,8 +961,7 @@ async def send_invoice_email(
         org_data = org_doc.to_dict() if org_doc.exists else {}
         
         # Generate PDF
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.generate_invoice_pdf(invoice_data, client_data, org_data)
+        pdf_buffer = io.BytesIO(await render_invoice_pdf(invoice_data, client_data, org_data))
         
         # Send email
         email_sent = email_service.send_invoice_email(invoice_data, client_data, pdf_buffer, org_data)
@@ -999,6 +975,7 @@ async def send_invoice_email(
                     'sentAt': now,
                     'updatedAt': now
                 })
+                record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, 'status': 'SENT'})
             
             # Log email activity
             activity_data = {
@@ -1056,8 +1033,7 @@ async def send_quote_email(
         org_data = org_doc.to_dict() if org_doc.exists else {}
         
         # Generate PDF
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.generate_quote_pdf(quote_data, client_data, org_data)
+        pdf_buffer = io.BytesIO(await render_quote_pdf(quote_data, client_data, org_data))
         
         # Send email
         email_sent = email_service.send_quote_email(quote_data, client_data, pdf_buffer, org_data)
@@ -1149,6 +1125,7 @@ async def send_payment_reminder(
             }
             
             db.collection('organizations', org_id, 'invoices', invoice_id, 'activities').add(activity_data)
+            db.collection('organizations', org_id, 'invoices').document(invoice_id).update({'lastReminderAt': now})
             
             return {"status": "success", "message": "Reminder sent successfully"}
         else:
@@ -1160,11 +1137,12 @@ async def send_payment_reminder(
 
 # --- Bulk Operations ---
 
-@router.post("/bulk/send-reminders")
+@router.post("/bulk/send-reminders", status_code=202)
 async def send_bulk_reminders(
+    background_tasks: BackgroundTasks,
     user_data: dict = Depends(get_current_user)
 ):
-    """Send automated payment reminders based on due dates"""
+    """Queue automated payment reminders based on due dates; poll the returned job for progress"""
     org_id = user_data.get('org_id')
     user_role = user_data.get('role', 'user')
     
@@ -1173,93 +1151,35 @@ async def send_bulk_reminders(
         raise HTTPException(status_code=403, detail="Not authorized for bulk operations")
     
     db = firestore.client()
-    now = get_utc_now()
-    
-    # Calculate dates for different reminder types
-    due_soon_date = now + timedelta(days=3)  # Due in 3 days
-    overdue_1_date = now - timedelta(days=1)  # 1 day overdue
-    overdue_7_date = now - timedelta(days=7)  # 7 days overdue
-    
-    reminder_counts = {
-        'due_soon': 0,
-        'overdue_1': 0,
-        'overdue_7': 0,
-        'errors': []
-    }
     
     try:
-        # Get invoices for each reminder type
-        reminder_queries = [
-            ('due_soon', db.collection('organizations', org_id, 'invoices')
-             .where('status', 'in', ['SENT', 'PARTIAL'])
-             .where('dueDate', '<=', due_soon_date.isoformat())
-             .where('dueDate', '>', now.isoformat())),
-            ('overdue_1', db.collection('organizations', org_id, 'invoices')
-             .where('status', 'in', ['SENT', 'PARTIAL', 'OVERDUE'])
-             .where('dueDate', '<=', overdue_1_date.isoformat())
-             .where('dueDate', '>', overdue_7_date.isoformat())),
-            ('overdue_7', db.collection('organizations', org_id, 'invoices')
-             .where('status', 'in', ['SENT', 'PARTIAL', 'OVERDUE'])
-             .where('dueDate', '<=', overdue_7_date.isoformat()))
-        ]
-        
-        for reminder_type, query in reminder_queries:
-            invoices = query.get()
-            
-            for invoice_doc in invoices:
-                try:
-                    invoice_data = invoice_doc.to_dict()
-                    amount_due = invoice_data.get('totals', {}).get('amountDue', 0)
-                    
-                    if amount_due <= 0:
-                        continue
-                    
-                    # Get client data
-                    client_id = invoice_data.get('clientId')
-                    client_doc = db.collection('organizations', org_id, 'clients').document(client_id).get()
-                    
-                    if not client_doc.exists:
-                        continue
-                    
-                    client_data = client_doc.to_dict()
-                    
-                    # Check if reminder already sent today
-                    activities = db.collection('organizations', org_id, 'invoices', invoice_doc.id, 'activities')\
-                        .where('type', '==', 'reminder_sent')\
-                        .where('timestamp', '>=', now.replace(hour=0, minute=0, second=0, microsecond=0))\
-                        .get()
-                    
-                    if len(activities) > 0:
-                        continue  # Already sent reminder today
-                    
-                    # Get organization data
-                    org_doc = db.collection('organizations').document(org_id).get()
-                    org_data = org_doc.to_dict() if org_doc.exists else {}
-                    
-                    # Send reminder
-                    email_sent = email_service.send_payment_reminder(invoice_data, client_data, reminder_type, org_data)
-                    
-                    if email_sent:
-                        # Log activity
-                        activity_data = {
-                            'id': str(uuid4()),
-                            'type': 'reminder_sent',
-                            'description': f"Automated payment reminder ({reminder_type}) sent",
-                            'timestamp': now,
-                            'userId': user_data.get('uid'),
-                            'userName': 'System (Automated)'
-                        }
-                        
-                        db.collection('organizations', org_id, 'invoices', invoice_doc.id, 'activities').add(activity_data)
-                        reminder_counts[reminder_type] += 1
-                    
-                except Exception as e:
-                    reminder_counts['errors'].append(f"Invoice {invoice_doc.id}: {str(e)}")
-        
-        return {"status": "success", "reminderCounts": reminder_counts}
-        
+        job_id = reminder_pipeline.create_reminder_job(db, org_id, user_data)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error sending bulk reminders: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error queueing bulk reminders: {str(e)}")
+    
+    background_tasks.add_task(reminder_pipeline.run_reminder_job, db, org_id, job_id, user_data)
+    
+    return {"status": "queued", "jobId": job_id}
+
+
+@router.get("/bulk/reminder-jobs/{job_id}")
+async def get_bulk_reminder_job(
+    job_id: str,
+    user_data: dict = Depends(get_current_user)
+):
+    """Progress and results of a bulk reminder job"""
+    org_id = user_data.get('org_id')
+    user_role = user_data.get('role', 'user')
+    
+    if user_role not in ['admin', 'accountant']:
+        raise HTTPException(status_code=403, detail="Not authorized for bulk operations")
+    
+    db = firestore.client()
+    job = reminder_pipeline.get_reminder_job(db, org_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Reminder job not found")
+    
+    return job
 
 @router.post("/quotes/{quote_id}/convert")
 async def convert_quote_to_invoice(
@@ -8,6 +8,9 @@ import logging
 from decimal import Decimal, ROUND_HALF_UP
 
 from ..dependencies import get_current_user
+from ..services.aging_ledger import AP_LEDGER, AP_OPEN_STATUSES, record_transition
+from ..services import sequence_allocator
+from ..utils.exports import export_response, paginate, project_rows
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -166,43 +169,7 @@ def generate_bill_number(db, org_id: str, year: int = None) -> str:
     """Generate a unique bill number in the format BILL-YYYY-####"""
     if year is None:
         year = datetime.now().year
-    
-    # Get and update the org's bill number sequence
-    seq_ref = db.collection('organizations', org_id, 'numberSequences').document('BILL')
-    
-    @firestore.transactional
-    def update_sequence(transaction, seq_ref):
-        try:
-            seq_doc = transaction.get(seq_ref)
-            if seq_doc.exists:
-                seq_data = seq_doc.to_dict()
-            else:
-                seq_data = {}
-            
-            # Initialize or get current year sequence
-            year_key = str(year)
-            if year_key not in seq_data:
-                seq_data[year_key] = 0
-            
-            # Increment the sequence
-            current_seq = seq_data[year_key] + 1
-            seq_data[year_key] = current_seq
-            
-            # Update the document
-            transaction.set(seq_ref, seq_data)
-            
-            return current_seq
-        except Exception as e:
-            logger.error(f"Error in bill number generation: {str(e)}")
-            # If there's an error, return a random sequence number as fallback
-            return int(datetime.now(timezone.utc).timestamp() % 10000)
-    
-    transaction = db.transaction()
-    current_seq = update_sequence(transaction, seq_ref)
-    
-    # Format the sequence number with leading zeros
-    seq_formatted = str(current_seq).zfill(4)
-    return f"BILL-{year}-{seq_formatted}"
+    return sequence_allocator.next_number(db, org_id, "BILL", year)
 
 def is_authorized_for_ap(current_user: dict) -> bool:
     """Check if the user is authorized for AP operations (admin or accountant)"""
@@ -581,6 +548,7 @@ async def update_bill(
         update_data["totals"] = totals
     
     bill_ref.update(update_data)
+    record_transition(db, org_id, AP_LEDGER, current_bill, {**current_bill, **update_data})
     
     return {"status": "success"}
 
@@ -637,6 +605,7 @@ async def update_bill_status(
         "updatedAt": datetime.now(timezone.utc).isoformat(),
         "updatedBy": current_user.get("uid")
     })
+    record_transition(db, org_id, AP_LEDGER, current_bill, {**current_bill, "status": new_status})
     
     return {"status": "success"}
 
@@ -726,6 +695,7 @@ async def record_bill_payment(
         "updatedAt": datetime.now(timezone.utc).isoformat(),
         "updatedBy": current_user.get("uid")
     })
+    record_transition(db, org_id, AP_LEDGER, bill_data, {**bill_data, "totals": updated_totals, "status": new_status})
     
     return {
         "status": "success", 
@@ -1127,48 +1097,52 @@ async def run_subscription_now(
 
 @router.get("/bills/export")
 async def export_bills(
-    format: str = Query("csv", enum=["csv"]),
+    format: str = Query("csv", enum=["csv", "xlsx"]),
     status: Optional[str] = None,
     vendor_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Export bills to CSV"""
+    """Stream bills as CSV or XLSX, paging through an issueDate-ordered query"""
     org_id = current_user.get("orgId")
     if not is_authorized_for_ap(current_user):
         raise HTTPException(status_code=403, detail="Not authorized for AP operations")
     
-    # This would return CSV data - implementation depends on your CSV library preference
-    # For now, return structured data that can be converted to CSV on frontend
+    db = firestore.client()
+    query = db.collection('organizations', org_id, 'bills')
+    if status:
+        query = query.where("status", "==", status)
+    if vendor_id:
+        query = query.where("vendorId", "==", vendor_id)
+    if start_date:
+        query = query.where("issueDate", ">=", start_date)
+    if end_date:
+        query = query.where("issueDate", "<=", end_date)
+    query = query.order_by("issueDate", direction=firestore.Query.DESCENDING)
     
-    # Get bills with same filtering as list_bills
-    bills = await list_bills(status, vendor_id, None, start_date, end_date, current_user)
+    header = ["Bill Number", "Vendor ID", "Issue Date", "Due Date", "Status", "Currency", "Subtotal",
+              "Tax Total", "Grand Total", "Amount Paid", "Amount Due", "Notes"]
     
-    # Prepare export data
-    export_data = []
-    for bill in bills:
+    def to_row(doc_id, bill):
         totals = bill.get("totals", {})
-        export_data.append({
-            "Bill Number": bill.get("number"),
-            "Vendor ID": bill.get("vendorId"),
-            "Issue Date": bill.get("issueDate"),
-            "Due Date": bill.get("dueDate"),
-            "Status": bill.get("status"),
-            "Currency": bill.get("currency"),
-            "Subtotal": totals.get("subTotal", 0),
-            "Tax Total": totals.get("taxTotal", 0),
-            "Grand Total": totals.get("grandTotal", 0),
-            "Amount Paid": totals.get("amountPaid", 0),
-            "Amount Due": totals.get("amountDue", 0),
-            "Notes": bill.get("notes", ""),
-        })
-    
-    return {
-        "format": format,
-        "data": export_data,
-        "filename": f"bills_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    }
+        return [
+            bill.get("number"),
+            bill.get("vendorId"),
+            bill.get("issueDate"),
+            bill.get("dueDate"),
+            compute_bill_status(bill),
+            bill.get("currency"),
+            totals.get("subTotal", 0),
+            totals.get("taxTotal", 0),
+            totals.get("grandTotal", 0),
+            totals.get("amountPaid", 0),
+            totals.get("amountDue", 0),
+            bill.get("notes", ""),
+        ]
+    
+    stem = f"bills_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return export_response(stem, header, project_rows(paginate(query), to_row), format, "Bills")
 
 @router.get("/aging-report")
 async def get_aging_report(
@@ -1186,7 +1160,10 @@ async def get_aging_report(
     as_of_dt = datetime.fromisoformat(as_of_date.replace('Z', ''))
     
     db = firestore.client()
-    bills_query = db.collection('organizations', org_id, 'bills').get()
+    # Itemized rows only need open bills; totals are summed from the same rows so they always agree
+    bills_query = db.collection('organizations', org_id, 'bills').where(
+        "status", "in", AP_OPEN_STATUSES
+    ).get()
     
     aging_buckets = {"0-15": [], "16-30": [], "31-60": [], "61-90": [], "90+": []}
     bucket_totals = {"0-15": 0, "16-30": 0, "31-60": 0, "61-90": 0, "90+": 0}
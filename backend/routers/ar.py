@@ -11,7 +11,7 @@ from uuid import uuid4
 import io
 
 from ..dependencies import get_current_user
-from ..utils.pdf_generator import PDFGenerator
+from ..utils.pdf_cache import render_invoice_pdf, render_quote_pdf
 from ..utils.email_service import email_service
 
 router = APIRouter(
@@ -193,13 +193,12 @@ async def get_client_invoice_pdf(
     org_data = org_doc.to_dict() if org_doc.exists else {}
     
     try:
-        # Generate PDF
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.generate_invoice_pdf(invoice_data, client_data, org_data)
+        # Generate PDF (cached by content, rendered off the event loop)
+        pdf_bytes = await render_invoice_pdf(invoice_data, client_data, org_data)
         
         # Return PDF
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf_bytes,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename=Invoice-{invoice_data.get('number', invoice_id)}.pdf"}
         )
@@ -376,13 +375,12 @@ async def get_client_quote_pdf(
     org_data = org_doc.to_dict() if org_doc.exists else {}
     
     try:
-        # Generate PDF
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.generate_quote_pdf(quote_data, client_data, org_data)
+        # Generate PDF (cached by content, rendered off the event loop)
+        pdf_bytes = await render_quote_pdf(quote_data, client_data, org_data)
         
         # Return PDF
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf_bytes,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename=Quote-{quote_data.get('number', quote_id)}.pdf"}
         )
@@ -560,13 +558,12 @@ async def get_invoice_pdf_admin(
         org_data = org_doc.to_dict() if org_doc.exists else {}
         
         try:
-            # Generate PDF
-            pdf_generator = PDFGenerator()
-            pdf_buffer = pdf_generator.generate_invoice_pdf(invoice_data, client_data, org_data)
+            # Generate PDF (cached by content, rendered off the event loop)
+            pdf_bytes = await render_invoice_pdf(invoice_data, client_data, org_data)
             
             # Return PDF
             return Response(
-                content=pdf_buffer.getvalue(),
+                content=pdf_bytes,
                 media_type="application/pdf",
                 headers={"Content-Disposition": f"attachment; filename=Invoice-{invoice_data.get('number', invoice_id)}.pdf"}
             )
@@ -677,13 +674,12 @@ async def get_quote_pdf_admin(
         org_data = org_doc.to_dict() if org_doc.exists else {}
         
         try:
-            # Generate PDF
-            pdf_generator = PDFGenerator()
-            pdf_buffer = pdf_generator.generate_quote_pdf(quote_data, client_data, org_data)
+            # Generate PDF (cached by content, rendered off the event loop)
+            pdf_bytes = await render_quote_pdf(quote_data, client_data, org_data)
             
             # Return PDF
             return Response(
-                content=pdf_buffer.getvalue(),
+                content=pdf_bytes,
                 media_type="application/pdf",
                 headers={"Content-Disposition": f"attachment; filename=Quote-{quote_data.get('number', quote_id)}.pdf"}
             )
@@ -9,8 +9,10 @@ import io
 from decimal import Decimal, ROUND_HALF_UP
 
 from ..dependencies import get_current_user
-from ..utils.pdf_generator import PDFGenerator
+from ..utils.pdf_cache import render_invoice_pdf
 from ..utils.email_service import email_service
+from ..services.aging_ledger import AR_LEDGER, AR_OPEN_STATUSES, record_transition
+from ..services import sequence_allocator
 
 router = APIRouter(
     prefix="/financial",
@@ -131,30 +133,7 @@ def calculate_totals(items: List[LineItem], discount: Discount, tax_mode: str, s
 
 def generate_invoice_number(db, org_id: str, invoice_type: str) -> str:
     """Generate sequential invoice numbers per org/year"""
-    current_year = get_ist_now().year
-    
-    @firestore.transactional
-    def update_sequence(transaction, seq_ref):
-        seq_doc = transaction.get(seq_ref)
-        if seq_doc.exists:
-            current_num = seq_doc.to_dict().get('next', 1)
-        else:
-            current_num = 1
-        
-        new_num = current_num + 1
-        transaction.set(seq_ref, {
-            'orgId': org_id,
-            'type': invoice_type,
-            'year': current_year,
-            'next': new_num,
-            'updatedAt': get_utc_now()
-        })
-        
-        return f"INV-{current_year}-{str(current_num).zfill(4)}"
-    
-    seq_ref = db.collection('organizations', org_id, 'sequences').document(f"invoice_{current_year}")
-    transaction = db.transaction()
-    return update_sequence(transaction, seq_ref)
+    return sequence_allocator.next_number(db, org_id, "INVOICE", get_ist_now().year)
 
 def is_authorized_for_financial_hub(current_user: dict) -> bool:
     """Check if user has Financial Hub access"""
@@ -508,6 +487,7 @@ async def update_invoice(
         update_data["totals"] = totals.dict()
     
     invoice_ref.update(update_data)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, **update_data})
     
     return {"status": "success"}
 
@@ -553,6 +533,7 @@ async def send_invoice(
     }
     
     invoice_ref.update(update_data)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, **update_data})
     
     return {"status": "success", "number": number}
 
@@ -715,6 +696,7 @@ async def cancel_invoice(
         "cancelledBy": current_user.get("uid"),
         "updatedAt": get_utc_now()
     })
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, "status": "CANCELLED"})
     
     return {"status": "success"}
 
@@ -790,6 +772,10 @@ async def record_payment(
     
     # Update invoice status
     update_invoice_status(db, org_id, invoice_id)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {
+        **invoice_data,
+        'totals': {**invoice_data.get('totals', {}), 'amountPaid': new_amount_paid, 'amountDue': new_amount_due}
+    })
     
     return {"status": "success", "paymentId": payment_ref.id}
 
@@ -1037,19 +1023,13 @@ async def get_aging_report(
     
     db = firestore.client()
     
-    # Get all FINAL invoices and filter unpaid/partially paid ones in memory
-    all_invoices = db.collection('organizations', org_id, 'invoices').where(
+    # Only open FINAL invoices are read; bucket totals live in the aging aggregate
+    invoices_query = db.collection('organizations', org_id, 'invoices').where(
         'type', '==', 'FINAL'
+    ).where(
+        'status', 'in', AR_OPEN_STATUSES
     ).get()
     
-    # Filter by status in memory to avoid composite index
-    invoices_query = []
-    for doc in all_invoices:
-        data = doc.to_dict()
-        status = data.get('status')
-        if status in ['SENT', 'PARTIAL', 'OVERDUE']:
-            invoices_query.append(doc)
-    
     aging_details = []
     now = get_utc_now()
     
@@ -1168,18 +1148,16 @@ async def generate_invoice_pdf(
         org_doc = db.collection('organizations').document(org_id).get()
         org_data = org_doc.to_dict() if org_doc.exists else {}
         
-        # Generate PDF
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.generate_invoice_pdf(invoice_data, client_data, org_data)
+        # Generate PDF (cached by content, rendered off the event loop)
+        pdf_bytes = await render_invoice_pdf(invoice_data, client_data, org_data)
         
         # Return PDF response
-        pdf_buffer.seek(0)
         invoice_type = invoice_data.get('type', 'Invoice')
         number = invoice_data.get('number', invoice_id)
         filename = f"{invoice_type}-{number}.pdf"
         
         return Response(
-            content=pdf_buffer.read(),
+            content=pdf_bytes,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
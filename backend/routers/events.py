@@ -1,15 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from firebase_admin import auth, firestore
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import datetime
-import requests
 import os
 import json
 import re
 import traceback
 
 from ..dependencies import get_current_user
+from ..services import llm_client, team_suggestions
 
 router = APIRouter(
     prefix="/events",
@@ -67,28 +67,14 @@ class TaskUpdateRequest(BaseModel):
     completionPercentage: Optional[int] = None
 
 # --- OpenRouter Client Helper ---
-def get_openrouter_suggestion(prompt_text):
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "google/gemma-3-4b-it:free",  # Changed model here
-        "messages": [{"role": "user", "content": prompt_text}]
-    }
-    print("OpenRouter request payload:", data)
-    response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
-    try:
-        response.raise_for_status()
-    except Exception as e:
-        print("OpenRouter API error:", response.text)
-        print("Status code:", response.status_code)
-        raise
-    
-    response_data = response.json()
-    print("OpenRouter response:", response_data)
-    content = response_data["choices"][0]["message"]["content"]
+async def get_openrouter_suggestion(prompt_text, deadline=None):
+    response = await llm_client.chat(
+        [{"role": "user", "content": prompt_text}],
+        model="google/gemma-3-4b-it:free",
+        deadline=deadline,
+        purpose="events.suggest_team",
+    )
+    content = response.content
     
     # Clean up the content - handle various code block formats
     # Remove markdown code blocks if present
@@ -221,7 +207,7 @@ def generate_rule_based_suggestion(event_data, available_team):
     else:
         reasoning_parts.append("No exact skill matches found, selected based on availability and workload")
     
-    reasoning_parts.append(f"Rule-based suggestion (AI service unavailable)")
+    reasoning_parts.append(f"Rule-based suggestion (AI service unavailable or too slow)")
     
     return {
         "reasoning": ". ".join(reasoning_parts),
@@ -408,9 +394,10 @@ async def suggest_team(event_id: str, client_id: str, current_user: dict = Depen
                 }
             }
 
-        # Try AI suggestion if API key is available, otherwise use rule-based suggestion
+        # The rule-based suggestion is ready at once; the AI gets a short deadline to beat it
+        rules_response = generate_rule_based_suggestion(event_data, available_team)
         api_key = os.getenv("OPENROUTER_API_KEY")
-        ai_response = None
+        ai_call = None
         
         if api_key:
             try:
@@ -460,36 +447,24 @@ IMPORTANT:
 - If no team members match the requirements, explain why in reasoning and provide empty suggestions array"""
 
                 print(f"[suggest-team] Calling AI with {len(available_team)} available members")
-                ai_response = get_openrouter_suggestion(prompt_text)
-                print(f"[suggest-team] AI response received: {ai_response}")
+                ai_call = get_openrouter_suggestion(prompt_text, deadline=team_suggestions.ai_budget_seconds())
             except Exception as ai_error:
                 print(f"[suggest-team] AI service failed: {str(ai_error)}")
                 print(f"[suggest-team] Falling back to rule-based suggestion")
-                ai_response = None
-        
-        # If AI failed or no API key, use rule-based suggestion
-        if not ai_response:
-            ai_response = generate_rule_based_suggestion(event_data, available_team)
-        
-        # Validate that suggested userIds exist in available team
-        if ai_response.get('suggestions'):
-            available_user_ids = {member['userId'] for member in available_team}
-            valid_suggestions = []
-            for suggestion in ai_response['suggestions']:
-                if suggestion.get('userId') in available_user_ids:
-                    # Ensure we include the skills from our team data
-                    team_member = next((m for m in available_team if m['userId'] == suggestion['userId']), None)
-                    if team_member:
-                        suggestion['skills'] = team_member['skills']
-                    valid_suggestions.append(suggestion)
-            ai_response['suggestions'] = valid_suggestions
-            
-            # If no valid suggestions after filtering, provide a helpful message
-            if not valid_suggestions:
-                ai_response['reasoning'] = "AI suggested team members, but they are no longer available. Please use manual assignment or try again."
+                ai_call = None
+        
+        # AI answer if it arrives within the deadline, otherwise rules (with an upgrade to poll for)
+        ai_response, source, upgrade_id = await team_suggestions.race(
+            db, org_id, event_id, rules_response, ai_call, available_team
+        )
         
-        print(f"[suggest-team] Returning {len(ai_response.get('suggestions', []))} suggestions")
-        return {"ai_suggestions": ai_response}
+        print(f"[suggest-team] Returning {len(ai_response.get('suggestions', []))} {source} suggestions")
+        return {
+            "ai_suggestions": ai_response,
+            "source": source,
+            "upgradeId": upgrade_id,
+            "upgradeUrl": f"/api/events/{event_id}/suggest-team/upgrades/{upgrade_id}" if upgrade_id else None,
+        }
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
@@ -499,6 +474,26 @@ IMPORTANT:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Failed to get AI suggestion: {str(e)}")
 
+@router.get("/{event_id}/suggest-team/upgrades/{upgrade_id}")
+async def get_suggest_team_upgrade(
+    event_id: str,
+    upgrade_id: str,
+    wait: float = Query(0, ge=0, le=25, description="Long-poll: seconds to wait while the AI is still running"),
+    current_user: dict = Depends(get_current_user),
+):
+    """AI suggestion that missed the suggest-team deadline: PENDING, READY (with ai_suggestions) or FAILED."""
+    if current_user.get("role") != "admin": raise HTTPException(status_code=403, detail="Forbidden")
+    db = firestore.client()
+    upgrade = await team_suggestions.wait_for_upgrade(db, current_user.get("orgId"), upgrade_id, wait)
+    if not upgrade or upgrade.get("eventId") != event_id:
+        raise HTTPException(status_code=404, detail="Suggestion upgrade not found")
+    return {
+        "status": upgrade.get("status"),
+        "ai_suggestions": upgrade.get("ai_suggestions"),
+        "source": "ai" if upgrade.get("status") == team_suggestions.READY else None,
+        "error": upgrade.get("error"),
+    }
+
 @router.put("/{event_id}/status")
 async def update_event_status(event_id: str, client_id: str, req: EventStatusRequest, current_user: dict = Depends(get_current_user)):
     org_id = current_user.get("orgId")
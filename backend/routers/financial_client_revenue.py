@@ -10,8 +10,11 @@ import math
 from decimal import Decimal, ROUND_HALF_UP
 
 from ..dependencies import get_current_user
-from ..utils.pdf_generator import PDFGenerator
+from ..utils.pdf_cache import render_invoice_pdf
+from ..utils.exports import export_response, paginate, project_rows
 from ..utils.email_service import email_service
+from ..services.aging_ledger import AR_LEDGER, AR_OPEN_STATUSES, record_transition
+from ..services import sequence_allocator
 
 router = APIRouter(
     prefix="/financial-hub",
@@ -141,51 +144,7 @@ def calculate_totals(items: List[LineItem], discount: Discount, tax_mode: str, s
 
 def generate_invoice_number(db, org_id: str, invoice_type: str) -> str:
     """Generate sequential invoice numbers per org/year"""
-    try:
-        print(f"DEBUG: Generating invoice number for org: {org_id}, type: {invoice_type}")
-        current_year = get_ist_now().year
-        print(f"DEBUG: Current year: {current_year}")
-        
-        @firestore.transactional
-        def update_sequence(transaction, seq_ref):
-            print(f"DEBUG: Getting sequence document: {seq_ref.path}")
-            seq_doc = seq_ref.get(transaction=transaction)
-            if seq_doc.exists:
-                current_num = seq_doc.to_dict().get('next', 1)
-                print(f"DEBUG: Existing sequence number: {current_num}")
-            else:
-                current_num = 1
-                print("DEBUG: Creating new sequence, starting at 1")
-            
-            new_num = current_num + 1
-            print(f"DEBUG: Setting next sequence number to: {new_num}")
-            
-            transaction.set(seq_ref, {
-                'orgId': org_id,
-                'type': invoice_type,
-                'year': current_year,
-                'next': new_num,
-                'updatedAt': get_utc_now()
-            })
-            
-            invoice_number = f"INV-{current_year}-{str(current_num).zfill(4)}"
-            print(f"DEBUG: Generated invoice number: {invoice_number}")
-            return invoice_number
-        
-        seq_ref = db.collection('organizations', org_id, 'sequences').document(f"invoice_{current_year}")
-        print(f"DEBUG: Sequence reference path: {seq_ref.path}")
-        
-        transaction = db.transaction()
-        result = update_sequence(transaction, seq_ref)
-        print(f"DEBUG: Transaction completed, returning: {result}")
-        return result
-        
-    except Exception as e:
-        print(f"DEBUG: Error in generate_invoice_number: {str(e)}")
-        print(f"DEBUG: Error type: {type(e)}")
-        import traceback
-        print(f"DEBUG: Traceback: {traceback.format_exc()}")
-        raise
+    return sequence_allocator.next_number(db, org_id, "INVOICE", get_ist_now().year)
 
 def is_authorized_for_financial_hub(current_user: dict) -> bool:
     """Check if user has Financial Hub access"""
@@ -640,6 +599,7 @@ async def send_invoice(
             'sentAt': get_utc_now(),
             'updatedAt': get_utc_now()
         })
+        record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, 'status': 'SENT'})
         
         # TODO: Send email notification to client
         # email_service.send_invoice_email(invoice_data, invoice_number)
@@ -736,6 +696,7 @@ async def cancel_invoice(
         'cancelledBy': current_user.get("uid"),
         'updatedAt': get_utc_now()
     })
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, 'status': 'CANCELLED'})
     
     return {"status": "success"}
 
@@ -811,6 +772,10 @@ async def record_payment(
     
     # Update invoice status
     update_invoice_status(db, org_id, invoice_id)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {
+        **invoice_data,
+        'totals': {**invoice_data.get('totals', {}), 'amountPaid': new_amount_paid, 'amountDue': new_amount_due}
+    })
     
     return {"status": "success", "paymentId": payment_ref.id}
 
@@ -1286,44 +1251,43 @@ async def mark_overdue_invoices(
 async def export_invoices_csv(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    format: str = Query("csv", enum=["csv", "xlsx"]),
     current_user: dict = Depends(get_current_user)
 ):
-    """Export invoices as CSV data"""
+    """Stream invoices issued in [start_date, end_date] as CSV or XLSX"""
     org_id = current_user.get("orgId")
     if not is_authorized_for_financial_hub(current_user):
         raise HTTPException(status_code=403, detail="Not authorized for Financial Hub")
     
     db = firestore.client()
     query = db.collection('organizations', org_id, 'invoices')
+    if start_date:
+        query = query.where('issueDate', '>=', start_date)
+    if end_date:
+        query = query.where('issueDate', '<=', end_date)
+    query = query.order_by('issueDate')
     
-    invoices = []
-    for doc in query.get():
-        invoice_data = doc.to_dict()
-        
-        # Filter by date if provided
-        if start_date or end_date:
-            issue_date = invoice_data.get('issueDate')
-            if issue_date:
-                if start_date and issue_date < start_date:
-                    continue
-                if end_date and issue_date > end_date:
-                    continue
-        
-        invoices.append({
-            "id": doc.id,
-            "number": invoice_data.get('number', ''),
-            "type": invoice_data.get('type'),
-            "clientId": invoice_data.get('clientId'),
-            "issueDate": invoice_data.get('issueDate'),
-            "dueDate": invoice_data.get('dueDate'),
-            "status": invoice_data.get('status'),
-            "grandTotal": invoice_data.get('totals', {}).get('grandTotal', 0),
-            "amountPaid": invoice_data.get('totals', {}).get('amountPaid', 0),
-            "amountDue": invoice_data.get('totals', {}).get('amountDue', 0),
-            "currency": invoice_data.get('currency', 'INR')
-        })
+    header = ["id", "number", "type", "clientId", "issueDate", "dueDate", "status",
+              "grandTotal", "amountPaid", "amountDue", "currency"]
     
-    return invoices
+    def to_row(doc_id, invoice_data):
+        totals = invoice_data.get('totals', {})
+        return [
+            doc_id,
+            invoice_data.get('number', ''),
+            invoice_data.get('type'),
+            invoice_data.get('clientId'),
+            invoice_data.get('issueDate'),
+            invoice_data.get('dueDate'),
+            invoice_data.get('status'),
+            totals.get('grandTotal', 0),
+            totals.get('amountPaid', 0),
+            totals.get('amountDue', 0),
+            invoice_data.get('currency', 'INR'),
+        ]
+    
+    stem = f"invoices_{start_date or 'all'}_{end_date or 'now'}"
+    return export_response(stem, header, project_rows(paginate(query), to_row), format, "Invoices")
 
 @router.get("/reports/aging")
 async def get_aging_report(
@@ -1337,9 +1301,11 @@ async def get_aging_report(
     db = firestore.client()
     now_utc = get_utc_now()
     
-    # Get all FINAL invoices with amounts due
+    # Only open FINAL invoices are read; bucket totals live in the aging aggregate
     invoices_query = db.collection('organizations', org_id, 'invoices').where(
         'type', '==', 'FINAL'
+    ).where(
+        'status', 'in', AR_OPEN_STATUSES
     ).get()
     
     aging_details = []
@@ -1348,7 +1314,7 @@ async def get_aging_report(
         invoice_data = doc.to_dict()
         amount_due = invoice_data.get('totals', {}).get('amountDue', 0)
         
-        if amount_due > 0 and invoice_data.get('status') in ['SENT', 'PARTIAL', 'OVERDUE']:
+        if amount_due > 0:
             due_date = invoice_data.get('dueDate')
             if due_date:
                 due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
@@ -1410,8 +1376,13 @@ async def get_invoice_pdf(
     
     # Generate PDF
     try:
-        pdf_generator = PDFGenerator()
-        pdf_data = pdf_generator.generate_invoice_pdf(invoice_data)
+        client_id = invoice_data.get('clientId')
+        client_doc = db.collection('organizations', org_id, 'clients').document(client_id).get() if client_id else None
+        client_data = client_doc.to_dict() if client_doc and client_doc.exists else {}
+        org_doc = db.collection('organizations').document(org_id).get()
+        org_data = org_doc.to_dict() if org_doc.exists else {}
+        
+        pdf_data = await render_invoice_pdf(invoice_data, client_data, org_data)
         
         return Response(
             content=pdf_data,
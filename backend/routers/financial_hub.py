@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from firebase_admin import firestore
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
@@ -10,8 +11,18 @@ import re
 import urllib.parse
 
 from ..dependencies import get_current_user
-from ..utils.pdf_generator import PDFGenerator
+from ..utils.pdf_cache import render_invoice_pdf
 from ..utils.email_service import email_service
+from ..services import invoice_pdf_export
+from ..services import sequence_allocator
+from ..services.aging_ledger import (
+    AR_LEDGER,
+    AP_LEDGER,
+    get_aging_snapshot,
+    rebuild_ledger,
+    record_transition,
+    top_parties,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -163,30 +174,7 @@ def calculate_totals(items: List[LineItem], discount: Discount, tax_mode: str, s
 
 def generate_invoice_number(db, org_id: str, invoice_type: str) -> str:
     """Generate sequential invoice numbers"""
-    current_year = get_ist_now().year
-    prefix = f"INV-{current_year}-"
-    
-    @firestore.transactional
-    def update_sequence(transaction, seq_ref):
-        seq_doc = transaction.get(seq_ref)
-        if seq_doc.exists:
-            current_num = seq_doc.to_dict().get('next', 1)
-        else:
-            current_num = 1
-        
-        new_num = current_num + 1
-        transaction.set(seq_ref, {
-            'orgId': org_id,
-            'year': current_year,
-            'prefix': prefix,
-            'next': new_num
-        })
-        
-        return f"{prefix}{str(current_num).zfill(4)}"
-    
-    seq_ref = db.collection('organizations', org_id, 'numberSequences').document(f"INV_{current_year}")
-    transaction = db.transaction()
-    return update_sequence(transaction, seq_ref)
+    return sequence_allocator.next_number(db, org_id, "INVOICE", get_ist_now().year)
 
 def is_authorized_for_financial_hub(current_user: dict) -> bool:
     """Check if user has Financial Hub access"""
@@ -258,6 +246,17 @@ def update_invoice_status(db, org_id: str, invoice_id: str):
             'updatedAt': get_utc_now()
         })
 
+def overview_aging_buckets(snapshot: dict) -> Dict[str, float]:
+    """Rename aging snapshot buckets to the keys used by the master overview"""
+    buckets = snapshot.get("buckets", {})
+    return {
+        "0_15": buckets.get("0-15", 0),
+        "16_30": buckets.get("16-30", 0),
+        "31_60": buckets.get("31-60", 0),
+        "61_90": buckets.get("61-90", 0),
+        "90_plus": buckets.get("90+", 0)
+    }
+
 # --- Master Dashboard Overview ---
 @router.get("/reports/overview")
 async def get_master_financial_overview(
@@ -448,57 +447,21 @@ async def get_master_financial_overview(
     net_cash_flow = cash_in - cash_out
     
     # === AR OUTSTANDING ===
+    # Served from the incremental aging aggregates (one read each) instead of
+    # scanning every open invoice and bill.
     try:
-        ar_invoices = db.collection('organizations', org_id, 'invoices').where(
-            'type', '==', 'FINAL'
-        ).where(
-            'status', 'in', ['SENT', 'PARTIAL', 'OVERDUE']
-        ).get()
-        
-        ar_outstanding = sum(doc.to_dict().get('totals', {}).get('amountDue', 0) for doc in ar_invoices)
-        ar_aging = {"0_15": 0, "16_30": 0, "31_60": 0, "61_90": 0, "90_plus": 0}
-        
-        # Top clients by outstanding
-        client_outstanding = {}
-        for invoice_doc in ar_invoices:
-            invoice_data = invoice_doc.to_dict()
-            client_id_key = invoice_data.get('clientId', 'Unknown')
-            amount_due = invoice_data.get('totals', {}).get('amountDue', 0)
-            
-            if amount_due > 0:
-                if client_id_key not in client_outstanding:
-                    client_outstanding[client_id_key] = {"clientId": client_id_key, "outstanding": 0}
-                client_outstanding[client_id_key]["outstanding"] += amount_due
-                
-                # Calculate aging
-                due_date = invoice_data.get('dueDate')
-                if due_date:
-                    try:
-                        due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                        days_overdue = (now_utc - due_dt).days
-                        
-                        if days_overdue > 0:
-                            if days_overdue <= 15:
-                                ar_aging["0_15"] += amount_due
-                            elif days_overdue <= 30:
-                                ar_aging["16_30"] += amount_due
-                            elif days_overdue <= 60:
-                                ar_aging["31_60"] += amount_due
-                            elif days_overdue <= 90:
-                                ar_aging["61_90"] += amount_due
-                            else:
-                                ar_aging["90_plus"] += amount_due
-                    except Exception:
-                        pass
+        ar_snapshot = get_aging_snapshot(db, org_id, AR_LEDGER, now_utc)
+        ar_outstanding = ar_snapshot["outstanding"]
+        ar_aging = overview_aging_buckets(ar_snapshot)
         
         # Get client names
         clients_query = db.collection('organizations', org_id, 'clients').get()
         clients_map = {doc.id: doc.to_dict().get('name', 'Unknown') for doc in clients_query}
         
-        top_clients = []
-        for client_data in sorted(client_outstanding.values(), key=lambda x: x["outstanding"], reverse=True)[:5]:
-            client_data["name"] = clients_map.get(client_data["clientId"], "Unknown Client")
-            top_clients.append(client_data)
+        top_clients = [
+            {"clientId": party_id, "outstanding": amount, "name": clients_map.get(party_id, "Unknown Client")}
+            for party_id, amount in top_parties(ar_snapshot)
+        ]
             
     except Exception as e:
         logger.warning(f"Error fetching AR data: {e}")
@@ -508,64 +471,20 @@ async def get_master_financial_overview(
     
     # === AP OUTSTANDING & DUE SOON ===
     try:
-        ap_bills = db.collection('organizations', org_id, 'bills').where(
-            'status', 'in', ['SCHEDULED', 'PARTIAL', 'OVERDUE']
-        ).get()
-        
-        ap_outstanding = sum(doc.to_dict().get('totals', {}).get('amountDue', 0) for doc in ap_bills)
-        ap_aging = {"0_15": 0, "16_30": 0, "31_60": 0, "61_90": 0, "90_plus": 0}
-        
-        due_next_7 = 0
-        due_next_30 = 0
-        next_7_days = now_utc + timedelta(days=7)
-        next_30_days = now_utc + timedelta(days=30)
-        
-        vendor_payables = {}
-        for bill_doc in ap_bills:
-            bill_data = bill_doc.to_dict()
-            vendor_id = bill_data.get('vendorId', 'Unknown')
-            amount_due = bill_data.get('totals', {}).get('amountDue', 0)
-            
-            if amount_due > 0:
-                if vendor_id not in vendor_payables:
-                    vendor_payables[vendor_id] = {"vendorId": vendor_id, "payable": 0}
-                vendor_payables[vendor_id]["payable"] += amount_due
-                
-                # Check due dates
-                due_date = bill_data.get('dueDate')
-                if due_date:
-                    try:
-                        due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                        
-                        if now_utc <= due_dt <= next_7_days:
-                            due_next_7 += amount_due
-                        elif now_utc <= due_dt <= next_30_days:
-                            due_next_30 += amount_due
-                        
-                        # Aging for overdue
-                        if now_utc > due_dt:
-                            days_overdue = (now_utc - due_dt).days
-                            if days_overdue <= 15:
-                                ap_aging["0_15"] += amount_due
-                            elif days_overdue <= 30:
-                                ap_aging["16_30"] += amount_due
-                            elif days_overdue <= 60:
-                                ap_aging["31_60"] += amount_due
-                            elif days_overdue <= 90:
-                                ap_aging["61_90"] += amount_due
-                            else:
-                                ap_aging["90_plus"] += amount_due
-                    except Exception:
-                        pass
+        ap_snapshot = get_aging_snapshot(db, org_id, AP_LEDGER, now_utc)
+        ap_outstanding = ap_snapshot["outstanding"]
+        ap_aging = overview_aging_buckets(ap_snapshot)
+        due_next_7 = ap_snapshot["dueNext7Days"]
+        due_next_30 = ap_snapshot["dueNext30Days"]
         
         # Get vendor names
         vendors_query = db.collection('organizations', org_id, 'vendors').get()
         vendors_map = {doc.id: doc.to_dict().get('name', 'Unknown') for doc in vendors_query}
         
-        top_vendors = []
-        for vendor_data in sorted(vendor_payables.values(), key=lambda x: x["payable"], reverse=True)[:5]:
-            vendor_data["name"] = vendors_map.get(vendor_data["vendorId"], "Unknown Vendor")
-            top_vendors.append(vendor_data)
+        top_vendors = [
+            {"vendorId": party_id, "payable": amount, "name": vendors_map.get(party_id, "Unknown Vendor")}
+            for party_id, amount in top_parties(ap_snapshot)
+        ]
             
     except Exception as e:
         logger.warning(f"Error fetching AP data: {e}")
@@ -1230,6 +1149,7 @@ async def update_invoice(
         update_data["totals"] = totals.dict()
     
     invoice_ref.update(update_data)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, **update_data})
     
     return {"status": "success"}
 
@@ -1364,6 +1284,10 @@ async def record_payment(
     
     # Update invoice status
     update_invoice_status(db, org_id, req.invoiceId)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {
+        **invoice_data,
+        'totals': {**invoice_data.get('totals', {}), 'amountPaid': new_amount_paid, 'amountDue': new_amount_due}
+    })
     
     return {"status": "success", "paymentId": payment_ref.id}
 
@@ -1599,6 +1523,7 @@ async def send_invoice(
         update_data["number"] = generate_invoice_number(db, org_id, invoice_data.get('type', 'FINAL'))
     
     invoice_ref.update(update_data)
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, **update_data})
     
     return {"status": "success", "message": "Invoice sent successfully"}
 
@@ -1632,9 +1557,14 @@ async def get_invoice_pdf(
         raise HTTPException(status_code=403, detail="Not authorized")
     
     try:
-        # Generate PDF using PDFGenerator utility
-        pdf_generator = PDFGenerator()
-        pdf_content = pdf_generator.generate_invoice_pdf(invoice_data)
+        # Generate PDF (cached by content, rendered off the event loop)
+        client_id = invoice_data.get('clientId')
+        client_doc = db.collection('organizations', org_id, 'clients').document(client_id).get() if client_id else None
+        client_data = client_doc.to_dict() if client_doc and client_doc.exists else {}
+        org_doc = db.collection('organizations').document(org_id).get()
+        org_data = org_doc.to_dict() if org_doc.exists else {}
+        
+        pdf_content = await render_invoice_pdf(invoice_data, client_data, org_data)
         
         return Response(
             content=pdf_content,
@@ -1692,6 +1622,7 @@ async def cancel_invoice(
         'cancelledAt': get_utc_now(),
         'updatedAt': get_utc_now()
     })
+    record_transition(db, org_id, AR_LEDGER, invoice_data, {**invoice_data, 'status': 'CANCELLED'})
     
     return {"status": "success", "message": "Invoice cancelled successfully"}
 
@@ -1879,3 +1810,130 @@ async def get_aging_report(
     aging_details.sort(key=lambda x: x['daysOverdue'], reverse=True)
     
     return aging_details
+
+@router.get("/reports/aging/summary")
+async def get_aging_summary(
+    ledger: str = Query("AR", pattern="^(AR|AP)$"),
+    as_of: Optional[str] = Query(None, alias="asOf"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get AR or AP aging buckets from the incremental aging aggregate"""
+    org_id = current_user.get("orgId")
+    if not is_authorized_for_financial_hub(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for Financial Hub")
+    
+    db = firestore.client()
+    ledger_name = AR_LEDGER if ledger == "AR" else AP_LEDGER
+    
+    try:
+        return get_aging_snapshot(db, org_id, ledger_name, as_of)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="asOf must be an ISO date")
+
+@router.post("/reports/aging/rebuild")
+async def rebuild_aging_aggregates(
+    current_user: dict = Depends(get_current_user)
+):
+    """Recompute AR/AP aging aggregates from open documents and report drift (admin only)"""
+    org_id = current_user.get("orgId")
+    if current_user.get("role", "").lower() != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can rebuild aging aggregates")
+    
+    db = firestore.client()
+    
+    return {
+        "status": "success",
+        "ledgers": [rebuild_ledger(db, org_id, AR_LEDGER), rebuild_ledger(db, org_id, AP_LEDGER)]
+    }
+
+
+# --- Bulk PDF Export ---
+
+class InvoicePdfExportRequest(BaseModel):
+    startDate: Optional[str] = None
+    endDate: Optional[str] = None
+    status: Optional[str] = None
+
+@router.post("/exports/invoices/pdf", status_code=202)
+async def create_invoice_pdf_export(
+    request: InvoicePdfExportRequest,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Start rendering every matching invoice PDF; poll the job, then download the ZIP"""
+    org_id = current_user.get("orgId")
+    if not is_authorized_for_financial_hub(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for Financial Hub")
+    
+    db = firestore.client()
+    job = invoice_pdf_export.create_export_job(db, org_id, request.dict(), current_user)
+    background_tasks.add_task(invoice_pdf_export.run_export_job, db, org_id, job["id"])
+    
+    return {"status": "queued", "jobId": job["id"]}
+
+@router.get("/exports/invoices/pdf/{job_id}")
+async def get_invoice_pdf_export(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Progress of a bulk invoice PDF export"""
+    org_id = current_user.get("orgId")
+    if not is_authorized_for_financial_hub(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for Financial Hub")
+    
+    db = firestore.client()
+    job = invoice_pdf_export.get_export_job(db, org_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    
+    return job
+
+@router.post("/exports/invoices/pdf/{job_id}/resume", status_code=202)
+async def resume_invoice_pdf_export(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Continue a failed or orphaned export from its last checkpoint"""
+    org_id = current_user.get("orgId")
+    if not is_authorized_for_financial_hub(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for Financial Hub")
+    
+    db = firestore.client()
+    job = invoice_pdf_export.get_export_job(db, org_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    # Claimed atomically, so a second resume or a still-running worker cannot run the job twice
+    runner_id = invoice_pdf_export.resume_export_job(db, org_id, job_id)
+    if not runner_id:
+        raise HTTPException(status_code=409, detail=f"Export job is {job.get('status')} and cannot be resumed")
+    
+    background_tasks.add_task(invoice_pdf_export.run_export_job, db, org_id, job_id, runner_id=runner_id)
+    
+    return {"status": "resuming", "jobId": job_id, "processed": job.get("processed", 0)}
+
+@router.get("/exports/invoices/pdf/{job_id}/download")
+async def download_invoice_pdf_export(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream the prepared export as a ZIP of invoice PDFs"""
+    org_id = current_user.get("orgId")
+    if not is_authorized_for_financial_hub(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for Financial Hub")
+    
+    db = firestore.client()
+    job = invoice_pdf_export.get_export_job(db, org_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.get("status") != "COMPLETED":
+        raise HTTPException(status_code=409, detail="Export is not ready yet")
+    
+    filters = job.get("filters", {})
+    filename = f"invoices_{filters.get('startDate', 'all')}_{filters.get('endDate', 'now')}.zip".replace(":", "-")
+    
+    return StreamingResponse(
+        invoice_pdf_export.stream_export_zip(db, org_id, filters),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -4,6 +4,7 @@ from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timezone, timedelta
 from uuid import uuid4
+import asyncio
 import logging
 
 from ..dependencies import get_current_user
@@ -129,129 +130,98 @@ def audit_log(db, org_id: str, entity: str, action: str, actor: str, payload_sum
         logger.warning(f"Failed to write audit log: {e}")
 
 # --- Pre-Close Checks ---
+def count_query(query) -> int:
+    """Count matching documents server-side with an aggregation query."""
+    results = query.count(alias="total").get()
+    for row in results:
+        for aggregation in row:
+            return int(aggregation.value)
+    return 0
+
+def _run_count_check(key: str, label: str, query, found_template: str, passed_details: str) -> PeriodCheck:
+    """Evaluate a single pre-close check from a count aggregation."""
+    try:
+        count = count_query(query)
+        return PeriodCheck(
+            key=key,
+            label=label,
+            passed=count == 0,
+            details=found_template.format(count=count) if count > 0 else passed_details,
+            count=count
+        )
+    except Exception as e:
+        logger.warning(f"Error running period check {key}: {e}")
+        return PeriodCheck(
+            key=key,
+            label=label,
+            passed=False,
+            details=f"Error checking {label.lower()}"
+        )
+
 async def run_period_checks(db, org_id: str, year: int, month: int) -> List[PeriodCheck]:
-    """Run pre-close checks for a period"""
-    checks = []
+    """Run pre-close checks for a period.
+
+    Date bounds are pushed into the queries (see firestore.indexes.json for the
+    matching composite indexes) and only counts are returned, so the cost is
+    independent of how many drafts exist outside the period. The four checks
+    run concurrently.
+    """
     start_dt, end_dt = get_period_date_range(year, month)
     start_iso = start_dt.isoformat()
     end_iso = end_dt.isoformat()
-    
+    org_ref = db.collection('organizations').document(org_id)
+
     # Check 1: Draft invoices in period
-    try:
-        draft_invoices = db.collection('organizations', org_id, 'invoices').where(
-            'status', '==', 'DRAFT'
-        ).get()
-        
-        draft_in_period = 0
-        for doc in draft_invoices:
-            data = doc.to_dict()
-            issue_date = data.get('issueDate', '')
-            if start_iso <= issue_date < end_iso:
-                draft_in_period += 1
-        
-        checks.append(PeriodCheck(
-            key="draft_invoices",
-            label="Draft invoices in period",
-            passed=draft_in_period == 0,
-            details=f"{draft_in_period} draft invoices found" if draft_in_period > 0 else "No draft invoices",
-            count=draft_in_period
-        ))
-    except Exception as e:
-        logger.warning(f"Error checking draft invoices: {e}")
-        checks.append(PeriodCheck(
-            key="draft_invoices",
-            label="Draft invoices in period",
-            passed=False,
-            details="Error checking draft invoices"
-        ))
-    
+    draft_invoices = org_ref.collection('invoices').where(
+        'status', '==', 'DRAFT'
+    ).where(
+        'issueDate', '>=', start_iso
+    ).where(
+        'issueDate', '<', end_iso
+    )
+
     # Check 2: Draft bills in period
-    try:
-        draft_bills = db.collection('organizations', org_id, 'bills').where(
-            'status', '==', 'DRAFT'
-        ).get()
-        
-        draft_bills_in_period = 0
-        for doc in draft_bills:
-            data = doc.to_dict()
-            issue_date = data.get('issueDate', '')
-            if start_iso <= issue_date < end_iso:
-                draft_bills_in_period += 1
-        
-        checks.append(PeriodCheck(
-            key="draft_bills",
-            label="Draft bills in period",
-            passed=draft_bills_in_period == 0,
-            details=f"{draft_bills_in_period} draft bills found" if draft_bills_in_period > 0 else "No draft bills",
-            count=draft_bills_in_period
-        ))
-    except Exception as e:
-        logger.warning(f"Error checking draft bills: {e}")
-        checks.append(PeriodCheck(
-            key="draft_bills",
-            label="Draft bills in period",
-            passed=False,
-            details="Error checking draft bills"
-        ))
-    
+    draft_bills = org_ref.collection('bills').where(
+        'status', '==', 'DRAFT'
+    ).where(
+        'issueDate', '>=', start_iso
+    ).where(
+        'issueDate', '<', end_iso
+    )
+
     # Check 3: Unpaid payslips for the period month
-    try:
-        unpaid_payslips = db.collection('organizations', org_id, 'payslips').where(
-            'period.year', '==', year
-        ).where(
-            'period.month', '==', month
-        ).where(
-            'status', 'in', ['DRAFT', 'PUBLISHED']
-        ).get()
-        
-        unpaid_count = len(unpaid_payslips)
-        
-        checks.append(PeriodCheck(
-            key="unpaid_payslips",
-            label="Unpaid payslips for period",
-            passed=unpaid_count == 0,
-            details=f"{unpaid_count} unpaid payslips found" if unpaid_count > 0 else "All payslips paid",
-            count=unpaid_count
-        ))
-    except Exception as e:
-        logger.warning(f"Error checking unpaid payslips: {e}")
-        checks.append(PeriodCheck(
-            key="unpaid_payslips",
-            label="Unpaid payslips for period",
-            passed=False,
-            details="Error checking unpaid payslips"
-        ))
-    
+    unpaid_payslips = org_ref.collection('payslips').where(
+        'period.year', '==', year
+    ).where(
+        'period.month', '==', month
+    ).where(
+        'status', 'in', ['DRAFT', 'PUBLISHED']
+    )
+
     # Check 4: Unapplied client receipts in period
-    try:
-        unapplied_payments = db.collection('organizations', org_id, 'payments').where(
-            'status', '==', 'UNAPPLIED'
-        ).get()
-        
-        unapplied_in_period = 0
-        for doc in unapplied_payments:
-            data = doc.to_dict()
-            paid_at = data.get('paidAt', '')
-            if start_iso <= paid_at < end_iso:
-                unapplied_in_period += 1
-        
-        checks.append(PeriodCheck(
-            key="unapplied_payments",
-            label="Unapplied client receipts in period",
-            passed=unapplied_in_period == 0,
-            details=f"{unapplied_in_period} unapplied payments found" if unapplied_in_period > 0 else "No unapplied payments",
-            count=unapplied_in_period
-        ))
-    except Exception as e:
-        logger.warning(f"Error checking unapplied payments: {e}")
-        checks.append(PeriodCheck(
-            key="unapplied_payments",
-            label="Unapplied client receipts in period",
-            passed=False,
-            details="Error checking unapplied payments"
-        ))
-    
-    return checks
+    unapplied_payments = org_ref.collection('payments').where(
+        'status', '==', 'UNAPPLIED'
+    ).where(
+        'paidAt', '>=', start_iso
+    ).where(
+        'paidAt', '<', end_iso
+    )
+
+    specs = [
+        ("draft_invoices", "Draft invoices in period", draft_invoices,
+         "{count} draft invoices found", "No draft invoices"),
+        ("draft_bills", "Draft bills in period", draft_bills,
+         "{count} draft bills found", "No draft bills"),
+        ("unpaid_payslips", "Unpaid payslips for period", unpaid_payslips,
+         "{count} unpaid payslips found", "All payslips paid"),
+        ("unapplied_payments", "Unapplied client receipts in period", unapplied_payments,
+         "{count} unapplied payments found", "No unapplied payments"),
+    ]
+
+    checks = await asyncio.gather(*(
+        asyncio.to_thread(_run_count_check, *spec) for spec in specs
+    ))
+    return list(checks)
 
 # --- API Endpoints ---
 @router.get("/")
@@ -371,9 +341,9 @@ async def close_period(
         if existing_data.get('status') == 'CLOSED':
             return {"status": "success", "message": "Period already closed", "periodId": period_id}
     
-    # Run pre-close checks if not acknowledged
+    # Run pre-close checks; they block closing unless acknowledged
+    checks = await run_period_checks(db, org_id, req.year, req.month)
     if not req.checklistAck:
-        checks = await run_period_checks(db, org_id, req.year, req.month)
         failed_checks = [check for check in checks if not check.passed]
         if failed_checks:
             raise HTTPException(
@@ -383,7 +353,6 @@ async def close_period(
     
     # Close the period
     now = get_utc_now()
-    checks = await run_period_checks(db, org_id, req.year, req.month)
     
     period_data = {
         "orgId": org_id,
@@ -7,7 +7,6 @@ import json
 import logging
 import os
 import re
-import requests
 from ..dependencies import get_current_user
 from ..services.postprod_svc import (
     find_event_ref,
@@ -20,10 +19,10 @@ from ..services.postprod_svc import (
     activity_ref,
 )
 from ..services.postprod_sync_service import PostProdSyncService
+from ..services import llm_client
 import os
 import json
 import re
-import requests
 
 router = APIRouter(prefix="/events", tags=["Post Production"])
 
@@ -1092,31 +1091,20 @@ async def _list_available_editors(org_id: str, event_id: str, stream: StreamType
         'currentEditors': current_editors
     }
 
-def _openrouter_suggest(prompt_text: str):
-    api_key = os.getenv('OPENROUTER_API_KEY')
-    if not api_key:
+async def _openrouter_suggest(prompt_text: str):
+    try:
+        response = await llm_client.chat(
+            [{'role': 'user', 'content': prompt_text}],
+            model='google/gemma-3-4b-it:free',
+            deadline=15,
+            purpose='postprod.suggest_editors',
+        )
+    except llm_client.LLMNotConfiguredError:
         raise HTTPException(status_code=500, detail='AI service is not configured')
+    except llm_client.LLMError as exc:
+        raise HTTPException(status_code=502, detail=f'AI provider error: {str(exc)[:200]}') from exc
 
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
-    body = {
-        'model': 'google/gemma-3-4b-it:free',
-        'messages': [
-            {'role': 'user', 'content': prompt_text}
-        ]
-    }
-
-    try:
-        response = requests.post('https://openrouter.ai/api/v1/chat/completions', headers=headers, json=body, timeout=15)
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        detail = getattr(exc.response, 'text', str(exc)) if hasattr(exc, 'response') else str(exc)
-        raise HTTPException(status_code=502, detail=f'AI provider error: {detail[:200]}') from exc
-
-    payload = response.json()
-    content = payload.get('choices', [{}])[0].get('message', {}).get('content', '')
+    content = response.content
     for pattern in (r'```json\s*\n([\s\S]+?)\n\s*```', r'```([\s\S]+?)```'):
         match = re.search(pattern, content)
         if match:
@@ -1145,7 +1133,7 @@ async def suggest_editors(event_id: str, stream: StreamType = Query('photo'), cu
     prompt = f"""You are an expert post-production coordinator.\nEvent has a {stream} stream. Select a LEAD editor and up to two ASSIST editors from the AVAILABLE list.\nChoose based on skills match and low currentWorkload. Only pick from AVAILABLE.\n\nAVAILABLE:\n{json.dumps(available)[:4000]}\n\nRespond strictly as JSON: {{\"lead\": {{\"uid\":\"...\",\"displayName\":\"...\"}}, \"assistants\": [{{\"uid\":\"...\",\"displayName\":\"...\"}}]}}. If none suitable, return empty arrays."""
 
     try:
-        ai = _openrouter_suggest(prompt)
+        ai = await _openrouter_suggest(prompt)
     except HTTPException as exc:
         if exc.status_code == 500:
             raise HTTPException(status_code=404, detail='AI not available')
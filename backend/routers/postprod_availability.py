@@ -3,11 +3,11 @@ import os
 import re
 from typing import Any, Dict, List
 
-import requests
 from fastapi import Depends, HTTPException, Query
 from firebase_admin import firestore
 
 from ..dependencies import get_current_user
+from ..services import llm_client
 from ..services.postprod_svc import ensure_root_event_mirror, find_event_ref
 from .postprod import StreamType, router, _job_ref
 
@@ -114,31 +114,20 @@ async def _list_available_editors(org_id: str, event_id: str, stream: StreamType
     }
 
 
-def _openrouter_suggest(prompt_text: str) -> Dict[str, Any]:
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="AI service is not configured")
-
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    body = {
-        "model": "google/gemma-3-4b-it:free",
-        "messages": [{"role": "user", "content": prompt_text}],
-    }
-
+async def _openrouter_suggest(prompt_text: str) -> Dict[str, Any]:
     try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=body,
-            timeout=15,
+        response = await llm_client.chat(
+            [{"role": "user", "content": prompt_text}],
+            model="google/gemma-3-4b-it:free",
+            deadline=15,
+            purpose="postprod.suggest_editors",
         )
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        detail = getattr(exc.response, "text", str(exc)) if hasattr(exc, "response") else str(exc)
-        raise HTTPException(status_code=502, detail=f"AI provider error: {detail[:200]}") from exc
+    except llm_client.LLMNotConfiguredError:
+        raise HTTPException(status_code=500, detail="AI service is not configured")
+    except llm_client.LLMError as exc:
+        raise HTTPException(status_code=502, detail=f"AI provider error: {str(exc)[:200]}") from exc
 
-    payload = response.json()
-    content = payload.get("choices", [{}])[0].get("message", {}).get("content", "")
+    content = response.content
     for pattern in (r"```json\s*\n([\s\S]+?)\n\s*```", r"```([\s\S]+?)```"):
         match = re.search(pattern, content)
         if match:
@@ -184,7 +173,7 @@ async def suggest_editors(
     )
 
     try:
-        ai = _openrouter_suggest(prompt)
+        ai = await _openrouter_suggest(prompt)
     except HTTPException as exc:
         if exc.status_code == 500:
             raise HTTPException(status_code=404, detail='AI not available')
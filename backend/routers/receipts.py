@@ -1,17 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Query, Request
+from fastapi.responses import JSONResponse
 from firebase_admin import firestore, auth as firebase_auth
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timezone
+import asyncio
 import logging
 import json
 import hashlib
 from dataclasses import asdict
 
 from ..dependencies import get_current_user
-from ..services.ocr_service import ocr_service
-from ..services.advanced_verification_service import advanced_verification_service
-from ..schemas.receipt_schema import create_receipt_record_from_analysis, AdminDecision, VerificationStatus
+from ..services import receipt_batch, receipt_rescore, receipt_stats, receipt_verification
+from ..schemas.receipt_schema import AdminDecision, VerificationStatus
+from ..utils.exports import export_response
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/receipts", tags=["Receipt Management"])
@@ -56,6 +58,10 @@ class ReviewAction(BaseModel):
     action: str  # "APPROVE", "REJECT", "FLAG_SUSPICIOUS"
     notes: Optional[str] = ""
 
+class RescoreRequest(BaseModel):
+    thresholds: Dict[str, float] = {}  # ELA_HIGH, REJECT_SCORE, REVIEW_SCORE overrides
+    dryRun: bool = False
+
 # --- ENDPOINTS ---
 
 @router.post("/upload")
@@ -64,8 +70,13 @@ async def upload_receipt(
     file: UploadFile = File(...),
     eventId: str = Query(...),
     teamMembers: str = Query("[]"),
+    wait: float = Query(0, ge=0, le=25, description="Seconds to wait for verification before answering 202"),
     current_user: dict = Depends(get_current_user)
 ):
+    """
+    Accept a receipt and queue it for verification. Answers 202 with the
+    receipt id; watch ``GET /receipts/{id}/status`` for the result.
+    """
     org_id = current_user.get("orgId")
     user_id = current_user.get("uid")
     
@@ -97,151 +108,123 @@ async def upload_receipt(
             if prev_data.get("status") not in ["REJECTED"]:
                 # SAVE the duplicate receipt as flagged so it appears in history
                 new_ref = receipts_ref.document()
-                receipt_id = new_ref.id
-                
-                duplicate_receipt = {
-                    "id": receipt_id,
-                    "eventId": eventId,
-                    "fileHash": file_hash,
-                    "submittedBy": user_id,
-                    "submittedByName": user_name,
-                    "imageUrl": f"receipts/{receipt_id}/{file.filename}",
-                    "extractedData": {},
-                    "riskScore": 100,
-                    "status": "REJECT",
-                    "issues": [f"Exact file duplicate of Receipt {match.id}"],
-                    "duplicateOf": {
-                        "type": "EXACT_FILE_MATCH",
-                        "match_type": "EXACT_FILE_MATCH",
-                        "receipt_id": match.id,
-                        "submitted_by": prev_data.get("submittedByName", "Unknown"),
-                        "submitted_at": prev_data.get("createdAt", ""),
-                        "confidence": 100,
-                        "details": "Exact file hash match (SHA-256)"
-                    },
-                    "createdAt": datetime.utcnow().isoformat(),
-                    "teamMembers": json.loads(teamMembers) if teamMembers else []
-                }
+                duplicate_receipt = receipt_verification.exact_duplicate_receipt(
+                    new_ref.id,
+                    match_id=match.id,
+                    match=prev_data,
+                    event_id=eventId,
+                    file_hash=file_hash,
+                    user_id=user_id,
+                    user_name=user_name,
+                    filename=file.filename,
+                    team_members=json.loads(teamMembers) if teamMembers else [],
+                )
                 new_ref.set(duplicate_receipt)
-                
-                return {
-                    "status": "duplicate",
-                    "receiptId": receipt_id,
-                    "verification": {
-                        "riskScore": 100,
-                        "decision": "REJECT",
-                        "issues": [f"Exact file duplicate of Receipt {match.id}"],
-                        "isDuplicate": True,
-                        "duplicateOf": duplicate_receipt["duplicateOf"]
-                    }
-                }
-        
-        # --- LAYER 1 & 3: VISUALS & FORENSICS (CPU BOUND) ---
-        image_analysis = advanced_verification_service.comprehensive_image_analysis(file_content)
-        
-        # --- LAYER 2: AI OCR (API COST) ---
-        # Only runs if Layer 0 passed
-        ocr_result = ocr_service.process_receipt(file_content)
-        if not ocr_result["success"]:
-             raise HTTPException(status_code=502, detail=f"OCR Failed: {ocr_result.get('error', 'Unknown error')}")
-             
-        # --- UNIFIED VERIFICATION ---
-        # Optimization: In production, use a more specific query if possible, but for now stream is okay
-        existing_docs = receipts_ref.stream()
-        existing_receipts = []
-        for doc in existing_docs:
-            data = doc.to_dict()
-            data['id'] = doc.id  # Include document ID for duplicate reference
-            existing_receipts.append(data)
-        
-        duplicate_matches = advanced_verification_service.find_duplicate_receipts(
-            image_analysis["perceptual_hashes"],
-            ocr_result["data"].get("rideId"),
-            existing_receipts
-        )
+                receipt_stats.record_transition(db, org_id, None, duplicate_receipt)
+                return receipt_verification.exact_duplicate_response(duplicate_receipt)
         
-        risk = advanced_verification_service.calculate_comprehensive_risk_score(
-            image_analysis,
-            ocr_result,
-            duplicate_matches,
-            None
-        )
-        
-        # --- SAVE TO DB ---
+        # --- ACCEPT: store the image, record it PENDING, verify in the background ---
+        # Forensics, OCR (up to 30s) and risk scoring run in receipt_verification's worker pool
         new_ref = receipts_ref.document()
         receipt_id = new_ref.id
-        
-        # Create Record Object using the Schema Factory
-        team_members_list = json.loads(teamMembers) if teamMembers else []
-        
-        upload_metadata = {
-            "id": receipt_id,
-            "uploader_id": user_id,
-            "uploader_name": current_user.get("name", ""),
-            "event_id": eventId,
-            "team_members": team_members_list,
-            "filename": file.filename,
-            "file_size": len(file_content)
-        }
-
-        receipt_record = create_receipt_record_from_analysis(
-            upload_metadata,
-            image_analysis,
-            ocr_result,
-            duplicate_matches,
-            risk
+        image_path = await asyncio.to_thread(
+            receipt_verification.store_image, org_id, receipt_id, file.filename, file_content, file.content_type
         )
+        pending = receipt_verification.pending_receipt(
+            receipt_id,
+            event_id=eventId,
+            file_hash=file_hash,  # Saving DNA for future Layer 0 checks
+            user_id=user_id,
+            user_name=user_name,
+            filename=file.filename,
+            file_size=len(file_content),
+            team_members=json.loads(teamMembers) if teamMembers else [],
+            image_path=image_path,
+        )
+        new_ref.set(pending)
+        receipt_stats.record_transition(db, org_id, None, pending)
         
-        # Convert to dict for Firestore
-        receipt_dict = receipt_record.to_dict()
-        
-        # Add Legacy/Frontend compatibility fields explicitly
-        receipt_dict.update({
-            "eventId": eventId,
-            "fileHash": file_hash, # Saving DNA for future Layer 0 checks
-            "submittedBy": user_id,
-            "submittedByName": user_name,
-            "imageUrl": f"receipts/{receipt_id}/{file.filename}", # Placeholder
-            "extractedData": ocr_result.get("data", {}),
-            "riskScore": risk["risk_score"],
-            "status": "VERIFIED" if risk["decision"] == "AUTO_APPROVE" else risk["decision"],
-            "issues": risk["issues"],
-            "duplicateOf": duplicate_matches[0] if duplicate_matches else None  # Reference to original receipt
-        })
-        
-        new_ref.set(receipt_dict)
-        
-        # Build extracted data with proper field mapping for frontend
-        extracted_data = ocr_result.get("data", {})
-        # Map date + time to timestamp if both exist
-        if extracted_data.get("date") and extracted_data.get("time"):
-            extracted_data["timestamp"] = f"{extracted_data['date']} {extracted_data['time']}"
-        elif extracted_data.get("date"):
-            extracted_data["timestamp"] = extracted_data["date"]
-        
-        # Map pickup/dropoff to locations object for frontend
-        if extracted_data.get("pickup") or extracted_data.get("dropoff"):
-            extracted_data["locations"] = {
-                "pickup": extracted_data.get("pickup"),
-                "dropoff": extracted_data.get("dropoff")
-            }
-        
-        return {
-            "status": "success",
+        queue = receipt_verification.get_queue()
+        try:
+            await queue.submit(receipt_verification.VerificationJob(
+                org_id=org_id, receipt_id=receipt_id, image_bytes=file_content, image_path=image_path
+            ))
+        except receipt_verification.QueueFullError as busy:
+            new_ref.delete()
+            receipt_stats.record_transition(db, org_id, pending, None)
+            raise HTTPException(status_code=503, detail=str(busy), headers={"Retry-After": "10"})
+        
+        if wait:
+            # Optional short wait so fast verifications still answer in one round trip
+            view = await receipt_verification.wait_for_status(db, org_id, receipt_id, wait, queue)
+            if view and view["state"] == receipt_verification.DONE:
+                return {**view, "status": "success"}
+        
+        return JSONResponse(status_code=202, content={
+            "status": "queued",
             "receiptId": receipt_id,
-            "verification": {
-                **risk,
-                "riskLevel": "LOW_RISK" if risk["risk_score"] < 30 else ("MEDIUM_RISK" if risk["risk_score"] < 60 else "HIGH_RISK"),
-                "extractedData": extracted_data,
-                "duplicateOf": duplicate_matches[0] if duplicate_matches else None,
-                "isDuplicate": len(duplicate_matches) > 0
-            }
-        }
+            "state": receipt_verification.QUEUED,
+            "statusUrl": f"/api/receipts/{receipt_id}/status",
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/upload/batch")
+async def upload_receipt_batch(
+    files: List[UploadFile] = File(...),
+    eventId: str = Query(...),
+    teamMembers: str = Query("[]"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Upload several receipts in one request. Files are deduplicated against each
+    other and verified concurrently; returns a verdict per file in upload order.
+    """
+    org_id = current_user.get("orgId")
+    user_id = current_user.get("uid")
+    
+    if len(files) > receipt_batch.max_files():
+        raise HTTPException(status_code=400, detail=f"At most {receipt_batch.max_files()} receipts per batch")
+    
+    try:
+        batch_files = [
+            receipt_batch.BatchFile(index=i, filename=f.filename, content_type=f.content_type, data=await f.read())
+            for i, f in enumerate(files)
+        ]
+        db = firestore.client()
+        user_name = current_user.get("name", "") or get_user_display_name(db, org_id, user_id, {})
+        
+        result = await receipt_batch.verify_batch(
+            db, org_id, batch_files,
+            event_id=eventId,
+            user_id=user_id,
+            user_name=user_name,
+            team_members=json.loads(teamMembers) if teamMembers else [],
+        )
+        return {"status": "success", "eventId": eventId, **result}
+    
+    except Exception as e:
+        logger.error(f"Batch upload failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{receipt_id}/status")
+async def get_receipt_status(
+    receipt_id: str,
+    wait: float = Query(0, ge=0, le=25, description="Long-poll: seconds to wait while verification is running"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Verification state of an uploaded receipt; with ``wait`` it returns as soon as the state settles."""
+    org_id = current_user.get("orgId")
+    db = firestore.client()
+    view = await receipt_verification.wait_for_status(db, org_id, receipt_id, wait)
+    if view is None:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+    return view
+
 @router.get("/event/{event_id}")
 async def get_event_receipts(
     event_id: str,
@@ -277,17 +260,38 @@ async def get_event_receipts(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/")
-async def get_all_receipts(current_user: dict = Depends(get_current_user)):
-    """Get all receipts for the organization"""
+async def get_all_receipts(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page"),
+    status: Optional[str] = Query(None),
+    eventId: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Receipts for the organization, newest first, one page at a time"""
     try:
         org_id = current_user.get("orgId")
         db = firestore.client()
         
         receipts_ref = db.collection('organizations', org_id, 'receipts')
-        docs = receipts_ref.stream()
-        
+        if cursor is None:
+            # First page: make sure older receipts carry createdAt before ordering by it
+            await asyncio.to_thread(receipt_stats.ensure_backfilled, db, org_id)
+        
+        query = receipts_ref
+        if eventId:
+            query = query.where('eventId', '==', eventId)
+        if status:
+            query = query.where('status', '==', status)
+        query = query.order_by('createdAt', direction=firestore.Query.DESCENDING).limit(limit + 1)
+        if cursor:
+            cursor_doc = receipts_ref.document(cursor).get()
+            if not cursor_doc.exists:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.start_after(cursor_doc)
+        
+        docs = list(query.stream())
         receipts = []
-        for doc in docs:
+        for doc in docs[:limit]:
             data = doc.to_dict()
             data['id'] = doc.id
             receipts.append(data)
@@ -298,64 +302,118 @@ async def get_all_receipts(current_user: dict = Depends(get_current_user)):
             if not receipt.get('submittedByName') and receipt.get('submittedBy'):
                 receipt['submittedByName'] = get_user_display_name(db, org_id, receipt['submittedBy'], user_cache)
             
-        receipts.sort(key=lambda x: x.get('createdAt', ''), reverse=True)
-        return {"receipts": receipts}
+        return {"receipts": receipts, "nextCursor": receipts[-1]['id'] if len(docs) > limit else None}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching all receipts: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/dashboard/summary")
-async def get_dashboard_summary(current_user: dict = Depends(get_current_user)):
-    """Get summary statistics for the dashboard"""
+async def get_dashboard_summary(
+    eventId: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Summary statistics for the dashboard, read from the incremental counters"""
     try:
         org_id = current_user.get("orgId")
         db = firestore.client()
-        
-        receipts_ref = db.collection('organizations', org_id, 'receipts')
-        docs = receipts_ref.stream()
-        
-        total_receipts = 0
-        total_amount = 0.0
-        status_counts = {"pending": 0, "verified": 0, "rejected": 0, "needs_review": 0}
-        
-        for doc in docs:
-            data = doc.to_dict()
-            total_receipts += 1
-            
-            try:
-                amount_val = data.get('extractedData', {}).get('amount', 0)
-                if not amount_val:
-                    amount_val = data.get('extractedData', {}).get('totalAmount', 0)
-                
-                if isinstance(amount_val, str):
-                    amount_val = amount_val.replace('$', '').replace(',', '')
-                amount = float(amount_val)
-                total_amount += amount
-            except (ValueError, TypeError):
-                pass
-            
-            # Normalizing Status
-            status = data.get('status', 'PENDING')
-            if status == 'VERIFIED' or status == 'AUTO_APPROVED' or status == 'APPROVED':
-                status_counts['verified'] += 1
-            elif status == 'REJECTED' or status == 'HIGH_RISK':
-                status_counts['rejected'] += 1
-            elif status == 'MANUAL_REVIEW' or status == 'MEDIUM_RISK' or status == 'FLAGGED':
-                status_counts['needs_review'] += 1
-            else:
-                status_counts['pending'] += 1
-                    
-        return {
-            "totalReceipts": total_receipts,
-            "totalAmount": round(total_amount, 2),
-            "statusCounts": status_counts
-        }
+        return await asyncio.to_thread(receipt_stats.get_summary, db, org_id, eventId)
         
     except Exception as e:
         logger.error(f"Error fetching dashboard summary: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/dashboard/rebuild")
+async def rebuild_dashboard_counters(current_user: dict = Depends(get_current_user)):
+    """Recompute receipt counters from every receipt and report drift (admin only)"""
+    org_id = current_user.get("orgId")
+    if current_user.get("role", "").lower() != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can rebuild receipt counters")
+    
+    db = firestore.client()
+    return {"status": "success", **await asyncio.to_thread(receipt_stats.rebuild, db, org_id)}
+
+def _require_admin(current_user: dict, action: str) -> None:
+    if current_user.get("role", "").lower() != "admin":
+        raise HTTPException(status_code=403, detail=f"Only administrators can {action}")
+
+@router.post("/admin/rescore", status_code=202)
+async def create_rescore_job(
+    request: RescoreRequest,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Re-score stored receipts with the given thresholds; poll the job, then fetch the diff report"""
+    org_id = current_user.get("orgId")
+    _require_admin(current_user, "re-score receipts")
+    
+    db = firestore.client()
+    try:
+        job = receipt_rescore.create_rescore_job(db, org_id, request.thresholds, request.dryRun, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(receipt_rescore.run_rescore_job, db, org_id, job["id"])
+    
+    return {"status": "queued", "jobId": job["id"], "thresholds": job["thresholds"], "dryRun": job["dryRun"]}
+
+@router.get("/admin/rescore/{job_id}")
+async def get_rescore_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Progress and decision transitions of a re-score job"""
+    org_id = current_user.get("orgId")
+    _require_admin(current_user, "view re-score jobs")
+    
+    db = firestore.client()
+    job = receipt_rescore.get_rescore_job(db, org_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Re-score job not found")
+    
+    return job
+
+@router.post("/admin/rescore/{job_id}/resume", status_code=202)
+async def resume_rescore_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Continue a failed or orphaned re-score job from its last checkpoint"""
+    org_id = current_user.get("orgId")
+    _require_admin(current_user, "re-score receipts")
+    
+    db = firestore.client()
+    job = receipt_rescore.get_rescore_job(db, org_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Re-score job not found")
+    # Claimed atomically, so a second resume or a still-running worker cannot run the job twice
+    runner_id = receipt_rescore.resume_rescore_job(db, org_id, job_id)
+    if not runner_id:
+        raise HTTPException(status_code=409, detail=f"Re-score job is {job.get('status')} and cannot be resumed")
+    
+    background_tasks.add_task(receipt_rescore.run_rescore_job, db, org_id, job_id, runner_id=runner_id)
+    
+    return {"status": "resuming", "jobId": job_id, "processed": job.get("processed", 0)}
+
+@router.get("/admin/rescore/{job_id}/report")
+async def download_rescore_report(
+    job_id: str,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Diff report of every receipt whose score or decision the job changed"""
+    org_id = current_user.get("orgId")
+    _require_admin(current_user, "view re-score jobs")
+    
+    db = firestore.client()
+    if not receipt_rescore.get_rescore_job(db, org_id, job_id):
+        raise HTTPException(status_code=404, detail="Re-score job not found")
+    
+    return export_response(f"receipt-rescore-{job_id}", receipt_rescore.REPORT_HEADER,
+                           receipt_rescore.report_rows(db, org_id, job_id), format, "Rescore")
+
 @router.patch("/{receipt_id}/review")
 async def review_receipt(
     receipt_id: str,
@@ -395,6 +453,8 @@ async def review_receipt(
         }
         
         receipt_ref.update(update_data)
+        before = doc.to_dict() or {}
+        receipt_stats.record_transition(db, org_id, before, {**before, **update_data})
         return {"status": "success", "new_state": new_status}
 
     except Exception as e:
@@ -428,6 +488,8 @@ async def update_receipt_status(
             update_dict["verificationNotes"] = update_data.verificationNotes
             
         receipt_ref.update(update_dict)
+        before = doc.to_dict() or {}
+        receipt_stats.record_transition(db, org_id, before, {**before, **update_dict})
         
         return {"status": "success", "message": "Receipt updated successfully"}
         
@@ -446,10 +508,12 @@ async def delete_receipt(
         db = firestore.client()
         
         receipt_ref = db.collection('organizations', org_id, 'receipts').document(receipt_id)
-        if not receipt_ref.get().exists:
+        doc = receipt_ref.get()
+        if not doc.exists:
             raise HTTPException(status_code=404, detail="Receipt not found")
             
         receipt_ref.delete()
+        receipt_stats.record_transition(db, org_id, doc.to_dict(), None)
         return {"status": "success", "message": "Receipt deleted successfully"}
         
     except Exception as e:
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from firebase_admin import firestore
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
@@ -9,6 +9,8 @@ import string
 import logging
 
 from ..dependencies import get_current_user
+from ..services import payroll_analytics, payslip_summaries, salary_payments, salary_run_generation, salary_run_metrics, sequence_allocator
+from ..utils.exports import export_response, paginate, project_rows
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -58,6 +60,7 @@ class SalaryRunCreate(BaseModel):
     month: int = Field(..., ge=1, le=12)
     year: int = Field(..., ge=2000, le=2100)
     notes: Optional[str] = None
+    dryRun: bool = False  # Compute payslips and totals without writing anything
 
 class SalaryRunUpdate(BaseModel):
     status: str  # DRAFT|PUBLISHED|PAID|CLOSED
@@ -147,47 +150,7 @@ def compute_payslip_totals(lines: dict, currency: str = "INR") -> dict:
 
 def generate_payslip_number(db, org_id: str, year: int) -> str:
     """Generate a unique payslip number in the format PAY-YYYY-####"""
-    # Get and update the org's payslip number sequence
-    org_ref = db.collection('organizations').document(org_id)
-    
-    # Run this in a transaction to ensure number uniqueness
-    @firestore.transactional
-    def update_sequence(transaction, org_ref):
-        try:
-            org_doc = transaction.get(org_ref)
-            if org_doc.exists:
-                org_data = org_doc.to_dict()
-            else:
-                org_data = {}
-            
-            # Initialize numberSequences if it doesn't exist
-            if "numberSequences" not in org_data:
-                org_data["numberSequences"] = {}
-            
-            # Initialize payslip sequence for the current year if it doesn't exist
-            payslip_seq_key = f"payslip_{year}"
-            if payslip_seq_key not in org_data["numberSequences"]:
-                org_data["numberSequences"][payslip_seq_key] = 0
-            
-            # Increment the sequence
-            current_seq = org_data["numberSequences"][payslip_seq_key] + 1
-            org_data["numberSequences"][payslip_seq_key] = current_seq
-            
-            # Update the document
-            transaction.update(org_ref, {"numberSequences": org_data["numberSequences"]})
-            
-            return current_seq
-        except Exception as e:
-            logger.error(f"Error in update_sequence: {str(e)}")
-            # If there's an error, return a random sequence number as fallback
-            return int(datetime.now(timezone.utc).timestamp() % 10000)
-    
-    transaction = db.transaction()
-    current_seq = update_sequence(transaction, org_ref)
-    
-    # Format the sequence number with leading zeros
-    seq_formatted = str(current_seq).zfill(4)
-    return f"PAY-{year}-{seq_formatted}"
+    return sequence_allocator.next_number(db, org_id, "PAYSLIP", year)
 
 def is_authorized_for_salary_actions(current_user: dict) -> bool:
     """Check if the user is authorized for salary operations (admin or accountant)"""
@@ -208,25 +171,7 @@ def record_salary_payment(
     existing_doc = salary_payment_ref.get()
     timestamp = datetime.now(timezone.utc).isoformat()
 
-    payment_record = {
-        "orgId": org_id,
-        "runId": payslip_data.get("runId"),
-        "payslipId": payslip_id,
-        "employeeId": payslip_data.get("userId"),
-        "employeeName": payslip_data.get("userName"),
-        "grossAmount": payslip_data.get("grossAmount", 0),
-        "netAmount": payslip_data.get("netPay", 0),
-        "taxAmount": payslip_data.get("totalTax", 0),
-        "deductionsAmount": payslip_data.get("totalDeductions", 0),
-        "currency": payslip_data.get("currency", "INR"),
-        "method": payment_info.method,
-        "reference": payment_info.reference,
-        "remarks": payment_info.remarks,
-        "paidAt": payment_info.paidAt,
-        "idempotencyKey": payment_info.idempotencyKey,
-        "processedBy": processed_by,
-        "updatedAt": timestamp,
-    }
+    payment_record = salary_payments.payment_record(org_id, payslip_id, payslip_data, payment_info, processed_by, timestamp)
 
     if existing_doc.exists:
         existing_data = existing_doc.to_dict() or {}
@@ -237,66 +182,6 @@ def record_salary_payment(
     salary_payment_ref.set(payment_record)
 
 
-def recalculate_run_metrics(db, org_id: str, run_id: str):
-    """Recompute salary run aggregates after status changes."""
-    payslips_query = db.collection('organizations', org_id, 'payslips').where('runId', '==', run_id).get()
-
-    counts = {"drafted": 0, "published": 0, "paid": 0}
-    total_gross = 0.0
-    total_deductions = 0.0
-    total_tax = 0.0
-    total_net = 0.0
-    count_paid = 0
-    count_unpaid = 0
-
-    for payslip_doc in payslips_query:
-        data = payslip_doc.to_dict() or {}
-        status = (data.get("status") or "").upper()
-
-        if status == "PAID":
-            counts["paid"] += 1
-            count_paid += 1
-        elif status == "PUBLISHED":
-            counts["published"] += 1
-            count_unpaid += 1
-        elif status == "DRAFT":
-            counts["drafted"] += 1
-            count_unpaid += 1
-        else:
-            count_unpaid += 1
-
-        total_gross += data.get("grossAmount", 0) or 0
-        total_deductions += data.get("totalDeductions", 0) or 0
-        total_tax += data.get("totalTax", 0) or 0
-        total_net += data.get("netPay", 0) or 0
-
-    counts["total"] = counts["drafted"] + counts["published"] + counts["paid"]
-
-    summary = {
-        "totalGross": round_currency(total_gross),
-        "totalDeductions": round_currency(total_deductions),
-        "totalTax": round_currency(total_tax),
-        "totalNet": round_currency(total_net),
-        "countPaid": count_paid,
-        "countUnpaid": count_unpaid,
-        "countTotal": count_paid + count_unpaid,
-    }
-
-    run_ref = db.collection('organizations', org_id, 'salaryRuns').document(run_id)
-    run_ref.update({
-        "counts": counts,
-        "totals": {
-            "gross": round_currency(total_gross),
-            "deductions": round_currency(total_deductions),
-            "tax": round_currency(total_tax),
-            "net": round_currency(total_net),
-        },
-        "summary": summary,
-        "updatedAt": datetime.now(timezone.utc).isoformat(),
-    })
-    
-    return {"counts": counts, "summary": summary}
-
 # --- Salary Profile Endpoints ---
 @router.get("/profiles")
 async def list_salary_profiles(
@@ -521,6 +406,21 @@ async def create_salary_run(
     run_id = f"run_{req.year}_{str(req.month).zfill(2)}"
     run_ref = db.collection('organizations', org_id, 'salaryRuns').document(run_id)
     
+    if req.dryRun:
+        result = await salary_run_generation.generate_run_payslips(
+            db, org_id, run_id, req.year, req.month, current_user.get("uid"), dry_run=True
+        )
+        draft = result["draft"]
+        return {
+            "status": "dry_run",
+            "runId": run_id,
+            "payslipsCreated": 0,
+            "payslipsComputed": len(draft.payslips),
+            "skipped": {"exited": draft.skipped_exited, "noProfile": draft.skipped_no_profile},
+            "totals": draft.totals(),
+            "latencyMs": result["latencyMs"]
+        }
+    
     period_sort_key = (req.year or 0) * 100 + (req.month or 0)
 
     run_data = {
@@ -538,118 +438,20 @@ async def create_salary_run(
     
     run_ref.set(run_data)
     
-    # Get all active team members
-    team_query = db.collection('organizations', org_id, 'team').where("availability", "==", True).get()
-    
-    # Generate draft payslips for each team member
-    payslips_created = 0
-    total_gross = 0
-    total_deductions = 0
-    total_tax = 0
-    total_net = 0
-    
-    for team_doc in team_query:
-        team_member = team_doc.to_dict()
-        user_id = team_doc.id
-        
-        # Skip if there's an exit date and it's before this run's period
-        exit_date = team_member.get("exitDate")
-        if exit_date:
-            try:
-                exit_dt = datetime.fromisoformat(exit_date.replace('Z', ''))
-                run_dt = datetime(req.year, req.month, 1)
-                if exit_dt < run_dt:
-                    continue
-            except:
-                pass  # Skip date parsing errors
-        
-        # Get member's salary profile
-        profile_ref = db.collection('organizations', org_id, 'salaryProfiles').document(user_id)
-        profile = profile_ref.get()
-        
-        if not profile.exists:
-            continue  # Skip members without salary profiles
-        
-        profile_data = profile.to_dict()
-        
-        # Create payslip lines
-        base_line = {"label": "Base Salary", "amount": profile_data.get("baseSalary", 0)}
-        allowances_lines = profile_data.get("allowances", [])
-        deductions_lines = profile_data.get("deductions", [])
-        
-        # Calculate totals
-        gross_amount = base_line["amount"] + sum(a.get("amount", 0) for a in allowances_lines)
-        total_allowances = sum(a.get("amount", 0) for a in allowances_lines)
-        total_deductions_amount = sum(d.get("amount", 0) for d in deductions_lines)
-        
-        # Calculate tax
-        tax_amount = 0
-        tax_config = profile_data.get("tax", {})
-        if tax_config.get("mode") == "PERCENT":
-            subtotal = gross_amount - total_deductions_amount
-            tax_amount = round(subtotal * (tax_config.get("value", 0) / 100), 2)
-        elif tax_config.get("mode") == "FIXED":
-            tax_amount = tax_config.get("value", 0)
-        
-        tax_line = {"label": "TDS", "amount": tax_amount}
-        net_pay = gross_amount - total_deductions_amount - tax_amount
-        
-        # Create payslip data
-        payslip_data = {
-            "orgId": org_id,
-            "runId": run_id,
-            "userId": user_id,
-            "userName": team_member.get("name", ""),
-            "period": {"month": req.month, "year": req.year},
-            "status": "DRAFT",
-            "currency": profile_data.get("currency", "INR"),
-            "lines": {
-                "base": base_line,
-                "allowances": [{"key": a.get("key", ""), "label": a.get("label", ""), "amount": a.get("amount", 0)} for a in allowances_lines],
-                "deductions": [{"key": d.get("key", ""), "label": d.get("label", ""), "amount": d.get("amount", 0)} for d in deductions_lines],
-                "tax": tax_line
-            },
-            "grossAmount": round_currency(gross_amount),
-            "totalAllowances": round_currency(total_allowances),
-            "totalDeductions": round_currency(total_deductions_amount),
-            "totalTax": round_currency(tax_amount),
-            "netPay": round_currency(net_pay),
-            "remarks": "",
-            "createdAt": datetime.now(timezone.utc).isoformat(),
-            "createdBy": current_user.get("uid"),
-            "updatedAt": datetime.now(timezone.utc).isoformat(),
-            "audit": [{
-                "by": current_user.get("uid"),
-                "action": "CREATED",
-                "at": datetime.now(timezone.utc).isoformat()
-            }]
-        }
-        
-        # Create payslip document
-        payslip_ref = db.collection('organizations', org_id, 'payslips').document()
-        payslip_data["id"] = payslip_ref.id
-        payslip_ref.set(payslip_data)
-        
-        # Update totals
-        total_gross += gross_amount
-        total_deductions += total_deductions_amount
-        total_tax += tax_amount
-        total_net += net_pay
-        payslips_created += 1
+    # Generate draft payslips for every active team member with a salary profile
+    result = await salary_run_generation.generate_run_payslips(
+        db, org_id, run_id, req.year, req.month, current_user.get("uid")
+    )
+    draft = result["draft"]
+    payslips_created = result["written"]
     
     # Update run with summary information
     run_ref.update({
-        "counts": {"drafted": payslips_created, "published": 0, "paid": 0},
-        "totals": {
-            "gross": round_currency(total_gross),
-            "deductions": round_currency(total_deductions),
-            "tax": round_currency(total_tax),
-            "net": round_currency(total_net)
-        },
+        **salary_run_metrics.summarize(draft.payslips if payslips_created else []),
         "generatedAt": datetime.now(timezone.utc).isoformat()
     })
     
-    return {"status": "success", "runId": run_id, "payslipsCreated": payslips_created}
+    return {"status": "success", "runId": run_id, "payslipsCreated": payslips_created, "latencyMs": result["latencyMs"]}
 
 @router.get("/runs")
 async def list_salary_runs(
@@ -682,6 +484,12 @@ async def list_salary_runs(
                 run_data = run_doc.to_dict()
                 run_data["id"] = run_doc.id
 
+                # Runs maintained incrementally already carry their totals
+                if salary_run_metrics.has_metrics(run_data):
+                    run_data["payslipsCount"] = run_data["counts"]["total"]
+                    runs.append(run_data)
+                    continue
+
                 # Calculate totals for each run
                 payslips_query = db.collection('organizations', org_id, 'payslips').where('runId', '==', run_doc.id).get()
                 total_gross = 0
@@ -756,6 +564,10 @@ async def get_salary_run(
     run_data = run.to_dict()
     run_data["id"] = run_id
     
+    # Runs maintained incrementally already carry their summary
+    if salary_run_metrics.has_metrics(run_data):
+        return run_data
+    
     # Get summary stats
     payslips_query = db.collection('organizations', org_id, 'payslips').where('runId', '==', run_id).get()
     total_gross = 0
@@ -839,22 +651,75 @@ async def update_salary_run(
                 # Assign payslip numbers and update status for all payslips
                 all_payslips = db.collection('organizations', org_id, 'payslips').where('runId', '==', run_id).get()
                 
+                salary_run_metrics.ensure_run_metrics(db, org_id, run_id)
+                
+                # Reserve one block of numbers per year for the payslips that still need one.
+                # Payslips published by an earlier attempt that failed partway keep their number.
+                by_year = {}
+                numbers = {}
                 for payslip_doc in all_payslips:
-                    payslip_data = payslip_doc.to_dict()
+                    payslip_data = payslip_doc.to_dict() or {}
+                    if payslip_data.get("number"):
+                        numbers[payslip_doc.id] = payslip_data["number"]
+                        continue
                     year = payslip_data.get("period", {}).get("year", datetime.now().year)
-                    
-                    # Generate payslip number
-                    payslip_number = generate_payslip_number(db, org_id, year)
-                    
-                    # Update payslip
-                    payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_doc.id)
-                    payslip_ref.update({
-                        "status": "PUBLISHED",
-                        "number": payslip_number,
-                        "publishedAt": datetime.now(timezone.utc).isoformat(),
-                        "publishedBy": current_user.get("uid"),
-                        "updatedAt": datetime.now(timezone.utc).isoformat()
-                    })
+                    by_year.setdefault(year, []).append(payslip_doc)
+                blocks = {}
+                sequences = {}
+                for year, docs in by_year.items():
+                    lease = sequence_allocator.reserve_block(db, org_id, "PAYSLIP", year, len(docs), purpose=f"salaryRun:{run_id}")
+                    blocks[year] = lease
+                    for doc, sequence in zip(docs, range(lease.next, lease.end)):
+                        numbers[doc.id] = sequence_allocator.format_number("PAYSLIP", year, sequence)
+                        sequences[doc.id] = (year, sequence)
+                
+                # Payslip update plus the employee's summary: two writes per payslip, and each
+                # batch also carries the run increment for its own payslips
+                deltas = []
+                batch_ids, committed = [], set()
+                published_at = datetime.now(timezone.utc).isoformat()
+                batch, batch_writes = db.batch(), 0
+
+                def commit_batch():
+                    delta = salary_run_metrics.add_deltas(deltas)
+                    if delta:
+                        batch.update(run_ref, salary_run_metrics.increment_update(delta))
+                    batch.commit()
+                    committed.update(batch_ids)
+                    deltas.clear()
+                    batch_ids.clear()
+
+                try:
+                    for payslip_doc in all_payslips:
+                        payslip_data = payslip_doc.to_dict() or {}
+                        if payslip_data.get("status") == "PUBLISHED":
+                            continue
+                        updates = {
+                            "status": "PUBLISHED",
+                            "number": numbers[payslip_doc.id],
+                            "publishedAt": published_at,
+                            "publishedBy": current_user.get("uid"),
+                            "updatedAt": published_at
+                        }
+                        payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_doc.id)
+                        batch.update(payslip_ref, updates)
+                        payslip_summaries.apply(batch, db, org_id, payslip_doc.id, payslip_data, {**payslip_data, **updates})
+                        deltas.append(salary_run_metrics.metrics_delta(payslip_data, {**payslip_data, "status": "PUBLISHED"}))
+                        batch_ids.append(payslip_doc.id)
+                        batch_writes += 2
+                        if batch_writes >= 498:
+                            commit_batch()
+                            batch, batch_writes = db.batch(), 0
+                    if batch_writes:
+                        commit_batch()
+                finally:
+                    # Numbers of payslips whose batch never committed are recorded as unused
+                    for year, lease in blocks.items():
+                        used = [sequence for doc_id, (y, sequence) in sequences.items() if y == year and doc_id in committed]
+                        try:
+                            sequence_allocator.close_block(db, org_id, "PAYSLIP", year, lease, used)
+                        except Exception as e:
+                            logger.warning(f"Failed to close payslip number block {lease.lease_id} for run {run_id}: {e}")
             except Exception as e:
                 logger.error(f"Error updating payslips: {str(e)}")
                 raise HTTPException(
@@ -975,8 +840,7 @@ async def update_payslip(
     db = firestore.client()
     
     # Get current payslip
-    payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_id)
-    payslip = payslip_ref.get()
+    payslip = db.collection('organizations', org_id, 'payslips').document(payslip_id).get()
     
     if not payslip.exists:
         raise HTTPException(status_code=404, detail="Payslip not found")
@@ -991,44 +855,50 @@ async def update_payslip(
     run = run_ref.get()
     if not run.exists or run.to_dict().get("status") != "DRAFT":
         raise HTTPException(status_code=400, detail="Cannot update payslips in a published or paid run")
+    salary_run_metrics.ensure_run_metrics(db, org_id, payslip_data.get("runId"))
     
-    # Update allowed fields
-    update_data = {}
-    current_lines = payslip_data.get("lines", {})
-    
-    if edit_data.base is not None:
-        current_lines["base"] = edit_data.base
-    if edit_data.allowances is not None:
-        current_lines["allowances"] = edit_data.allowances
-    if edit_data.deductions is not None:
-        current_lines["deductions"] = edit_data.deductions
-    if edit_data.tax is not None:
-        current_lines["tax"] = edit_data.tax
-    if edit_data.remarks is not None:
-        update_data["remarks"] = edit_data.remarks
-    
-    # Recalculate totals
-    base_amount = current_lines.get("base", {}).get("amount", 0)
-    allowances_total = sum(a.get("amount", 0) for a in current_lines.get("allowances", []))
-    deductions_total = sum(d.get("amount", 0) for d in current_lines.get("deductions", []))
-    tax_amount = current_lines.get("tax", {}).get("amount", 0)
-    
-    gross_amount = base_amount + allowances_total
-    net_pay = gross_amount - deductions_total - tax_amount
-    
-    update_data.update({
-        "lines": current_lines,
-        "grossAmount": round_currency(gross_amount),
-        "totalAllowances": round_currency(allowances_total),
-        "totalDeductions": round_currency(deductions_total),
-        "totalTax": round_currency(tax_amount),
-        "netPay": round_currency(net_pay),
-        "updatedAt": datetime.now(timezone.utc).isoformat(),
-        "updatedBy": current_user.get("uid")
-    })
+    def build_update(current):
+        if current.get("status") != "DRAFT":
+            raise HTTPException(status_code=400, detail="Cannot update payslips that are not in DRAFT status")
+        
+        # Update allowed fields
+        update_data = {}
+        current_lines = current.get("lines", {})
+        
+        if edit_data.base is not None:
+            current_lines["base"] = edit_data.base
+        if edit_data.allowances is not None:
+            current_lines["allowances"] = edit_data.allowances
+        if edit_data.deductions is not None:
+            current_lines["deductions"] = edit_data.deductions
+        if edit_data.tax is not None:
+            current_lines["tax"] = edit_data.tax
+        if edit_data.remarks is not None:
+            update_data["remarks"] = edit_data.remarks
+        
+        # Recalculate totals
+        base_amount = current_lines.get("base", {}).get("amount", 0)
+        allowances_total = sum(a.get("amount", 0) for a in current_lines.get("allowances", []))
+        deductions_total = sum(d.get("amount", 0) for d in current_lines.get("deductions", []))
+        tax_amount = current_lines.get("tax", {}).get("amount", 0)
+        
+        gross_amount = base_amount + allowances_total
+        net_pay = gross_amount - deductions_total - tax_amount
+        
+        update_data.update({
+            "lines": current_lines,
+            "grossAmount": round_currency(gross_amount),
+            "totalAllowances": round_currency(allowances_total),
+            "totalDeductions": round_currency(deductions_total),
+            "totalTax": round_currency(tax_amount),
+            "netPay": round_currency(net_pay),
+            "updatedAt": datetime.now(timezone.utc).isoformat(),
+            "updatedBy": current_user.get("uid")
+        })
+        return update_data
     
-    # Update payslip
-    payslip_ref.update(update_data)
+    # Update payslip and the run aggregates together
+    salary_run_metrics.update_payslip_with_metrics(db, org_id, payslip_id, build_update)
     
     return {"status": "success", "payslipId": payslip_id}
 
@@ -1047,68 +917,21 @@ async def create_bulk_payment(
     if not payment_data.payslipIds:
         raise HTTPException(status_code=400, detail="No payslip IDs provided")
     
-    processed_payslips = []
-    skipped_payslips = []
-    
-    for payslip_id in payment_data.payslipIds:
-        try:
-            # Get payslip
-            payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_id)
-            payslip = payslip_ref.get()
-            
-            if not payslip.exists:
-                skipped_payslips.append({"id": payslip_id, "reason": "Payslip not found"})
-                continue
-            
-            payslip_data = payslip.to_dict()
-            
-            if payslip_data.get("status") == "PAID":
-                # Check idempotency
-                existing_payment = payslip_data.get("payment", {})
-                if existing_payment.get("idempotencyKey") == payment_data.idempotencyKey:
-                    skipped_payslips.append({"id": payslip_id, "reason": "Already processed with this idempotency key"})
-                    continue
-                else:
-                    skipped_payslips.append({"id": payslip_id, "reason": "Already paid"})
-                    continue
-            
-            if payslip_data.get("status") != "PUBLISHED":
-                skipped_payslips.append({"id": payslip_id, "reason": "Not in PUBLISHED status"})
-                continue
-            
-            # Record payment
-            payment_record = {
-                "method": payment_data.method,
-                "reference": payment_data.reference,
-                "paidAt": payment_data.paidAt,
-                "remarks": payment_data.remarks,
-                "idempotencyKey": payment_data.idempotencyKey,
-                "processedAt": datetime.now(timezone.utc).isoformat(),
-                "processedBy": current_user.get("uid"),
-                "amount": payslip_data.get("netPay", 0)
-            }
-            
-            # Update payslip
-            payslip_ref.update({
-                "status": "PAID",
-                "payment": payment_record,
-                "paidAt": payment_data.paidAt,
-                "paidBy": current_user.get("uid"),
-                "updatedAt": datetime.now(timezone.utc).isoformat()
-            })
-            
-            processed_payslips.append(payslip_id)
-            
-        except Exception as e:
-            logger.error(f"Error processing payslip {payslip_id}: {str(e)}")
-            skipped_payslips.append({"id": payslip_id, "reason": f"Error: {str(e)}"})
+    # Chunked commits: payslip updates, payment records and one run increment per chunk
+    result = await salary_payments.pay_payslips(
+        db, org_id, payment_data, current_user.get("uid"), payslip_ids=payment_data.payslipIds
+    )
+    processed_payslips = result.processed + result.already_processed
     
     return {
         "status": "success",
         "processed": len(processed_payslips),
-        "skipped": len(skipped_payslips),
+        "skipped": len(result.skipped),
         "processedPayslips": processed_payslips,
-        "skippedPayslips": skipped_payslips
+        "skippedPayslips": result.skipped,
+        "alreadyProcessed": len(result.already_processed),
+        "commits": result.commits,
+        "latencyMs": result.latency_ms
     }
 
 @router.post("/payslips/{payslip_id}/void")
@@ -1128,8 +951,7 @@ async def void_payslip(
     db = firestore.client()
     
     # Get payslip
-    payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_id)
-    payslip = payslip_ref.get()
+    payslip = db.collection('organizations', org_id, 'payslips').document(payslip_id).get()
     
     if not payslip.exists:
         raise HTTPException(status_code=404, detail="Payslip not found")
@@ -1137,15 +959,22 @@ async def void_payslip(
     payslip_data = payslip.to_dict()
     if payslip_data.get("status") == "VOID":
         raise HTTPException(status_code=400, detail="Payslip is already voided")
+    if payslip_data.get("runId"):
+        salary_run_metrics.ensure_run_metrics(db, org_id, payslip_data["runId"])
+    
+    def build_update(current):
+        if current.get("status") == "VOID":
+            raise HTTPException(status_code=400, detail="Payslip is already voided")
+        return {
+            "status": "VOID",
+            "voidReason": reason,
+            "voidedAt": datetime.now(timezone.utc).isoformat(),
+            "voidedBy": current_user.get("uid"),
+            "updatedAt": datetime.now(timezone.utc).isoformat()
+        }
     
-    # Update payslip
-    payslip_ref.update({
-        "status": "VOID",
-        "voidReason": reason,
-        "voidedAt": datetime.now(timezone.utc).isoformat(),
-        "voidedBy": current_user.get("uid"),
-        "updatedAt": datetime.now(timezone.utc).isoformat()
-    })
+    # Update payslip and the run aggregates together
+    salary_run_metrics.update_payslip_with_metrics(db, org_id, payslip_id, build_update)
     
     return {"status": "success", "payslipId": payslip_id}
 
@@ -1163,54 +992,30 @@ async def mark_payslip_paid(
     db = firestore.client()
     
     # Get payslip
-    payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_id)
-    payslip = payslip_ref.get()
+    payslip = db.collection('organizations', org_id, 'payslips').document(payslip_id).get()
     
     if not payslip.exists:
         raise HTTPException(status_code=404, detail="Payslip not found")
     
-    payslip_data = payslip.to_dict()
-    if payslip_data.get("status") == "PAID":
-        # Check idempotency key to avoid duplicate payments
-        existing_payment = payslip_data.get("payment", {})
-        if existing_payment.get("idempotencyKey") == payment_info.idempotencyKey:
+    run_id = (payslip.to_dict() or {}).get("runId")
+    if run_id:
+        salary_run_metrics.ensure_run_metrics(db, org_id, run_id)
+    
+    # Update payslip and the run aggregates together
+    try:
+        _, payslip_data = salary_run_metrics.update_payslip_with_metrics(
+            db, org_id, payslip_id,
+            lambda current: salary_payments.paid_update(current, payment_info, current_user.get("uid"), datetime.now(timezone.utc).isoformat())
+        )
+    except salary_payments.PaymentSkipped as skipped:
+        if skipped.already_processed:
             return {"status": "success", "message": "Payment already processed", "payslipId": payslip_id}
-        else:
+        if skipped.reason == "Already paid":
             raise HTTPException(status_code=400, detail="Payslip is already marked as paid")
-    
-    if payslip_data.get("status") != "PUBLISHED":
         raise HTTPException(status_code=400, detail="Can only mark published payslips as paid")
     
-    # Record payment
-    payment_data = {
-        "method": payment_info.method,
-        "reference": payment_info.reference,
-        "paidAt": payment_info.paidAt,
-        "remarks": payment_info.remarks,
-        "idempotencyKey": payment_info.idempotencyKey,
-        "processedAt": datetime.now(timezone.utc).isoformat(),
-        "processedBy": current_user.get("uid"),
-        "amount": payslip_data.get("netPay", 0)
-    }
-    
-    # Update payslip
-    update_timestamp = datetime.now(timezone.utc).isoformat()
-    payslip_ref.update({
-        "status": "PAID",
-        "payment": payment_data,
-        "paidAt": payment_info.paidAt,
-        "paidBy": current_user.get("uid"),
-        "updatedAt": update_timestamp
-    })
-
-    # Refresh local data for downstream helpers
-    payslip_data.update({
-        "status": "PAID",
-        "payment": payment_data,
-        "paidAt": payment_info.paidAt,
-        "paidBy": current_user.get("uid"),
-        "updatedAt": update_timestamp
-    })
+    if payslip_data is None:
+        raise HTTPException(status_code=404, detail="Payslip not found")
 
     # Record salary payment entry for dashboards
     record_salary_payment(
@@ -1221,11 +1026,6 @@ async def mark_payslip_paid(
         payment_info=payment_info,
         processed_by=current_user.get("uid"),
     )
-
-    # Update run aggregates
-    run_id = payslip_data.get("runId")
-    if run_id:
-        recalculate_run_metrics(db, org_id, run_id)
     
     return {"status": "success", "payslipId": payslip_id}
 
@@ -1252,119 +1052,105 @@ async def mark_all_payslips_paid(
     if run_data.get("status") not in ["PUBLISHED", "PAID"]:
         raise HTTPException(status_code=400, detail="Can only mark payslips as paid in PUBLISHED or PAID runs")
     
-    # Get all payslips for the run and process eligible ones
-    payslips_query = db.collection('organizations', org_id, 'payslips').where('runId', '==', run_id).get()
-    processed_at = datetime.now(timezone.utc).isoformat()
-
-    payslips_marked = 0
-    for payslip_doc in payslips_query:
-        payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_doc.id)
-        payslip_data = payslip_doc.to_dict() or {}
-        status = (payslip_data.get("status") or "").upper()
-
-        # Only convert published payslips; skip drafts or already paid
-        if status != "PUBLISHED":
-            continue
-
-        payment_data = {
-            "method": payment_info.method,
-            "reference": payment_info.reference,
-            "paidAt": payment_info.paidAt,
-            "remarks": payment_info.remarks,
-            "idempotencyKey": payment_info.idempotencyKey,
-            "processedAt": processed_at,
-            "processedBy": current_user.get("uid"),
-            "amount": payslip_data.get("netPay", 0)
-        }
-
-        payslip_ref.update({
-            "status": "PAID",
-            "payment": payment_data,
-            "paidAt": payment_info.paidAt,
-            "paidBy": current_user.get("uid"),
-            "updatedAt": processed_at
-        })
-
-        payslip_data.update({
-            "status": "PAID",
-            "payment": payment_data,
-            "paidAt": payment_info.paidAt,
-            "paidBy": current_user.get("uid"),
-            "updatedAt": processed_at
-        })
-
-        record_salary_payment(
-            db=db,
-            org_id=org_id,
-            payslip_id=payslip_doc.id,
-            payslip_data=payslip_data,
-            payment_info=payment_info,
-            processed_by=current_user.get("uid"),
-        )
-
-        payslips_marked += 1
-
-    if payslips_marked > 0:
-        metrics = recalculate_run_metrics(db, org_id, run_id)
+    # Pay every published payslip in a handful of chunked commits
+    result = await salary_payments.pay_payslips(
+        db, org_id, payment_info, current_user.get("uid"), run_id=run_id
+    )
+    payslips_marked = len(result.processed)
 
-        counts = (metrics or {}).get("counts", {})
+    if payslips_marked or result.already_processed:
+        counts = (run_ref.get().to_dict() or {}).get("counts", {})
         total_count = counts.get("total", 0)
         paid_count = counts.get("paid", 0)
 
-        if total_count and total_count == paid_count:
+        if total_count and total_count == paid_count and run_data.get("status") != "PAID":
             run_ref.update({
                 "status": "PAID",
                 "paidAt": payment_info.paidAt,
                 "paidBy": current_user.get("uid"),
-                "updatedAt": processed_at
+                "updatedAt": datetime.now(timezone.utc).isoformat()
             })
 
-    return {"status": "success", "payslipsMarked": payslips_marked}
+    return {
+        "status": "success",
+        "payslipsMarked": payslips_marked,
+        "alreadyProcessed": len(result.already_processed),
+        "commits": result.commits,
+        "latencyMs": result.latency_ms
+    }
+
+@router.get("/runs/{run_id}/metrics/verify")
+async def verify_run_metrics(
+    run_id: str,
+    repair: bool = Query(False, description="Overwrite the stored aggregates with the recomputed values"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Recompute a run's aggregates from its payslips and report any drift from the stored values"""
+    org_id = current_user.get("orgId")
+    if not is_authorized_for_salary_actions(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for salary operations")
+    
+    db = firestore.client()
+    result = salary_run_metrics.verify_run_metrics(db, org_id, run_id, repair=repair)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Salary run not found")
+    return result
+
 
 
+@router.get("/my-payslips/summary")
+async def get_my_payslips_summary(
+    current_user: dict = Depends(get_current_user)
+):
+    """Latest payslip, year-to-date totals and recent payslips for the current team member in one read"""
+    org_id = current_user.get("orgId")
+    user_id = current_user.get("uid")
+    
+    db = firestore.client()
+    return payslip_summaries.read_summary(db, org_id, user_id)
 
 @router.get("/my-payslips")
 async def get_my_payslips(
+    response: Response,
+    limit: int = Query(24, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Payslip ID from the previous page's X-Next-Cursor header"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all payslips for the current team member"""
+    """Get the current team member's payslips, newest period first"""
     org_id = current_user.get("orgId")
     user_id = current_user.get("uid")
     
     db = firestore.client()
+    payslips_collection = db.collection('organizations', org_id, 'payslips')
     
     try:
-        # Get all payslips for this user
-        payslips_query = db.collection('organizations', org_id, 'payslips').where(
+        # Served by the (userId, status, period.year desc, period.month desc) index
+        query = payslips_collection.where(
             "userId", "==", user_id
         ).where(
-            "status", "in", ["PUBLISHED", "PAID"]
-        ).get()
+            "status", "in", list(payslip_summaries.VISIBLE_STATUSES)
+        ).order_by(
+            "period.year", direction=firestore.Query.DESCENDING
+        ).order_by(
+            "period.month", direction=firestore.Query.DESCENDING
+        )
         
-        my_payslips = []
-        for payslip_doc in payslips_query:
-            payslip_data = payslip_doc.to_dict()
-            
-            # Include minimal data needed for listing
-            my_payslips.append({
-                "id": payslip_doc.id,
-                "runId": payslip_data.get("runId"),
-                "number": payslip_data.get("number"),
-                "period": payslip_data.get("period"),
-                "status": payslip_data.get("status"),
-                "netPay": payslip_data.get("netPay"),
-                "currency": payslip_data.get("currency"),
-                "paidAt": payslip_data.get("paidAt"),
-            })
+        if cursor:
+            cursor_doc = payslips_collection.document(cursor).get()
+            if not cursor_doc.exists or (cursor_doc.to_dict() or {}).get("userId") != user_id:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.start_after(cursor_doc)
+        
+        docs = query.select(payslip_summaries.LIST_FIELDS).limit(limit).get()
+        my_payslips = [payslip_summaries.list_item(doc.id, doc.to_dict() or {}) for doc in docs]
         
-        # Sort by period (year desc, month desc)
-        my_payslips.sort(key=lambda x: (
-            -1 * (x.get("period", {}).get("year", 0) or 0), 
-            -1 * (x.get("period", {}).get("month", 0) or 0)
-        ))
+        if len(my_payslips) == limit:
+            response.headers["X-Next-Cursor"] = my_payslips[-1]["id"]
         
         return my_payslips
         
+    except HTTPException:
+        raise
     except Exception as db_error:
         logger.error(f"Error in get_my_payslips: {str(db_error)}")
         
@@ -1373,33 +1159,23 @@ async def get_my_payslips(
         if "The query requires an index" in error_str:
             logger.info("Index error detected in get_my_payslips, falling back to simpler query")
             
-            # Fallback to a simpler query
-            simple_payslips_query = db.collection('organizations', org_id, 'payslips').where("userId", "==", user_id).get()
+            # Fallback to a simpler query, sorted and paged in memory
+            simple_payslips_query = payslips_collection.where("userId", "==", user_id).get()
             
-            my_payslips = []
-            for payslip_doc in simple_payslips_query:
-                payslip_data = payslip_doc.to_dict()
-                
-                # Only include published or paid payslips
-                if payslip_data.get("status") in ["PUBLISHED", "PAID"]:
-                    my_payslips.append({
-                        "id": payslip_doc.id,
-                        "runId": payslip_data.get("runId"),
-                        "number": payslip_data.get("number"),
-                        "period": payslip_data.get("period"),
-                        "status": payslip_data.get("status"),
-                        "netPay": payslip_data.get("netPay"),
-                        "currency": payslip_data.get("currency"),
-                        "paidAt": payslip_data.get("paidAt"),
-                    })
-            
-            # Sort manually in memory
-            my_payslips.sort(key=lambda x: (
-                -1 * (x.get("period", {}).get("year", 0) or 0), 
-                -1 * (x.get("period", {}).get("month", 0) or 0)
-            ))
+            my_payslips = [
+                payslip_summaries.list_item(doc.id, doc.to_dict() or {})
+                for doc in simple_payslips_query
+                if payslip_summaries.is_visible(doc.to_dict())
+            ]
+            my_payslips.sort(key=lambda item: (payslip_summaries.period_key(item), item["id"]), reverse=True)
             
-            return my_payslips
+            start = 0
+            if cursor:
+                start = next((i + 1 for i, item in enumerate(my_payslips) if item["id"] == cursor), len(my_payslips))
+            page = my_payslips[start:start + limit]
+            if start + limit < len(my_payslips):
+                response.headers["X-Next-Cursor"] = page[-1]["id"]
+            return page
         else:
             # For other errors, return empty list and log
             logger.error(f"Unhandled error in get_my_payslips: {str(db_error)}")
@@ -1419,54 +1195,16 @@ async def get_period_summary(
     
     db = firestore.client()
     
-    # Get payslips for the specified period
-    payslips_query = db.collection('organizations', org_id, 'payslips').where(
-        "period.month", "==", month
-    ).where(
-        "period.year", "==", year
-    ).get()
-    
-    total_gross = 0
-    total_deductions = 0
-    total_tax = 0
-    total_net = 0
-    count_total = 0
-    count_paid = 0
-    count_unpaid = 0
-    
-    for payslip_doc in payslips_query:
-        payslip_data = payslip_doc.to_dict()
-        
-        if payslip_data.get("status") == "VOID":
-            continue
-        
-        count_total += 1
-        total_gross += payslip_data.get("grossAmount", 0)
-        total_deductions += payslip_data.get("totalDeductions", 0)
-        total_tax += payslip_data.get("totalTax", 0)
-        total_net += payslip_data.get("netPay", 0)
-        
-        if payslip_data.get("status") == "PAID":
-            count_paid += 1
-        else:
-            count_unpaid += 1
-    
+    # The period's run document carries the aggregates; no payslip reads
     return {
         "period": {"month": month, "year": year},
-        "summary": {
-            "totalGross": round_currency(total_gross),
-            "totalDeductions": round_currency(total_deductions),
-            "totalTax": round_currency(total_tax),
-            "totalNet": round_currency(total_net),
-            "countTotal": count_total,
-            "countPaid": count_paid,
-            "countUnpaid": count_unpaid
-        }
+        "summary": payroll_analytics.period_summary(db, org_id, year, month)
     }
 
 @router.get("/reports/annual-summary")
 async def get_annual_summary(
     year: int = Query(..., ge=2000, le=2100),
+    includeDistribution: bool = Query(False, description="Add net pay percentiles computed from the payslip snapshot"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get annual salary summary"""
@@ -1476,82 +1214,21 @@ async def get_annual_summary(
     
     db = firestore.client()
     
-    # Get all payslips for the year
-    payslips_query = db.collection('organizations', org_id, 'payslips').where(
-        "period.year", "==", year
-    ).get()
-    
-    monthly_data = {}
-    annual_totals = {
-        "totalGross": 0,
-        "totalDeductions": 0,
-        "totalTax": 0,
-        "totalNet": 0,
-        "countTotal": 0,
-        "countPaid": 0
-    }
-    
-    for payslip_doc in payslips_query:
-        payslip_data = payslip_doc.to_dict()
-        
-        if payslip_data.get("status") == "VOID":
-            continue
-        
-        month = payslip_data.get("period", {}).get("month", 0)
-        if month not in monthly_data:
-            monthly_data[month] = {
-                "month": month,
-                "totalGross": 0,
-                "totalDeductions": 0,
-                "totalTax": 0,
-                "totalNet": 0,
-                "countTotal": 0,
-                "countPaid": 0
-            }
-        
-        # Update monthly data
-        monthly_data[month]["totalGross"] += payslip_data.get("grossAmount", 0)
-        monthly_data[month]["totalDeductions"] += payslip_data.get("totalDeductions", 0)
-        monthly_data[month]["totalTax"] += payslip_data.get("totalTax", 0)
-        monthly_data[month]["totalNet"] += payslip_data.get("netPay", 0)
-        monthly_data[month]["countTotal"] += 1
-        
-        if payslip_data.get("status") == "PAID":
-            monthly_data[month]["countPaid"] += 1
-        
-        # Update annual totals
-        annual_totals["totalGross"] += payslip_data.get("grossAmount", 0)
-        annual_totals["totalDeductions"] += payslip_data.get("totalDeductions", 0)
-        annual_totals["totalTax"] += payslip_data.get("totalTax", 0)
-        annual_totals["totalNet"] += payslip_data.get("netPay", 0)
-        annual_totals["countTotal"] += 1
-        
-        if payslip_data.get("status") == "PAID":
-            annual_totals["countPaid"] += 1
-    
-    # Convert to list and sort by month
-    monthly_summary = sorted(
-        [data for data in monthly_data.values()],
-        key=lambda x: x["month"]
-    )
-    
-    # Round currency values
-    for month_data in monthly_summary:
-        for key in ["totalGross", "totalDeductions", "totalTax", "totalNet"]:
-            month_data[key] = round_currency(month_data[key])
-    
-    for key in ["totalGross", "totalDeductions", "totalTax", "totalNet"]:
-        annual_totals[key] = round_currency(annual_totals[key])
-    
-    return {
+    # Monthly breakdown comes from the twelve run documents of the year
+    summary = payroll_analytics.annual_summary(db, org_id, year)
+    response = {
         "year": year,
-        "monthlyBreakdown": monthly_summary,
-        "annualTotals": annual_totals
+        "monthlyBreakdown": summary["monthlyBreakdown"],
+        "annualTotals": summary["annualTotals"]
     }
+    if includeDistribution:
+        snapshot = payroll_analytics.year_snapshot(db, org_id, year)
+        response["netPayPercentiles"] = payroll_analytics.net_percentiles(snapshot)
+    return response
 
 @router.get("/analytics/salary-trends")
 async def get_salary_trends(
-    months: int = Query(12, ge=1, le=24),
+    months: int = Query(12, ge=1, le=60),
     current_user: dict = Depends(get_current_user)
 ):
     """Get salary trends over specified months"""
@@ -1561,63 +1238,48 @@ async def get_salary_trends(
     
     db = firestore.client()
     
-    # Calculate date range
     from datetime import date
     import calendar
     
     current_date = date.today()
-    trends = []
+    periods = payroll_analytics.period_window(current_date.year, current_date.month, months)
     
-    for i in range(months):
-        # Calculate month and year
-        target_month = current_date.month - i
-        target_year = current_date.year
-        
-        if target_month <= 0:
-            target_month += 12
-            target_year -= 1
-        
-        # Get payslips for this month
-        payslips_query = db.collection('organizations', org_id, 'payslips').where(
-            "period.month", "==", target_month
-        ).where(
-            "period.year", "==", target_year
-        ).where(
-            "status", "!=", "VOID"
-        ).get()
-        
-        month_total = 0
-        employee_count = 0
-        
-        for payslip_doc in payslips_query:
-            payslip_data = payslip_doc.to_dict()
-            month_total += payslip_data.get("netPay", 0)
-            employee_count += 1
-        
-        trends.append({
-            "month": target_month,
-            "year": target_year,
-            "label": f"{calendar.month_abbr[target_month]} {target_year}",
-            "totalPayout": round_currency(month_total),
-            "employeeCount": employee_count,
-            "averageSalary": round_currency(month_total / employee_count if employee_count > 0 else 0)
-        })
-    
-    # Reverse to get chronological order
-    trends.reverse()
+    # One batched read of the window's run documents, oldest first
+    trends = payroll_analytics.salary_trends(db, org_id, periods)
+    for trend in trends:
+        trend["label"] = f"{calendar.month_abbr[trend['month']]} {trend['year']}"
     
     return {
         "period": f"Last {months} months",
         "trends": trends
     }
+
+@router.get("/analytics/employee-trends")
+async def get_employee_trends(
+    year: int = Query(..., ge=2000, le=2100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-employee monthly net pay for a year, plus the net pay distribution"""
+    org_id = current_user.get("orgId")
+    if not is_authorized_for_salary_actions(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for salary operations")
+    
+    db = firestore.client()
+    
+    snapshot = payroll_analytics.year_snapshot(db, org_id, year)
+    return {
+        "year": year,
+        "employees": payroll_analytics.employee_trends(snapshot),
+        "netPayPercentiles": payroll_analytics.net_percentiles(snapshot)
+    }
 # --- Export Endpoints ---
 @router.get("/runs/{run_id}/export")
 async def export_payslips(
     run_id: str,
-    format: str = Query("csv", enum=["csv"]),  # For now, only CSV is supported
+    format: str = Query("csv", enum=["csv", "xlsx"]),
     current_user: dict = Depends(get_current_user)
 ):
-    """Export all payslips in a run as CSV"""
+    """Stream all non-void payslips in a run as CSV or XLSX"""
     org_id = current_user.get("orgId")
     if not is_authorized_for_salary_actions(current_user):
         raise HTTPException(status_code=403, detail="Not authorized for salary operations")
@@ -1633,13 +1295,10 @@ async def export_payslips(
     run_data = run.to_dict()
     period = run_data.get("period", {})
     
-    # Get all payslips for this run
-    payslips_query = db.collection('organizations', org_id, 'payslips').where('runId', '==', run_id).get()
-    
-    # Prepare CSV data
-    csv_rows = []
+    payslips_query = db.collection('organizations', org_id, 'payslips')\
+        .where('runId', '==', run_id)\
+        .order_by('__name__')  # document id; gives the cursor a stable order
     
-    # Add header row
     header = [
         "Employee ID",
         "Employee Name",
@@ -1657,44 +1316,33 @@ async def export_payslips(
         "Payment Reference",
         "Remarks"
     ]
-    csv_rows.append(",".join([f'"{h}"' for h in header]))
     
-    # Add data rows
-    for payslip_doc in payslips_query:
-        payslip_data = payslip_doc.to_dict()
-        
-        # Skip voided payslips unless explicitly requested
+    def to_row(doc_id, payslip_data):
+        # Skip voided payslips
         if payslip_data.get("status") == "VOID":
-            continue
+            return None
         
         payment = payslip_data.get("payment", {})
-        row = [
+        return [
             payslip_data.get("userId", ""),
             payslip_data.get("userName", ""),
             payslip_data.get("number", ""),
             payslip_data.get("status", ""),
-            str(payslip_data.get("lines", {}).get("base", {}).get("amount", 0)),
-            str(payslip_data.get("totalAllowances", 0)),
-            str(payslip_data.get("totalDeductions", 0)),
-            str(payslip_data.get("totalTax", 0)),
-            str(payslip_data.get("grossAmount", 0)),
-            str(payslip_data.get("netPay", 0)),
+            payslip_data.get("lines", {}).get("base", {}).get("amount", 0),
+            payslip_data.get("totalAllowances", 0),
+            payslip_data.get("totalDeductions", 0),
+            payslip_data.get("totalTax", 0),
+            payslip_data.get("grossAmount", 0),
+            payslip_data.get("netPay", 0),
             payslip_data.get("currency", "INR"),
             payment.get("method", ""),
             payment.get("paidAt", ""),
             payment.get("reference", ""),
             payslip_data.get("remarks", "")
         ]
-        csv_rows.append(",".join([f'"{str(cell)}"' for cell in row]))
-    
-    # Join rows with newlines
-    csv_content = "\n".join(csv_rows)
     
-    return {
-        "content": csv_content, 
-        "filename": f"payslips_{period.get('label', run_id)}.csv",
-        "runId": run_id
-    }
+    stem = f"payslips_{period.get('label', run_id)}"
+    return export_response(stem, header, project_rows(paginate(payslips_query), to_row), format, "Payslips")
 
 @router.get("/settings")
 async def get_salary_settings(
@@ -1780,32 +1428,13 @@ async def get_salary_dashboard(
     current_month = now.month
     current_year = now.year
     
-    # Get current month's run
-    current_run_query = db.collection('organizations', org_id, 'salaryRuns').where(
-        "period.month", "==", current_month
-    ).where(
-        "period.year", "==", current_year
-    ).limit(1).get()
-    
-    current_run = None
-    if current_run_query:
-        current_run_doc = current_run_query[0]
-        current_run = current_run_doc.to_dict()
-        current_run["id"] = current_run_doc.id
-    
-    # Get recent runs
-    recent_runs_query = db.collection('organizations', org_id, 'salaryRuns').limit(5).get()
-    recent_runs = []
-    for run_doc in recent_runs_query:
-        run_data = run_doc.to_dict()
-        run_data["id"] = run_doc.id
-        recent_runs.append(run_data)
-    
-    # Sort recent runs by period (latest first)
-    recent_runs.sort(key=lambda x: (
-        -x.get("period", {}).get("year", 0),
-        -x.get("period", {}).get("month", 0)
-    ))
+    # Runs are keyed by period, so the current and recent runs are direct reads
+    recent_periods = payroll_analytics.period_window(current_year, current_month, 12)
+    runs = payroll_analytics.load_period_runs(db, org_id, recent_periods)
+    current_run = runs.get((current_year, current_month))
+    
+    # Latest periods first
+    recent_runs = [runs[period] for period in reversed(recent_periods) if period in runs]
     
     # Get summary statistics
     total_employees = 0
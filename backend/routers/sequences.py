@@ -7,6 +7,7 @@ from uuid import uuid4
 import logging
 
 from ..dependencies import get_current_user
+from ..services import sequence_allocator
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +18,7 @@ router = APIRouter(
 
 # --- Pydantic Models ---
 class SequenceAllocation(BaseModel):
-    type: str = Field(..., pattern="^(INVOICE|CREDIT_NOTE|BILL|PAYSLIP)$")
+    type: str = Field(..., pattern="^(INVOICE|QUOTE|CREDIT_NOTE|BILL|PAYSLIP)$")
     year: int = Field(..., ge=2000, le=2100)
     idempotencyKey: str = Field(default_factory=lambda: uuid4().hex)
 
@@ -40,18 +41,11 @@ def is_authorized_for_sequences(current_user: dict) -> bool:
 
 def get_sequence_prefix(doc_type: str, year: int) -> str:
     """Get prefix for sequence based on type and year"""
-    prefixes = {
-        "INVOICE": f"INV-{year}-",
-        "CREDIT_NOTE": f"CN-{year}-",
-        "BILL": f"BILL-{year}-",
-        "PAYSLIP": f"PAY-{year}-"
-    }
-    return prefixes.get(doc_type, f"{doc_type}-{year}-")
+    return sequence_allocator.sequence_prefix(doc_type, year)
 
 def format_document_number(doc_type: str, year: int, sequence: int) -> str:
     """Format complete document number"""
-    prefix = get_sequence_prefix(doc_type, year)
-    return f"{prefix}{sequence:04d}"
+    return sequence_allocator.format_number(doc_type, year, sequence)
 
 def audit_log(db, org_id: str, entity: str, action: str, actor: str, payload_summary: str = ""):
     """Log audit events"""
@@ -69,80 +63,15 @@ def audit_log(db, org_id: str, entity: str, action: str, actor: str, payload_sum
 
 def allocate_sequence_number(db, org_id: str, doc_type: str, year: int, idempotency_key: str) -> dict:
     """
-    Allocate next sequence number atomically with idempotency support.
+    Allocate next sequence number with idempotency support.
     Returns: {"number": "INV-2025-0001", "sequence": 1, "isNew": True}
     """
-    sequence_id = f"{doc_type}_{year}"
-    sequence_ref = db.collection('organizations', org_id, 'numberSequences').document(sequence_id)
-    
-    # Check for existing allocation with same idempotency key
-    allocations_query = db.collection('organizations', org_id, 'sequenceAllocations').where(
-        'idempotencyKey', '==', idempotency_key
-    ).where(
-        'type', '==', doc_type
-    ).where(
-        'year', '==', year
-    ).limit(1).get()
-    
-    if allocations_query:
-        # Return existing allocation
-        existing = allocations_query[0].to_dict()
-        return {
-            "number": existing.get('number'),
-            "sequence": existing.get('sequence'),
-            "isNew": False
-        }
-    
-    # Atomic transaction to allocate new number
-    @firestore.transactional
-    def allocate_in_transaction(transaction):
-        sequence_doc = sequence_ref.get(transaction=transaction)
-        
-        if sequence_doc.exists:
-            sequence_data = sequence_doc.to_dict()
-            next_num = sequence_data.get('next', 1)
-        else:
-            next_num = 1
-            # Initialize sequence document
-            sequence_init = {
-                "orgId": org_id,
-                "type": doc_type,
-                "year": year,
-                "prefix": get_sequence_prefix(doc_type, year),
-                "next": 1,
-                "createdAt": get_utc_now(),
-                "updatedAt": get_utc_now()
-            }
-            transaction.set(sequence_ref, sequence_init)
-        
-        # Increment next number
-        transaction.update(sequence_ref, {
-            "next": next_num + 1,
-            "updatedAt": get_utc_now()
-        })
-        
-        # Record allocation for idempotency
-        allocation_ref = db.collection('organizations', org_id, 'sequenceAllocations').document()
-        allocation_data = {
-            "orgId": org_id,
-            "type": doc_type,
-            "year": year,
-            "sequence": next_num,
-            "number": format_document_number(doc_type, year, next_num),
-            "idempotencyKey": idempotency_key,
-            "allocatedAt": get_utc_now()
-        }
-        transaction.set(allocation_ref, allocation_data)
-        
-        return {
-            "number": format_document_number(doc_type, year, next_num),
-            "sequence": next_num,
-            "isNew": True
-        }
-    
-    # Execute transaction
-    transaction = db.transaction()
-    return allocate_in_transaction(transaction)
+    result = sequence_allocator.allocate_idempotent(db, org_id, doc_type, year, idempotency_key)
+    return {
+        "number": result.number,
+        "sequence": result.sequence,
+        "isNew": result.is_new
+    }
 
 # --- API Endpoints ---
 @router.get("/")
@@ -181,7 +110,7 @@ async def get_sequence(
         raise HTTPException(status_code=403, detail="Not authorized to view sequences")
     
     # Validate doc_type
-    valid_types = ["INVOICE", "CREDIT_NOTE", "BILL", "PAYSLIP"]
+    valid_types = list(sequence_allocator.SEQUENCE_TYPES)
     if doc_type not in valid_types:
         raise HTTPException(status_code=400, detail=f"Invalid document type. Must be one of: {valid_types}")
     
@@ -282,7 +211,7 @@ async def validate_sequence_integrity(
         raise HTTPException(status_code=403, detail="Not authorized for validation")
     
     # Validate doc_type
-    valid_types = ["INVOICE", "CREDIT_NOTE", "BILL", "PAYSLIP"]
+    valid_types = list(sequence_allocator.SEQUENCE_TYPES)
     if doc_type not in valid_types:
         raise HTTPException(status_code=400, detail=f"Invalid document type. Must be one of: {valid_types}")
     
@@ -297,6 +226,9 @@ async def validate_sequence_integrity(
     
     allocated_numbers = [doc.to_dict().get('sequence') for doc in allocations_query]
     
+    # Numbers are handed out in leased blocks; leases account for any gaps
+    leases = sequence_allocator.lease_report(db, org_id, doc_type, year)
+    
     if not allocated_numbers:
         return {
             "type": doc_type,
@@ -305,7 +237,8 @@ async def validate_sequence_integrity(
             "gaps": [],
             "duplicates": [],
             "highestAllocated": 0,
-            "totalAllocated": 0
+            "totalAllocated": 0,
+            **leases
         }
     
     # Detect gaps
@@ -331,5 +264,6 @@ async def validate_sequence_integrity(
         "gaps": gaps,
         "duplicates": duplicates,
         "highestAllocated": max(allocated_numbers) if allocated_numbers else 0,
-        "totalAllocated": len(allocated_numbers)
+        "totalAllocated": len(allocated_numbers),
+        **leases
     }
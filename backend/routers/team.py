@@ -466,50 +466,69 @@ async def assign_teammate_codes(req: BulkTeammateCodeRequest, current_user: dict
     org_data = org_doc.to_dict() if org_doc.exists else {}
     pattern = org_data.get("codePattern", "{ORGCODE}-{ROLE}-{NUMBER:5}")
 
-    results = []
-    for teammate_uid in req.teammateUids:
-        member_ref = db.collection('organizations', org_id, 'team').document(teammate_uid)
-        member_doc = member_ref.get()
-        if not member_doc.exists:
-            results.append({"teammateUid": teammate_uid, "status": "not_found"})
+    # Read every member in one round trip, then allocate all codes in a single reservation.
+    team_collection = db.collection('organizations', org_id, 'team')
+    unique_uids = list(dict.fromkeys(req.teammateUids))
+    member_docs = {
+        snapshot.id: snapshot
+        for snapshot in db.get_all([team_collection.document(uid) for uid in unique_uids])
+    }
+
+    results: Dict[str, dict] = {}
+    pending = []
+    for teammate_uid in unique_uids:
+        member_doc = member_docs.get(teammate_uid)
+        if member_doc is None or not member_doc.exists:
+            results[teammate_uid] = {"teammateUid": teammate_uid, "status": "not_found"}
             continue
 
         member_data = member_doc.to_dict() or {}
         employee_code = _extract_employee_code(member_data)
         if employee_code and not req.force:
-            results.append({"teammateUid": teammate_uid, "status": "skipped", "code": employee_code})
+            results[teammate_uid] = {"teammateUid": teammate_uid, "status": "skipped", "code": employee_code}
             continue
 
         role_value = member_data.get("role") or member_data.get("profile", {}).get("role")
         if not role_value:
-            results.append({"teammateUid": teammate_uid, "status": "missing_role"})
+            results[teammate_uid] = {"teammateUid": teammate_uid, "status": "missing_role"}
             continue
 
-        normalized_role = _normalize_role_for_code(role_value)
+        pending.append((teammate_uid, _normalize_role_for_code(role_value)))
+
+    latency_ms = 0.0
+    if pending:
         try:
-            allocation = await teammate_codes.allocate_teammate_code(
+            allocation = await teammate_codes.allocate_teammate_codes_bulk(
                 firestore,
                 org_code,
-                normalized_role,
+                pending,
                 expected_org_id=org_id,
-                teammate_uid=teammate_uid,
                 pattern=pattern,
             )
-            results.append(
-                {
-                    "teammateUid": teammate_uid,
+            latency_ms = allocation.latency_ms
+            for assignment in allocation.assignments:
+                if assignment.status != "assigned":
+                    results[assignment.teammate_uid] = {"teammateUid": assignment.teammate_uid, "status": "failed"}
+                    continue
+                results[assignment.teammate_uid] = {
+                    "teammateUid": assignment.teammate_uid,
                     "status": "assigned",
-                    "code": allocation.code,
-                    "role": allocation.role,
-                    "number": allocation.number,
+                    "code": assignment.code,
+                    "role": assignment.role,
+                    "number": assignment.number,
                 }
-            )
         except teammate_codes.AllocationExhaustedError:
-            results.append({"teammateUid": teammate_uid, "status": "conflict"})
+            for teammate_uid, _ in pending:
+                results[teammate_uid] = {"teammateUid": teammate_uid, "status": "conflict"}
         except teammate_codes.AllocationFailedError:
-            results.append({"teammateUid": teammate_uid, "status": "failed"})
+            for teammate_uid, _ in pending:
+                results[teammate_uid] = {"teammateUid": teammate_uid, "status": "failed"}
 
-    return {"orgCode": org_code, "results": results}
+    return {
+        "orgCode": org_code,
+        "results": [results[uid] for uid in unique_uids],
+        "latencyMs": round(latency_ms, 1),
+    }
 
 @router.put("/members/{member_id}")
 async def update_team_member(member_id: str, req: TeamMemberUpdateRequest, current_user: dict = Depends(get_current_user)):
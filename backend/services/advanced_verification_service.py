@@ -1,11 +1,14 @@
 import logging
 import hashlib
 import io
+import time
 import imagehash
 from typing import Dict, List, Any, Optional, Tuple
 from PIL import Image, ImageChops, ImageEnhance
 import numpy as np
 
+from .receipt_index import hamming, hash_to_int, normalize_ride_id
+
 logger = logging.getLogger(__name__)
 
 class AdvancedReceiptVerificationService:
@@ -21,7 +24,9 @@ class AdvancedReceiptVerificationService:
         self.thresholds = {
             "PHASH_TEMPLATE": 12, # If distance < 12, it's the same App UI
             "DHASH_EXACT": 4,     # If distance < 4, it's the same file (suspicious)
-            "ELA_HIGH": 70        # If score > 70, likely edited
+            "ELA_HIGH": 70,       # If score > 70, likely edited
+            "REJECT_SCORE": 80,   # Risk score at or above which a receipt is rejected
+            "REVIEW_SCORE": 40    # ... and at or above which it needs manual review
         }
 
     def preprocess_image(self, image_bytes: bytes) -> Tuple[Image.Image, bytes]:
@@ -82,11 +87,29 @@ class AdvancedReceiptVerificationService:
             return {"manipulation_score": 0, "is_manipulated": False}
 
     def comprehensive_image_analysis(self, image_bytes: bytes) -> Dict[str, Any]:
-        """Run all image-based checks"""
+        """
+        Run all image-based checks. The image is decoded and resized once; the
+        grayscale conversion of that buffer is shared by both hashes (imagehash
+        would otherwise convert it twice). ``timings_ms`` reports each stage.
+        """
+        timings = {}
+        started = time.perf_counter()
         image, _ = self.preprocess_image(image_bytes)
+        timings["decode_resize"] = round((time.perf_counter() - started) * 1000, 2)
+
+        stage = time.perf_counter()
+        gray = image.convert('L')
+        hashes = self.calculate_hashes(gray)
+        timings["hashes"] = round((time.perf_counter() - stage) * 1000, 2)
+
+        stage = time.perf_counter()
+        ela = self.perform_ela_analysis(image)
+        timings["ela"] = round((time.perf_counter() - stage) * 1000, 2)
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
         return {
-            "perceptual_hashes": self.calculate_hashes(image),
-            "ela_analysis": self.perform_ela_analysis(image)
+            "perceptual_hashes": hashes,
+            "ela_analysis": ela,
+            "timings_ms": timings
         }
 
     def find_duplicate_receipts(self, current_hashes, current_ride_id, existing_receipts):
@@ -94,9 +117,13 @@ class AdvancedReceiptVerificationService:
         The Core Logic:
         - Ride ID Match = FATAL (Reject)
         - pHash Match = INFO (Template Detection)
+
+        ``existing_receipts`` only needs the candidates from ``receipt_index``,
+        not the org's whole receipt history.
         """
         duplicates = []
-        current_ride_id_clean = str(current_ride_id).strip().lower() if current_ride_id else None
+        current_ride_id_clean = normalize_ride_id(current_ride_id)
+        current_phash = hash_to_int(current_hashes.get("phash"))
 
         for existing in existing_receipts:
             extracted = existing.get("extractedData", {})
@@ -118,11 +145,10 @@ class AdvancedReceiptVerificationService:
                     continue # Stop checking this receipt, we found the smoking gun
 
             # CHECK 2: VISUALS (pHash)
-            if "phash" in current_hashes and "phash" in existing_hashes:
-                h1 = imagehash.hex_to_hash(current_hashes["phash"])
-                h2 = imagehash.hex_to_hash(existing_hashes["phash"])
+            if current_phash is not None and "phash" in existing_hashes:
+                existing_phash = hash_to_int(existing_hashes["phash"])
                 
-                if (h1 - h2) < self.thresholds["PHASH_TEMPLATE"]:
+                if existing_phash is not None and hamming(current_phash, existing_phash) < self.thresholds["PHASH_TEMPLATE"]:
                     # It looks like the same app. This is NOT fraud yet.
                     # We flag it as a template match.
                     duplicates.append({
@@ -173,9 +199,9 @@ class AdvancedReceiptVerificationService:
         # Final Decision Logic
         risk_score = min(100, risk_score)
         
-        if risk_score >= 80:
+        if risk_score >= self.thresholds["REJECT_SCORE"]:
             decision = "REJECT"
-        elif risk_score >= 40:
+        elif risk_score >= self.thresholds["REVIEW_SCORE"]:
             decision = "MANUAL_REVIEW"
         
         return {
@@ -184,4 +210,37 @@ class AdvancedReceiptVerificationService:
             "issues": issues
         }
 
+    def calculate_risk_scores_bulk(self, ela_scores, has_amount, has_ride_id, id_duplicate_of, thresholds=None):
+        """
+        ``calculate_comprehensive_risk_score`` for many stored receipts at once.
+
+        Takes one entry per receipt: the ELA manipulation score, whether an
+        amount and a ride ID were extracted, and the receipt ID it duplicates
+        by ride ID (or None). ``thresholds`` overrides ``self.thresholds``.
+        """
+        t = {**self.thresholds, **(thresholds or {})}
+        ela = np.asarray(ela_scores, dtype=float)
+        amount = np.asarray(has_amount, dtype=bool)
+        ride = np.asarray(has_ride_id, dtype=bool)
+        duplicate = np.array([bool(d) for d in id_duplicate_of], dtype=bool)
+        manipulated = ela > t["ELA_HIGH"]
+
+        scores = np.minimum(100, 100 * duplicate + 40 * manipulated + 20 * ~amount + 15 * ~ride)
+        decisions = np.where(scores >= t["REJECT_SCORE"], "REJECT",
+                             np.where(scores >= t["REVIEW_SCORE"], "MANUAL_REVIEW", "AUTO_APPROVE"))
+
+        results = []
+        for i, score in enumerate(scores.tolist()):
+            issues = []
+            if duplicate[i]:
+                issues.append(f"Duplicate Ride ID found (Receipt {id_duplicate_of[i]})")
+            if manipulated[i]:
+                issues.append("High likelihood of digital manipulation (Photoshop).")
+            if not amount[i]:
+                issues.append("Amount not detected.")
+            if not ride[i]:
+                issues.append("Ride ID missing.")
+            results.append({"risk_score": int(score), "decision": str(decisions[i]), "issues": issues})
+        return results
+
 advanced_verification_service = AdvancedReceiptVerificationService()
\ No newline at end of file
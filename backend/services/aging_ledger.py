@@ -0,0 +1,257 @@
+"""
+Incremental AR/AP aging aggregates.
+
+Each org keeps one aggregate document per ledger under
+``organizations/{orgId}/aggregates/{ledger}`` holding a histogram of open
+balances keyed by due date (``YYYY-MM-DD``) plus per-client/vendor balances.
+Routers report every change to an invoice or bill through
+``record_transition`` with the document before and after the write; the
+difference is applied with ``firestore.Increment`` so concurrent writers never
+contend on a transaction.
+
+Aging buckets for any "as of" day are derived from the histogram by shifting
+each due date against that day, so the cost depends on the number of distinct
+due dates rather than the number of open documents.
+
+Only ``rebuild_ledger`` stamps ``rebuiltAt``. Increments alone create a
+partial document holding just the activity since deploy, so a ledger without
+the marker is rebuilt from its open documents on first read.
+"""
+import logging
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Optional
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+AR_LEDGER = "arAging"
+AP_LEDGER = "apAging"
+
+AGING_BUCKETS = ("0-15", "16-30", "31-60", "61-90", "90+")
+
+# Histogram key for open balances that have no due date; always "current".
+NO_DUE_DATE = "none"
+
+AR_OPEN_STATUSES = ["SENT", "PARTIAL", "OVERDUE"]
+AP_OPEN_STATUSES = ["SCHEDULED", "PARTIAL", "OVERDUE"]
+
+# Balances below this are treated as settled (rounding noise).
+_EPSILON = 0.005
+
+
+def ledger_ref(db, org_id: str, ledger: str):
+    return db.collection("organizations").document(org_id).collection("aggregates").document(ledger)
+
+
+def due_day_key(due_date: Any) -> str:
+    """Normalize a stored due date (ISO string or datetime) to a UTC day key."""
+    if not due_date:
+        return NO_DUE_DATE
+    try:
+        if isinstance(due_date, datetime):
+            due_dt = due_date
+        else:
+            due_dt = datetime.fromisoformat(str(due_date).replace("Z", "+00:00"))
+        if due_dt.tzinfo is not None:
+            due_dt = due_dt.astimezone(timezone.utc)
+        return due_dt.date().isoformat()
+    except (TypeError, ValueError):
+        return NO_DUE_DATE
+
+
+def bucket_for_days(days_overdue: int) -> Optional[str]:
+    """Map days past due to an aging bucket (None when not yet overdue)."""
+    if days_overdue <= 0:
+        return None
+    if days_overdue <= 15:
+        return "0-15"
+    if days_overdue <= 30:
+        return "16-30"
+    if days_overdue <= 60:
+        return "31-60"
+    if days_overdue <= 90:
+        return "61-90"
+    return "90+"
+
+
+def open_balance(ledger: str, doc: Optional[Dict[str, Any]]) -> float:
+    """Amount a document contributes to the ledger (0 when it is not open)."""
+    if not doc:
+        return 0.0
+    amount_due = float((doc.get("totals") or {}).get("amountDue", 0) or 0)
+    if amount_due <= _EPSILON:
+        return 0.0
+    status = doc.get("status")
+    if ledger == AR_LEDGER:
+        if doc.get("type", "FINAL") == "BUDGET" or status not in AR_OPEN_STATUSES:
+            return 0.0
+    elif status not in AP_OPEN_STATUSES:
+        return 0.0
+    return amount_due
+
+
+def _party_id(ledger: str, doc: Dict[str, Any]) -> str:
+    key = "clientId" if ledger == AR_LEDGER else "vendorId"
+    return doc.get(key) or "Unknown"
+
+
+def transition_delta(ledger: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compute histogram/party/total deltas for a document changing from before to after."""
+    histogram: Dict[str, float] = {}
+    parties: Dict[str, float] = {}
+    outstanding = 0.0
+    open_count = 0
+
+    for doc, sign in ((before, -1), (after, 1)):
+        amount = open_balance(ledger, doc)
+        if not amount:
+            continue
+        day = due_day_key(doc.get("dueDate"))
+        party = _party_id(ledger, doc)
+        histogram[day] = histogram.get(day, 0.0) + sign * amount
+        parties[party] = parties.get(party, 0.0) + sign * amount
+        outstanding += sign * amount
+        open_count += sign
+
+    return {
+        "dueHistogram": {k: v for k, v in histogram.items() if abs(v) > _EPSILON},
+        "partyBalances": {k: v for k, v in parties.items() if abs(v) > _EPSILON},
+        "outstanding": outstanding,
+        "openCount": open_count,
+    }
+
+
+def record_transition(db, org_id: str, ledger: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+    """Apply the aging delta for one document write. Never raises; drift is repaired by rebuild_ledger."""
+    try:
+        delta = transition_delta(ledger, before, after)
+        if not delta["dueHistogram"] and not delta["partyBalances"] and not delta["openCount"]:
+            return
+        payload = {
+            "outstanding": firestore.Increment(delta["outstanding"]),
+            "openCount": firestore.Increment(delta["openCount"]),
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        }
+        # Empty maps would replace the stored map under merge, so only send non-empty ones.
+        for key in ("dueHistogram", "partyBalances"):
+            if delta[key]:
+                payload[key] = {k: firestore.Increment(v) for k, v in delta[key].items()}
+        ledger_ref(db, org_id, ledger).set(payload, merge=True)
+    except Exception as e:
+        logger.warning(f"Failed to update {ledger} aggregate for org {org_id}: {e}")
+
+
+def _as_of_day(as_of: Optional[Any]) -> date:
+    if as_of is None:
+        return datetime.now(timezone.utc).date()
+    if isinstance(as_of, datetime):
+        return (as_of.astimezone(timezone.utc) if as_of.tzinfo else as_of).date()
+    if isinstance(as_of, date):
+        return as_of
+    return date.fromisoformat(due_day_key(as_of))
+
+
+def snapshot_from_aggregate(aggregate: Dict[str, Any], as_of: Optional[Any] = None) -> Dict[str, Any]:
+    """Derive aging buckets and due-soon totals for ``as_of`` (default: today, UTC)."""
+    as_of_day = _as_of_day(as_of)
+    buckets = {bucket: 0.0 for bucket in AGING_BUCKETS}
+    current = 0.0
+    due_next_7 = 0.0
+    due_next_30 = 0.0
+
+    for day_key, amount in (aggregate.get("dueHistogram") or {}).items():
+        amount = float(amount or 0)
+        if amount <= _EPSILON:
+            continue
+        if day_key == NO_DUE_DATE:
+            current += amount
+            continue
+        days_overdue = (as_of_day - date.fromisoformat(day_key)).days
+        bucket = bucket_for_days(days_overdue)
+        if bucket:
+            buckets[bucket] += amount
+            continue
+        current += amount
+        if -days_overdue <= 7:
+            due_next_7 += amount
+        elif -days_overdue <= 30:
+            due_next_30 += amount
+
+    party_balances = {
+        party: round(float(amount), 2)
+        for party, amount in (aggregate.get("partyBalances") or {}).items()
+        if float(amount or 0) > _EPSILON
+    }
+    overdue = sum(buckets.values())
+
+    return {
+        "asOf": as_of_day.isoformat(),
+        "buckets": {k: round(v, 2) for k, v in buckets.items()},
+        "outstanding": round(overdue + current, 2),
+        "overdue": round(overdue, 2),
+        "current": round(current, 2),
+        "dueNext7Days": round(due_next_7, 2),
+        "dueNext30Days": round(due_next_30, 2),
+        "openCount": int(aggregate.get("openCount", 0) or 0),
+        "partyBalances": party_balances,
+    }
+
+
+def ensure_backfilled(db, org_id: str, ledger: str):
+    """The ledger snapshot document, rebuilding first for orgs that predate the aggregates."""
+    doc = ledger_ref(db, org_id, ledger).get()
+    if not (doc.exists and (doc.to_dict() or {}).get("rebuiltAt")):
+        rebuild_ledger(db, org_id, ledger)
+        doc = ledger_ref(db, org_id, ledger).get()
+    return doc
+
+
+def get_aging_snapshot(db, org_id: str, ledger: str, as_of: Optional[Any] = None) -> Dict[str, Any]:
+    """Read the aggregate document (one read once backfilled) and derive the aging snapshot."""
+    doc = ensure_backfilled(db, org_id, ledger)
+    aggregate = doc.to_dict() if doc.exists else {}
+    return snapshot_from_aggregate(aggregate or {}, as_of)
+
+
+def top_parties(snapshot: Dict[str, Any], limit: int = 5):
+    """Largest open balances as (partyId, amount) pairs."""
+    balances = snapshot.get("partyBalances", {})
+    return sorted(balances.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def rebuild_ledger(db, org_id: str, ledger: str) -> Dict[str, Any]:
+    """
+    Recompute a ledger from the open documents and overwrite the aggregate.
+
+    Used to backfill orgs created before incremental maintenance and to repair
+    drift. Returns the outstanding total before and after so callers can report it.
+    """
+    collection = "invoices" if ledger == AR_LEDGER else "bills"
+    statuses = AR_OPEN_STATUSES if ledger == AR_LEDGER else AP_OPEN_STATUSES
+    query = db.collection("organizations", org_id, collection).where("status", "in", statuses)
+
+    fresh = {"dueHistogram": {}, "partyBalances": {}, "outstanding": 0.0, "openCount": 0}
+    for doc in query.stream():
+        delta = transition_delta(ledger, None, doc.to_dict())
+        for key in ("dueHistogram", "partyBalances"):
+            for k, v in delta[key].items():
+                fresh[key][k] = fresh[key].get(k, 0.0) + v
+        fresh["outstanding"] += delta["outstanding"]
+        fresh["openCount"] += delta["openCount"]
+
+    ref = ledger_ref(db, org_id, ledger)
+    previous = ref.get()
+    previous_data = previous.to_dict() if previous.exists else {}
+
+    ref.set({**fresh, "rebuiltAt": firestore.SERVER_TIMESTAMP, "updatedAt": firestore.SERVER_TIMESTAMP})
+
+    previous_outstanding = round(float((previous_data or {}).get("outstanding", 0) or 0), 2)
+    rebuilt_outstanding = round(fresh["outstanding"], 2)
+    return {
+        "ledger": ledger,
+        "openCount": fresh["openCount"],
+        "previousOutstanding": previous_outstanding,
+        "outstanding": rebuilt_outstanding,
+        "drift": round(rebuilt_outstanding - previous_outstanding, 2),
+    }
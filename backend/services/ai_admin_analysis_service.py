@@ -4,7 +4,6 @@ Uses OpenRouter API for intelligent receipt analysis and decision support
 """
 
 import logging
-import requests
 import os
 import json
 import re
@@ -12,6 +11,8 @@ from typing import Dict, List, Optional, Any
 from datetime import datetime, timezone
 from dataclasses import dataclass
 
+from . import llm_client
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -63,19 +64,11 @@ class AIAdminAnalysisService:
             "REJECT": 80
         }
     
-    def get_openrouter_analysis(self, prompt_text: str) -> Dict[str, Any]:
-        """Get AI analysis using OpenRouter API (same as events.py)"""
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        if not api_key:
-            raise ValueError("OPENROUTER_API_KEY not configured")
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "google/gemma-2-9b-it:free",  # Free model that works well
-            "messages": [
+    async def get_openrouter_analysis(self, prompt_text: str) -> Dict[str, Any]:
+        """Get AI analysis through the shared LLM client"""
+        logger.info("OpenRouter request for receipt analysis")
+        response = await llm_client.chat(
+            [
                 {
                     "role": "system", 
                     "content": "You are a financial fraud detection expert. You MUST respond with ONLY valid JSON. Do not include any text before or after the JSON object."
@@ -85,20 +78,11 @@ class AIAdminAnalysisService:
                     "content": prompt_text
                 }
             ],
-            "temperature": 0.1  # Very low temperature for consistent JSON output
-        }
-        
-        logger.info("OpenRouter request for receipt analysis")
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
-        
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f"OpenRouter API error: {response.text}")
-            raise
-        
-        response_data = response.json()
-        content = response_data["choices"][0]["message"]["content"]
+            model="google/gemma-2-9b-it:free",  # Free model that works well
+            temperature=0.1,  # Very low temperature for consistent JSON output
+            purpose="receipts.admin_analysis",
+        )
+        content = response.content
         
         # Clean up the content - handle various code block formats (same as events.py)
         patterns = [
@@ -197,7 +181,7 @@ class AIAdminAnalysisService:
             prompt = self._create_analysis_prompt(receipt_summary, historical_summary, team_context)
             
             # Get AI analysis
-            ai_response = self.get_openrouter_analysis(prompt)
+            ai_response = await self.get_openrouter_analysis(prompt)
             
             # Process AI response into structured format
             analysis_result = self._process_ai_response(
@@ -817,7 +801,7 @@ REMEMBER: Respond with ONLY the JSON object, no additional text or formatting.""
         """Generate AI content using OpenRouter API"""
         try:
             # Use the same OpenRouter integration as in the main analysis
-            ai_response = self.get_openrouter_analysis(f"""
+            ai_response = await self.get_openrouter_analysis(f"""
             Generate a {content_type} based on this prompt:
             {prompt}
             
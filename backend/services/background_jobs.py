@@ -0,0 +1,90 @@
+"""
+Claiming and checkpointing resumable background jobs.
+
+Invoice PDF exports and receipt re-scores both keep a job document that moves
+QUEUED -> RUNNING -> COMPLETED/FAILED and records a cursor, so a job whose
+worker died can be resumed. Starting or resuming a job is a claim: a
+transaction checks the job's status and writes a new ``runnerId`` together
+with a fresh ``heartbeatAt``. A runner then commits each checkpoint through
+``commit_as_runner``, which re-reads the job in the same transaction and
+refuses to write once another runner has claimed it.
+
+Two resume calls, or a resume racing a slow worker, therefore never both
+advance the cursor: the losing call gets nothing back from ``claim`` and the
+superseded worker stops at its next checkpoint with ``ClaimLost``.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import uuid4
+
+from firebase_admin import firestore
+
+# A RUNNING job whose heartbeat is older than this is treated as orphaned and may be resumed.
+STALE_AFTER = timedelta(minutes=2)
+
+
+class ClaimLost(Exception):
+    """Raised when a runner tries to write to a job another runner has claimed."""
+
+
+def is_resumable(job: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """
+    FAILED jobs, and QUEUED/RUNNING jobs whose worker has gone quiet. A QUEUED
+    job counts as alive from its creation, so a resume cannot race the
+    background task that is still starting it.
+    """
+    if job.get("status") == "FAILED":
+        return True
+    if job.get("status") not in ("QUEUED", "RUNNING"):
+        return False
+    last_seen = job.get("heartbeatAt") or job.get("createdAt")
+    now = now or datetime.now(timezone.utc)
+    return last_seen is None or now - last_seen > STALE_AFTER
+
+
+def claim(db, job_ref, resume: bool = False) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Move the job to RUNNING under a new runner id. A first start needs the job
+    to be QUEUED; a resume needs ``is_resumable``. Returns ``(runner_id, job)``,
+    or None if the job is missing or not claimable.
+    """
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = job_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        job = snapshot.to_dict() or {}
+        if not (is_resumable(job) if resume else job.get("status") == "QUEUED"):
+            return None
+        runner_id = uuid4().hex
+        transaction.update(job_ref, {
+            "status": "RUNNING",
+            "runnerId": runner_id,
+            "heartbeatAt": firestore.SERVER_TIMESTAMP,
+            "startedAt": job.get("startedAt") or firestore.SERVER_TIMESTAMP,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        })
+        return runner_id, {**job, "status": "RUNNING", "runnerId": runner_id}
+
+    return run(db.transaction())
+
+
+def commit_as_runner(db, job_ref, runner_id: str, write: Callable[[Any], None]) -> None:
+    """
+    Run ``write(transaction)`` in a transaction that first checks the job is
+    still claimed by ``runner_id``; raises ``ClaimLost`` otherwise.
+    """
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = job_ref.get(transaction=transaction)
+        if not snapshot.exists or (snapshot.to_dict() or {}).get("runnerId") != runner_id:
+            raise ClaimLost(f"Job {job_ref.id} is no longer claimed by runner {runner_id}")
+        write(transaction)
+
+    run(db.transaction())
+
+
+def update_as_runner(db, job_ref, runner_id: str, update: Dict[str, Any]) -> None:
+    commit_as_runner(db, job_ref, runner_id, lambda transaction: transaction.update(job_ref, update))
@@ -0,0 +1,132 @@
+"""
+Process-pool image forensics for receipt uploads.
+
+Decoding a phone photo, the 1024px LANCZOS resize, hashing and the ELA JPEG
+re-encode are CPU-bound. Run inline in ``upload_receipt``, they stall every
+other request on the worker. ``analyze`` runs the pipeline in a
+``ProcessPoolExecutor`` instead (the same pattern as ``utils.pdf_cache``).
+
+Admission is bounded. At most ``workers + queue`` analyses may be running or
+waiting at once. A caller that cannot get a slot within
+``RECEIPT_FORENSICS_WAIT_SECONDS`` gets ``ForensicsBusyError``, so a burst of
+uploads is pushed back to the client instead of piling up in memory. The
+returned ``timings_ms`` adds the time spent waiting for a slot (``queue``) and
+the round trip through the pool (``pool``) to the per-stage timings the
+pipeline reports.
+
+Workers run the NumPy pipeline in ``fast_forensics`` by default. Set
+``RECEIPT_FORENSICS_IMPL=reference`` to use the PIL/imagehash path instead.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ForensicsBusyError(Exception):
+    """Raised when no analysis slot frees up within the wait budget."""
+
+
+def _workers() -> int:
+    return int(os.getenv("RECEIPT_FORENSICS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _max_pending() -> int:
+    return _workers() + int(os.getenv("RECEIPT_FORENSICS_QUEUE", str(2 * _workers())))
+
+
+def _wait_seconds() -> float:
+    return float(os.getenv("RECEIPT_FORENSICS_WAIT_SECONDS", "10"))
+
+
+def _analyze_in_worker(image_bytes: bytes) -> Dict[str, Any]:
+    from .advanced_verification_service import advanced_verification_service
+    return advanced_verification_service.comprehensive_image_analysis(image_bytes)
+
+
+def _fast_analyze_in_worker(image_bytes: bytes) -> Dict[str, Any]:
+    from .fast_forensics import fast_image_analysis
+    return fast_image_analysis(image_bytes)
+
+
+def _analyzer():
+    # "reference" keeps the PIL/imagehash pipeline; the NumPy path is threshold-equivalent.
+    if os.getenv("RECEIPT_FORENSICS_IMPL", "numpy").lower() == "reference":
+        return _analyze_in_worker
+    return _fast_analyze_in_worker
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots: Optional[asyncio.Semaphore] = None
+_slots_loop = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_workers())
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def shutdown() -> None:
+    _reset_pool()
+
+
+def _get_slots() -> asyncio.Semaphore:
+    # asyncio primitives belong to one loop; recreate if the loop changed (tests, reloads).
+    global _slots, _slots_loop
+    loop = asyncio.get_running_loop()
+    if _slots is None or _slots_loop is not loop:
+        _slots = asyncio.Semaphore(_max_pending())
+        _slots_loop = loop
+    return _slots
+
+
+async def _run(image_bytes: bytes) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    analyzer = _analyzer()
+    try:
+        return await loop.run_in_executor(_get_pool(), analyzer, image_bytes)
+    except BrokenProcessPool:
+        # A crashed worker poisons the pool; rebuild it and analyze this one in a thread.
+        logger.warning("Receipt forensics pool broken; recreating")
+        _reset_pool()
+        return await asyncio.to_thread(analyzer, image_bytes)
+
+
+async def analyze(image_bytes: bytes, wait_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """Image forensics off the event loop; raises ForensicsBusyError under overload."""
+    slots = _get_slots()
+    queued = time.perf_counter()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=_wait_seconds() if wait_seconds is None else wait_seconds)
+    except asyncio.TimeoutError:
+        logger.warning("receipt_forensics_busy", extra={"max_pending": _max_pending()})
+        raise ForensicsBusyError("Image analysis is at capacity; retry shortly")
+    started = time.perf_counter()
+    try:
+        result = await _run(image_bytes)
+    finally:
+        slots.release()
+
+    timings = dict(result.get("timings_ms") or {})
+    timings["queue"] = round((started - queued) * 1000, 2)
+    timings["pool"] = round((time.perf_counter() - started) * 1000, 2)
+    result["timings_ms"] = timings
+    return result
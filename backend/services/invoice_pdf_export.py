@@ -0,0 +1,262 @@
+"""
+Bulk invoice PDF export.
+
+An export job lives at ``organizations/{orgId}/exportJobs/{jobId}`` and runs
+in two phases:
+
+* **prepare** (background): pages through the matching invoices in
+  ``issueDate`` order and renders each PDF through ``utils.pdf_cache`` with
+  bounded concurrency. Renders land in the content-addressed cache, and the
+  job document records progress plus a cursor (the last fully processed
+  invoice id). If the worker dies, ``resume_export_job`` claims the job (see
+  ``background_jobs``) and continues from that cursor, and anything rendered
+  before the crash is a cache hit.
+* **download**: streams a ZIP built on the fly. Each entry is pulled from the
+  cache (or rendered if it was evicted) and written through a non-seekable
+  zip writer. Only one PDF is held in memory at a time.
+"""
+import asyncio
+import logging
+import time
+import zipfile
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+
+from firebase_admin import firestore
+
+from . import background_jobs
+from ..utils.exports import EXPORT_PAGE_SIZE
+from ..utils.pdf_cache import render_invoice_pdf
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOBS = "exportJobs"
+DEFAULT_CONCURRENCY = 4
+# Smaller than the CSV export page so the heartbeat/cursor advance often while rendering.
+PREPARE_PAGE_SIZE = 100
+MAX_RECORDED_ERRORS = 50
+
+
+def _job_ref(db, org_id: str, job_id: str):
+    return db.collection("organizations", org_id, EXPORT_JOBS).document(job_id)
+
+
+def build_invoice_query(db, org_id: str, filters: Dict[str, Any]):
+    query = db.collection("organizations", org_id, "invoices")
+    if filters.get("status"):
+        query = query.where("status", "==", filters["status"])
+    if filters.get("startDate"):
+        query = query.where("issueDate", ">=", filters["startDate"])
+    if filters.get("endDate"):
+        query = query.where("issueDate", "<=", filters["endDate"])
+    return query.order_by("issueDate").order_by("__name__")
+
+
+def _pages(db, org_id: str, filters: Dict[str, Any], after_id: Optional[str], page_size: int):
+    """Yield lists of invoice snapshots, resuming after ``after_id`` when given."""
+    query = build_invoice_query(db, org_id, filters)
+    cursor = None
+    if after_id:
+        cursor = db.collection("organizations", org_id, "invoices").document(after_id).get()
+        if not cursor.exists:
+            cursor = None
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        yield docs
+        if len(docs) < page_size:
+            return
+        cursor = docs[-1]
+
+
+def _load_clients(db, org_id: str, invoices: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    ids = sorted({inv.get("clientId") for inv in invoices if inv.get("clientId")})
+    if not ids:
+        return {}
+    collection = db.collection("organizations", org_id, "clients")
+    return {snap.id: snap.to_dict() for snap in db.get_all([collection.document(i) for i in ids]) if snap.exists}
+
+
+def _load_org(db, org_id: str) -> Dict[str, Any]:
+    org_doc = db.collection("organizations").document(org_id).get()
+    return org_doc.to_dict() if org_doc.exists else {}
+
+
+def create_export_job(db, org_id: str, filters: Dict[str, Any], user_data: Dict[str, Any]) -> Dict[str, Any]:
+    job_id = str(uuid4())
+    job = {
+        "id": job_id,
+        "kind": "invoice_pdf_zip",
+        "status": "QUEUED",
+        "filters": {k: v for k, v in filters.items() if v},
+        "total": None,
+        "processed": 0,
+        "failed": 0,
+        "errors": [],
+        "cursor": None,
+        "createdBy": user_data.get("uid"),
+        "createdAt": firestore.SERVER_TIMESTAMP,
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+    _job_ref(db, org_id, job_id).set(job)
+    return job
+
+
+def get_export_job(db, org_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+    doc = _job_ref(db, org_id, job_id).get()
+    return doc.to_dict() if doc.exists else None
+
+
+def resume_export_job(db, org_id: str, job_id: str) -> Optional[str]:
+    """Claim a failed or orphaned job for resuming; the runner id, or None if it cannot be resumed."""
+    claimed = background_jobs.claim(db, _job_ref(db, org_id, job_id), resume=True)
+    return claimed[0] if claimed else None
+
+
+def _count_matching(db, org_id: str, filters: Dict[str, Any]) -> int:
+    result = build_invoice_query(db, org_id, filters).count(alias="total").get()
+    return int(result[0][0].value)
+
+
+async def run_export_job(db, org_id: str, job_id: str, *, runner_id: Optional[str] = None,
+                         concurrency: int = DEFAULT_CONCURRENCY, page_size: int = PREPARE_PAGE_SIZE) -> None:
+    """
+    Prepare an export job, claiming it first unless ``runner_id`` comes from
+    ``resume_export_job``. Never raises.
+    """
+    job_ref = _job_ref(db, org_id, job_id)
+    started = time.perf_counter()
+    try:
+        if runner_id is None:
+            claimed = await asyncio.to_thread(background_jobs.claim, db, job_ref)
+            if not claimed:
+                return
+            runner_id, job = claimed
+        else:
+            job = await asyncio.to_thread(get_export_job, db, org_id, job_id)
+            if not job:
+                return
+        filters = job.get("filters", {})
+        processed = int(job.get("processed") or 0)
+        failed = int(job.get("failed") or 0)
+        errors = list(job.get("errors") or [])
+        cursor = job.get("cursor")
+
+        if job.get("total") is None:
+            total = await asyncio.to_thread(_count_matching, db, org_id, filters)
+            await asyncio.to_thread(background_jobs.update_as_runner, db, job_ref, runner_id, {"total": total})
+
+        org_data = await asyncio.to_thread(_load_org, db, org_id)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def render_one(invoice: Dict[str, Any], client: Dict[str, Any]):
+            async with semaphore:
+                await render_invoice_pdf(invoice, client, org_data)
+
+        pages = _pages(db, org_id, filters, cursor, page_size)
+        while True:
+            docs = await asyncio.to_thread(next, pages, None)
+            if docs is None:
+                break
+            invoices = [doc.to_dict() for doc in docs]
+            clients = await asyncio.to_thread(_load_clients, db, org_id, invoices)
+            results = await asyncio.gather(
+                *(render_one(inv, clients.get(inv.get("clientId"), {})) for inv in invoices),
+                return_exceptions=True,
+            )
+            for doc, result in zip(docs, results):
+                if isinstance(result, Exception):
+                    failed += 1
+                    if len(errors) < MAX_RECORDED_ERRORS:
+                        errors.append(f"Invoice {doc.id}: {result}")
+            processed += len(docs)
+            # The cursor only advances after a whole page is rendered, so a crash re-renders at most one page.
+            await asyncio.to_thread(background_jobs.update_as_runner, db, job_ref, runner_id, {
+                "processed": processed,
+                "failed": failed,
+                "errors": errors,
+                "cursor": docs[-1].id,
+                "heartbeatAt": firestore.SERVER_TIMESTAMP,
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            })
+
+        await asyncio.to_thread(background_jobs.update_as_runner, db, job_ref, runner_id, {
+            "status": "COMPLETED",
+            "completedAt": firestore.SERVER_TIMESTAMP,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        })
+        logger.info(
+            "invoice_pdf_export_prepared",
+            extra={"org_id": org_id, "job_id": job_id, "processed": processed, "failed": failed,
+                   "latency_ms": round((time.perf_counter() - started) * 1000, 1)},
+        )
+    except background_jobs.ClaimLost:
+        logger.info("invoice_pdf_export_superseded", extra={"org_id": org_id, "job_id": job_id})
+    except Exception as e:
+        logger.warning(f"Invoice PDF export {job_id} for org {org_id} failed: {e}")
+        try:
+            background_jobs.update_as_runner(db, job_ref, runner_id, {
+                "status": "FAILED", "lastError": str(e), "updatedAt": firestore.SERVER_TIMESTAMP})
+        except Exception:
+            pass
+
+
+class _ZipStream:
+    """Write-only, non-seekable sink for ZipFile; callers drain it after each entry."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _entry_name(invoice_id: str, invoice: Dict[str, Any], used: set) -> str:
+    name = f"Invoice-{invoice.get('number') or invoice_id}.pdf".replace("/", "-")
+    if name in used:
+        name = f"Invoice-{invoice.get('number') or 'DRAFT'}-{invoice_id}.pdf".replace("/", "-")
+    used.add(name)
+    return name
+
+
+async def stream_export_zip(db, org_id: str, filters: Dict[str, Any],
+                            page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[bytes]:
+    """Yield a ZIP of the matching invoices' PDFs, one entry at a time."""
+    sink = _ZipStream()
+    used_names: set = set()
+    org_data = await asyncio.to_thread(_load_org, db, org_id)
+    pages = _pages(db, org_id, filters, None, page_size)
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        while True:
+            docs = await asyncio.to_thread(next, pages, None)
+            if docs is None:
+                break
+            invoices = [doc.to_dict() for doc in docs]
+            clients = await asyncio.to_thread(_load_clients, db, org_id, invoices)
+            for doc, invoice in zip(docs, invoices):
+                pdf_bytes = await render_invoice_pdf(invoice, clients.get(invoice.get("clientId"), {}), org_data)
+                # PDFs are already compressed; storing avoids burning CPU for no gain.
+                archive.writestr(_entry_name(doc.id, invoice, used_names), pdf_bytes)
+                yield sink.drain()
+    tail = sink.drain()
+    if tail:
+        yield tail
@@ -0,0 +1,307 @@
+"""
+Shared async client for OpenRouter chat completions.
+
+Each LLM call site used to build its own request: a blocking ``requests.post``
+(some with no timeout) inside async handlers, with no retry and no limit on
+how many calls run at once. ``chat`` replaces them:
+
+* One pooled ``aiohttp.ClientSession`` per event loop, so connections and TLS
+  sessions are reused.
+* A process-wide semaphore (``LLM_MAX_CONCURRENCY``). At most that many
+  requests are in flight; waiting for a slot counts against the deadline.
+* A per-call deadline (``LLM_TIMEOUT_SECONDS`` unless the caller passes one).
+  It bounds the slot wait, every attempt and the backoff sleeps together.
+  ``LLMTimeoutError`` is raised when it runs out.
+* Retries on connection errors, timeouts, 429 and 5xx, up to
+  ``LLM_MAX_RETRIES`` times, with full-jitter exponential backoff. Other 4xx
+  responses fail at once.
+* Optional hedging. When a hedge model is given (or ``LLM_HEDGE_MODEL`` is
+  set) and the primary has not answered within ``LLM_HEDGE_AFTER_SECONDS``,
+  the same prompt goes to the hedge model. It is also tried straight away if
+  the primary fails first. The first success wins and the other request is
+  cancelled.
+
+Every call logs ``llm_call`` with model, latency, token usage, attempts and
+whether it was hedged. Per-model totals are kept in process for
+``metrics_snapshot``.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "google/gemma-3-4b-it:free"
+
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The provider failed or returned an unusable response."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMNotConfiguredError(LLMError):
+    """OPENROUTER_API_KEY is not set."""
+
+
+class LLMTimeoutError(LLMError):
+    """The call's deadline passed before any attempt succeeded."""
+
+
+class LLMBusyError(LLMError):
+    """No concurrency slot freed up before the deadline."""
+
+
+class _RetryableError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class LLMResponse:
+    content: str
+    model: str
+    latency_ms: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    attempts: int = 1
+    hedged: bool = False
+
+
+def default_model() -> str:
+    return os.getenv("LLM_DEFAULT_MODEL", DEFAULT_MODEL)
+
+
+def _max_concurrency() -> int:
+    return max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+
+def _timeout_seconds() -> float:
+    return float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+
+
+def _max_retries() -> int:
+    return max(0, int(os.getenv("LLM_MAX_RETRIES", "2")))
+
+
+def _backoff_seconds() -> float:
+    return float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+
+
+def _hedge_model() -> Optional[str]:
+    return os.getenv("LLM_HEDGE_MODEL") or None
+
+
+def _hedge_after_seconds() -> float:
+    return float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "4"))
+
+
+_session: Optional[aiohttp.ClientSession] = None
+_slots: Optional[asyncio.Semaphore] = None
+_loop = None
+
+
+def _get_session() -> aiohttp.ClientSession:
+    # Sessions and semaphores belong to one loop; recreate if the loop changed (tests, reloads).
+    global _session, _slots, _loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _loop is not loop:
+        connector = aiohttp.TCPConnector(limit=_max_concurrency(), ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector)
+        _slots = asyncio.Semaphore(_max_concurrency())
+        _loop = loop
+    return _session
+
+
+def _get_slots() -> asyncio.Semaphore:
+    _get_session()
+    return _slots
+
+
+async def close() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+_metrics: Dict[str, Dict[str, float]] = {}
+_metrics_lock = threading.Lock()
+
+
+def _record(model: str, *, ok: bool, latency_ms: float, attempts: int, hedged: bool,
+            prompt_tokens: int = 0, completion_tokens: int = 0, purpose: str = "") -> None:
+    with _metrics_lock:
+        stats = _metrics.setdefault(model, {
+            "calls": 0, "errors": 0, "retries": 0, "hedged": 0,
+            "promptTokens": 0, "completionTokens": 0, "latencyMsTotal": 0.0,
+        })
+        stats["calls"] += 1
+        stats["errors"] += 0 if ok else 1
+        stats["retries"] += attempts - 1
+        stats["hedged"] += 1 if hedged else 0
+        stats["promptTokens"] += prompt_tokens
+        stats["completionTokens"] += completion_tokens
+        stats["latencyMsTotal"] += latency_ms
+    logger.info("llm_call", extra={
+        "purpose": purpose, "model": model, "ok": ok, "latency_ms": round(latency_ms, 2),
+        "attempts": attempts, "hedged": hedged,
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+    })
+
+
+def metrics_snapshot() -> Dict[str, Dict[str, float]]:
+    """Per-model totals since process start, with the mean latency of each model."""
+    with _metrics_lock:
+        snapshot = {model: dict(stats) for model, stats in _metrics.items()}
+    for stats in snapshot.values():
+        stats["latencyMsAvg"] = round(stats["latencyMsTotal"] / stats["calls"], 2) if stats["calls"] else 0.0
+    return snapshot
+
+
+def reset_metrics() -> None:
+    with _metrics_lock:
+        _metrics.clear()
+
+
+async def _post(body: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    headers = {
+        "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": os.getenv("SITE_URL", "http://localhost:3000"),
+    }
+    try:
+        async with _get_session().post(
+            API_URL, json=body, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            if response.status in _RETRYABLE_STATUSES:
+                raise _RetryableError(f"HTTP {response.status}", response.status)
+            if response.status >= 400:
+                text = await response.text()
+                raise LLMError(text[:200] or f"HTTP {response.status}", response.status)
+            return await response.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise _RetryableError(str(e) or type(e).__name__) from e
+
+
+async def _call_model(body: Dict[str, Any], model: str, expires: float, purpose: str, hedged: bool) -> LLMResponse:
+    loop = asyncio.get_running_loop()
+    slots = _get_slots()
+    started = time.perf_counter()
+    attempts = 0
+    try:
+        while True:
+            attempts += 1
+            remaining = expires - loop.time()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM call to {model} ran out of time")
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=remaining)
+            except asyncio.TimeoutError:
+                raise LLMBusyError("LLM client is at capacity")
+            error = None
+            try:
+                payload = await _post({**body, "model": model}, max(0.001, expires - loop.time()))
+            except _RetryableError as e:
+                error = e
+            finally:
+                slots.release()
+            if error is not None:
+                # The slot is released before backing off so a retrying call does not starve others.
+                if attempts > _max_retries():
+                    raise LLMError(f"{error} (after {attempts} attempts)", error.status) from error
+                backoff = random.uniform(0, _backoff_seconds() * 2 ** (attempts - 1))
+                if loop.time() + backoff >= expires:
+                    raise LLMTimeoutError(f"LLM call to {model} ran out of time: {error}") from error
+                logger.warning("llm_call_retry", extra={"model": model, "attempt": attempts, "error": str(error)})
+                await asyncio.sleep(backoff)
+                continue
+
+            try:
+                content = payload["choices"][0]["message"]["content"] or ""
+            except (KeyError, IndexError, TypeError):
+                raise LLMError(f"No choices in response: {str(payload)[:200]}")
+            usage = payload.get("usage") or {}
+            result = LLMResponse(
+                content=content,
+                model=payload.get("model") or model,
+                latency_ms=(time.perf_counter() - started) * 1000,
+                prompt_tokens=int(usage.get("prompt_tokens") or 0),
+                completion_tokens=int(usage.get("completion_tokens") or 0),
+                attempts=attempts,
+                hedged=hedged,
+            )
+            _record(model, ok=True, latency_ms=result.latency_ms, attempts=attempts, hedged=hedged,
+                    prompt_tokens=result.prompt_tokens, completion_tokens=result.completion_tokens, purpose=purpose)
+            return result
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        _record(model, ok=False, latency_ms=(time.perf_counter() - started) * 1000, attempts=attempts,
+                hedged=hedged, purpose=purpose)
+        raise
+
+
+async def chat(
+    messages: List[Dict[str, Any]],
+    *,
+    model: Optional[str] = None,
+    temperature: Optional[float] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None,
+    hedge_model: Optional[str] = None,
+    hedge_after: Optional[float] = None,
+    purpose: str = "",
+) -> LLMResponse:
+    """
+    One chat completion, finished within ``deadline`` seconds or LLMTimeoutError.
+    ``purpose`` labels the call in the ``llm_call`` log line.
+    """
+    if not os.getenv("OPENROUTER_API_KEY"):
+        raise LLMNotConfiguredError("AI service is not configured")
+    loop = asyncio.get_running_loop()
+    expires = loop.time() + (_timeout_seconds() if deadline is None else deadline)
+    model = model or default_model()
+    hedge_model = hedge_model or _hedge_model()
+
+    body: Dict[str, Any] = {"messages": messages}
+    if temperature is not None:
+        body["temperature"] = temperature
+    if response_format is not None:
+        body["response_format"] = response_format
+
+    if not hedge_model or hedge_model == model:
+        return await _call_model(body, model, expires, purpose, hedged=False)
+
+    tasks = [asyncio.ensure_future(_call_model(body, model, expires, purpose, hedged=False))]
+    try:
+        delay = _hedge_after_seconds() if hedge_after is None else hedge_after
+        done, _ = await asyncio.wait(tasks, timeout=max(0.0, min(delay, expires - loop.time())))
+        # Hedge when the primary is slow, and also when it has already failed.
+        if not done or tasks[0].exception() is not None:
+            tasks.append(asyncio.ensure_future(_call_model(body, hedge_model, expires, purpose, hedged=True)))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,188 @@
+"""
+Content-addressed cache for receipt OCR results.
+
+An OCR call costs money and several seconds. The same bytes come back often:
+a member re-uploads after a REJECTED verdict, or a teammate submits the photo
+that was shared in the group chat. Results are keyed by SHA-256 of the image
+bytes together with the model and a prompt version. Switching ``OCR_MODEL`` or
+editing the prompt therefore misses instead of serving stale extractions.
+
+Two backends, selected with ``OCR_CACHE_BACKEND``:
+
+* ``disk`` (default): one JSON file per key in ``OCR_CACHE_DIR``. It is
+  evicted least-recently-used once there are more than
+  ``OCR_CACHE_MAX_ENTRIES`` files, the same layout as ``utils.pdf_cache``.
+* ``firestore``: ``ocrCache/{key}`` documents shared by every instance.
+  ``expiresAt`` is a timestamp, so a Firestore TTL policy on that field
+  removes old entries server-side.
+
+Entries older than ``OCR_CACHE_TTL_DAYS`` are treated as misses by both
+backends. Only successful extractions are stored. Cache failures are logged
+and never fail an upload.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_COLLECTION = "ocrCache"
+
+
+def image_digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def ocr_cache_key(image_bytes: bytes, model: str, prompt_version: str) -> str:
+    payload = f"{image_digest(image_bytes)}:{model}:{prompt_version}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def prompt_version(prompt: str) -> str:
+    """Short fingerprint of a prompt; any edit to the text changes the cache key."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+class DiskOCRCache:
+    """Directory-backed LRU of OCR results, bounded by entry count and age."""
+
+    def __init__(self, directory: str, max_entries: int, ttl_seconds: float):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                files.append((os.stat(os.path.join(self.directory, name)).st_mtime, name[:-5]))
+            except OSError:
+                continue
+        for mtime, key in sorted(files):
+            self._entries[key] = mtime
+
+    def _drop(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._drop(key)
+            return None
+        if time.time() - entry.get("storedAt", 0) > self.ttl_seconds:
+            self._drop(key)
+            return None
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return entry.get("result")
+
+    def put(self, key: str, result: Dict[str, Any], model: str, prompt_version: str) -> None:
+        entry = {"result": result, "model": model, "promptVersion": prompt_version, "storedAt": time.time()}
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, default=str)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to cache OCR result {key}: {e}")
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry["storedAt"]
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+
+class FirestoreOCRCache:
+    """OCR results in a top-level collection; expiry is enforced on read and by a TTL policy."""
+
+    def __init__(self, db, ttl_seconds: float, collection: str = FIRESTORE_COLLECTION):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.db.collection(self.collection).document(key).get()
+        if not snapshot.exists:
+            return None
+        entry = snapshot.to_dict() or {}
+        expires_at = entry.get("expiresAt")
+        if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+            return None
+        return entry.get("result")
+
+    def put(self, key: str, result: Dict[str, Any], model: str, prompt_version: str) -> None:
+        now = datetime.now(timezone.utc)
+        self.db.collection(self.collection).document(key).set({
+            "result": result,
+            "model": model,
+            "promptVersion": prompt_version,
+            "createdAt": now,
+            "expiresAt": now + timedelta(seconds=self.ttl_seconds),
+        })
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _ttl_seconds() -> float:
+    return float(os.getenv("OCR_CACHE_TTL_DAYS", "30")) * 86400
+
+
+def get_ocr_cache():
+    """The configured cache, or None when ``OCR_CACHE_BACKEND=off``."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            backend = os.getenv("OCR_CACHE_BACKEND", "disk").lower()
+            if backend == "off":
+                return None
+            if backend == "firestore":
+                from firebase_admin import firestore
+                _cache = FirestoreOCRCache(firestore.client(), _ttl_seconds())
+            else:
+                directory = os.getenv("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "autostudioflow-ocr-cache"))
+                _cache = DiskOCRCache(directory, int(os.getenv("OCR_CACHE_MAX_ENTRIES", "20000")), _ttl_seconds())
+        return _cache
+
+
+def reset_ocr_cache() -> None:
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,160 @@
+"""
+Shrink receipt photos before they are sent to the OCR model.
+
+Phone uploads are often 4-8 MB JPEGs, and base64 makes them another third
+larger. The model reads text just as well from a much smaller image, and every
+megabyte costs upload time and model latency against the 30s OCR timeout.
+``compact_for_ocr`` applies, in order:
+
+1. **Decode**: for very large JPEGs, ``draft`` mode lets the decoder
+   downscale by 1/2-1/8 (and to grayscale) instead of producing full-size RGB.
+2. **Orientation**: EXIF rotation is applied, because the model does not
+   read EXIF.
+3. **Crop**: the receipt region is found as the bounding box of pixels that
+   differ from the border colour, either a table under a paper receipt or the
+   margins of a screenshot. The crop is skipped when the box is implausibly
+   small or removes almost nothing.
+4. **Downscale**: the longest side is limited to ``OCR_MAX_SIDE``.
+5. **Encode**: the image is saved as grayscale (``OCR_GRAYSCALE``) JPEG or WebP
+   (``OCR_IMAGE_FORMAT``) at ``OCR_IMAGE_QUALITY``.
+
+If the upload cannot be decoded, or compaction would not make it smaller, the
+original bytes are sent with their real MIME type. ``compaction_profile()``
+goes into the OCR cache key, so changing these settings does not reuse
+extractions made from differently prepared images.
+``benchmark_ocr_compaction.py`` at the repo root measures payload size, latency
+and field accuracy against a fixture set.
+"""
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+# Pixels this far (0-255) from the border colour count as receipt content.
+_CROP_DIFF = 40
+# A row/column belongs to the receipt if this share of it is content.
+_CROP_LINE_SHARE = 0.02
+_CROP_MARGIN = 0.02
+_CROP_MIN_AREA = 0.15
+_CROP_MAX_AREA = 0.9
+_PROBE_SIDE = 256
+
+
+@dataclass
+class CompactedImage:
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    width: int
+    height: int
+    cropped: bool
+    compacted: bool
+    latency_ms: float
+
+
+def _max_side() -> int:
+    return int(os.getenv("OCR_MAX_SIDE", "2000"))
+
+
+def _grayscale() -> bool:
+    return os.getenv("OCR_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+
+
+def _format() -> str:
+    return "WEBP" if os.getenv("OCR_IMAGE_FORMAT", "jpeg").lower() == "webp" else "JPEG"
+
+
+def _quality() -> int:
+    return int(os.getenv("OCR_IMAGE_QUALITY", "82"))
+
+
+def compaction_profile() -> str:
+    return f"c1:{_max_side()}:{'L' if _grayscale() else 'RGB'}:{_format()}:{_quality()}"
+
+
+def detect_receipt_box(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """``(left, top, right, bottom)`` of the receipt content, or None to keep the full frame."""
+    width, height = image.size
+    factor = max(1, max(width, height) // _PROBE_SIDE)
+    probe = np.asarray(image.convert("L").reduce(factor), dtype=np.int16)
+    if probe.shape[0] < 8 or probe.shape[1] < 8:
+        return None
+    border = np.concatenate([probe[:2].ravel(), probe[-2:].ravel(), probe[:, :2].ravel(), probe[:, -2:].ravel()])
+    content = np.abs(probe - int(np.median(border))) > _CROP_DIFF
+    rows = np.flatnonzero(content.mean(axis=1) > _CROP_LINE_SHARE)
+    cols = np.flatnonzero(content.mean(axis=0) > _CROP_LINE_SHARE)
+    if rows.size == 0 or cols.size == 0:
+        return None
+
+    scale_y, scale_x = height / probe.shape[0], width / probe.shape[1]
+    margin_y, margin_x = int(height * _CROP_MARGIN), int(width * _CROP_MARGIN)
+    box = (
+        max(0, int(cols[0] * scale_x) - margin_x),
+        max(0, int(rows[0] * scale_y) - margin_y),
+        min(width, int((cols[-1] + 1) * scale_x) + margin_x),
+        min(height, int((rows[-1] + 1) * scale_y) + margin_y),
+    )
+    area = (box[2] - box[0]) * (box[3] - box[1]) / float(width * height)
+    if not _CROP_MIN_AREA <= area <= _CROP_MAX_AREA:
+        return None
+    return box
+
+
+def passthrough(image_bytes: bytes) -> CompactedImage:
+    """The upload unchanged (labelled JPEG, like the pre-compaction requests)."""
+    return CompactedImage(
+        data=image_bytes, mime_type="image/jpeg", original_bytes=len(image_bytes),
+        width=0, height=0, cropped=False, compacted=False, latency_ms=0.0,
+    )
+
+
+def compact_for_ocr(image_bytes: bytes) -> CompactedImage:
+    """Smaller, upright, cropped rendition of ``image_bytes`` for the OCR request."""
+    started = time.perf_counter()
+    original = passthrough(image_bytes)
+    max_side, grayscale = _max_side(), _grayscale()
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        original.mime_type = _MIME_TYPES.get(image.format, "image/jpeg")
+        original.width, original.height = image.size
+        if image.format == "JPEG" and max(image.size) > 2 * max_side:
+            # 2x headroom so the receipt still has max_side pixels after the crop
+            scale = 2 * max_side / float(max(image.size))
+            image.draft("L" if grayscale else "RGB", (int(image.size[0] * scale), int(image.size[1] * scale)))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("L" if grayscale else "RGB")
+
+        box = detect_receipt_box(image)
+        if box is not None:
+            image = image.crop(box)
+        if max(image.size) > max_side:
+            scale = max_side / float(max(image.size))
+            image = image.resize((max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale))),
+                                 Image.LANCZOS, reducing_gap=2.0)
+
+        buf = io.BytesIO()
+        image.save(buf, _format(), quality=_quality())
+        data = buf.getvalue()
+    except Exception as e:
+        logger.warning(f"OCR image compaction skipped: {e}")
+        original.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        return original
+
+    latency_ms = round((time.perf_counter() - started) * 1000, 2)
+    if len(data) >= len(image_bytes) and box is None:
+        # Already small (e.g. a compressed screenshot); nothing to gain.
+        original.latency_ms = latency_ms
+        return original
+    return CompactedImage(
+        data=data, mime_type=_MIME_TYPES[_format()], original_bytes=len(image_bytes),
+        width=image.size[0], height=image.size[1], cropped=box is not None, compacted=True,
+        latency_ms=latency_ms,
+    )
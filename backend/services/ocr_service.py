@@ -7,8 +7,38 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from typing import Dict, Any, Optional
 
+from .ocr_cache import get_ocr_cache, ocr_cache_key, prompt_version
+from .ocr_image import compact_for_ocr, compaction_profile, passthrough
+
 logger = logging.getLogger(__name__)
 
+# --- OPTIMIZED DATA EXTRACTION PROMPT ---
+RECEIPT_PROMPT = """
+        Extract the following details from this cab receipt into a valid JSON object.
+        
+        CRITICAL FIELDS:
+        - "provider": The app name (Uber, Ola, Rapido, Lyft, Bolt, etc.).
+        - "rideId": The unique booking identifier (Look for 'CRN', 'Booking ID', 'Order #', 'Trip ID', 'Ride ID').
+        - "amount": The total fare paid (numeric only, no currency symbols).
+        - "date": The date of the ride (YYYY-MM-DD format).
+        - "time": The time of the ride (HH:MM format).
+        - "pickup": The pickup location/address.
+        - "dropoff": The drop-off location/address.
+        
+        RULES:
+        1. If 'rideId' is not visible, return null for that field.
+        2. If 'amount' is not visible, return null for that field.
+        3. Extract location names as shown on the receipt.
+        4. Do not estimate or hallucinate values.
+        5. Return ONLY the JSON object.
+        
+        Example output:
+        {"provider": "Ola", "rideId": "CRN123456", "amount": 250, "date": "2025-11-25", "time": "14:30", "pickup": "Koramangala", "dropoff": "MG Road"}
+        """
+# Part of the OCR cache key, so editing the prompt invalidates cached extractions
+PROMPT_VERSION = prompt_version(RECEIPT_PROMPT)
+
+
 class ReceiptOCRService:
     """
     Optimized OCR Service: Uses AI strictly for extracting structured data.
@@ -42,40 +72,42 @@ class ReceiptOCRService:
             logger.error(f"Image encoding failed: {e}")
             return ""
 
-    def process_receipt(self, image_bytes: bytes) -> Dict[str, Any]:
+    def process_receipt(self, image_bytes: bytes, use_cache: bool = True, compact: bool = True) -> Dict[str, Any]:
         """
         Sends image to AI to extract: Ride ID, Amount, Date, Time, Provider.
+        Identical bytes seen before with the same model and prompt are served
+        from the OCR cache (``cached: True``) without an API call. The image is
+        compacted first (see ``ocr_image``) unless ``compact`` is False.
         """
+        cache = get_ocr_cache() if use_cache else None
+        profile = compaction_profile() if compact else "raw"
+        key = ocr_cache_key(image_bytes or b"", self.model, f"{PROMPT_VERSION}:{profile}")
+        if cache is not None:
+            try:
+                cached = cache.get(key)
+            except Exception as e:
+                logger.warning(f"OCR cache read failed: {e}")
+                cached = None
+            if cached is not None:
+                logger.info(f"OCR cache hit - RideId: {cached.get('data', {}).get('rideId')}")
+                return {**cached, "cached": True}
+
         if not self.api_key:
             return self._error_response("Missing API Key")
 
-        base64_image = self._encode_image(image_bytes)
+        if not image_bytes:
+            return self._error_response("Image encoding failed")
+        # Upright, cropped, downscaled grayscale: a fraction of the raw photo's bytes
+        compacted = compact_for_ocr(image_bytes) if compact else passthrough(image_bytes)
+        base64_image = self._encode_image(compacted.data)
         if not base64_image:
             return self._error_response("Image encoding failed")
-
-        # --- OPTIMIZED DATA EXTRACTION PROMPT ---
-        prompt = """
-        Extract the following details from this cab receipt into a valid JSON object.
-        
-        CRITICAL FIELDS:
-        - "provider": The app name (Uber, Ola, Rapido, Lyft, Bolt, etc.).
-        - "rideId": The unique booking identifier (Look for 'CRN', 'Booking ID', 'Order #', 'Trip ID', 'Ride ID').
-        - "amount": The total fare paid (numeric only, no currency symbols).
-        - "date": The date of the ride (YYYY-MM-DD format).
-        - "time": The time of the ride (HH:MM format).
-        - "pickup": The pickup location/address.
-        - "dropoff": The drop-off location/address.
-        
-        RULES:
-        1. If 'rideId' is not visible, return null for that field.
-        2. If 'amount' is not visible, return null for that field.
-        3. Extract location names as shown on the receipt.
-        4. Do not estimate or hallucinate values.
-        5. Return ONLY the JSON object.
-        
-        Example output:
-        {"provider": "Ola", "rideId": "CRN123456", "amount": 250, "date": "2025-11-25", "time": "14:30", "pickup": "Koramangala", "dropoff": "MG Road"}
-        """
+        logger.info("ocr_image_compacted", extra={
+            "original_bytes": compacted.original_bytes,
+            "sent_bytes": len(compacted.data),
+            "cropped": compacted.cropped,
+            "compaction_ms": compacted.latency_ms,
+        })
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -89,8 +121,8 @@ class ReceiptOCRService:
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                        {"type": "text", "text": RECEIPT_PROMPT},
+                        {"type": "image_url", "image_url": {"url": f"data:{compacted.mime_type};base64,{base64_image}"}}
                     ]
                 }
             ],
@@ -117,11 +149,17 @@ class ReceiptOCRService:
             data = json.loads(content.strip())
             logger.info(f"OCR Success - Provider: {data.get('provider')}, RideId: {data.get('rideId')}")
             
-            return {
+            extracted = {
                 "success": True,
                 "provider": data.get("provider", "Unknown"),
                 "data": data
             }
+            if cache is not None:
+                try:
+                    cache.put(key, extracted, self.model, PROMPT_VERSION)
+                except Exception as e:
+                    logger.warning(f"OCR cache write failed: {e}")
+            return {**extracted, "cached": False}
 
         except Exception as e:
             logger.error(f"AI OCR Failed: {str(e)}")
@@ -0,0 +1,268 @@
+"""
+Payroll analytics from per-period aggregates and columnar snapshots.
+
+Every salary run is one pay period (``run_{year}_{month:02d}``) and its
+document carries the ``counts``/``totals`` aggregates maintained by
+``salary_run_metrics``. Period, annual and multi-year trend views therefore
+read at most one run document per month and never touch payslips.
+
+Per-employee trends and pay distributions do need payslip-level amounts. For
+those, a year's payslips are loaded once into a ``PayrollSnapshot`` of NumPy
+columns and cached in-process. The cache key is the org and year. Each
+snapshot stores a fingerprint built from the ``updatedAt`` of that year's
+runs. Any payslip change bumps its run's ``updatedAt``, so a stale snapshot is
+rebuilt on the next request. Group-bys are ``np.bincount`` calls over the
+month and employee columns.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import salary_run_metrics
+
+logger = logging.getLogger(__name__)
+
+# Org-years kept in memory; a snapshot is a few arrays of len(payslips).
+SNAPSHOT_CACHE_SIZE = 64
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def run_id_for(year: int, month: int) -> str:
+    return f"run_{year}_{str(month).zfill(2)}"
+
+
+def period_window(year: int, month: int, months: int) -> List[Tuple[int, int]]:
+    """``months`` periods ending at ``(year, month)``, oldest first."""
+    periods = []
+    for offset in range(months):
+        index = year * 12 + (month - 1) - offset
+        periods.append((index // 12, index % 12 + 1))
+    periods.reverse()
+    return periods
+
+
+def _period_totals(run_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Period totals excluding voided payslips (``counts.total`` already omits them)."""
+    counts = (run_data or {}).get("counts") or {}
+    totals = (run_data or {}).get("totals") or {}
+    count_total = counts.get("total", 0) or 0
+    count_paid = counts.get("paid", 0) or 0
+    return {
+        "totalGross": round(totals.get("gross", 0) or 0, 2),
+        "totalDeductions": round(totals.get("deductions", 0) or 0, 2),
+        "totalTax": round(totals.get("tax", 0) or 0, 2),
+        "totalNet": round(totals.get("net", 0) or 0, 2),
+        "countTotal": count_total,
+        "countPaid": count_paid,
+        "countUnpaid": count_total - count_paid,
+    }
+
+
+def load_period_runs(db, org_id: str, periods: Sequence[Tuple[int, int]]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+    """
+    Run documents for ``periods`` in one ``get_all``. Runs created before the
+    aggregates were maintained are backfilled once, which is the only time
+    their payslips are read.
+    """
+    collection = db.collection('organizations', org_id, 'salaryRuns')
+    refs = {run_id_for(year, month): (year, month) for year, month in periods}
+    runs: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for snapshot in db.get_all([collection.document(run_id) for run_id in refs]):
+        if not snapshot.exists:
+            continue
+        data = snapshot.to_dict() or {}
+        if not salary_run_metrics.has_metrics(data):
+            salary_run_metrics.ensure_run_metrics(db, org_id, snapshot.id)
+            data = {**data, **salary_run_metrics.recompute_run_metrics(db, org_id, snapshot.id)}
+        data["id"] = snapshot.id
+        runs[refs[snapshot.id]] = data
+    return runs
+
+
+def period_summary(db, org_id: str, year: int, month: int) -> Dict[str, Any]:
+    run = load_period_runs(db, org_id, [(year, month)]).get((year, month))
+    return _period_totals(run)
+
+
+def annual_summary(db, org_id: str, year: int) -> Dict[str, Any]:
+    runs = load_period_runs(db, org_id, [(year, month) for month in range(1, 13)])
+    monthly = []
+    annual = {"totalGross": 0.0, "totalDeductions": 0.0, "totalTax": 0.0, "totalNet": 0.0, "countTotal": 0, "countPaid": 0}
+    for (_, month), run in sorted(runs.items()):
+        totals = _period_totals(run)
+        if not totals["countTotal"]:
+            continue
+        totals.pop("countUnpaid")
+        monthly.append({"month": month, **totals})
+        for key in annual:
+            annual[key] += totals[key]
+    for key in ("totalGross", "totalDeductions", "totalTax", "totalNet"):
+        annual[key] = round(annual[key], 2)
+    return {"monthlyBreakdown": monthly, "annualTotals": annual}
+
+
+def salary_trends(db, org_id: str, periods: Sequence[Tuple[int, int]]) -> List[Dict[str, Any]]:
+    runs = load_period_runs(db, org_id, periods)
+    trends = []
+    for year, month in periods:
+        totals = _period_totals(runs.get((year, month)))
+        count = totals["countTotal"]
+        trends.append({
+            "month": month,
+            "year": year,
+            "totalPayout": totals["totalNet"],
+            "employeeCount": count,
+            "averageSalary": round(totals["totalNet"] / count, 2) if count else 0,
+        })
+    return trends
+
+
+@dataclass
+class PayrollSnapshot:
+    """Column-oriented, non-VOID payslip amounts for one org-year."""
+    year: int
+    fingerprint: Tuple
+    employee_ids: List[str]
+    employee_names: List[str]
+    employee: np.ndarray  # int32 index into employee_ids
+    month: np.ndarray     # int8, 1-12
+    paid: np.ndarray      # bool
+    gross: np.ndarray
+    deductions: np.ndarray
+    tax: np.ndarray
+    net: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.net)
+
+
+def build_snapshot(year: int, payslips: Iterable[Dict[str, Any]], fingerprint: Tuple = ()) -> PayrollSnapshot:
+    index: Dict[str, int] = {}
+    names: List[str] = []
+    employee, month, paid, gross, deductions, tax, net = [], [], [], [], [], [], []
+    for payslip in payslips:
+        status = (payslip.get("status") or "").upper()
+        if status == "VOID":
+            continue
+        user_id = payslip.get("userId") or ""
+        if user_id not in index:
+            index[user_id] = len(index)
+            names.append(payslip.get("userName") or "")
+        employee.append(index[user_id])
+        month.append((payslip.get("period") or {}).get("month", 0) or 0)
+        paid.append(status == "PAID")
+        gross.append(payslip.get("grossAmount", 0) or 0)
+        deductions.append(payslip.get("totalDeductions", 0) or 0)
+        tax.append(payslip.get("totalTax", 0) or 0)
+        net.append(payslip.get("netPay", 0) or 0)
+    return PayrollSnapshot(
+        year=year,
+        fingerprint=fingerprint,
+        employee_ids=list(index),
+        employee_names=names,
+        employee=np.asarray(employee, dtype=np.int32),
+        month=np.asarray(month, dtype=np.int8),
+        paid=np.asarray(paid, dtype=bool),
+        gross=np.asarray(gross, dtype=np.float64),
+        deductions=np.asarray(deductions, dtype=np.float64),
+        tax=np.asarray(tax, dtype=np.float64),
+        net=np.asarray(net, dtype=np.float64),
+    )
+
+
+def monthly_totals(snapshot: PayrollSnapshot) -> Dict[str, np.ndarray]:
+    """Per-month sums and counts as length-13 arrays (index 0 is unused)."""
+    month = snapshot.month.astype(np.intp)
+    return {
+        "gross": np.bincount(month, weights=snapshot.gross, minlength=13),
+        "deductions": np.bincount(month, weights=snapshot.deductions, minlength=13),
+        "tax": np.bincount(month, weights=snapshot.tax, minlength=13),
+        "net": np.bincount(month, weights=snapshot.net, minlength=13),
+        "count": np.bincount(month, minlength=13),
+        "paid": np.bincount(month, weights=snapshot.paid, minlength=13).astype(np.int64),
+    }
+
+
+def employee_net_matrix(snapshot: PayrollSnapshot) -> np.ndarray:
+    """``(employees, 12)`` matrix of net pay per month."""
+    employees = len(snapshot.employee_ids)
+    month = snapshot.month.astype(np.intp)
+    valid = (month >= 1) & (month <= 12)
+    flat = snapshot.employee[valid].astype(np.intp) * 12 + (month[valid] - 1)
+    return np.bincount(flat, weights=snapshot.net[valid], minlength=employees * 12).reshape(employees, 12)
+
+
+def net_percentiles(snapshot: PayrollSnapshot, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, float]:
+    if not len(snapshot):
+        return {f"p{p:g}": 0.0 for p in percentiles}
+    values = np.percentile(snapshot.net, percentiles)
+    return {f"p{p:g}": round(float(value), 2) for p, value in zip(percentiles, values)}
+
+
+def employee_trends(snapshot: PayrollSnapshot) -> List[Dict[str, Any]]:
+    matrix = employee_net_matrix(snapshot)
+    totals = matrix.sum(axis=1)
+    months_paid = (matrix != 0).sum(axis=1)
+    trends = []
+    for i in np.argsort(-totals, kind="stable"):
+        trends.append({
+            "userId": snapshot.employee_ids[i],
+            "userName": snapshot.employee_names[i],
+            "monthlyNet": [round(float(v), 2) for v in matrix[i]],
+            "totalNet": round(float(totals[i]), 2),
+            "averageNet": round(float(totals[i] / months_paid[i]), 2) if months_paid[i] else 0,
+        })
+    return trends
+
+
+class _SnapshotCache:
+    def __init__(self, max_entries: int = SNAPSHOT_CACHE_SIZE):
+        self._entries: "OrderedDict[Tuple[str, int], PayrollSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+
+    def get(self, key: Tuple[str, int], fingerprint: Tuple) -> Optional[PayrollSnapshot]:
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is None or snapshot.fingerprint != fingerprint:
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def put(self, key: Tuple[str, int], snapshot: PayrollSnapshot) -> None:
+        with self._lock:
+            self._entries[key] = snapshot
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _SnapshotCache()
+
+
+def clear_snapshot_cache() -> None:
+    _cache.clear()
+
+
+def year_snapshot(db, org_id: str, year: int) -> PayrollSnapshot:
+    """Cached columnar snapshot of an org-year; rebuilt when any of its runs changed."""
+    runs = load_period_runs(db, org_id, [(year, month) for month in range(1, 13)])
+    fingerprint = tuple(sorted((run["id"], str(run.get("updatedAt"))) for run in runs.values()))
+    key = (org_id, year)
+    snapshot = _cache.get(key, fingerprint)
+    if snapshot is not None:
+        return snapshot
+
+    docs = db.collection('organizations', org_id, 'payslips').where("period.year", "==", year).get()
+    snapshot = build_snapshot(year, (doc.to_dict() or {} for doc in docs), fingerprint)
+    _cache.put(key, snapshot)
+    logger.info("payroll_snapshot_built", extra={"org_id": org_id, "year": year, "payslips": len(snapshot)})
+    return snapshot
@@ -0,0 +1,136 @@
+"""
+Per-employee payslip summary documents.
+
+``organizations/{orgId}/payslipSummaries/{userId}`` holds what the
+self-service payslip screen needs in one read:
+
+* ``items``: a list entry per visible (PUBLISHED or PAID) payslip, keyed by
+  payslip id. Roughly twelve entries a year keeps the document small.
+* ``ytd``: gross/deductions/tax/net/count per year over the visible payslips.
+
+Writers pass the payslip before and after a change to ``apply`` with the
+transaction or batch that writes the payslip. The summary is updated with a
+merge ``set`` in which item entries are replaced or deleted and YTD figures
+are moved with ``firestore.Increment``. Only a rebuild from the user's
+payslips stamps ``rebuiltAt``. A document without it is partial: it was
+created by an incremental write for a user whose earlier payslips predate the
+summaries. Such a document is rebuilt on first read, as is a missing one.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from firebase_admin import firestore
+
+VISIBLE_STATUSES = ("PUBLISHED", "PAID")
+LIST_FIELDS = ["runId", "number", "period", "status", "netPay", "currency", "paidAt"]
+_YTD_FIELDS = (("gross", "grossAmount"), ("deductions", "totalDeductions"), ("tax", "totalTax"), ("net", "netPay"))
+
+
+def summary_ref(db, org_id: str, user_id: str):
+    return db.collection('organizations', org_id, 'payslipSummaries').document(user_id)
+
+
+def is_visible(payslip: Optional[Dict[str, Any]]) -> bool:
+    return bool(payslip) and (payslip.get("status") or "").upper() in VISIBLE_STATUSES
+
+
+def list_item(payslip_id: str, payslip: Dict[str, Any]) -> Dict[str, Any]:
+    """The projection returned by ``/my-payslips`` for one payslip."""
+    return {"id": payslip_id, **{name: payslip.get(name) for name in LIST_FIELDS}}
+
+
+def period_key(item: Dict[str, Any]):
+    period = item.get("period") or {}
+    return (period.get("year", 0) or 0, period.get("month", 0) or 0)
+
+
+def _ytd_contribution(payslip: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    if not is_visible(payslip):
+        return {}
+    year = str((payslip.get("period") or {}).get("year", 0) or 0)
+    values = {name: payslip.get(source, 0) or 0 for name, source in _YTD_FIELDS}
+    values["count"] = 1
+    return {year: values}
+
+
+def summary_update(payslip_id: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Merge payload moving a payslip's summary entry from ``before`` to ``after``; None when nothing changes."""
+    if not is_visible(before) and not is_visible(after):
+        return None
+
+    old, new = _ytd_contribution(before), _ytd_contribution(after)
+    ytd: Dict[str, Dict[str, Any]] = {}
+    for year in set(old) | set(new):
+        for name in ("gross", "deductions", "tax", "net", "count"):
+            diff = new.get(year, {}).get(name, 0) - old.get(year, {}).get(name, 0)
+            if diff:
+                ytd.setdefault(year, {})[name] = firestore.Increment(round(diff, 2) if name != "count" else diff)
+
+    update: Dict[str, Any] = {
+        "userId": (after or before).get("userId"),
+        "items": {payslip_id: list_item(payslip_id, after) if is_visible(after) else firestore.DELETE_FIELD},
+        "updatedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    if ytd:
+        update["ytd"] = ytd
+    return update
+
+
+def apply(writer, db, org_id: str, payslip_id: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> bool:
+    """Queue the summary change on ``writer`` (a transaction or WriteBatch); returns whether a write was added."""
+    update = summary_update(payslip_id, before, after)
+    user_id = (after or before or {}).get("userId")
+    if update is None or not user_id:
+        return False
+    writer.set(summary_ref(db, org_id, user_id), update, merge=True)
+    return True
+
+
+def build_summary(user_id: str, payslips: List[tuple]) -> Dict[str, Any]:
+    """Full summary document for ``(payslip_id, data)`` pairs."""
+    items: Dict[str, Dict[str, Any]] = {}
+    ytd: Dict[str, Dict[str, float]] = {}
+    for payslip_id, data in payslips:
+        if not is_visible(data):
+            continue
+        items[payslip_id] = list_item(payslip_id, data)
+        for year, values in _ytd_contribution(data).items():
+            totals = ytd.setdefault(year, {"gross": 0, "deductions": 0, "tax": 0, "net": 0, "count": 0})
+            for name, value in values.items():
+                totals[name] += value
+    for totals in ytd.values():
+        for name in ("gross", "deductions", "tax", "net"):
+            totals[name] = round(totals[name], 2)
+    now = datetime.now(timezone.utc).isoformat()
+    return {"userId": user_id, "items": items, "ytd": ytd, "updatedAt": now, "rebuiltAt": now}
+
+
+def rebuild_summary(db, org_id: str, user_id: str) -> Dict[str, Any]:
+    docs = db.collection('organizations', org_id, 'payslips').where("userId", "==", user_id).get()
+    summary = build_summary(user_id, [(doc.id, doc.to_dict() or {}) for doc in docs])
+    summary_ref(db, org_id, user_id).set(summary)
+    return summary
+
+
+def read_summary(db, org_id: str, user_id: str, year: Optional[int] = None) -> Dict[str, Any]:
+    """Summary view for the payslip screen: latest payslip, YTD totals and the recent items, newest first."""
+    snapshot = summary_ref(db, org_id, user_id).get()
+    summary = snapshot.to_dict() if snapshot.exists else None
+    if not (summary or {}).get("rebuiltAt"):
+        # Increments alone create a partial document; only a rebuild makes it complete.
+        summary = rebuild_summary(db, org_id, user_id)
+    items = sorted((summary.get("items") or {}).values(), key=period_key, reverse=True)
+    year = year or datetime.now(timezone.utc).year
+    ytd = (summary.get("ytd") or {}).get(str(year)) or {}
+    return {
+        "latest": items[0] if items else None,
+        "ytd": {
+            "year": year,
+            "gross": round(ytd.get("gross", 0), 2),
+            "deductions": round(ytd.get("deductions", 0), 2),
+            "tax": round(ytd.get("tax", 0), 2),
+            "net": round(ytd.get("net", 0), 2),
+            "count": ytd.get("count", 0),
+        },
+        "payslips": items,
+    }
@@ -0,0 +1,283 @@
+"""
+Multi-receipt upload.
+
+Crew members often submit 5-15 cab receipts at once after a shoot. Sent one at
+a time, each receipt pays for its own SHA-256 query, OCR call and duplicate
+lookup. ``verify_batch`` processes the whole set together:
+
+1. **Exact duplicates**: files are hashed with SHA-256. Repeats inside the
+   batch are dropped, and one ``fileHash in [...]`` query per 30 hashes
+   checks the org's history. A history match is saved as a rejected
+   duplicate, the same as a single upload would save it.
+2. **Forensics** run concurrently on the shared process pool. A file whose
+   pHash *and* dHash are near-identical to an earlier file in the batch is
+   the same photo sent twice (re-encoded, resized). It is dropped before OCR.
+3. **OCR** runs concurrently, at most ``RECEIPT_BATCH_OCR_CONCURRENCY`` calls
+   at a time.
+4. **Duplicates and scoring**: the ride-ID and pHash lookups for every file
+   resolve in one ``get_all``. Files are then scored in upload order, and
+   each one is also compared with the files before it in the batch. The
+   verdicts therefore match uploading the files one after another.
+5. **Save**: all records are written in one batched write, then indexed and
+   counted (``receipt_stats``).
+
+A file whose forensics or OCR fails is not failed outright. It is recorded
+PENDING and handed to the background verification queue, which retries it.
+Its verdict carries ``status: queued`` and a status URL. Wall time is
+roughly that of the slowest file, not the sum.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from . import image_forensics, receipt_index, receipt_stats, receipt_verification
+from .advanced_verification_service import advanced_verification_service
+from .ocr_service import ocr_service
+
+logger = logging.getLogger(__name__)
+
+# Firestore caps ``in`` filters at 30 values.
+_IN_QUERY_LIMIT = 30
+# pHash distance below which two batch files are treated as the same photo; dHash must agree too
+# (DHASH_EXACT), because receipts from the same app can share a pHash.
+SAME_PHOTO_PHASH_DISTANCE = 4
+
+
+class BatchTooLargeError(Exception):
+    """Raised when a batch has more files than RECEIPT_BATCH_MAX_FILES."""
+
+
+@dataclass
+class BatchFile:
+    index: int
+    filename: str
+    content_type: Optional[str]
+    data: bytes
+    sha256: str = ""
+    receipt_id: Optional[str] = None
+    image_path: Optional[str] = None
+    analysis: Optional[Dict[str, Any]] = None
+    ocr: Optional[Dict[str, Any]] = None
+    timings: Dict[str, Any] = field(default_factory=dict)
+    verdict: Optional[Dict[str, Any]] = None
+
+    def settle(self, status: str, **fields) -> None:
+        self.verdict = {"index": self.index, "filename": self.filename, "status": status, **fields}
+
+
+def max_files() -> int:
+    return int(os.getenv("RECEIPT_BATCH_MAX_FILES", "20"))
+
+
+def _ocr_concurrency() -> int:
+    return max(1, int(os.getenv("RECEIPT_BATCH_OCR_CONCURRENCY", "4")))
+
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 2)
+
+
+def _find_hash_matches(receipts_ref, hashes: List[str]) -> Dict[str, Any]:
+    """First non-rejected stored receipt per SHA-256; rejected uploads may be retried."""
+    matches = {}
+    for start in range(0, len(hashes), _IN_QUERY_LIMIT):
+        chunk = hashes[start:start + _IN_QUERY_LIMIT]
+        for snapshot in receipts_ref.where('fileHash', 'in', chunk).stream():
+            data = snapshot.to_dict() or {}
+            if data.get("status") not in ["REJECTED"]:
+                matches.setdefault(data.get("fileHash"), snapshot)
+    return matches
+
+
+def _same_photo(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    a_hashes, b_hashes = a.get("perceptual_hashes", {}), b.get("perceptual_hashes", {})
+    distances = []
+    for key in ("phash", "dhash"):
+        x, y = receipt_index.hash_to_int(a_hashes.get(key)), receipt_index.hash_to_int(b_hashes.get(key))
+        if x is None or y is None:
+            return False
+        distances.append(receipt_index.hamming(x, y))
+    return (distances[0] < SAME_PHOTO_PHASH_DISTANCE
+            and distances[1] < advanced_verification_service.thresholds["DHASH_EXACT"])
+
+
+async def verify_batch(db, org_id: str, files: List[BatchFile], *, event_id: str, user_id: str, user_name: str,
+                       team_members: List[Any],
+                       queue: Optional[receipt_verification.VerificationQueue] = None) -> Dict[str, Any]:
+    """Verify ``files`` together; returns one verdict per file, in upload order."""
+    if len(files) > max_files():
+        raise BatchTooLargeError(f"At most {max_files()} receipts per batch")
+    started = time.perf_counter()
+    receipts_ref = db.collection('organizations', org_id, 'receipts')
+    timings = {}
+
+    # --- LAYER 0: SHA-256, within the batch and against history ---
+    stage = time.perf_counter()
+    first_by_hash: Dict[str, BatchFile] = {}
+    unique: List[BatchFile] = []
+    for item in files:
+        item.sha256 = hashlib.sha256(item.data).hexdigest()
+        if item.content_type and not item.content_type.startswith('image/'):
+            item.settle("error", error="File must be an image")
+        elif item.sha256 in first_by_hash:
+            item.settle("duplicate", duplicateOfFile=first_by_hash[item.sha256].index,
+                        issues=[f"Same file as {first_by_hash[item.sha256].filename} in this batch"])
+        else:
+            first_by_hash[item.sha256] = item
+            unique.append(item)
+
+    matches = await asyncio.to_thread(_find_hash_matches, receipts_ref, [item.sha256 for item in unique])
+    fresh: List[BatchFile] = []
+    writes = []
+    for item in unique:
+        match = matches.get(item.sha256)
+        if match is None:
+            fresh.append(item)
+            continue
+        ref = receipts_ref.document()
+        record = receipt_verification.exact_duplicate_receipt(
+            ref.id, match_id=match.id, match=match.to_dict() or {}, event_id=event_id, file_hash=item.sha256,
+            user_id=user_id, user_name=user_name, filename=item.filename, team_members=team_members,
+        )
+        writes.append((ref, record))
+        item.settle(**receipt_verification.exact_duplicate_response(record))
+    timings["fileHash"] = _ms(stage)
+
+    # --- LAYER 1 & 3: FORENSICS, concurrently on the process pool ---
+    stage = time.perf_counter()
+    analyses = await asyncio.gather(*(image_forensics.analyze(item.data) for item in fresh), return_exceptions=True)
+    kept: List[BatchFile] = []
+    deferred: List[BatchFile] = []
+    for item, analysis in zip(fresh, analyses):
+        if isinstance(analysis, Exception):
+            logger.warning(f"Batch forensics failed for {item.filename}; deferring to the queue: {analysis}")
+            deferred.append(item)
+            continue
+        item.timings.update(analysis.pop("timings_ms", {}))
+        item.analysis = analysis
+        same = next((other for other in kept if _same_photo(other.analysis, analysis)), None)
+        if same is not None:
+            item.settle("duplicate", duplicateOfFile=same.index,
+                        issues=[f"Same photo as {same.filename} in this batch"])
+            continue
+        kept.append(item)
+    timings["forensics"] = _ms(stage)
+
+    # --- LAYER 2: OCR, bounded concurrency ---
+    stage = time.perf_counter()
+    slots = asyncio.Semaphore(_ocr_concurrency())
+
+    async def run_ocr(item: BatchFile) -> None:
+        async with slots:
+            ocr_started = time.perf_counter()
+            item.ocr = await asyncio.to_thread(ocr_service.process_receipt, item.data)
+            item.timings["ocr"] = _ms(ocr_started)
+
+    await asyncio.gather(*(run_ocr(item) for item in kept))
+    analysed = []
+    for item in kept:
+        if item.ocr and item.ocr.get("success"):
+            analysed.append(item)
+        else:
+            logger.warning(f"Batch OCR failed for {item.filename}; deferring to the queue")
+            deferred.append(item)
+    timings["ocr"] = _ms(stage)
+
+    # --- Shared duplicate lookup ---
+    stage = time.perf_counter()
+
+    def find_candidates():
+        per_file = {
+            item.index: receipt_verification.duplicate_candidate_ids(
+                db, org_id, item.ocr["data"].get("rideId"), item.analysis["perceptual_hashes"].get("phash")
+            )
+            for item in analysed
+        }
+        loaded = receipt_index.load_receipts(db, org_id, [rid for ids in per_file.values() for rid in ids])
+        return {index: [loaded[rid] for rid in ids if rid in loaded] for index, ids in per_file.items()}
+
+    candidates = await asyncio.to_thread(find_candidates)
+    timings["duplicates"] = _ms(stage)
+
+    # --- Scoring, in upload order, against history and earlier files in this batch ---
+    scored = []
+    for item in sorted(analysed, key=lambda f: f.index):
+        ref = receipts_ref.document()
+        item.receipt_id = ref.id
+        pending = receipt_verification.pending_receipt(
+            ref.id, event_id=event_id, file_hash=item.sha256, user_id=user_id, user_name=user_name,
+            filename=item.filename, file_size=len(item.data), team_members=team_members, image_path=None,
+        )
+        earlier = [record for _, record in scored]
+        record, result = receipt_verification.score_receipt(
+            ref.id, pending, len(item.data), item.analysis, item.ocr, candidates[item.index] + earlier, item.timings
+        )
+        record = {**pending, **record, "verificationAttempts": 1}
+        scored.append((item, {**record, "id": ref.id}))
+        writes.append((ref, record))
+        item.settle("success", receiptId=ref.id, **result)
+
+    # --- Deferred files: recorded PENDING and retried by the verification queue ---
+    for item in deferred:
+        ref = receipts_ref.document()
+        item.receipt_id = ref.id
+        writes.append((ref, receipt_verification.pending_receipt(
+            ref.id, event_id=event_id, file_hash=item.sha256, user_id=user_id, user_name=user_name,
+            filename=item.filename, file_size=len(item.data), team_members=team_members, image_path=None,
+        )))
+
+    # --- Save: images, one batched write, then the duplicate indexes ---
+    stage = time.perf_counter()
+    stored = [item for item, _ in scored] + deferred
+    paths = await asyncio.gather(*(
+        asyncio.to_thread(receipt_verification.store_image, org_id, item.receipt_id, item.filename, item.data,
+                          item.content_type)
+        for item in stored
+    ))
+    for item, path in zip(stored, paths):
+        item.image_path = path
+    path_by_id = {item.receipt_id: item.image_path for item in stored}
+
+    def save():
+        batch, saved = db.batch(), []
+        for ref, record in writes:
+            if path_by_id.get(ref.id):
+                record = {**record, "imagePath": path_by_id[ref.id], "imageUrl": path_by_id[ref.id]}
+            batch.set(ref, record)
+            saved.append(record)
+        batch.commit()
+        for record in saved:
+            receipt_stats.record_transition(db, org_id, None, record)
+        for item, record in scored:
+            receipt_index.add_receipt(db, org_id, item.receipt_id, item.ocr["data"].get("rideId"),
+                                      item.analysis["perceptual_hashes"].get("phash"), record.get("upload_timestamp"))
+
+    await asyncio.to_thread(save)
+    timings["save"] = _ms(stage)
+
+    queue = queue or receipt_verification.get_queue()
+    for item in deferred:
+        try:
+            await queue.submit(receipt_verification.VerificationJob(
+                org_id=org_id, receipt_id=item.receipt_id, image_bytes=item.data, image_path=item.image_path
+            ))
+            item.settle("queued", receiptId=item.receipt_id, state=receipt_verification.QUEUED,
+                        statusUrl=f"/api/receipts/{item.receipt_id}/status")
+        except receipt_verification.QueueFullError as busy:
+            # Left QUEUED in Firestore; the periodic recovery sweep picks it up.
+            item.settle("queued", receiptId=item.receipt_id, state=receipt_verification.QUEUED,
+                        statusUrl=f"/api/receipts/{item.receipt_id}/status", warning=str(busy))
+
+    verdicts = [item.verdict for item in files]
+    summary = {}
+    for verdict in verdicts:
+        summary[verdict["status"]] = summary.get(verdict["status"], 0) + 1
+    timings["total"] = _ms(started)
+    logger.info("receipt_batch_timings", extra={
+        "org_id": org_id, "files": len(files), "ocr_calls": len(kept), "summary": summary, "timings_ms": timings,
+    })
+    return {"results": verdicts, "summary": summary, "timingsMs": timings}
@@ -0,0 +1,300 @@
+"""
+Per-org indexes for receipt duplicate detection.
+
+Two lookups replace streaming every receipt the org has ever submitted:
+
+* **Ride IDs**: ``organizations/{orgId}/receiptRideIds/{key}`` maps a
+  normalized ride ID to the first receipt that carried it, so an exact match is
+  a single document read.
+* **Perceptual hashes**: 64-bit pHashes are kept as ``"<hex>:<receiptId>"``
+  entries in chunk documents under ``organizations/{orgId}/receiptHashIndex``.
+  A ``meta`` document records how many entries exist. Each worker loads the
+  chunks into an in-memory BK-tree, using popcount (Hamming) distance, and
+  caches it per org. It reloads only when ``meta.count`` moves past what it
+  has seen.
+
+Orgs whose receipts predate the index are backfilled from one full scan the
+first time they are queried. Deleted receipts are dropped lazily: matches are
+resolved with ``get_all`` and any that no longer exist are ignored.
+"""
+import hashlib
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from firebase_admin import firestore
+from google.api_core import exceptions as g_exceptions
+
+logger = logging.getLogger(__name__)
+
+# Entries per chunk document; ~30 bytes each keeps a chunk far below the 1 MiB limit.
+CHUNK_SIZE = 5000
+
+_SAFE_KEY = re.compile(r"^[A-Za-z0-9_\-]{1,100}$")
+
+
+def normalize_ride_id(ride_id: Any) -> Optional[str]:
+    if ride_id is None:
+        return None
+    normalized = str(ride_id).strip().lower()
+    return normalized or None
+
+
+def _ride_id_ref(db, org_id: str, normalized: str):
+    key = normalized if _SAFE_KEY.match(normalized) else hashlib.sha256(normalized.encode()).hexdigest()
+    return db.collection('organizations', org_id, 'receiptRideIds').document(key)
+
+
+def _hash_index(db, org_id: str):
+    return db.collection('organizations', org_id, 'receiptHashIndex')
+
+
+def _chunk_id(index: int) -> str:
+    return f"chunk_{index:04d}"
+
+
+def hash_to_int(hex_hash: Optional[str]) -> Optional[int]:
+    try:
+        return int(hex_hash, 16) if hex_hash else None
+    except (TypeError, ValueError):
+        return None
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance."""
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [hash, items, {distance: child}]
+        self.size = 0
+
+    def add(self, value: int, item: Any) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[Any, int]]:
+        """All items within ``max_distance`` of ``value``, nearest first."""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.extend((item, distance) for item in node[1])
+            # Triangle inequality: only children in [d - r, d + r] can hold matches.
+            for child_distance, child in list(node[2].items()):
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda match: match[1])
+        return found
+
+
+@dataclass
+class _CachedIndex:
+    count: int
+    tree: BKTree
+
+
+_cache: Dict[str, _CachedIndex] = {}
+_cache_lock = threading.Lock()
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def _parse_entry(entry: str) -> Optional[Tuple[int, str]]:
+    hex_hash, _, receipt_id = entry.partition(":")
+    value = hash_to_int(hex_hash)
+    return (value, receipt_id) if value is not None and receipt_id else None
+
+
+def _entry(phash: str, receipt_id: str) -> str:
+    return f"{phash.lower()}:{receipt_id}"
+
+
+def backfill(db, org_id: str) -> int:
+    """Build both indexes from the org's existing receipts; returns the number of hash entries."""
+    receipts = []
+    for doc in db.collection('organizations', org_id, 'receipts').stream():
+        data = doc.to_dict() or {}
+        receipts.append((data.get("createdAt") or data.get("upload_timestamp") or "", doc.id, data))
+    receipts.sort(key=lambda item: (str(item[0]), item[1]))
+
+    entries: List[str] = []
+    ride_ids: Dict[str, Dict[str, Any]] = {}
+    for created_at, receipt_id, data in receipts:
+        normalized = normalize_ride_id((data.get("extractedData") or {}).get("rideId"))
+        if normalized and normalized not in ride_ids:
+            ride_ids[normalized] = {"rideId": normalized, "receiptId": receipt_id, "createdAt": created_at}
+        phash = ((data.get("image_fingerprints") or {}).get("perceptual_hashes") or {}).get("phash")
+        if hash_to_int(phash) is not None:
+            entries.append(_entry(phash, receipt_id))
+
+    batch, writes = db.batch(), 0
+    for normalized, payload in ride_ids.items():
+        batch.set(_ride_id_ref(db, org_id, normalized), payload)
+        writes += 1
+        if writes == 500:
+            batch.commit()
+            batch, writes = db.batch(), 0
+    for start in range(0, len(entries), CHUNK_SIZE):
+        batch.set(_hash_index(db, org_id).document(_chunk_id(start // CHUNK_SIZE)), {"entries": entries[start:start + CHUNK_SIZE]})
+        writes += 1
+        if writes == 500:
+            batch.commit()
+            batch, writes = db.batch(), 0
+    batch.set(_hash_index(db, org_id).document("meta"), {
+        "count": len(entries),
+        "backfilledAt": datetime.now(timezone.utc).isoformat(),
+    })
+    batch.commit()
+    logger.info("receipt_index_backfilled", extra={"org_id": org_id, "receipts": len(receipts),
+                                                   "ride_ids": len(ride_ids), "hashes": len(entries)})
+    return len(entries)
+
+
+def _meta_count(db, org_id: str) -> Optional[int]:
+    meta = _hash_index(db, org_id).document("meta").get()
+    return (meta.to_dict() or {}).get("count", 0) if meta.exists else None
+
+
+def load_tree(db, org_id: str) -> BKTree:
+    """The org's pHash BK-tree, from the worker cache when it is current."""
+    count = _meta_count(db, org_id)
+    if count is None:
+        count = backfill(db, org_id)
+    with _cache_lock:
+        cached = _cache.get(org_id)
+        if cached is not None and cached.count == count:
+            return cached.tree
+
+    tree = BKTree()
+    for doc in _hash_index(db, org_id).get():
+        if doc.id == "meta":
+            continue
+        for entry in (doc.to_dict() or {}).get("entries", []):
+            parsed = _parse_entry(entry)
+            if parsed:
+                tree.add(*parsed)
+    with _cache_lock:
+        _cache[org_id] = _CachedIndex(count=count, tree=tree)
+    return tree
+
+
+def find_ride_id(db, org_id: str, ride_id: Any) -> Optional[str]:
+    """Receipt ID that first used ``ride_id``, or None."""
+    normalized = normalize_ride_id(ride_id)
+    if not normalized:
+        return None
+    snapshot = _ride_id_ref(db, org_id, normalized).get()
+    return (snapshot.to_dict() or {}).get("receiptId") if snapshot.exists else None
+
+
+def find_ride_ids(db, org_id: str, ride_ids: Iterable[Any]) -> Dict[str, str]:
+    """``{normalized ride ID: first receipt ID}`` for many ride IDs in one ``get_all``."""
+    keys = [key for key in dict.fromkeys(normalize_ride_id(r) for r in ride_ids) if key]
+    if not keys:
+        return {}
+    owners = {}
+    for snapshot in db.get_all([_ride_id_ref(db, org_id, key) for key in keys]):
+        data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+        if data.get("receiptId"):
+            owners[data.get("rideId") or snapshot.id] = data["receiptId"]
+    return owners
+
+
+def default_max_distance() -> int:
+    """The radius ``find_duplicate_receipts`` treats as the same app layout (distance below PHASH_TEMPLATE)."""
+    # Imported here: the verification service itself imports this module.
+    from .advanced_verification_service import advanced_verification_service
+    return advanced_verification_service.thresholds["PHASH_TEMPLATE"] - 1
+
+
+def find_similar(db, org_id: str, phash: Optional[str], max_distance: Optional[int] = None) -> List[Tuple[str, int]]:
+    """
+    ``(receipt_id, distance)`` for indexed receipts within ``max_distance`` of
+    ``phash``; by default, every receipt that would count as a template match.
+    """
+    value = hash_to_int(phash)
+    if value is None:
+        return []
+    return load_tree(db, org_id).search(value, default_max_distance() if max_distance is None else max_distance)
+
+
+def load_receipts(db, org_id: str, receipt_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Existing receipts by ID in one ``get_all``; deleted ones are simply absent."""
+    ids = list(dict.fromkeys(receipt_ids))
+    if not ids:
+        return {}
+    collection = db.collection('organizations', org_id, 'receipts')
+    found = {}
+    for snapshot in db.get_all([collection.document(receipt_id) for receipt_id in ids]):
+        if snapshot.exists:
+            found[snapshot.id] = {**(snapshot.to_dict() or {}), "id": snapshot.id}
+    return found
+
+
+def add_receipt(db, org_id: str, receipt_id: str, ride_id: Any, phash: Optional[str], created_at: Optional[str] = None) -> None:
+    """Index a newly saved receipt; the first receipt with a ride ID keeps it."""
+    normalized = normalize_ride_id(ride_id)
+    if normalized:
+        ride_ref = _ride_id_ref(db, org_id, normalized)
+        try:
+            ride_ref.create({"rideId": normalized, "receiptId": receipt_id, "createdAt": created_at})
+        except g_exceptions.AlreadyExists:
+            # Re-point the key if the receipt that held it has since been deleted.
+            current = (ride_ref.get().to_dict() or {}).get("receiptId")
+            if current and not load_receipts(db, org_id, [current]):
+                ride_ref.set({"rideId": normalized, "receiptId": receipt_id, "createdAt": created_at})
+
+    if hash_to_int(phash) is None:
+        return
+    if _meta_count(db, org_id) is None:
+        # Backfill scans receipts, including the one just saved.
+        backfill(db, org_id)
+        return
+
+    meta_ref = _hash_index(db, org_id).document("meta")
+    entry = _entry(phash, receipt_id)
+
+    @firestore.transactional
+    def append(transaction):
+        meta = meta_ref.get(transaction=transaction)
+        count = (meta.to_dict() or {}).get("count", 0) if meta.exists else 0
+        transaction.set(
+            _hash_index(db, org_id).document(_chunk_id(count // CHUNK_SIZE)),
+            {"entries": firestore.ArrayUnion([entry])},
+            merge=True,
+        )
+        transaction.set(meta_ref, {"count": count + 1, "updatedAt": datetime.now(timezone.utc).isoformat()}, merge=True)
+        return count
+
+    previous = append(db.transaction())
+    with _cache_lock:
+        cached = _cache.get(org_id)
+        if cached is not None and cached.count == previous:
+            cached.tree.add(hash_to_int(phash), receipt_id)
+            cached.count = previous + 1
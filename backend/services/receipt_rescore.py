@@ -0,0 +1,320 @@
+"""
+Re-score stored receipts after a risk threshold change.
+
+Thresholds in ``AdvancedVerificationService.thresholds`` are applied when a
+receipt is verified, so changing them used to affect only new uploads. A
+re-score job lives at ``organizations/{orgId}/receiptRescoreJobs/{jobId}`` and
+runs in the background, without touching any image or calling OCR:
+
+* Receipts are read in pages ordered by document ID. A field mask limits each
+  read to the stored fingerprints, extracted data and decision fields.
+* The ride-ID duplicate check is re-evaluated against ``receipt_index``. One
+  ``get_all`` per page looks up the owners of the page's ride IDs, and a second
+  confirms that those owners still exist. A receipt duplicates its ride ID
+  owner if it is not the owner itself.
+* ``calculate_risk_scores_bulk`` scores the whole page with NumPy, using the
+  job's threshold overrides (``ELA_HIGH``, ``REJECT_SCORE``, ``REVIEW_SCORE``)
+  on top of the service defaults.
+* Receipts whose score, decision or issues changed are updated. Each change is
+  also written to the job's ``changes`` subcollection as the diff report. The
+  updates, report rows and progress cursor of a page commit in one
+  transaction that also checks the job is still claimed by this runner (see
+  ``background_jobs``), so a resumed job continues exactly after the last
+  committed page and two runners never apply the same page.
+
+Only automatic decisions are re-scored. Receipts that an admin reviewed, that
+are still being verified, or that were rejected as exact file duplicates are
+skipped. With ``dryRun`` the report is written but receipts are not.
+``PHASH_TEMPLATE`` and ``DHASH_EXACT`` do not contribute to the risk score, so
+they have no effect here.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from firebase_admin import firestore
+
+from . import background_jobs, receipt_index, receipt_stats, receipt_verification
+from .advanced_verification_service import advanced_verification_service
+from ..utils.exports import paginate
+
+logger = logging.getLogger(__name__)
+
+RESCORE_JOBS = "receiptRescoreJobs"
+# Two writes per changed receipt (update + report row) plus the job document stay under Firestore's 500.
+PAGE_SIZE = 200
+RESCORABLE_THRESHOLDS = ("ELA_HIGH", "REJECT_SCORE", "REVIEW_SCORE")
+# Statuses the verifier sets itself; anything else was decided by a person.
+AUTOMATIC_STATUSES = {"VERIFIED", "AUTO_APPROVED", "MANUAL_REVIEW", "REJECT"}
+REPORT_HEADER = ["Receipt ID", "Status Before", "Status After", "Risk Before", "Risk After",
+                 "Issues Before", "Issues After"]
+
+_FIELDS = [
+    "status", "riskScore", "issues", "duplicateOf", "eventId", "amountValue", "createdAt",
+    "extractedData.amount", "extractedData.totalAmount", "extractedData.rideId",
+    "image_fingerprints.ela_analysis.manipulation_score",
+    "adminDecision", "admin_decision", "verificationState",
+]
+
+
+def _job_ref(db, org_id: str, job_id: str):
+    return db.collection("organizations", org_id, RESCORE_JOBS).document(job_id)
+
+
+def create_rescore_job(db, org_id: str, thresholds: Dict[str, Any], dry_run: bool,
+                       user_data: Dict[str, Any]) -> Dict[str, Any]:
+    unknown = set(thresholds) - set(RESCORABLE_THRESHOLDS)
+    if unknown:
+        raise ValueError(f"Thresholds that affect the risk score: {', '.join(RESCORABLE_THRESHOLDS)}; "
+                         f"got {', '.join(sorted(unknown))}")
+    job_id = str(uuid4())
+    job = {
+        "id": job_id,
+        "status": "QUEUED",
+        "thresholds": {**{k: advanced_verification_service.thresholds[k] for k in RESCORABLE_THRESHOLDS},
+                       **thresholds},
+        "dryRun": dry_run,
+        "processed": 0,
+        "skipped": 0,
+        "changed": 0,
+        "transitions": {},
+        "cursor": None,
+        "createdBy": user_data.get("uid"),
+        "createdAt": firestore.SERVER_TIMESTAMP,
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+    _job_ref(db, org_id, job_id).set(job)
+    return job
+
+
+def get_rescore_job(db, org_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+    doc = _job_ref(db, org_id, job_id).get()
+    return doc.to_dict() if doc.exists else None
+
+
+def resume_rescore_job(db, org_id: str, job_id: str) -> Optional[str]:
+    """Claim a failed or orphaned job for resuming; the runner id, or None if it cannot be resumed."""
+    claimed = background_jobs.claim(db, _job_ref(db, org_id, job_id), resume=True)
+    return claimed[0] if claimed else None
+
+
+def _pages(db, org_id: str, after_id: Optional[str], page_size: int):
+    """Yield pages of receipt snapshots in document-ID order, resuming after ``after_id``."""
+    query = db.collection("organizations", org_id, "receipts").select(_FIELDS).order_by("__name__")
+    cursor = after_id
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            # An ID cursor keeps working even if that receipt has since been deleted.
+            page_query = page_query.start_after({"__name__": cursor})
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        yield docs
+        if len(docs) < page_size:
+            return
+        cursor = docs[-1].id
+
+
+def is_rescorable(data: Dict[str, Any]) -> bool:
+    if data.get("adminDecision") or data.get("admin_decision"):
+        return False
+    if data.get("verificationState", receipt_verification.DONE) != receipt_verification.DONE:
+        return False
+    if (data.get("duplicateOf") or {}).get("type") == "EXACT_FILE_MATCH":
+        return False
+    return data.get("status") in AUTOMATIC_STATUSES
+
+
+def _ride_duplicates(db, org_id: str, rows: List[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Existing ride-ID owner each row duplicates, keyed by receipt ID (None when it is the owner)."""
+    ride_ids = {row["id"]: receipt_index.normalize_ride_id((row.get("extractedData") or {}).get("rideId"))
+                for row in rows}
+    owners = receipt_index.find_ride_ids(db, org_id, ride_ids.values())
+    others = {owners[r] for rid, r in ride_ids.items() if r in owners and owners[r] != rid}
+    loaded = receipt_index.load_receipts(db, org_id, others)
+    duplicates = {}
+    for rid, ride_id in ride_ids.items():
+        owner = owners.get(ride_id)
+        duplicates[rid] = loaded.get(owner) if owner and owner != rid else None
+    return duplicates
+
+
+def rescore_page(db, org_id: str, docs, thresholds: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Changes for one page: ``{id, before, after, update}`` for each receipt whose outcome moved."""
+    rows = []
+    for doc in docs:
+        data = doc.to_dict() or {}
+        if is_rescorable(data):
+            rows.append({**data, "id": doc.id})
+    if not rows:
+        return []
+
+    duplicates = _ride_duplicates(db, org_id, rows)
+    extracted = [row.get("extractedData") or {} for row in rows]
+    results = advanced_verification_service.calculate_risk_scores_bulk(
+        [((row.get("image_fingerprints") or {}).get("ela_analysis") or {}).get("manipulation_score", 0) or 0
+         for row in rows],
+        [bool(e.get("amount")) for e in extracted],
+        [bool(e.get("rideId")) for e in extracted],
+        [(duplicates[row["id"]] or {}).get("id") for row in rows],
+        thresholds,
+    )
+
+    changes = []
+    for row, risk in zip(rows, results):
+        status = "VERIFIED" if risk["decision"] == "AUTO_APPROVE" else risk["decision"]
+        current = "VERIFIED" if row.get("status") == "AUTO_APPROVED" else row.get("status")
+        if (status == current and risk["risk_score"] == row.get("riskScore")
+                and risk["issues"] == row.get("issues")):
+            continue
+        owner = duplicates[row["id"]]
+        duplicate_of = row.get("duplicateOf")
+        if owner:
+            duplicate_of = {
+                "type": "EXACT_ID_MATCH",
+                "match_type": "EXACT_ID_MATCH",
+                "receipt_id": owner["id"],
+                "submitted_by": owner.get("submittedByName", "Unknown"),
+                "submitted_at": owner.get("createdAt", ""),
+                "confidence": 100,
+                "details": "Ride IDs match exactly.",
+            }
+        elif (duplicate_of or {}).get("type") == "EXACT_ID_MATCH":
+            duplicate_of = None
+        update = {
+            "status": status,
+            "riskScore": risk["risk_score"],
+            "issues": risk["issues"],
+            "duplicateOf": duplicate_of,
+            "verification_results.risk_score": risk["risk_score"],
+            "verification_results.decision": risk["decision"],
+            "verification_results.issues": risk["issues"],
+        }
+        if row.get("verificationState") == receipt_verification.DONE:
+            # What GET /receipts/{id}/status returns for queue-verified receipts
+            update.update({
+                "verificationResult.verification.risk_score": risk["risk_score"],
+                "verificationResult.verification.decision": risk["decision"],
+                "verificationResult.verification.issues": risk["issues"],
+                "verificationResult.verification.riskLevel": receipt_verification.risk_level(risk["risk_score"]),
+                "verificationResult.verification.duplicateOf": duplicate_of,
+                "verificationResult.verification.isDuplicate": bool(duplicate_of),
+            })
+        changes.append({
+            "id": row["id"],
+            "before": {"status": row.get("status"), "riskScore": row.get("riskScore"), "issues": row.get("issues")},
+            "after": {"status": status, "riskScore": risk["risk_score"], "issues": risk["issues"]},
+            "update": update,
+            "row": row,
+        })
+    return changes
+
+
+async def run_rescore_job(db, org_id: str, job_id: str, *, runner_id: Optional[str] = None,
+                          page_size: int = PAGE_SIZE) -> None:
+    """
+    Run a re-score job, claiming it first unless ``runner_id`` comes from
+    ``resume_rescore_job``. Never raises.
+    """
+    job_ref = _job_ref(db, org_id, job_id)
+    started = time.perf_counter()
+    try:
+        if runner_id is None:
+            claimed = await asyncio.to_thread(background_jobs.claim, db, job_ref)
+            if not claimed:
+                return
+            runner_id, job = claimed
+        else:
+            job = await asyncio.to_thread(get_rescore_job, db, org_id, job_id)
+            if not job:
+                return
+        thresholds = job.get("thresholds") or {}
+        dry_run = bool(job.get("dryRun"))
+        processed = int(job.get("processed") or 0)
+        skipped = int(job.get("skipped") or 0)
+        changed = int(job.get("changed") or 0)
+        transitions = dict(job.get("transitions") or {})
+
+        receipts = db.collection("organizations", org_id, "receipts")
+        pages = _pages(db, org_id, job.get("cursor"), page_size)
+        while True:
+            docs = await asyncio.to_thread(next, pages, None)
+            if docs is None:
+                break
+            changes = await asyncio.to_thread(rescore_page, db, org_id, docs, thresholds)
+
+            processed += len(docs)
+            skipped += sum(1 for doc in docs if not is_rescorable(doc.to_dict() or {}))
+            changed += len(changes)
+            for change in changes:
+                if change["before"]["status"] != change["after"]["status"]:
+                    key = f"{change['before']['status']}->{change['after']['status']}"
+                    transitions[key] = transitions.get(key, 0) + 1
+
+            def write_page(transaction):
+                for change in changes:
+                    if not dry_run:
+                        transaction.update(receipts.document(change["id"]), {
+                            **change["update"], "rescoredAt": firestore.SERVER_TIMESTAMP, "rescoreJobId": job_id,
+                        })
+                    transaction.set(job_ref.collection("changes").document(change["id"]), {
+                        "receiptId": change["id"], "before": change["before"], "after": change["after"],
+                    })
+                # The cursor moves in the same commit as the page's writes, so a resume neither skips nor repeats.
+                transaction.update(job_ref, {
+                    "processed": processed,
+                    "skipped": skipped,
+                    "changed": changed,
+                    "transitions": transitions,
+                    "cursor": docs[-1].id,
+                    "heartbeatAt": firestore.SERVER_TIMESTAMP,
+                    "updatedAt": firestore.SERVER_TIMESTAMP,
+                })
+
+            def commit_page():
+                background_jobs.commit_as_runner(db, job_ref, runner_id, write_page)
+                # Only the runner whose page committed counts its transitions
+                if not dry_run:
+                    for change in changes:
+                        before = change["row"]
+                        receipt_stats.record_transition(db, org_id, before, {**before, "status": change["after"]["status"]})
+
+            await asyncio.to_thread(commit_page)
+
+        await asyncio.to_thread(background_jobs.update_as_runner, db, job_ref, runner_id, {
+            "status": "COMPLETED",
+            "completedAt": firestore.SERVER_TIMESTAMP,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        })
+        logger.info(
+            "receipt_rescore_completed",
+            extra={"org_id": org_id, "job_id": job_id, "processed": processed, "changed": changed,
+                   "dry_run": dry_run, "transitions": transitions,
+                   "latency_ms": round((time.perf_counter() - started) * 1000, 1)},
+        )
+    except background_jobs.ClaimLost:
+        logger.info("receipt_rescore_superseded", extra={"org_id": org_id, "job_id": job_id})
+    except Exception as e:
+        logger.warning(f"Receipt re-score {job_id} for org {org_id} failed: {e}")
+        try:
+            background_jobs.update_as_runner(db, job_ref, runner_id, {
+                "status": "FAILED", "lastError": str(e), "updatedAt": firestore.SERVER_TIMESTAMP})
+        except Exception:
+            pass
+
+
+def report_rows(db, org_id: str, job_id: str):
+    """Diff report rows for CSV export, in receipt-ID order."""
+    query = _job_ref(db, org_id, job_id).collection("changes").order_by("__name__")
+    for doc in paginate(query):
+        change = doc.to_dict() or {}
+        before, after = change.get("before") or {}, change.get("after") or {}
+        yield [
+            change.get("receiptId", doc.id),
+            before.get("status"), after.get("status"),
+            before.get("riskScore"), after.get("riskScore"),
+            "; ".join(before.get("issues") or []), "; ".join(after.get("issues") or []),
+        ]
@@ -0,0 +1,196 @@
+"""
+Incremental receipt dashboard counters.
+
+The dashboard summary used to stream every receipt the org had, parse each
+amount string and normalize each status on every request. The counters now
+live in aggregate documents:
+
+* ``organizations/{orgId}/aggregates/receipts`` for the whole org, and
+* ``organizations/{orgId}/aggregates/receipts/events/{eventId}`` per event.
+
+Each holds ``totalReceipts``, ``totalAmount`` and ``statusCounts`` (pending /
+verified / rejected / needs_review). Every receipt write (upload, verification,
+review, status change, delete) reports the document before and after the write
+to ``record_transition``. The difference is applied with ``firestore.Increment``,
+so concurrent uploads never contend on a transaction.
+
+Amounts are normalized once, when the receipt is written, into ``amountValue``.
+Older receipts without it are parsed the legacy way. Orgs whose receipts
+predate the counters (no ``rebuiltAt`` on the org document) are rebuilt from
+one full scan the first time the summary or list is read. The same scan copies
+``upload_timestamp`` into ``createdAt`` on receipts from the old synchronous
+upload, because the paginated list is ordered by ``createdAt``. ``rebuild``
+also repairs drift.
+"""
+import logging
+from typing import Any, Dict, Optional
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+STATUS_BUCKETS = ("pending", "verified", "rejected", "needs_review")
+
+_VERIFIED = {"VERIFIED", "AUTO_APPROVED", "APPROVED"}
+_REJECTED = {"REJECTED", "HIGH_RISK"}
+_NEEDS_REVIEW = {"MANUAL_REVIEW", "MEDIUM_RISK", "FLAGGED"}
+
+
+def aggregate_ref(db, org_id: str):
+    return db.collection("organizations").document(org_id).collection("aggregates").document("receipts")
+
+
+def event_ref(db, org_id: str, event_id: str):
+    return aggregate_ref(db, org_id).collection("events").document(event_id)
+
+
+def normalize_amount(value: Any) -> float:
+    """Parse an extracted amount ("$1,250.00", "300", 300) to a float; 0 when unreadable."""
+    if not value:
+        return 0.0
+    if isinstance(value, str):
+        value = value.replace('$', '').replace(',', '')
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def receipt_amount(doc: Dict[str, Any]) -> float:
+    if "amountValue" in doc:
+        return float(doc.get("amountValue") or 0)
+    extracted = doc.get("extractedData") or {}
+    return normalize_amount(extracted.get("amount") or extracted.get("totalAmount"))
+
+
+def status_bucket(status: Any) -> str:
+    status = str(getattr(status, "value", status) or "PENDING")
+    if status in _VERIFIED:
+        return "verified"
+    if status in _REJECTED:
+        return "rejected"
+    if status in _NEEDS_REVIEW:
+        return "needs_review"
+    return "pending"
+
+
+def transition_delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Counter deltas keyed by scope: ``""`` for the org, the event ID for its event."""
+    deltas: Dict[str, Dict[str, Any]] = {}
+    for doc, sign in ((before, -1), (after, 1)):
+        if not doc:
+            continue
+        amount, bucket = receipt_amount(doc), status_bucket(doc.get("status"))
+        for scope in [""] + ([doc["eventId"]] if doc.get("eventId") else []):
+            delta = deltas.setdefault(scope, {"totalReceipts": 0, "totalAmount": 0.0, "statusCounts": {}})
+            delta["totalReceipts"] += sign
+            delta["totalAmount"] += sign * amount
+            delta["statusCounts"][bucket] = delta["statusCounts"].get(bucket, 0) + sign
+    for delta in deltas.values():
+        delta["totalAmount"] = round(delta["totalAmount"], 2)
+        delta["statusCounts"] = {k: v for k, v in delta["statusCounts"].items() if v}
+    return {scope: d for scope, d in deltas.items() if d["totalReceipts"] or d["totalAmount"] or d["statusCounts"]}
+
+
+def record_transition(db, org_id: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+    """Apply the counter delta for one receipt write. Never raises; drift is repaired by rebuild."""
+    try:
+        for scope, delta in transition_delta(before, after).items():
+            payload = {
+                "totalReceipts": firestore.Increment(delta["totalReceipts"]),
+                "totalAmount": firestore.Increment(delta["totalAmount"]),
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            }
+            # Empty maps would replace the stored map under merge, so only send non-empty ones.
+            if delta["statusCounts"]:
+                payload["statusCounts"] = {k: firestore.Increment(v) for k, v in delta["statusCounts"].items()}
+            ref = event_ref(db, org_id, scope) if scope else aggregate_ref(db, org_id)
+            ref.set(payload, merge=True)
+    except Exception as e:
+        logger.warning(f"Failed to update receipt counters for org {org_id}: {e}")
+
+
+def summary_from_aggregate(aggregate: Dict[str, Any]) -> Dict[str, Any]:
+    counts = aggregate.get("statusCounts") or {}
+    return {
+        "totalReceipts": int(aggregate.get("totalReceipts", 0) or 0),
+        "totalAmount": round(float(aggregate.get("totalAmount", 0) or 0), 2),
+        "statusCounts": {bucket: int(counts.get(bucket, 0) or 0) for bucket in STATUS_BUCKETS},
+    }
+
+
+def ensure_backfilled(db, org_id: str):
+    """
+    The org counter snapshot, rebuilding first for orgs that predate the counters.
+    Increments alone create a partial document; only a rebuild makes it complete.
+    """
+    org_doc = aggregate_ref(db, org_id).get()
+    if not (org_doc.exists and (org_doc.to_dict() or {}).get("rebuiltAt")):
+        rebuild(db, org_id)
+        org_doc = aggregate_ref(db, org_id).get()
+    return org_doc
+
+
+def get_summary(db, org_id: str, event_id: Optional[str] = None) -> Dict[str, Any]:
+    """Dashboard summary from the counters: one read for the org, two for an event."""
+    org_doc = ensure_backfilled(db, org_id)
+    doc = event_ref(db, org_id, event_id).get() if event_id else org_doc
+    return summary_from_aggregate((doc.to_dict() or {}) if doc.exists else {})
+
+
+def rebuild(db, org_id: str) -> Dict[str, Any]:
+    """
+    Recompute the org and event counters from every receipt and overwrite them.
+    Returns the totals before and after so callers can report drift.
+    """
+    totals: Dict[str, Dict[str, Any]] = {}
+    stamps = []
+    for snapshot in db.collection("organizations", org_id, "receipts").stream():
+        data = snapshot.to_dict() or {}
+        if not data.get("createdAt") and data.get("upload_timestamp"):
+            # Receipts from the old synchronous upload lack createdAt, which the list is ordered by.
+            stamps.append((snapshot.reference, data["upload_timestamp"]))
+        for scope, delta in transition_delta(None, data).items():
+            fresh = totals.setdefault(scope, {"totalReceipts": 0, "totalAmount": 0.0, "statusCounts": {}})
+            fresh["totalReceipts"] += delta["totalReceipts"]
+            fresh["totalAmount"] += delta["totalAmount"]
+            for bucket, count in delta["statusCounts"].items():
+                fresh["statusCounts"][bucket] = fresh["statusCounts"].get(bucket, 0) + count
+
+    ref = aggregate_ref(db, org_id)
+    previous = ref.get()
+    previous_total = int(((previous.to_dict() or {}) if previous.exists else {}).get("totalReceipts", 0) or 0)
+
+    # Events that no longer have receipts are zeroed rather than left stale.
+    for stale in ref.collection("events").stream():
+        totals.setdefault(stale.id, {"totalReceipts": 0, "totalAmount": 0.0, "statusCounts": {}})
+
+    batch, writes = db.batch(), 0
+    for receipt_ref, created_at in stamps:
+        batch.update(receipt_ref, {"createdAt": created_at})
+        writes += 1
+        if writes == 500:
+            batch.commit()
+            batch, writes = db.batch(), 0
+    for scope, fresh in totals.items():
+        fresh = {**fresh, "totalAmount": round(fresh["totalAmount"], 2),
+                 "rebuiltAt": firestore.SERVER_TIMESTAMP, "updatedAt": firestore.SERVER_TIMESTAMP}
+        batch.set(event_ref(db, org_id, scope) if scope else ref, fresh)
+        writes += 1
+        if writes == 500:
+            batch.commit()
+            batch, writes = db.batch(), 0
+    if "" not in totals:
+        batch.set(ref, {"totalReceipts": 0, "totalAmount": 0.0, "statusCounts": {},
+                        "rebuiltAt": firestore.SERVER_TIMESTAMP, "updatedAt": firestore.SERVER_TIMESTAMP})
+    batch.commit()
+
+    rebuilt_total = totals.get("", {}).get("totalReceipts", 0)
+    logger.info("receipt_counters_rebuilt", extra={"org_id": org_id, "receipts": rebuilt_total,
+                                                   "events": len(totals) - ("" in totals),
+                                                   "created_at_backfilled": len(stamps)})
+    return {
+        "previousTotalReceipts": previous_total,
+        "totalReceipts": rebuilt_total,
+        "drift": rebuilt_total - previous_total,
+    }
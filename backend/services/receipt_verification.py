@@ -0,0 +1,661 @@
+"""
+Background verification for uploaded receipts.
+
+``POST /receipts/upload`` used to run forensics, the OCR HTTP call (up to 30s
+with retries), duplicate lookups and risk scoring before it responded, so
+mobile clients on slow networks timed out. The route now only runs the
+SHA-256 duplicate check and stores the image. It then writes the receipt as
+``PENDING`` with ``verificationState: QUEUED`` and returns its id. Everything
+else runs here:
+
+* ``verify_receipt`` is the pipeline that used to live in the route. It
+  writes the final record onto the receipt, along with the payload the upload
+  route used to return (``verificationResult``).
+* ``VerificationQueue`` is a bounded in-process queue drained by
+  ``RECEIPT_VERIFY_WORKERS`` asyncio workers. Failures are retried with
+  exponential backoff and jitter. A job that exhausts its attempts leaves the
+  receipt ``PENDING`` with ``verificationState: FAILED`` for manual review.
+  ``InlineVerificationQueue`` runs each job to completion inside ``submit``.
+  It is the local stand-in tests use (``RECEIPT_VERIFY_QUEUE=inline``).
+* The receipt documents are the durable record. ``start_recovery`` runs
+  ``requeue_stale`` at startup and then every
+  ``RECEIPT_VERIFY_RECOVERY_INTERVAL`` seconds (default
+  ``STALE_AFTER_SECONDS``). It re-submits receipts left QUEUED/PROCESSING by a
+  stopped instance, a shutdown or a full queue. Each one is claimed with an
+  update-time precondition, so two instances do not both take the same
+  receipt. A receipt can still sit in one instance's backlog while another
+  re-queues it, so ``verify_receipt`` claims the QUEUED -> PROCESSING move the
+  same way (stamping its job's ``verificationClaim``) and the loser stops
+  before any OCR call.
+
+Clients watch ``GET /receipts/{id}/status``, which long-polls through
+``wait_for_status``. It wakes when a local job finishes and otherwise re-reads
+the document every second.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from firebase_admin import firestore, storage
+from google.api_core import exceptions as g_exceptions
+
+from . import image_forensics, receipt_index, receipt_stats
+from .advanced_verification_service import advanced_verification_service
+from .ocr_service import ocr_service
+from ..schemas.receipt_schema import create_receipt_record_from_analysis
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "QUEUED"
+PROCESSING = "PROCESSING"
+DONE = "DONE"
+FAILED = "FAILED"
+ACTIVE_STATES = (QUEUED, PROCESSING)
+
+DEFAULT_MAX_ATTEMPTS = 3
+STALE_AFTER_SECONDS = 600
+# Long-poll re-read interval when the job is running on another instance.
+POLL_INTERVAL_SECONDS = 1.0
+
+
+class QueueFullError(Exception):
+    """Raised when the verification backlog is at capacity."""
+
+
+class VerificationError(Exception):
+    """A verification step failed; ``retryable`` says whether another attempt can help."""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+@dataclass
+class VerificationJob:
+    org_id: str
+    receipt_id: str
+    # Bytes are handed over in-process; image_path lets a restarted instance reload them.
+    image_bytes: Optional[bytes] = None
+    image_path: Optional[str] = None
+    attempts: int = 0
+    # Written to the receipt as verificationClaim while this job owns the PROCESSING state.
+    claim_id: str = field(default_factory=lambda: uuid4().hex)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _receipt_ref(db, org_id: str, receipt_id: str):
+    return db.collection('organizations', org_id, 'receipts').document(receipt_id)
+
+
+# --- Image storage ---
+
+def store_image(org_id: str, receipt_id: str, filename: str, data: bytes, content_type: Optional[str]) -> Optional[str]:
+    """Upload the original to Firebase Storage; returns the blob path, or None if storage is unavailable."""
+    path = f"organizations/{org_id}/receipts/{receipt_id}/{filename or 'receipt'}"
+    try:
+        storage.bucket().blob(path).upload_from_string(data, content_type=content_type or "image/jpeg")
+        return path
+    except Exception as e:
+        logger.warning(f"Receipt image upload failed for {receipt_id}; verifying from memory only: {e}")
+        return None
+
+
+def load_image(path: str) -> bytes:
+    return storage.bucket().blob(path).download_as_bytes()
+
+
+# --- Records ---
+
+def pending_receipt(receipt_id: str, *, event_id: str, file_hash: str, user_id: str, user_name: str,
+                    filename: str, file_size: int, team_members: List[Any], image_path: Optional[str]) -> Dict[str, Any]:
+    """Receipt document written by the accept step, before any analysis."""
+    now = _now()
+    return {
+        "id": receipt_id,
+        "eventId": event_id,
+        "fileHash": file_hash,
+        "submittedBy": user_id,
+        "submittedByName": user_name,
+        "imageUrl": image_path or f"receipts/{receipt_id}/{filename}",
+        "imagePath": image_path,
+        "filename": filename,
+        "fileSize": file_size,
+        "extractedData": {},
+        "status": "PENDING",
+        "teamMembers": team_members,
+        "createdAt": now,
+        "verificationState": QUEUED,
+        "verificationAttempts": 0,
+        "verificationUpdatedAt": now,
+    }
+
+
+def status_view(receipt_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """What ``GET /receipts/{id}/status`` returns for a receipt document."""
+    # Receipts verified before the queue existed have no state and are complete.
+    state = data.get("verificationState", DONE)
+    view = {
+        "receiptId": receipt_id,
+        "state": state,
+        "status": data.get("status"),
+        "attempts": data.get("verificationAttempts", 0),
+    }
+    if state == DONE and data.get("verificationResult"):
+        view.update(data["verificationResult"])
+    if state == FAILED:
+        view["error"] = data.get("verificationError")
+    return view
+
+
+def _frontend_extracted_data(extracted: Dict[str, Any]) -> Dict[str, Any]:
+    extracted = dict(extracted or {})
+    # Map date + time to timestamp if both exist
+    if extracted.get("date") and extracted.get("time"):
+        extracted["timestamp"] = f"{extracted['date']} {extracted['time']}"
+    elif extracted.get("date"):
+        extracted["timestamp"] = extracted["date"]
+    # Map pickup/dropoff to locations object for frontend
+    if extracted.get("pickup") or extracted.get("dropoff"):
+        extracted["locations"] = {"pickup": extracted.get("pickup"), "dropoff": extracted.get("dropoff")}
+    return extracted
+
+
+def risk_level(risk_score: int) -> str:
+    return "LOW_RISK" if risk_score < 30 else ("MEDIUM_RISK" if risk_score < 60 else "HIGH_RISK")
+
+
+def duplicate_candidate_ids(db, org_id: str, ride_id: Any, phash: Optional[str]) -> List[str]:
+    """Receipt IDs worth comparing against: the ride-ID owner plus pHash neighbours."""
+    candidate_ids = [receipt_index.find_ride_id(db, org_id, ride_id)]
+    candidate_ids += [rid for rid, _ in receipt_index.find_similar(db, org_id, phash)]
+    return [rid for rid in dict.fromkeys(candidate_ids) if rid]
+
+
+def score_receipt(receipt_id: str, pending: Dict[str, Any], file_size: int, image_analysis: Dict[str, Any],
+                  ocr_result: Dict[str, Any], existing_receipts: List[Dict[str, Any]],
+                  timings: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Duplicate matching and risk scoring for an analysed receipt. Returns the
+    receipt document to merge onto ``pending`` and the upload payload stored
+    as ``verificationResult``.
+    """
+    ride_id = ocr_result["data"].get("rideId")
+    duplicate_matches = advanced_verification_service.find_duplicate_receipts(
+        image_analysis["perceptual_hashes"], ride_id, existing_receipts
+    )
+    risk = advanced_verification_service.calculate_comprehensive_risk_score(
+        image_analysis, ocr_result, duplicate_matches, None
+    )
+
+    upload_metadata = {
+        "id": receipt_id,
+        "uploader_id": pending.get("submittedBy"),
+        "uploader_name": pending.get("submittedByName", ""),
+        "event_id": pending.get("eventId"),
+        "team_members": pending.get("teamMembers", []),
+        "filename": pending.get("filename", ""),
+        "file_size": pending.get("fileSize", file_size),
+    }
+    receipt_dict = create_receipt_record_from_analysis(
+        upload_metadata, image_analysis, ocr_result, duplicate_matches, risk
+    ).to_dict()
+
+    duplicate_of = duplicate_matches[0] if duplicate_matches else None
+    result = {
+        "verification": {
+            **risk,
+            "riskLevel": risk_level(risk["risk_score"]),
+            "extractedData": _frontend_extracted_data(ocr_result.get("data", {})),
+            "duplicateOf": duplicate_of,
+            "isDuplicate": len(duplicate_matches) > 0,
+        },
+        "timingsMs": timings,
+    }
+    # Legacy/Frontend compatibility fields, as the synchronous upload wrote them
+    extracted = ocr_result.get("data", {})
+    receipt_dict.update({
+        "extractedData": extracted,
+        "amountValue": receipt_stats.normalize_amount(extracted.get("amount") or extracted.get("totalAmount")),
+        "riskScore": risk["risk_score"],
+        "status": "VERIFIED" if risk["decision"] == "AUTO_APPROVE" else risk["decision"],
+        "issues": risk["issues"],
+        "duplicateOf": duplicate_of,
+        "verificationState": DONE,
+        "verificationUpdatedAt": _now(),
+        "verificationResult": result,
+        "verificationError": None,
+    })
+    return receipt_dict, result
+
+
+def exact_duplicate_receipt(receipt_id: str, *, match_id: str, match: Dict[str, Any], event_id: str, file_hash: str,
+                            user_id: str, user_name: str, filename: str, team_members: List[Any]) -> Dict[str, Any]:
+    """Rejected record for a byte-identical resubmission, saved so it appears in history."""
+    return {
+        "id": receipt_id,
+        "eventId": event_id,
+        "fileHash": file_hash,
+        "submittedBy": user_id,
+        "submittedByName": user_name,
+        "imageUrl": f"receipts/{receipt_id}/{filename}",
+        "extractedData": {},
+        "riskScore": 100,
+        "status": "REJECT",
+        "issues": [f"Exact file duplicate of Receipt {match_id}"],
+        "duplicateOf": {
+            "type": "EXACT_FILE_MATCH",
+            "match_type": "EXACT_FILE_MATCH",
+            "receipt_id": match_id,
+            "submitted_by": match.get("submittedByName", "Unknown"),
+            "submitted_at": match.get("createdAt", ""),
+            "confidence": 100,
+            "details": "Exact file hash match (SHA-256)"
+        },
+        "createdAt": datetime.utcnow().isoformat(),
+        "teamMembers": team_members,
+    }
+
+
+def exact_duplicate_response(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "duplicate",
+        "receiptId": record["id"],
+        "verification": {
+            "riskScore": 100,
+            "decision": "REJECT",
+            "issues": record["issues"],
+            "isDuplicate": True,
+            "duplicateOf": record["duplicateOf"],
+        },
+    }
+
+
+# --- Pipeline ---
+
+async def verify_receipt(db, job: VerificationJob) -> Optional[Dict[str, Any]]:
+    """Forensics, OCR, duplicate lookup and risk scoring for one pending receipt."""
+    ref = _receipt_ref(db, job.org_id, job.receipt_id)
+    snapshot = await asyncio.to_thread(ref.get)
+    if not snapshot.exists:
+        logger.info(f"Receipt {job.receipt_id} deleted before verification; skipping")
+        return None
+    pending = snapshot.to_dict() or {}
+    if pending.get("verificationState") == DONE:
+        return pending.get("verificationResult")
+    if pending.get("verificationState") == PROCESSING and pending.get("verificationClaim") != job.claim_id:
+        logger.info(f"Receipt {job.receipt_id} is being verified by another worker; skipping")
+        return None
+
+    # Claim against the version just read: if another instance re-queued or claimed the receipt since, stop here
+    try:
+        await asyncio.to_thread(ref.update, {
+            "verificationState": PROCESSING,
+            "verificationClaim": job.claim_id,
+            "verificationAttempts": job.attempts,
+            "verificationUpdatedAt": _now(),
+        }, option=db.write_option(last_update_time=snapshot.update_time))
+    except (g_exceptions.FailedPrecondition, g_exceptions.NotFound):
+        logger.info(f"Receipt {job.receipt_id} was claimed by another worker; skipping")
+        return None
+
+    image_bytes = job.image_bytes
+    if image_bytes is None:
+        path = job.image_path or pending.get("imagePath")
+        if not path:
+            raise VerificationError("Receipt image is no longer available", retryable=False)
+        image_bytes = await asyncio.to_thread(load_image, path)
+
+    # --- LAYER 1 & 3: VISUALS & FORENSICS (process pool) ---
+    try:
+        image_analysis = await image_forensics.analyze(image_bytes)
+    except image_forensics.ForensicsBusyError as busy:
+        raise VerificationError(str(busy))
+    timings = dict(image_analysis.pop("timings_ms", {}))
+
+    # --- LAYER 2: AI OCR (API COST) ---
+    stage = time.perf_counter()
+    ocr_result = await asyncio.to_thread(ocr_service.process_receipt, image_bytes)
+    timings["ocr"] = round((time.perf_counter() - stage) * 1000, 2)
+    if not ocr_result["success"]:
+        raise VerificationError(f"OCR Failed: {ocr_result.get('error', 'Unknown error')}")
+
+    # --- UNIFIED VERIFICATION ---
+    # Candidates come from the ride-ID lookup and the pHash BK-tree, not the full receipt history
+    stage = time.perf_counter()
+    ride_id = ocr_result["data"].get("rideId")
+    phash = image_analysis["perceptual_hashes"].get("phash")
+
+    def find_candidates():
+        candidate_ids = [rid for rid in duplicate_candidate_ids(db, job.org_id, ride_id, phash) if rid != job.receipt_id]
+        return list(receipt_index.load_receipts(db, job.org_id, candidate_ids).values())
+
+    existing_receipts = await asyncio.to_thread(find_candidates)
+    timings["duplicates"] = round((time.perf_counter() - stage) * 1000, 2)
+
+    receipt_dict, result = score_receipt(
+        job.receipt_id, pending, len(image_bytes), image_analysis, ocr_result, existing_receipts, timings
+    )
+    receipt_dict["verificationAttempts"] = job.attempts
+
+    stage = time.perf_counter()
+
+    def save():
+        ref.set(receipt_dict, merge=True)
+        receipt_stats.record_transition(db, job.org_id, pending, {**pending, **receipt_dict})
+        receipt_index.add_receipt(db, job.org_id, job.receipt_id, ride_id, phash, receipt_dict.get("upload_timestamp"))
+
+    await asyncio.to_thread(save)
+    timings["save"] = round((time.perf_counter() - stage) * 1000, 2)
+    logger.info("receipt_verification_timings", extra={
+        "org_id": job.org_id, "receipt_id": job.receipt_id, "attempts": job.attempts, "timings_ms": timings,
+    })
+    return result
+
+
+async def mark_failed(db, job: VerificationJob, error: Exception) -> None:
+    """Leave the receipt PENDING for manual review once automatic verification gives up."""
+    ref = _receipt_ref(db, job.org_id, job.receipt_id)
+    try:
+        await asyncio.to_thread(ref.update, {
+            "verificationState": FAILED,
+            "verificationAttempts": job.attempts,
+            "verificationError": str(error),
+            "verificationUpdatedAt": _now(),
+            "issues": [f"Automatic verification failed: {error}"],
+        })
+    except g_exceptions.NotFound:
+        pass
+
+
+# --- Queue ---
+
+class VerificationQueue:
+    """
+    Bounded in-process job queue drained by a pool of asyncio workers.
+
+    At most ``max_pending`` jobs may be queued, running or waiting for a retry
+    at once; beyond that ``submit`` raises ``QueueFullError``. Failures are
+    retried with exponential backoff and jitter until ``max_attempts``, then
+    handed to ``on_failure``.
+    """
+
+    def __init__(self, runner: Callable[[VerificationJob], Awaitable[Any]],
+                 on_failure: Callable[[VerificationJob, Exception], Awaitable[None]],
+                 workers: int = 4, max_pending: int = 100,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay: float = 2.0):
+        self.runner = runner
+        self.on_failure = on_failure
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.stats = {"queued": 0, "done": 0, "retried": 0, "failed": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    def _ensure_workers(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def submit(self, job: VerificationJob) -> None:
+        if self._pending >= self.max_pending:
+            raise QueueFullError("Receipt verification is at capacity; retry shortly")
+        self._ensure_workers()
+        self._pending += 1
+        self._idle.clear()
+        self.stats["queued"] += 1
+        self._finished.setdefault(job.receipt_id, asyncio.Event())
+        self._queue.put_nowait(job)
+
+    def is_pending(self, receipt_id: str) -> bool:
+        """Whether this queue holds a job for ``receipt_id`` that has not settled yet."""
+        return receipt_id in self._finished
+
+    async def wait(self, receipt_id: str, timeout: float) -> bool:
+        """
+        Wait up to ``timeout`` for this queue's job on ``receipt_id`` to finish.
+        Returns True early if it does. Jobs this queue does not know about (done
+        already, or running on another instance) simply take the full timeout.
+        """
+        event = self._finished.get(receipt_id)
+        if event is None:
+            await asyncio.sleep(timeout)
+            return False
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no job is queued, running or waiting to retry; False on timeout."""
+        if self._idle is None:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            await self._attempt(job)
+
+    async def _attempt(self, job: VerificationJob) -> bool:
+        """Run one attempt; returns True when the job is settled (done or failed)."""
+        job.attempts += 1
+        try:
+            await self.runner(job)
+        except Exception as e:
+            retryable = getattr(e, "retryable", True)
+            if retryable and job.attempts < self.max_attempts:
+                self.stats["retried"] += 1
+                delay = self.base_delay * (2 ** (job.attempts - 1))
+                logger.warning(f"Receipt {job.receipt_id} verification attempt {job.attempts} failed, retrying: {e}")
+                self._schedule_retry(job, delay + random.uniform(0, delay))
+                return False
+            logger.error(f"Receipt {job.receipt_id} verification failed after {job.attempts} attempts: {e}")
+            try:
+                await self.on_failure(job, e)
+            except Exception as mark_error:
+                logger.error(f"Could not record verification failure for {job.receipt_id}: {mark_error}")
+            self._settle(job, "failed")
+            return True
+        self._settle(job, "done")
+        return True
+
+    def _schedule_retry(self, job: VerificationJob, delay: float) -> None:
+        async def requeue():
+            await asyncio.sleep(delay)
+            self._queue.put_nowait(job)
+        asyncio.create_task(requeue())
+
+    def _settle(self, job: VerificationJob, outcome: str) -> None:
+        self.stats[outcome] += 1
+        self._pending -= 1
+        event = self._finished.pop(job.receipt_id, None)
+        if event is not None:
+            event.set()
+        if self._pending == 0:
+            self._idle.set()
+
+
+class InlineVerificationQueue(VerificationQueue):
+    """Runs each job, retries included, before ``submit`` returns. For tests and local debugging."""
+
+    async def submit(self, job: VerificationJob) -> None:
+        self._idle = self._idle or asyncio.Event()
+        self._pending += 1
+        self.stats["queued"] += 1
+        self._finished.setdefault(job.receipt_id, asyncio.Event())
+        while not await self._attempt(job):
+            await asyncio.sleep(self.base_delay * (2 ** (job.attempts - 1)))
+
+    def _schedule_retry(self, job: VerificationJob, delay: float) -> None:
+        pass
+
+
+def queue_from_env(db_factory: Callable[[], Any] = firestore.client) -> VerificationQueue:
+    """Pick the queue from RECEIPT_VERIFY_QUEUE (workers | inline)."""
+    async def runner(job):
+        return await verify_receipt(db_factory(), job)
+
+    async def on_failure(job, error):
+        await mark_failed(db_factory(), job, error)
+
+    kind = os.getenv("RECEIPT_VERIFY_QUEUE", "workers").lower()
+    options = dict(
+        max_attempts=int(os.getenv("RECEIPT_VERIFY_MAX_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS))),
+        base_delay=float(os.getenv("RECEIPT_VERIFY_RETRY_DELAY", "2.0")),
+    )
+    if kind == "inline":
+        return InlineVerificationQueue(runner, on_failure, **options)
+    return VerificationQueue(
+        runner, on_failure,
+        workers=int(os.getenv("RECEIPT_VERIFY_WORKERS", "4")),
+        max_pending=int(os.getenv("RECEIPT_VERIFY_MAX_PENDING", "100")),
+        **options,
+    )
+
+
+_queue: Optional[VerificationQueue] = None
+_queue_loop = None
+
+
+def get_queue() -> VerificationQueue:
+    # asyncio primitives belong to one loop; recreate if the loop changed (tests, reloads).
+    global _queue, _queue_loop
+    loop = asyncio.get_running_loop()
+    if _queue is None or _queue_loop is not loop:
+        _queue = queue_from_env()
+        _queue_loop = loop
+    return _queue
+
+
+def set_queue(queue: Optional[VerificationQueue]) -> None:
+    global _queue, _queue_loop
+    _queue = queue
+    _queue_loop = asyncio.get_running_loop() if queue is not None else None
+
+
+def shutdown() -> None:
+    global _queue, _recovery_task
+    if _recovery_task is not None:
+        _recovery_task.cancel()
+    _recovery_task = None
+    if _queue is not None:
+        _queue.close()
+    _queue = None
+
+
+async def wait_for_status(db, org_id: str, receipt_id: str, wait_seconds: float,
+                          queue: Optional[VerificationQueue] = None) -> Optional[Dict[str, Any]]:
+    """Status view, waiting up to ``wait_seconds`` for the receipt to leave QUEUED/PROCESSING."""
+    queue = queue or get_queue()
+    ref = _receipt_ref(db, org_id, receipt_id)
+    deadline = time.monotonic() + max(0.0, wait_seconds)
+    while True:
+        snapshot = await asyncio.to_thread(ref.get)
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict() or {}
+        remaining = deadline - time.monotonic()
+        if data.get("verificationState") not in ACTIVE_STATES or remaining <= 0:
+            return status_view(receipt_id, data)
+        await queue.wait(receipt_id, min(POLL_INTERVAL_SECONDS, remaining))
+
+
+def requeue_stale(db, queue: VerificationQueue, older_than_seconds: float = STALE_AFTER_SECONDS) -> List[VerificationJob]:
+    """
+    Claim receipts left QUEUED/PROCESSING by a stopped instance; returns the
+    jobs for the caller to ``submit``. Each claim is an update guarded by the
+    document's update time, so a concurrent claimer gets FailedPrecondition.
+    Receipts still pending in ``queue`` are left alone.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=older_than_seconds)).isoformat()
+    query = (
+        db.collection_group('receipts')
+        .where('verificationState', 'in', list(ACTIVE_STATES))
+        .where('verificationUpdatedAt', '<', cutoff)
+    )
+    jobs = []
+    for snapshot in query.stream():
+        if queue.is_pending(snapshot.id):
+            continue
+        data = snapshot.to_dict() or {}
+        try:
+            snapshot.reference.update(
+                {"verificationState": QUEUED, "verificationUpdatedAt": _now()},
+                option=db.write_option(last_update_time=snapshot.update_time),
+            )
+        except (g_exceptions.FailedPrecondition, g_exceptions.NotFound):
+            continue
+        org_id = snapshot.reference.parent.parent.id
+        jobs.append(VerificationJob(org_id=org_id, receipt_id=snapshot.id, image_path=data.get("imagePath"),
+                                    attempts=data.get("verificationAttempts", 0)))
+    return jobs
+
+
+async def recover_stale_jobs(db=None) -> int:
+    """One recovery sweep: resubmit verification jobs that nobody is running any more."""
+    try:
+        queue = get_queue()
+        jobs = await asyncio.to_thread(requeue_stale, db or firestore.client(), queue)
+        submitted = 0
+        for job in jobs:
+            try:
+                await queue.submit(job)
+            except QueueFullError:
+                # The rest stay QUEUED with a fresh timestamp; a later sweep takes them.
+                break
+            submitted += 1
+        if jobs:
+            logger.info("receipt_verification_recovered", extra={"jobs": submitted, "claimed": len(jobs)})
+        return submitted
+    except Exception as e:
+        logger.warning(f"Receipt verification recovery skipped: {e}")
+        return 0
+
+
+def _recovery_interval() -> float:
+    return float(os.getenv("RECEIPT_VERIFY_RECOVERY_INTERVAL", str(STALE_AFTER_SECONDS)))
+
+
+_recovery_task: Optional[asyncio.Task] = None
+
+
+async def _recovery_loop() -> None:
+    while True:
+        await recover_stale_jobs()
+        await asyncio.sleep(_recovery_interval())
+
+
+def start_recovery() -> asyncio.Task:
+    """Startup hook: sweep for orphaned verifications now and every recovery interval."""
+    global _recovery_task
+    if _recovery_task is None or _recovery_task.done():
+        _recovery_task = asyncio.create_task(_recovery_loop())
+    return _recovery_task
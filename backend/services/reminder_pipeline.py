@@ -0,0 +1,366 @@
+"""
+Bulk payment reminder pipeline.
+
+``send_bulk_reminders`` creates a job document under
+``organizations/{orgId}/reminderJobs/{jobId}`` and returns immediately; the
+job then runs in the background:
+
+1. the three due-date queries select candidate invoices,
+2. client documents are fetched with batched ``get_all`` calls,
+3. messages are rendered from the precompiled reminder template,
+4. a bounded pool of senders delivers them under a per-provider rate limit,
+   retrying transient failures with backoff and jitter,
+5. activity entries and ``lastReminderAt`` stamps are committed in batches and
+   progress counters are flushed to the job document for the UI to poll.
+"""
+import asyncio
+import logging
+import random
+import time
+import urllib.error
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import uuid4
+
+from firebase_admin import firestore
+
+from ..utils.email_service import email_service
+
+logger = logging.getLogger(__name__)
+
+REMINDER_JOBS = "reminderJobs"
+REMINDER_TYPES = ("due_soon", "overdue_1", "overdue_7")
+
+CLIENT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE_PER_SECOND = 10.0
+MAX_ATTEMPTS = 3
+# Results are flushed to Firestore (activities + job progress) every N sends.
+FLUSH_EVERY = 25
+MAX_RECORDED_ERRORS = 50
+
+
+@dataclass
+class ReminderTask:
+    invoice_id: str
+    invoice: Dict[str, Any]
+    reminder_type: str
+    client: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class ReminderOutcome:
+    invoice_id: str
+    reminder_type: str
+    status: str  # "sent" | "skipped" | "failed"
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate_per_second`` apart across all callers on the loop."""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+_provider_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(provider: str = "sendgrid", rate_per_second: float = DEFAULT_RATE_PER_SECOND) -> RateLimiter:
+    """Shared limiter per email provider so concurrent jobs respect one send budget."""
+    limiter = _provider_limiters.get(provider)
+    if limiter is None:
+        limiter = _provider_limiters[provider] = RateLimiter(rate_per_second)
+    return limiter
+
+
+def _job_ref(db, org_id: str, job_id: str):
+    return db.collection("organizations", org_id, REMINDER_JOBS).document(job_id)
+
+
+def _start_of_day(now: datetime) -> datetime:
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def reminder_queries(db, org_id: str, now: datetime):
+    """(reminder_type, query) pairs for T-3, T+1..T+6 and T+7 onwards."""
+    due_soon_date = now + timedelta(days=3)
+    overdue_1_date = now - timedelta(days=1)
+    overdue_7_date = now - timedelta(days=7)
+    invoices = db.collection("organizations", org_id, "invoices")
+    return [
+        ("due_soon", invoices
+         .where("status", "in", ["SENT", "PARTIAL"])
+         .where("dueDate", "<=", due_soon_date.isoformat())
+         .where("dueDate", ">", now.isoformat())),
+        ("overdue_1", invoices
+         .where("status", "in", ["SENT", "PARTIAL", "OVERDUE"])
+         .where("dueDate", "<=", overdue_1_date.isoformat())
+         .where("dueDate", ">", overdue_7_date.isoformat())),
+        ("overdue_7", invoices
+         .where("status", "in", ["SENT", "PARTIAL", "OVERDUE"])
+         .where("dueDate", "<=", overdue_7_date.isoformat())),
+    ]
+
+
+def _reminded_since(invoice: Dict[str, Any], since: datetime) -> bool:
+    last = invoice.get("lastReminderAt")
+    if not last:
+        return False
+    if isinstance(last, str):
+        try:
+            last = datetime.fromisoformat(last.replace("Z", "+00:00"))
+        except ValueError:
+            return False
+    try:
+        return last >= since
+    except TypeError:
+        return False
+
+
+def select_candidates(rows: Iterable, now: datetime) -> List[ReminderTask]:
+    """
+    Filter (reminder_type, invoice_id, invoice) rows down to invoices that still
+    owe money and have not been reminded today. Each invoice appears once.
+    """
+    since = _start_of_day(now)
+    seen = set()
+    tasks = []
+    for reminder_type, invoice_id, invoice in rows:
+        if invoice_id in seen:
+            continue
+        seen.add(invoice_id)
+        if (invoice.get("totals") or {}).get("amountDue", 0) <= 0:
+            continue
+        if not invoice.get("clientId") or _reminded_since(invoice, since):
+            continue
+        tasks.append(ReminderTask(invoice_id=invoice_id, invoice=invoice, reminder_type=reminder_type))
+    return tasks
+
+
+def fetch_clients(db, org_id: str, client_ids: Iterable[str], batch_size: int = CLIENT_BATCH_SIZE) -> Dict[str, Dict[str, Any]]:
+    """Load client documents with one ``get_all`` round trip per batch."""
+    ids = sorted(set(client_ids))
+    clients = {}
+    collection = db.collection("organizations", org_id, "clients")
+    for i in range(0, len(ids), batch_size):
+        refs = [collection.document(cid) for cid in ids[i:i + batch_size]]
+        for snap in db.get_all(refs):
+            if snap.exists:
+                clients[snap.id] = snap.to_dict()
+    return clients
+
+
+def _legacy_reminded_today(db, org_id: str, invoice_id: str, since: datetime) -> bool:
+    """Invoices reminded before ``lastReminderAt`` existed only have an activity entry."""
+    activities = (
+        db.collection("organizations", org_id, "invoices", invoice_id, "activities")
+        .where("type", "==", "reminder_sent")
+        .where("timestamp", ">=", since)
+        .limit(1)
+        .get()
+    )
+    return len(activities) > 0
+
+
+# Connection-level failures worth another attempt. Anything else without an HTTP
+# status (a missing transport, bad configuration) is permanent.
+_TRANSIENT_ERRORS = (ConnectionError, TimeoutError, urllib.error.URLError)
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, _TRANSIENT_ERRORS)
+
+
+async def deliver_with_retry(sender, message, limiter: RateLimiter, max_attempts: int = MAX_ATTEMPTS,
+                             base_delay: float = 0.5):
+    """Send one message, retrying transient failures. Returns (attempts, error_or_None)."""
+    for attempt in range(1, max_attempts + 1):
+        await limiter.acquire()
+        try:
+            await asyncio.to_thread(sender.deliver, message)
+            return attempt, None
+        except Exception as e:
+            if attempt >= max_attempts or not _is_retryable(e):
+                return attempt, str(e)
+            delay = base_delay * (2 ** (attempt - 1))
+            await asyncio.sleep(delay + random.uniform(0, delay))
+    return max_attempts, "exhausted retries"
+
+
+class _ProgressRecorder:
+    """Accumulates outcomes and flushes activities, invoice stamps and job counters in batches."""
+
+    def __init__(self, db, org_id: str, job_id: str, user_id: Optional[str], now: datetime):
+        self.db = db
+        self.org_id = org_id
+        self.job_ref = _job_ref(db, org_id, job_id)
+        self.user_id = user_id
+        self.now = now
+        self.counts = {t: 0 for t in REMINDER_TYPES}
+        self.skipped = 0
+        self.failed = 0
+        self.processed = 0
+        self.errors: List[str] = []
+        self._pending_sent: List[ReminderOutcome] = []
+        self._unflushed = 0
+
+    def add(self, outcome: ReminderOutcome) -> bool:
+        """Record an outcome; returns True when a flush is due."""
+        self.processed += 1
+        self._unflushed += 1
+        if outcome.status == "sent":
+            self.counts[outcome.reminder_type] += 1
+            self._pending_sent.append(outcome)
+        elif outcome.status == "skipped":
+            self.skipped += 1
+        else:
+            self.failed += 1
+            if len(self.errors) < MAX_RECORDED_ERRORS:
+                self.errors.append(f"Invoice {outcome.invoice_id}: {outcome.error}")
+        return self._unflushed >= FLUSH_EVERY
+
+    def flush(self, final_status: Optional[str] = None) -> None:
+        batch = self.db.batch()
+        invoices = self.db.collection("organizations", self.org_id, "invoices")
+        for outcome in self._pending_sent:
+            invoice_ref = invoices.document(outcome.invoice_id)
+            batch.set(invoice_ref.collection("activities").document(str(uuid4())), {
+                "type": "reminder_sent",
+                "description": f"Automated payment reminder ({outcome.reminder_type}) sent",
+                "timestamp": self.now,
+                "userId": self.user_id,
+                "userName": "System (Automated)",
+            })
+            batch.update(invoice_ref, {"lastReminderAt": self.now})
+        job_update = {
+            "processed": self.processed,
+            "reminderCounts": dict(self.counts),
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": list(self.errors),
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        }
+        if final_status:
+            job_update["status"] = final_status
+            job_update["completedAt"] = firestore.SERVER_TIMESTAMP
+        batch.update(self.job_ref, job_update)
+        batch.commit()
+        self._pending_sent = []
+        self._unflushed = 0
+
+
+def create_reminder_job(db, org_id: str, user_data: Dict[str, Any]) -> str:
+    job_id = str(uuid4())
+    _job_ref(db, org_id, job_id).set({
+        "id": job_id,
+        "status": "QUEUED",
+        "total": 0,
+        "processed": 0,
+        "reminderCounts": {t: 0 for t in REMINDER_TYPES},
+        "skipped": 0,
+        "failed": 0,
+        "errors": [],
+        "createdBy": user_data.get("uid"),
+        "createdAt": firestore.SERVER_TIMESTAMP,
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    })
+    return job_id
+
+
+def get_reminder_job(db, org_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+    doc = _job_ref(db, org_id, job_id).get()
+    return doc.to_dict() if doc.exists else None
+
+
+def _load_job_inputs(db, org_id: str, now: datetime):
+    rows = []
+    for reminder_type, query in reminder_queries(db, org_id, now):
+        for doc in query.stream():
+            rows.append((reminder_type, doc.id, doc.to_dict()))
+    tasks = select_candidates(rows, now)
+    clients = fetch_clients(db, org_id, (t.invoice["clientId"] for t in tasks))
+    for task in tasks:
+        task.client = clients.get(task.invoice["clientId"])
+    org_doc = db.collection("organizations").document(org_id).get()
+    org_data = org_doc.to_dict() if org_doc.exists else {}
+    return tasks, org_data
+
+
+async def run_reminder_job(db, org_id: str, job_id: str, user_data: Dict[str, Any], *,
+                           sender=email_service, now: Optional[datetime] = None,
+                           concurrency: int = DEFAULT_CONCURRENCY,
+                           limiter: Optional[RateLimiter] = None,
+                           max_attempts: int = MAX_ATTEMPTS) -> Dict[str, Any]:
+    """Execute a reminder job created by ``create_reminder_job``. Never raises."""
+    now = now or datetime.now(timezone.utc)
+    limiter = limiter or get_rate_limiter()
+    job_ref = _job_ref(db, org_id, job_id)
+    started = time.perf_counter()
+
+    try:
+        tasks, org_data = await asyncio.to_thread(_load_job_inputs, db, org_id, now)
+        job_ref.update({"status": "RUNNING", "total": len(tasks), "startedAt": firestore.SERVER_TIMESTAMP})
+    except Exception as e:
+        logger.warning(f"Reminder job {job_id} for org {org_id} failed to start: {e}")
+        job_ref.update({"status": "FAILED", "errors": [str(e)], "completedAt": firestore.SERVER_TIMESTAMP})
+        return {"jobId": job_id, "status": "FAILED"}
+
+    recorder = _ProgressRecorder(db, org_id, job_id, user_data.get("uid"), now)
+    semaphore = asyncio.Semaphore(concurrency)
+    since = _start_of_day(now)
+
+    async def process(task: ReminderTask) -> ReminderOutcome:
+        async with semaphore:
+            if task.client is None:
+                return ReminderOutcome(task.invoice_id, task.reminder_type, "skipped", error="client not found")
+            try:
+                if "lastReminderAt" not in task.invoice and await asyncio.to_thread(
+                        _legacy_reminded_today, db, org_id, task.invoice_id, since):
+                    return ReminderOutcome(task.invoice_id, task.reminder_type, "skipped")
+                message = sender.build_payment_reminder(task.invoice, task.client, task.reminder_type, org_data)
+            except Exception as e:
+                return ReminderOutcome(task.invoice_id, task.reminder_type, "failed", error=str(e))
+            if message is None:
+                return ReminderOutcome(task.invoice_id, task.reminder_type, "skipped", error="client email missing")
+            attempts, error = await deliver_with_retry(sender, message, limiter, max_attempts)
+            status = "failed" if error else "sent"
+            return ReminderOutcome(task.invoice_id, task.reminder_type, status, attempts=attempts, error=error)
+
+    try:
+        for next_outcome in asyncio.as_completed([process(t) for t in tasks]):
+            if recorder.add(await next_outcome):
+                await asyncio.to_thread(recorder.flush)
+        await asyncio.to_thread(recorder.flush, "COMPLETED")
+    except Exception as e:
+        logger.warning(f"Reminder job {job_id} for org {org_id} aborted: {e}")
+        recorder.errors.append(str(e))
+        await asyncio.to_thread(recorder.flush, "FAILED")
+
+    latency_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        "reminder_job_completed",
+        extra={"org_id": org_id, "job_id": job_id, "total": len(tasks), "sent": sum(recorder.counts.values()),
+               "failed": recorder.failed, "latency_ms": round(latency_ms, 1)},
+    )
+    return {
+        "jobId": job_id,
+        "total": len(tasks),
+        "reminderCounts": dict(recorder.counts),
+        "skipped": recorder.skipped,
+        "failed": recorder.failed,
+        "latency_ms": latency_ms,
+    }
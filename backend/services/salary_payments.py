@@ -0,0 +1,265 @@
+"""
+Bulk salary payments.
+
+Paying many payslips used to cost a transaction per payslip, a separate
+``salaryPayments`` write and a run update for each one. Here the payslips are
+planned in chunks that fit Firestore's 500-write limit, and each chunk is
+committed atomically with:
+
+* the payslip updates (PUBLISHED -> PAID),
+* one ``salaryPayments`` record per payslip,
+* the employee's payslip summary (``payslip_summaries``),
+* a single ``firestore.Increment`` per affected run for the whole chunk.
+
+Each chunk re-reads its payslips with ``get_all`` inside the commit, so a
+payslip paid concurrently is never counted twice. Retrying a request with the
+same ``idempotencyKey`` reports the already-paid payslips as processed and
+writes nothing for them.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from . import payslip_summaries, salary_run_metrics
+
+logger = logging.getLogger(__name__)
+
+# Firestore caps a commit at 500 writes; each payslip costs three (payslip, payment record, employee summary).
+BATCH_WRITE_LIMIT = 500
+WRITES_PER_PAYSLIP = 3
+# Keys per get_all call when loading payslips by ID.
+READ_CHUNK = 300
+DEFAULT_COMMIT_CONCURRENCY = 4
+
+
+class PaymentSkipped(Exception):
+    """Raised when a payment does not apply to a payslip."""
+
+    def __init__(self, reason: str, already_processed: bool = False):
+        super().__init__(reason)
+        self.reason = reason
+        self.already_processed = already_processed
+
+
+@dataclass
+class BulkPaymentResult:
+    processed: List[str] = field(default_factory=list)
+    already_processed: List[str] = field(default_factory=list)
+    skipped: List[Dict[str, str]] = field(default_factory=list)
+    run_ids: List[str] = field(default_factory=list)
+    commits: int = 0
+    latency_ms: float = 0.0
+
+
+def paid_update(current: Dict[str, Any], payment_info, processed_by: str, processed_at: str) -> Dict[str, Any]:
+    """Payslip fields for a payment; raises PaymentSkipped unless the payslip is PUBLISHED."""
+    status = (current.get("status") or "").upper()
+    if status == "PAID":
+        # Check idempotency key to avoid duplicate payments
+        if current.get("payment", {}).get("idempotencyKey") == payment_info.idempotencyKey:
+            raise PaymentSkipped("Already processed with this idempotency key", already_processed=True)
+        raise PaymentSkipped("Already paid")
+    if status != "PUBLISHED":
+        raise PaymentSkipped("Not in PUBLISHED status")
+
+    payment_record = {
+        "method": payment_info.method,
+        "reference": payment_info.reference,
+        "paidAt": payment_info.paidAt,
+        "remarks": payment_info.remarks,
+        "idempotencyKey": payment_info.idempotencyKey,
+        "processedAt": processed_at,
+        "processedBy": processed_by,
+        "amount": current.get("netPay", 0)
+    }
+    return {
+        "status": "PAID",
+        "payment": payment_record,
+        "paidAt": payment_info.paidAt,
+        "paidBy": processed_by,
+        "updatedAt": processed_at
+    }
+
+
+def payment_record(org_id: str, payslip_id: str, payslip_data: Dict[str, Any], payment_info,
+                   processed_by: str, timestamp: str) -> Dict[str, Any]:
+    """The ``salaryPayments`` document for a paid payslip (without ``createdAt``)."""
+    return {
+        "orgId": org_id,
+        "runId": payslip_data.get("runId"),
+        "payslipId": payslip_id,
+        "employeeId": payslip_data.get("userId"),
+        "employeeName": payslip_data.get("userName"),
+        "grossAmount": payslip_data.get("grossAmount", 0),
+        "netAmount": payslip_data.get("netPay", 0),
+        "taxAmount": payslip_data.get("totalTax", 0),
+        "deductionsAmount": payslip_data.get("totalDeductions", 0),
+        "currency": payslip_data.get("currency", "INR"),
+        "method": payment_info.method,
+        "reference": payment_info.reference,
+        "remarks": payment_info.remarks,
+        "paidAt": payment_info.paidAt,
+        "idempotencyKey": payment_info.idempotencyKey,
+        "processedBy": processed_by,
+        "updatedAt": timestamp,
+    }
+
+
+def _payslips(db, org_id: str):
+    return db.collection('organizations', org_id, 'payslips')
+
+
+def plan_chunks(payslips: Iterable[Tuple[str, Optional[str]]], write_limit: int = BATCH_WRITE_LIMIT) -> List[List[str]]:
+    """
+    Group ``(payslip_id, run_id)`` pairs into chunks whose payslip writes plus
+    one run increment per distinct run stay within ``write_limit``.
+    """
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    runs: set = set()
+    writes = 0
+    for payslip_id, run_id in payslips:
+        cost = WRITES_PER_PAYSLIP + (1 if run_id and run_id not in runs else 0)
+        if current and writes + cost > write_limit:
+            chunks.append(current)
+            current, runs, writes = [], set(), 0
+            cost = WRITES_PER_PAYSLIP + (1 if run_id else 0)
+        current.append(payslip_id)
+        writes += cost
+        if run_id:
+            runs.add(run_id)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _commit_chunk(db, org_id: str, payslip_ids: List[str], payment_info, processed_by: str,
+                  processed_at: str) -> BulkPaymentResult:
+    collection = _payslips(db, org_id)
+    payments = db.collection('organizations', org_id, 'salaryPayments')
+    refs = [collection.document(payslip_id) for payslip_id in payslip_ids]
+
+    @firestore.transactional
+    def run(transaction):
+        outcome = BulkPaymentResult()
+        snapshots = {snapshot.id: snapshot for snapshot in db.get_all(refs, transaction=transaction)}
+
+        deltas: Dict[str, List[Dict[str, float]]] = {}
+        for ref in refs:
+            snapshot = snapshots.get(ref.id)
+            if snapshot is None or not snapshot.exists:
+                outcome.skipped.append({"id": ref.id, "reason": "Payslip not found"})
+                continue
+            before = snapshot.to_dict() or {}
+            try:
+                updates = paid_update(before, payment_info, processed_by, processed_at)
+            except PaymentSkipped as skipped:
+                if skipped.already_processed:
+                    outcome.already_processed.append(ref.id)
+                else:
+                    outcome.skipped.append({"id": ref.id, "reason": skipped.reason})
+                continue
+
+            after = {**before, **updates}
+            transaction.update(ref, updates)
+            transaction.set(
+                payments.document(ref.id),
+                {**payment_record(org_id, ref.id, after, payment_info, processed_by, processed_at), "createdAt": processed_at},
+            )
+            payslip_summaries.apply(transaction, db, org_id, ref.id, before, after)
+            if before.get("runId"):
+                deltas.setdefault(before["runId"], []).append(salary_run_metrics.metrics_delta(before, after))
+            outcome.processed.append(ref.id)
+
+        for run_id, run_deltas in deltas.items():
+            delta = salary_run_metrics.add_deltas(run_deltas)
+            if delta:
+                transaction.update(
+                    db.collection('organizations', org_id, 'salaryRuns').document(run_id),
+                    salary_run_metrics.increment_update(delta),
+                )
+        outcome.run_ids = sorted(deltas)
+        outcome.commits = 1 if outcome.processed else 0
+        return outcome
+
+    return run(db.transaction())
+
+
+def _load_payslips(db, org_id: str, payslip_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    collection = _payslips(db, org_id)
+    found: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(payslip_ids), READ_CHUNK):
+        for snapshot in db.get_all([collection.document(pid) for pid in payslip_ids[i:i + READ_CHUNK]]):
+            if snapshot.exists:
+                found[snapshot.id] = snapshot.to_dict() or {}
+    return found
+
+
+async def pay_payslips(
+    db,
+    org_id: str,
+    payment_info,
+    processed_by: str,
+    *,
+    payslip_ids: Optional[List[str]] = None,
+    run_id: Optional[str] = None,
+    write_limit: int = BATCH_WRITE_LIMIT,
+    concurrency: int = DEFAULT_COMMIT_CONCURRENCY,
+) -> BulkPaymentResult:
+    """
+    Mark payslips as paid, either an explicit ``payslip_ids`` list or every
+    PUBLISHED payslip in ``run_id``. Payslips that are not payable are reported
+    in ``skipped``; those already paid with the same idempotency key are
+    reported in ``already_processed``.
+    """
+    started = time.perf_counter()
+    result = BulkPaymentResult()
+
+    if run_id is not None:
+        docs = await asyncio.to_thread(lambda: _payslips(db, org_id).where('runId', '==', run_id).get())
+        loaded = {doc.id: doc.to_dict() or {} for doc in docs}
+        # Drafts and voided payslips are simply not part of a run payment.
+        ordered = [
+            pid for pid, data in loaded.items()
+            if (data.get("status") or "").upper() in ("PUBLISHED", "PAID")
+        ]
+    else:
+        ordered = list(dict.fromkeys(payslip_ids or []))
+        loaded = await asyncio.to_thread(_load_payslips, db, org_id, ordered)
+        result.skipped.extend({"id": pid, "reason": "Payslip not found"} for pid in ordered if pid not in loaded)
+        ordered = [pid for pid in ordered if pid in loaded]
+
+    # Legacy runs need their aggregates backfilled before deltas are applied.
+    for affected_run in sorted({loaded[pid].get("runId") for pid in ordered} - {None}):
+        await asyncio.to_thread(salary_run_metrics.ensure_run_metrics, db, org_id, affected_run)
+
+    processed_at = datetime.now(timezone.utc).isoformat()
+    chunks = plan_chunks(((pid, loaded[pid].get("runId")) for pid in ordered), write_limit)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def commit(chunk):
+        async with semaphore:
+            return await asyncio.to_thread(_commit_chunk, db, org_id, chunk, payment_info, processed_by, processed_at)
+
+    runs = set()
+    for outcome in await asyncio.gather(*(commit(chunk) for chunk in chunks)):
+        result.processed.extend(outcome.processed)
+        result.already_processed.extend(outcome.already_processed)
+        result.skipped.extend(outcome.skipped)
+        result.commits += outcome.commits
+        runs.update(outcome.run_ids)
+    result.run_ids = sorted(runs)
+
+    result.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        "salary_bulk_payment",
+        extra={"org_id": org_id, "run_id": run_id, "processed": len(result.processed),
+               "already_processed": len(result.already_processed), "skipped": len(result.skipped),
+               "commits": result.commits, "latency_ms": result.latency_ms},
+    )
+    return result
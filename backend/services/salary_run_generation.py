@@ -0,0 +1,223 @@
+"""
+Salary run generation.
+
+Draft payslips for a run are built in three steps:
+
+* one ``get_all`` per chunk of salary profiles instead of a ``get()`` per member,
+* a single pass over the members that computes every payslip and the run
+  totals together,
+* ``WriteBatch`` commits of up to 500 writes, with the chunks committed in
+  parallel threads.
+
+``dry_run`` stops after the compute step, so callers can preview totals
+without writing anything.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Firestore caps a WriteBatch at 500 operations.
+BATCH_WRITE_LIMIT = 500
+# Keys per get_all call; keeps each request well under the RPC size limit.
+PROFILE_READ_CHUNK = 300
+DEFAULT_WRITE_CONCURRENCY = 8
+
+
+@dataclass
+class SalaryRunDraft:
+    payslips: List[Dict[str, Any]] = field(default_factory=list)
+    skipped_exited: int = 0
+    skipped_no_profile: int = 0
+    gross: float = 0.0
+    allowances: float = 0.0
+    deductions: float = 0.0
+    tax: float = 0.0
+    net: float = 0.0
+
+    def totals(self) -> Dict[str, float]:
+        return {
+            "gross": round(self.gross, 2),
+            "deductions": round(self.deductions, 2),
+            "tax": round(self.tax, 2),
+            "net": round(self.net, 2),
+        }
+
+
+def _exited_before(team_member: Dict[str, Any], year: int, month: int) -> bool:
+    exit_date = team_member.get("exitDate")
+    if not exit_date:
+        return False
+    try:
+        return datetime.fromisoformat(exit_date.replace('Z', '')) < datetime(year, month, 1)
+    except Exception:
+        return False  # Unparseable exit dates never exclude a member
+
+
+def fetch_profiles(db, org_id: str, user_ids: Iterable[str], chunk_size: int = PROFILE_READ_CHUNK) -> Dict[str, Dict[str, Any]]:
+    """Load salary profiles for ``user_ids`` with batched reads."""
+    collection = db.collection('organizations', org_id, 'salaryProfiles')
+    ids = list(user_ids)
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(ids), chunk_size):
+        refs = [collection.document(uid) for uid in ids[i:i + chunk_size]]
+        for snapshot in db.get_all(refs):
+            if snapshot.exists:
+                profiles[snapshot.id] = snapshot.to_dict() or {}
+    return profiles
+
+
+def _tax_amount(tax_config: Dict[str, Any], gross_amount: float, total_deductions: float) -> float:
+    if tax_config.get("mode") == "PERCENT":
+        return round((gross_amount - total_deductions) * (tax_config.get("value", 0) / 100), 2)
+    if tax_config.get("mode") == "FIXED":
+        return tax_config.get("value", 0)
+    return 0
+
+
+def build_payslips(
+    org_id: str,
+    run_id: str,
+    year: int,
+    month: int,
+    members: Iterable[tuple],
+    profiles: Dict[str, Dict[str, Any]],
+    actor: Optional[str],
+    now_iso: Optional[str] = None,
+) -> SalaryRunDraft:
+    """
+    Compute draft payslips for ``(user_id, team_member)`` pairs in one pass.
+    Payslips have no ``id`` yet; ``commit_payslips`` assigns document IDs.
+    """
+    now_iso = now_iso or datetime.now(timezone.utc).isoformat()
+    draft = SalaryRunDraft()
+    for user_id, team_member in members:
+        if _exited_before(team_member, year, month):
+            draft.skipped_exited += 1
+            continue
+        profile_data = profiles.get(user_id)
+        if profile_data is None:
+            draft.skipped_no_profile += 1
+            continue
+
+        base_line = {"label": "Base Salary", "amount": profile_data.get("baseSalary", 0)}
+        allowances_lines = profile_data.get("allowances", [])
+        deductions_lines = profile_data.get("deductions", [])
+
+        total_allowances = sum(a.get("amount", 0) for a in allowances_lines)
+        gross_amount = base_line["amount"] + total_allowances
+        total_deductions = sum(d.get("amount", 0) for d in deductions_lines)
+        tax_amount = _tax_amount(profile_data.get("tax", {}), gross_amount, total_deductions)
+        net_pay = gross_amount - total_deductions - tax_amount
+
+        draft.payslips.append({
+            "orgId": org_id,
+            "runId": run_id,
+            "userId": user_id,
+            "userName": team_member.get("name", ""),
+            "period": {"month": month, "year": year},
+            "status": "DRAFT",
+            "currency": profile_data.get("currency", "INR"),
+            "lines": {
+                "base": base_line,
+                "allowances": [{"key": a.get("key", ""), "label": a.get("label", ""), "amount": a.get("amount", 0)} for a in allowances_lines],
+                "deductions": [{"key": d.get("key", ""), "label": d.get("label", ""), "amount": d.get("amount", 0)} for d in deductions_lines],
+                "tax": {"label": "TDS", "amount": tax_amount},
+            },
+            "grossAmount": round(gross_amount, 2),
+            "totalAllowances": round(total_allowances, 2),
+            "totalDeductions": round(total_deductions, 2),
+            "totalTax": round(tax_amount, 2),
+            "netPay": round(net_pay, 2),
+            "remarks": "",
+            "createdAt": now_iso,
+            "createdBy": actor,
+            "updatedAt": now_iso,
+            "audit": [{"by": actor, "action": "CREATED", "at": now_iso}],
+        })
+        draft.gross += gross_amount
+        draft.allowances += total_allowances
+        draft.deductions += total_deductions
+        draft.tax += tax_amount
+        draft.net += net_pay
+    return draft
+
+
+def _commit_chunk(db, refs_and_payloads: List[tuple]) -> int:
+    batch = db.batch()
+    for ref, payload in refs_and_payloads:
+        batch.set(ref, payload)
+    batch.commit()
+    return len(refs_and_payloads)
+
+
+async def commit_payslips(
+    db,
+    org_id: str,
+    payslips: List[Dict[str, Any]],
+    *,
+    batch_size: int = BATCH_WRITE_LIMIT,
+    concurrency: int = DEFAULT_WRITE_CONCURRENCY,
+) -> int:
+    """Write payslips in parallel WriteBatches; returns the number written."""
+    collection = db.collection('organizations', org_id, 'payslips')
+    writes = []
+    for payslip in payslips:
+        ref = collection.document()
+        payslip["id"] = ref.id
+        writes.append((ref, payslip))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def commit(chunk):
+        async with semaphore:
+            return await asyncio.to_thread(_commit_chunk, db, chunk)
+
+    written = await asyncio.gather(
+        *(commit(writes[i:i + batch_size]) for i in range(0, len(writes), batch_size))
+    )
+    return sum(written)
+
+
+async def generate_run_payslips(
+    db,
+    org_id: str,
+    run_id: str,
+    year: int,
+    month: int,
+    actor: Optional[str],
+    *,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Build (and unless ``dry_run``, write) the draft payslips for a run."""
+    started = time.perf_counter()
+    team_docs = await asyncio.to_thread(
+        lambda: db.collection('organizations', org_id, 'team').where("availability", "==", True).get()
+    )
+    members = [(doc.id, doc.to_dict() or {}) for doc in team_docs]
+    profiles = await asyncio.to_thread(fetch_profiles, db, org_id, [uid for uid, _ in members])
+    read_ms = (time.perf_counter() - started) * 1000
+
+    draft = build_payslips(org_id, run_id, year, month, members, profiles, actor)
+
+    written = 0
+    write_started = time.perf_counter()
+    if not dry_run and draft.payslips:
+        written = await commit_payslips(db, org_id, draft.payslips)
+    write_ms = (time.perf_counter() - write_started) * 1000
+
+    latency_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        "salary_run_generated",
+        extra={"org_id": org_id, "run_id": run_id, "dry_run": dry_run, "payslips": len(draft.payslips),
+               "read_ms": round(read_ms, 1), "write_ms": round(write_ms, 1), "latency_ms": round(latency_ms, 1)},
+    )
+    return {
+        "draft": draft,
+        "written": written,
+        "latencyMs": round(latency_ms, 1),
+    }
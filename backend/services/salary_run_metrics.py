@@ -0,0 +1,200 @@
+"""
+Incrementally maintained salary run metrics.
+
+A run document carries ``counts``, ``totals`` and ``summary`` aggregates over
+its payslips. Instead of re-reading every payslip after each change, the
+payslip update and a ``firestore.Increment`` on the run's affected fields are
+committed in the same transaction. ``contribution`` defines what one payslip
+adds to the aggregates, so the delta is simply ``after - before``.
+
+Runs stamped with an older ``metricsVersion`` (or none, e.g. created before
+the aggregates were maintained this way, or before voided payslips stopped
+carrying money) are recomputed once by ``ensure_run_metrics`` before any
+delta is applied. ``verify_run_metrics`` recomputes from scratch and reports
+(optionally repairs) any drift.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from firebase_admin import firestore
+
+from . import payslip_summaries
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever ``contribution`` changes so stored aggregates are recomputed once.
+METRICS_VERSION = 2
+
+# Monetary fields are compared with this tolerance when checking for drift.
+DRIFT_TOLERANCE = 0.01
+
+_COUNT_FIELDS = ("counts.drafted", "counts.published", "counts.paid", "counts.total",
+                 "summary.countPaid", "summary.countUnpaid", "summary.countTotal")
+_AMOUNT_FIELDS = ("totals.gross", "totals.deductions", "totals.tax", "totals.net",
+                  "summary.totalGross", "summary.totalDeductions", "summary.totalTax", "summary.totalNet")
+METRIC_FIELDS = _COUNT_FIELDS + _AMOUNT_FIELDS
+
+
+def _run_ref(db, org_id: str, run_id: str):
+    return db.collection('organizations', org_id, 'salaryRuns').document(run_id)
+
+
+def contribution(payslip: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """What a single payslip adds to its run's aggregates, keyed by field path."""
+    if not payslip:
+        return {}
+    status = (payslip.get("status") or "").upper()
+    if status == "VOID":
+        # Voided payslips stay in the head count but no longer carry any money.
+        return {"summary.countTotal": 1, "summary.countUnpaid": 1}
+    gross = payslip.get("grossAmount", 0) or 0
+    deductions = payslip.get("totalDeductions", 0) or 0
+    tax = payslip.get("totalTax", 0) or 0
+    net = payslip.get("netPay", 0) or 0
+
+    values = {
+        "summary.countTotal": 1,
+        "totals.gross": gross,
+        "totals.deductions": deductions,
+        "totals.tax": tax,
+        "totals.net": net,
+        "summary.totalGross": gross,
+        "summary.totalDeductions": deductions,
+        "summary.totalTax": tax,
+        "summary.totalNet": net,
+    }
+    bucket = {"PAID": "counts.paid", "PUBLISHED": "counts.published", "DRAFT": "counts.drafted"}.get(status)
+    if bucket:
+        values[bucket] = 1
+        values["counts.total"] = 1
+    values["summary.countPaid" if status == "PAID" else "summary.countUnpaid"] = 1
+    return values
+
+
+def metrics_delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    old, new = contribution(before), contribution(after)
+    delta = {}
+    for path in METRIC_FIELDS:
+        diff = new.get(path, 0) - old.get(path, 0)
+        if diff:
+            delta[path] = round(diff, 2) if path in _AMOUNT_FIELDS else diff
+    return delta
+
+
+def add_deltas(deltas: Iterable[Dict[str, float]]) -> Dict[str, float]:
+    combined: Dict[str, float] = {}
+    for delta in deltas:
+        for path, value in delta.items():
+            combined[path] = combined.get(path, 0) + value
+    return {path: value for path, value in combined.items() if value}
+
+
+def increment_update(delta: Dict[str, float]) -> Dict[str, Any]:
+    update: Dict[str, Any] = {path: firestore.Increment(value) for path, value in delta.items()}
+    update["updatedAt"] = datetime.now(timezone.utc).isoformat()
+    return update
+
+
+def summarize(payslips: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Full ``counts``/``totals``/``summary`` maps for a set of payslips."""
+    flat = {path: 0 for path in METRIC_FIELDS}
+    for payslip in payslips:
+        for path, value in contribution(payslip).items():
+            flat[path] += value
+    nested: Dict[str, Dict[str, Any]] = {"counts": {}, "totals": {}, "summary": {}}
+    for path, value in flat.items():
+        group, name = path.split(".")
+        nested[group][name] = round(value, 2) if path in _AMOUNT_FIELDS else value
+    return {**nested, "metricsVersion": METRICS_VERSION}
+
+
+def has_metrics(run_data: Optional[Dict[str, Any]]) -> bool:
+    """Runs whose aggregates predate the current ``METRICS_VERSION`` need one full recompute."""
+    return (bool(run_data) and run_data.get("metricsVersion") == METRICS_VERSION
+            and isinstance(run_data.get("summary"), dict) and "total" in (run_data.get("counts") or {}))
+
+
+def recompute_run_metrics(db, org_id: str, run_id: str) -> Dict[str, Any]:
+    payslips = db.collection('organizations', org_id, 'payslips').where('runId', '==', run_id).get()
+    return summarize(doc.to_dict() or {} for doc in payslips)
+
+
+def ensure_run_metrics(db, org_id: str, run_id: str) -> None:
+    """Backfill full aggregates on a legacy run so later deltas start from the right base."""
+    run_ref = _run_ref(db, org_id, run_id)
+    run = run_ref.get()
+    if run.exists and not has_metrics(run.to_dict()):
+        metrics = recompute_run_metrics(db, org_id, run_id)
+        run_ref.update({**metrics, "updatedAt": datetime.now(timezone.utc).isoformat()})
+
+
+def update_payslip_with_metrics(
+    db,
+    org_id: str,
+    payslip_id: str,
+    build_update: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Read a payslip, apply ``build_update(current)`` and increment its run's
+    aggregates by the resulting delta, all in one transaction. The employee's
+    payslip summary is updated in the same transaction.
+
+    ``build_update`` may raise to abort (e.g. an HTTPException for an invalid
+    transition) or return None for a no-op; it can run more than once if the
+    transaction is retried. Returns ``(before, after)``; ``before`` is None
+    when the payslip does not exist.
+    """
+    payslip_ref = db.collection('organizations', org_id, 'payslips').document(payslip_id)
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = payslip_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None, None
+        before = snapshot.to_dict() or {}
+        updates = build_update(before)
+        if updates is None:
+            return before, None
+        after = {**before, **updates}
+        transaction.update(payslip_ref, updates)
+        delta = metrics_delta(before, after)
+        if before.get("runId") and delta:
+            transaction.update(_run_ref(db, org_id, before["runId"]), increment_update(delta))
+        payslip_summaries.apply(transaction, db, org_id, payslip_id, before, after)
+        return before, after
+
+    return run(db.transaction())
+
+
+def _flatten(run_data: Dict[str, Any]) -> Dict[str, float]:
+    flat = {}
+    for path in METRIC_FIELDS:
+        group, name = path.split(".")
+        flat[path] = ((run_data.get(group) or {}).get(name)) or 0
+    return flat
+
+
+def verify_run_metrics(db, org_id: str, run_id: str, repair: bool = False) -> Optional[Dict[str, Any]]:
+    """Compare stored aggregates with a full recompute; returns None if the run does not exist."""
+    run_ref = _run_ref(db, org_id, run_id)
+    run = run_ref.get()
+    if not run.exists:
+        return None
+
+    actual = recompute_run_metrics(db, org_id, run_id)
+    stored = _flatten(run.to_dict() or {})
+    expected = _flatten(actual)
+    drift = {}
+    for path in METRIC_FIELDS:
+        diff = expected[path] - stored[path]
+        if abs(diff) > (DRIFT_TOLERANCE if path in _AMOUNT_FIELDS else 0):
+            drift[path] = {"stored": stored[path], "actual": expected[path], "diff": round(diff, 2)}
+
+    repaired = False
+    if drift and repair:
+        run_ref.update({**actual, "updatedAt": datetime.now(timezone.utc).isoformat()})
+        repaired = True
+    if drift:
+        logger.warning("salary_run_metrics_drift", extra={"org_id": org_id, "run_id": run_id, "fields": sorted(drift)})
+    return {"runId": run_id, "consistent": not drift, "drift": drift, "repaired": repaired, "metrics": actual}
@@ -0,0 +1,361 @@
+"""
+Leased-range document number allocator.
+
+Every numbered document type (invoices, quotes, bills, payslips, credit notes)
+draws from one counter per org/type/year at
+``organizations/{orgId}/numberSequences/{TYPE}_{year}``. Instead of a
+transaction per number, each worker process leases a block of
+``SEQUENCE_LEASE_SIZE`` numbers in a single transaction and hands them out
+from memory. Every lease is recorded under
+``numberSequences/{TYPE}_{year}/leases/{leaseId}``, so each gap in the issued
+numbers traces back to a lease that was released early or never released.
+On shutdown, ``release_leases`` gives an unused tail back to the counter when
+no later lease has been taken.
+
+Bulk callers (salary runs, imports) use ``reserve_block`` to reserve exactly
+N numbers in one transaction and ``close_block`` once their writes have
+committed, so numbers a failed bulk write never used show up as gaps. Idempotent allocations store their key as the
+document ID in ``sequenceAllocations``, so a retry is a single document read.
+"""
+import hashlib
+import logging
+import os
+import re
+import socket
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+from google.api_core import exceptions as g_exceptions
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_TYPES = ("INVOICE", "QUOTE", "CREDIT_NOTE", "BILL", "PAYSLIP")
+
+_PREFIXES = {
+    "INVOICE": "INV",
+    "QUOTE": "QUO",
+    "CREDIT_NOTE": "CN",
+    "BILL": "BILL",
+    "PAYSLIP": "PAY",
+}
+
+DEFAULT_LEASE_SIZE = int(os.getenv("SEQUENCE_LEASE_SIZE", "10"))
+
+_HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+_SAFE_KEY = re.compile(r"^[A-Za-z0-9_\-]{1,100}$")
+
+
+class SequenceAllocationError(Exception):
+    """Raised when a block of numbers cannot be leased."""
+
+
+@dataclass
+class AllocatedNumber:
+    number: str
+    sequence: int
+    is_new: bool = True
+
+
+@dataclass
+class _Lease:
+    lease_id: str
+    next: int
+    end: int  # exclusive
+    returned: List[int] = field(default_factory=list)
+
+    def take(self) -> Optional[int]:
+        if self.returned:
+            return self.returned.pop(0)
+        if self.next < self.end:
+            value = self.next
+            self.next += 1
+            return value
+        return None
+
+
+def sequence_prefix(doc_type: str, year: int) -> str:
+    return f"{_PREFIXES.get(doc_type, doc_type)}-{year}-"
+
+
+def format_number(doc_type: str, year: int, sequence: int) -> str:
+    return f"{sequence_prefix(doc_type, year)}{sequence:04d}"
+
+
+def sequence_id(doc_type: str, year: int) -> str:
+    return f"{doc_type}_{year}"
+
+
+def _counter_ref(db, org_id: str, doc_type: str, year: int):
+    return db.collection("organizations", org_id, "numberSequences").document(sequence_id(doc_type, year))
+
+
+def _allocation_ref(db, org_id: str, doc_type: str, year: int, idempotency_key: str):
+    key = idempotency_key if _SAFE_KEY.match(idempotency_key) else hashlib.sha256(idempotency_key.encode()).hexdigest()
+    return db.collection("organizations", org_id, "sequenceAllocations").document(f"{doc_type}_{year}_{key}")
+
+
+def _legacy_refs(db, org_id: str, doc_type: str, year: int) -> List[Tuple[object, callable]]:
+    """
+    Counters used before the central allocator, with a reader that returns the
+    next free number from each snapshot. Consulted until the central counter
+    carries ``seededFrom``. The old ``allocate_sequence_number`` may already
+    have created ``{TYPE}_{year}`` without it, while the legacy counters ran
+    ahead.
+    """
+    sequences = db.collection("organizations", org_id, "numberSequences")
+    if doc_type == "INVOICE":
+        return [
+            (sequences.document(f"INV_{year}"), lambda d: int(d.get("next", 1))),
+            (db.collection("organizations", org_id, "sequences").document(f"invoice_{year}"),
+             lambda d: int(d.get("next", 1))),
+        ]
+    if doc_type == "QUOTE":
+        return [(sequences.document(f"QUO_{year}"), lambda d: int(d.get("next", 1)))]
+    if doc_type == "BILL":
+        return [(sequences.document("BILL"), lambda d: int(d.get(str(year), 0)) + 1)]
+    if doc_type == "PAYSLIP":
+        return [(db.collection("organizations").document(org_id),
+                 lambda d: int((d.get("numberSequences") or {}).get(f"payslip_{year}", 0)) + 1)]
+    return []
+
+
+def _lease_in_transaction(transaction, db, org_id: str, doc_type: str, year: int, size: int, purpose: str) -> _Lease:
+    counter_ref = _counter_ref(db, org_id, doc_type, year)
+    counter = counter_ref.get(transaction=transaction)
+    counter_data = (counter.to_dict() or {}) if counter.exists else {}
+    now = datetime.now(timezone.utc)
+
+    start = int(counter_data.get("next", 1))
+    seeded = "seededFrom" in counter_data
+    if not seeded:
+        for legacy_ref, read_next in _legacy_refs(db, org_id, doc_type, year):
+            legacy = legacy_ref.get(transaction=transaction)
+            if legacy.exists:
+                start = max(start, read_next(legacy.to_dict() or {}))
+
+    end = start + size
+    lease_ref = counter_ref.collection("leases").document()
+    payload = {
+        "orgId": org_id,
+        "type": doc_type,
+        "year": year,
+        "prefix": sequence_prefix(doc_type, year),
+        "next": end,
+        "updatedAt": now,
+        "lastLeaseId": lease_ref.id,
+    }
+    if not counter.exists:
+        payload["createdAt"] = now
+    if not seeded:
+        payload["seededFrom"] = start
+    transaction.set(counter_ref, payload, merge=True)
+    lease = {
+        "start": start,
+        "end": end,
+        "size": size,
+        "holder": _HOLDER,
+        "purpose": purpose,
+        "leasedAt": now,
+        "releasedAt": None,
+    }
+    transaction.set(lease_ref, lease)
+    return _Lease(lease_id=lease_ref.id, next=start, end=end)
+
+
+def lease_range(db, org_id: str, doc_type: str, year: int, size: int, purpose: str = "lease") -> _Lease:
+    """Reserve ``size`` consecutive numbers in one transaction."""
+    if size < 1:
+        raise ValueError("size must be positive")
+
+    @firestore.transactional
+    def run(transaction):
+        return _lease_in_transaction(transaction, db, org_id, doc_type, year, size, purpose)
+
+    try:
+        return run(db.transaction())
+    except g_exceptions.GoogleAPICallError as e:
+        raise SequenceAllocationError(f"Could not lease {size} {doc_type} numbers for {year}: {e}") from e
+
+
+class SequenceAllocator:
+    """Per-process cache of leased ranges, one per org/type/year."""
+
+    def __init__(self, lease_size: int = DEFAULT_LEASE_SIZE):
+        self.lease_size = lease_size
+        self._leases: Dict[Tuple[str, str, int], _Lease] = {}
+        self._locks: Dict[Tuple[str, str, int], threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._db_by_key: Dict[Tuple[str, str, int], object] = {}
+
+    def _lock_for(self, key) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def next_sequence(self, db, org_id: str, doc_type: str, year: int) -> int:
+        key = (org_id, doc_type, year)
+        with self._lock_for(key):
+            lease = self._leases.get(key)
+            value = lease.take() if lease else None
+            if value is None:
+                if lease is not None:
+                    self._close_exhausted(org_id, doc_type, year, lease)
+                lease = lease_range(db, org_id, doc_type, year, self.lease_size)
+                self._leases[key] = lease
+                self._db_by_key[key] = db
+                value = lease.take()
+            return value
+
+    def _close_exhausted(self, org_id: str, doc_type: str, year: int, lease: _Lease) -> None:
+        db = self._db_by_key.get((org_id, doc_type, year))
+        try:
+            _release_lease(db, org_id, doc_type, year, lease)
+        except Exception as e:
+            logger.warning(f"Failed to close used-up {doc_type}_{year} lease {lease.lease_id} for org {org_id}: {e}")
+
+    def give_back(self, org_id: str, doc_type: str, year: int, sequence: int) -> None:
+        """Return a number that was taken but never used (e.g. an idempotency race)."""
+        key = (org_id, doc_type, year)
+        with self._lock_for(key):
+            lease = self._leases.get(key)
+            if lease is not None:
+                lease.returned.append(sequence)
+                lease.returned.sort()
+
+    def release_all(self) -> None:
+        """Hand unused tails back to their counters where possible and close the lease records."""
+        with self._guard:
+            items = list(self._leases.items())
+            self._leases.clear()
+        for (org_id, doc_type, year), lease in items:
+            db = self._db_by_key.get((org_id, doc_type, year))
+            if db is None:
+                continue
+            try:
+                _release_lease(db, org_id, doc_type, year, lease)
+            except Exception as e:
+                logger.warning(f"Failed to release {doc_type}_{year} lease {lease.lease_id} for org {org_id}: {e}")
+
+
+def _release_lease(db, org_id: str, doc_type: str, year: int, lease: _Lease) -> None:
+    counter_ref = _counter_ref(db, org_id, doc_type, year)
+    lease_ref = counter_ref.collection("leases").document(lease.lease_id)
+    unused = sorted(lease.returned + list(range(lease.next, lease.end)))
+
+    @firestore.transactional
+    def run(transaction):
+        counter = counter_ref.get(transaction=transaction)
+        returned_from = None
+        # The tail can only go back if nobody has leased past us.
+        if unused and counter.exists and int((counter.to_dict() or {}).get("next", 0)) == lease.end \
+                and unused == list(range(unused[0], lease.end)):
+            returned_from = unused[0]
+            transaction.update(counter_ref, {"next": returned_from, "updatedAt": datetime.now(timezone.utc)})
+        transaction.update(lease_ref, {
+            "releasedAt": datetime.now(timezone.utc),
+            "unused": unused,
+            "returnedFrom": returned_from,
+        })
+
+    run(db.transaction())
+
+
+_allocator = SequenceAllocator()
+
+
+def get_allocator() -> SequenceAllocator:
+    return _allocator
+
+
+def release_leases() -> None:
+    _allocator.release_all()
+
+
+def next_number(db, org_id: str, doc_type: str, year: int) -> str:
+    """Next formatted number for a document, e.g. ``INV-2025-0042``."""
+    return format_number(doc_type, year, _allocator.next_sequence(db, org_id, doc_type, year))
+
+
+def reserve_block(db, org_id: str, doc_type: str, year: int, count: int, purpose: str = "bulk") -> Optional[_Lease]:
+    """
+    Reserve ``count`` consecutive numbers (``range(lease.next, lease.end)``) in
+    one transaction, bypassing the per-process lease. The lease stays open
+    until ``close_block``. Returns None when ``count`` is not positive.
+    """
+    if count <= 0:
+        return None
+    return lease_range(db, org_id, doc_type, year, count, purpose)
+
+
+def close_block(db, org_id: str, doc_type: str, year: int, lease: _Lease, used) -> None:
+    """Close a ``reserve_block`` lease; reserved numbers not in ``used`` are recorded as unused."""
+    used = set(used)
+    lease.returned = [seq for seq in range(lease.next, lease.end) if seq not in used]
+    lease.next = lease.end
+    _release_lease(db, org_id, doc_type, year, lease)
+
+
+def allocate_idempotent(db, org_id: str, doc_type: str, year: int, idempotency_key: str) -> AllocatedNumber:
+    """
+    Allocate a number once per idempotency key. The key is the allocation
+    document's ID, so a repeat call is one document read, not a query.
+    """
+    allocation_ref = _allocation_ref(db, org_id, doc_type, year, idempotency_key)
+    existing = allocation_ref.get()
+    if existing.exists:
+        data = existing.to_dict() or {}
+        return AllocatedNumber(number=data.get("number"), sequence=data.get("sequence"), is_new=False)
+
+    sequence = _allocator.next_sequence(db, org_id, doc_type, year)
+    number = format_number(doc_type, year, sequence)
+    try:
+        allocation_ref.create({
+            "orgId": org_id,
+            "type": doc_type,
+            "year": year,
+            "sequence": sequence,
+            "number": number,
+            "idempotencyKey": idempotency_key,
+            "allocatedAt": datetime.now(timezone.utc),
+        })
+    except g_exceptions.AlreadyExists:
+        # A concurrent request with the same key won; reuse its number and recycle ours.
+        _allocator.give_back(org_id, doc_type, year, sequence)
+        data = allocation_ref.get().to_dict() or {}
+        return AllocatedNumber(number=data.get("number"), sequence=data.get("sequence"), is_new=False)
+    return AllocatedNumber(number=number, sequence=sequence, is_new=True)
+
+
+def lease_report(db, org_id: str, doc_type: str, year: int) -> Dict[str, object]:
+    """
+    Summarise the leases behind a counter so gaps can be accounted for:
+    numbers a released lease never used, and ranges still held by a lease
+    that has not been released (a live worker, or one that died).
+    """
+    leases_ref = _counter_ref(db, org_id, doc_type, year).collection("leases")
+    leases, unused, unreleased = [], [], []
+    for doc in leases_ref.order_by("start").stream():
+        data = doc.to_dict() or {}
+        lease = {
+            "leaseId": doc.id,
+            "start": data.get("start"),
+            "end": data.get("end"),
+            "holder": data.get("holder"),
+            "purpose": data.get("purpose"),
+            "leasedAt": data.get("leasedAt"),
+            "releasedAt": data.get("releasedAt"),
+            "unused": data.get("unused") or [],
+            "returnedFrom": data.get("returnedFrom"),
+        }
+        leases.append(lease)
+        if lease["releasedAt"] is None:
+            unreleased.append(lease)
+        else:
+            returned_from = lease["returnedFrom"]
+            unused.extend(n for n in lease["unused"] if returned_from is None or n < returned_from)
+    return {"leases": leases, "unusedNumbers": sorted(unused), "unreleasedLeases": unreleased}
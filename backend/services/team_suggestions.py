@@ -0,0 +1,147 @@
+"""
+Deadline-bounded team suggestions for ``GET /events/{id}/suggest-team``.
+
+The endpoint used to wait for the LLM with no time limit and only fell back
+to the rule-based suggestion after an error. A slow provider kept admins
+waiting 20-60s. ``race`` now computes the rule-based suggestion first and
+gives the LLM ``SUGGEST_TEAM_AI_DEADLINE_SECONDS`` (default 4):
+
+* If the LLM answers in time with at least one usable suggestion, that
+  answer is returned (``source: "ai"``).
+* Otherwise the rule-based suggestion is returned (``source: "rules"``). If
+  the LLM is still running, it carries on in the background until
+  ``SUGGEST_TEAM_AI_BUDGET_SECONDS`` (default 20). Its answer is written to
+  ``organizations/{orgId}/teamSuggestionUpgrades/{upgradeId}``, and the client
+  fetches it with ``GET /events/{id}/suggest-team/upgrades/{upgradeId}``.
+
+Endpoint latency is bounded by the deadline, not by the provider.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+UPGRADES = "teamSuggestionUpgrades"
+PENDING, READY, FAILED = "PENDING", "READY", "FAILED"
+POLL_INTERVAL_SECONDS = 1.0
+
+# Background LLM calls that outlive their request; held so they are not garbage collected.
+_background = set()
+
+
+def ai_deadline_seconds() -> float:
+    return float(os.getenv("SUGGEST_TEAM_AI_DEADLINE_SECONDS", "4"))
+
+
+def ai_budget_seconds() -> float:
+    return max(ai_deadline_seconds(), float(os.getenv("SUGGEST_TEAM_AI_BUDGET_SECONDS", "20")))
+
+
+def upgrade_ref(db, org_id: str, upgrade_id: str):
+    return db.collection("organizations", org_id, UPGRADES).document(upgrade_id)
+
+
+def validate_suggestions(response: Optional[Dict[str, Any]], available_team: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Keep only suggestions for members in ``available_team``, with the skills
+    from our team data. Returns None when nothing usable is left.
+    """
+    if not isinstance(response, dict) or not isinstance(response.get("suggestions"), list):
+        return None
+    members = {member["userId"]: member for member in available_team}
+    valid = []
+    for suggestion in response["suggestions"]:
+        member = members.get(suggestion.get("userId")) if isinstance(suggestion, dict) else None
+        if member:
+            valid.append({**suggestion, "skills": member["skills"]})
+    return {**response, "suggestions": valid} if valid else None
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def _finish_upgrade(db, org_id: str, upgrade_id: str, task: asyncio.Task,
+                          available_team: List[Dict[str, Any]]) -> None:
+    ref = upgrade_ref(db, org_id, upgrade_id)
+    try:
+        result = validate_suggestions(await task, available_team)
+        update = {"status": READY, "ai_suggestions": result} if result else {
+            "status": FAILED, "error": "AI returned no usable suggestions"}
+    except Exception as e:
+        update = {"status": FAILED, "error": str(e)[:200]}
+    try:
+        await asyncio.to_thread(ref.set, {**update, "updatedAt": _now()}, merge=True)
+    except Exception as e:
+        logger.warning(f"Failed to store team suggestion upgrade {upgrade_id}: {e}")
+    logger.info("team_suggestion_upgrade", extra={"org_id": org_id, "upgrade_id": upgrade_id,
+                                                  "status": update["status"]})
+
+
+async def race(
+    db,
+    org_id: str,
+    event_id: str,
+    rules_result: Dict[str, Any],
+    ai_call: Optional[Awaitable[Dict[str, Any]]],
+    available_team: List[Dict[str, Any]],
+    deadline: Optional[float] = None,
+) -> Tuple[Dict[str, Any], str, Optional[str]]:
+    """
+    ``(suggestion, source, upgrade_id)``. ``ai_call`` is the LLM coroutine, or
+    None when AI is not configured. ``upgrade_id`` is set only when the LLM
+    was still running at the deadline.
+    """
+    if ai_call is None:
+        return rules_result, "rules", None
+    deadline = ai_deadline_seconds() if deadline is None else deadline
+    started = time.perf_counter()
+    task = asyncio.ensure_future(ai_call)
+    done, _ = await asyncio.wait({task}, timeout=deadline)
+    waited_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    if done:
+        try:
+            result = validate_suggestions(task.result(), available_team)
+        except Exception as e:
+            logger.warning(f"AI team suggestion failed, using rules: {e}")
+            result = None
+        logger.info("team_suggestion_race", extra={"event_id": event_id, "winner": "ai" if result else "rules",
+                                                   "waited_ms": waited_ms})
+        return (result, "ai", None) if result else (rules_result, "rules", None)
+
+    upgrade_id = uuid.uuid4().hex
+    try:
+        await asyncio.to_thread(upgrade_ref(db, org_id, upgrade_id).set, {
+            "eventId": event_id, "status": PENDING, "createdAt": _now(), "updatedAt": _now(),
+        })
+    except Exception as e:
+        logger.warning(f"Could not record team suggestion upgrade, dropping AI call: {e}")
+        task.cancel()
+        return rules_result, "rules", None
+    follow_up = asyncio.create_task(_finish_upgrade(db, org_id, upgrade_id, task, available_team))
+    _background.add(follow_up)
+    follow_up.add_done_callback(_background.discard)
+    logger.info("team_suggestion_race", extra={"event_id": event_id, "winner": "rules", "waited_ms": waited_ms,
+                                               "upgrade_id": upgrade_id})
+    return rules_result, "rules", upgrade_id
+
+
+async def wait_for_upgrade(db, org_id: str, upgrade_id: str, wait_seconds: float) -> Optional[Dict[str, Any]]:
+    """The upgrade document, waiting up to ``wait_seconds`` while it is PENDING; None if missing."""
+    ref = upgrade_ref(db, org_id, upgrade_id)
+    expires = time.monotonic() + max(0.0, wait_seconds)
+    while True:
+        snapshot = await asyncio.to_thread(ref.get)
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict() or {}
+        remaining = expires - time.monotonic()
+        if data.get("status") != PENDING or remaining <= 0:
+            return data
+        await asyncio.sleep(min(POLL_INTERVAL_SECONDS, remaining))
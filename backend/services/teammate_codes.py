@@ -2,8 +2,8 @@ import asyncio
 import logging
 import random
 import time
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from google.api_core import exceptions as g_exceptions
 
@@ -93,6 +93,25 @@ def _format_code(org_code: str, role: str, number: int, pattern: Optional[str] =
     return result
 
 
+def _resolve_org_in_transaction(transaction, db, org_code: str, org_id_expected: str) -> str:
+    org_code_snapshot = _org_code_ref(db, org_code).get(transaction=transaction)
+    if not org_code_snapshot.exists:
+        raise OrgCodeNotFoundError(org_code)
+
+    org_id = (org_code_snapshot.to_dict() or {}).get("orgId")
+    if not org_id:
+        raise OrgCodeNotFoundError(org_code)
+    if org_id != org_id_expected:
+        raise OrgMismatchError(org_id)
+    return org_id
+
+
+def _backoff_delay(attempt: int, base_delay: float) -> float:
+    # Exponential backoff with jitter per Firestore recommendations.
+    delay = base_delay * (2 ** (attempt - 1))
+    return delay + random.uniform(0, delay * 0.1)
+
+
 @dataclass
 class _TxnResult:
     code: str
@@ -125,15 +144,7 @@ def _transaction_allocate(transaction, context: _TxnContext) -> _TxnResult:
     org_id_expected = context.org_id_expected
     teammate_uid = context.teammate_uid
 
-    org_code_snapshot = _org_code_ref(db, org_code).get(transaction=transaction)
-    if not org_code_snapshot.exists:
-        raise OrgCodeNotFoundError(org_code)
-
-    org_id = (org_code_snapshot.to_dict() or {}).get("orgId")
-    if not org_id:
-        raise OrgCodeNotFoundError(org_code)
-    if org_id != org_id_expected:
-        raise OrgMismatchError(org_id)
+    org_id = _resolve_org_in_transaction(transaction, db, org_code, org_id_expected)
 
     counter_ref = _counter_ref(db, org_id, role)
     counter_snapshot = counter_ref.get(transaction=transaction)
@@ -259,17 +270,15 @@ async def allocate_teammate_code(
             raise
         except g_exceptions.Aborted as exc:
             last_error = exc
-            # Exponential backoff with jitter per Firestore recommendations.
-            delay = base_delay * (2 ** (attempt - 1))
-            jitter = random.uniform(0, delay * 0.1)
-            await asyncio.sleep(delay + jitter)
+            delay = _backoff_delay(attempt, base_delay)
+            await asyncio.sleep(delay)
             logger.warning(
                 "teammate_code.txn_aborted",
                 extra={
                     "orgCode": normalized_org_code,
                     "role": normalized_role,
                     "attempt": attempt,
-                    "delaySeconds": round(delay + jitter, 4),
+                    "delaySeconds": round(delay, 4),
                 },
             )
             continue
@@ -286,3 +295,259 @@ async def allocate_teammate_code(
             break
 
     raise AllocationFailedError(last_error)
+
+
+# --- Bulk allocation ---
+
+# Firestore caps a WriteBatch at 500 operations; each assignment writes three documents.
+BATCH_WRITE_LIMIT = 500
+_WRITES_PER_ASSIGNMENT = 3
+
+
+@dataclass
+class BulkAssignment:
+    teammate_uid: str
+    role: str
+    status: str = "assigned"
+    code: Optional[str] = None
+    number: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class BulkAllocationResult:
+    org_id: str
+    assignments: List[BulkAssignment]
+    attempts: int
+    latency_ms: float
+    reserve_latency_ms: float
+    write_latency_ms: float
+
+
+@dataclass
+class _BulkTxnContext:
+    """Context passed to the bulk reservation transaction."""
+    db: any
+    firestore_module: any
+    org_code: str
+    org_id_expected: str
+    counts: Dict[str, int]
+    pattern: Optional[str] = None
+    reserved: Dict[str, List[Tuple[int, str]]] = field(default_factory=dict)
+
+
+def _transaction_reserve_block(transaction, context: _BulkTxnContext) -> str:
+    """
+    Reserve ``counts[role]`` free numbers for every role in one transaction.
+
+    Only the role counters are written here. Candidate codes are checked
+    against the unique index in batched reads so numbers already taken (for
+    example by a pattern change) are skipped, exactly like the single
+    allocator does one at a time.
+    """
+    db = context.db
+    org_id = _resolve_org_in_transaction(transaction, db, context.org_code, context.org_id_expected)
+
+    # All reads must happen before the first write in a Firestore transaction.
+    reserved: Dict[str, List[Tuple[int, str]]] = {}
+    next_numbers: Dict[str, int] = {}
+    for role, count in context.counts.items():
+        counter_snapshot = _counter_ref(db, org_id, role).get(transaction=transaction)
+        next_number = 1
+        if counter_snapshot.exists:
+            next_number = max(1, int((counter_snapshot.to_dict() or {}).get("next", 1)))
+
+        taken: List[Tuple[int, str]] = []
+        for _ in range(128):
+            needed = count - len(taken)
+            if needed <= 0:
+                break
+            candidates = {
+                _format_code(context.org_code, role, number, context.pattern): number
+                for number in range(next_number, next_number + needed)
+            }
+            snapshots = db.get_all([_unique_index_ref(db, code) for code in candidates], transaction=transaction)
+            existing = {snapshot.id for snapshot in snapshots if snapshot.exists}
+            taken.extend((number, code) for code, number in candidates.items() if code not in existing)
+            next_number += needed
+        if len(taken) < count:
+            raise AllocationExhaustedError(f"Unable to allocate {count} codes for {context.org_code}-{role}")
+
+        taken.sort()
+        reserved[role] = taken
+        next_numbers[role] = taken[-1][0] + 1
+
+    for role, next_number in next_numbers.items():
+        transaction.set(
+            _counter_ref(db, org_id, role),
+            {
+                "orgId": org_id,
+                "role": role,
+                "next": next_number,
+                "updatedAt": context.firestore_module.SERVER_TIMESTAMP,
+            },
+            merge=True,
+        )
+
+    context.reserved = reserved
+    return org_id
+
+
+def _assignment_writes(db, firestore_module, org_id: str, org_code: str, assignment: BulkAssignment):
+    index_payload = {
+        "orgId": org_id,
+        "role": assignment.role,
+        "number": assignment.number,
+        "code": assignment.code,
+        "createdAt": firestore_module.SERVER_TIMESTAMP,
+        "orgCode": org_code,
+        "uid": assignment.teammate_uid,
+    }
+    member_payload = {
+        "employeeCode": assignment.code,
+        "profile": {"employeeCode": assignment.code},
+        "orgId": org_id,
+        "role": assignment.role,
+        "codeGeneratedAt": firestore_module.SERVER_TIMESTAMP,
+    }
+    return (_unique_index_ref(db, assignment.code), index_payload), [
+        (_teammate_ref(db, org_id, assignment.teammate_uid), {"profile": {"employeeCode": assignment.code}}),
+        (_team_member_ref(db, org_id, assignment.teammate_uid), member_payload),
+    ]
+
+
+def _commit_chunk(db, firestore_module, org_id: str, org_code: str, chunk: List[BulkAssignment]) -> None:
+    batch = db.batch()
+    for assignment in chunk:
+        (index_ref, index_payload), member_writes = _assignment_writes(db, firestore_module, org_id, org_code, assignment)
+        # create, not set: a code claimed since the reservation fails the whole batch instead of being overwritten
+        batch.create(index_ref, index_payload)
+        for ref, payload in member_writes:
+            batch.set(ref, payload, merge=True)
+    batch.commit()
+
+
+async def allocate_teammate_codes_bulk(
+    firestore_module,
+    org_code: str,
+    members: Sequence[Tuple[str, str]],
+    expected_org_id: str,
+    *,
+    pattern: Optional[str] = None,
+    max_attempts: int = 6,
+    base_delay: float = 0.05,
+) -> BulkAllocationResult:
+    """
+    Allocate codes for many ``(teammate_uid, role)`` pairs at once.
+
+    One transaction reserves a block of consecutive numbers per role; the
+    unique-index, teammate and team documents are then written in parallel
+    batches. Index documents are created, never overwritten, so a code taken
+    by someone else in the meantime fails its batch. A failed batch marks its
+    members ``failed`` and leaves the reserved numbers unused rather than
+    rolling the counters back.
+    """
+    if not expected_org_id:
+        raise ValueError("expected_org_id is required")
+
+    normalized_org_code = org_code.upper()
+    pending = [(uid, role.upper()) for uid, role in members]
+    counts: Dict[str, int] = {}
+    for _, role in pending:
+        counts[role] = counts.get(role, 0) + 1
+
+    db = firestore_module.client()
+    start = time.perf_counter()
+    context = _BulkTxnContext(
+        db=db,
+        firestore_module=firestore_module,
+        org_code=normalized_org_code,
+        org_id_expected=expected_org_id,
+        counts=counts,
+        pattern=pattern,
+    )
+
+    attempt = 0
+    last_error: Optional[Exception] = None
+    org_id: Optional[str] = None
+    while attempt < max_attempts and counts:
+        attempt += 1
+        transaction = db.transaction()
+        try:
+            @firestore_module.transactional
+            def run_transaction(txn):
+                return _transaction_reserve_block(txn, context)
+
+            org_id = run_transaction(transaction)
+            break
+        except (OrgCodeNotFoundError, OrgMismatchError, AllocationExhaustedError):
+            raise
+        except g_exceptions.Aborted as exc:
+            last_error = exc
+            delay = _backoff_delay(attempt, base_delay)
+            await asyncio.sleep(delay)
+            logger.warning(
+                "teammate_code.bulk_txn_aborted",
+                extra={
+                    "orgCode": normalized_org_code,
+                    "roles": sorted(counts),
+                    "attempt": attempt,
+                    "delaySeconds": round(delay, 4),
+                },
+            )
+        except Exception as exc:  # pragma: no cover - unexpected
+            last_error = exc
+            logger.exception(
+                "teammate_code.bulk_txn_unexpected_error",
+                extra={"orgCode": normalized_org_code, "attempt": attempt},
+            )
+            break
+    if counts and org_id is None:
+        raise AllocationFailedError(last_error)
+    reserve_latency_ms = (time.perf_counter() - start) * 1000
+
+    numbers = {role: iter(taken) for role, taken in context.reserved.items()}
+    assignments = []
+    for uid, role in pending:
+        number, code = next(numbers[role])
+        assignments.append(BulkAssignment(teammate_uid=uid, role=role, code=code, number=number))
+
+    chunk_size = BATCH_WRITE_LIMIT // _WRITES_PER_ASSIGNMENT
+    chunks = [assignments[i:i + chunk_size] for i in range(0, len(assignments), chunk_size)]
+    write_start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(asyncio.to_thread(_commit_chunk, db, firestore_module, org_id, normalized_org_code, chunk) for chunk in chunks),
+        return_exceptions=True,
+    )
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, Exception):
+            logger.warning(
+                "teammate_code.bulk_batch_failed",
+                extra={"orgCode": normalized_org_code, "size": len(chunk), "error": str(outcome)},
+            )
+            for assignment in chunk:
+                assignment.status = "failed"
+                assignment.error = str(outcome)
+    write_latency_ms = (time.perf_counter() - write_start) * 1000
+
+    result = BulkAllocationResult(
+        org_id=org_id or expected_org_id,
+        assignments=assignments,
+        attempts=attempt,
+        latency_ms=(time.perf_counter() - start) * 1000,
+        reserve_latency_ms=reserve_latency_ms,
+        write_latency_ms=write_latency_ms,
+    )
+    logger.info(
+        "teammate_code.bulk_allocated",
+        extra={
+            "orgCode": normalized_org_code,
+            "count": len(assignments),
+            "roles": counts,
+            "attempts": attempt,
+            "latencyMs": round(result.latency_ms, 1),
+            "reserveLatencyMs": round(reserve_latency_ms, 1),
+            "writeLatencyMs": round(write_latency_ms, 1),
+        },
+    )
+    return result
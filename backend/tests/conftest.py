@@ -0,0 +1,333 @@
+"""
+In-memory Firestore shared by the service tests.
+
+``fake_db`` stores documents in ``db.docs`` keyed by their path tuple, e.g.
+``("organizations", "org-1", "receipts", "r1")``. Batches and transactions
+buffer their writes and apply them on commit. ``fake_firestore`` stands in for
+the ``firebase_admin.firestore`` module: tests monkeypatch it onto the service
+under test so ``Increment``, ``ArrayUnion``, ``DELETE_FIELD``,
+``SERVER_TIMESTAMP`` and ``transactional`` work against ``fake_db``.
+
+The DB counts what the services do so tests can assert on it:
+
+* ``reads``: paths of every document read, through ``get`` or a query.
+* ``queries``: collection id of every query run.
+* ``counts``: collection id of every ``count()`` aggregation run. These read
+  no documents.
+* ``get_all_calls``: number of ``get_all`` round trips.
+* ``transactions``: number of transactions started.
+* ``commits`` / ``commit_sizes``: commit attempts, and the write count of each
+  successful commit. Set ``fail_on_commit`` to the attempt number that should
+  fail.
+"""
+import copy
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as g_exceptions
+
+FIRESTORE_WRITE_LIMIT = 500
+IN_QUERY_LIMIT = 30
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Increment) and other.value == self.value
+
+
+class ArrayUnion:
+    def __init__(self, values):
+        self.values = values
+
+
+DELETE_FIELD = object()
+SERVER_TIMESTAMP = object()
+
+
+def transactional(fn):
+    def run(transaction):
+        result = fn(transaction)
+        transaction.commit()
+        return result
+    return run
+
+
+def _resolve(current, value):
+    """The stored value for ``value`` written over ``current``, applying sentinels."""
+    if isinstance(value, Increment):
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    if isinstance(value, ArrayUnion):
+        existing = list(current) if isinstance(current, list) else []
+        return existing + [v for v in value.values if v not in existing]
+    if value is SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, dict):
+        return {k: _resolve(None, v) for k, v in value.items() if v is not DELETE_FIELD}
+    return copy.deepcopy(value)
+
+
+def _merge(target, data):
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and value and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = _resolve(target.get(key), value)
+
+
+def _set_path(target, path, value):
+    *parents, leaf = path.split(".")
+    for key in parents:
+        if not isinstance(target.get(key), dict):
+            target[key] = {}
+        target = target[key]
+    if value is DELETE_FIELD:
+        target.pop(leaf, None)
+    else:
+        target[leaf] = _resolve(target.get(leaf), value)
+
+
+def lookup(data, field):
+    for part in field.split("."):
+        data = data.get(part) if isinstance(data, dict) else None
+    return data
+
+
+class Snapshot:
+    def __init__(self, ref, data, update_time=None):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return lookup(self._data, field)
+
+
+class DocumentRef:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path[-1]
+
+    @property
+    def parent(self):
+        return Query(self._db, self.path[:-1])
+
+    def collection(self, name):
+        return Query(self._db, self.path + (name,))
+
+    def get(self, transaction=None, field_paths=None):
+        self._db.reads.append(self.path)
+        return self._db.snapshot(self)
+
+    def set(self, data, merge=False):
+        if merge:
+            _merge(self._db.docs.setdefault(self.path, {}), data)
+        else:
+            self._db.docs[self.path] = {k: _resolve(None, v) for k, v in data.items() if v is not DELETE_FIELD}
+        self._db.touch(self.path)
+
+    def update(self, data, option=None):
+        if self.path not in self._db.docs:
+            raise g_exceptions.NotFound(f"{'/'.join(self.path)} not found")
+        if option is not None and option.get("last_update_time") != self._db.versions.get(self.path, 0):
+            raise g_exceptions.FailedPrecondition(f"{'/'.join(self.path)} changed")
+        doc = self._db.docs[self.path]
+        for key, value in data.items():
+            _set_path(doc, key, value)
+        self._db.touch(self.path)
+
+    def create(self, data):
+        if self.path in self._db.docs:
+            raise g_exceptions.AlreadyExists(f"{'/'.join(self.path)} already exists")
+        self.set(data)
+
+    def delete(self):
+        self._db.docs.pop(self.path, None)
+        self._db.touch(self.path)
+
+
+class Query:
+    """A collection reference, and any query built from it."""
+
+    def __init__(self, db, path, filters=(), order=(), limit=None, after=None):
+        self._db = db
+        self._path = path
+        self._filters = filters
+        self._order = order
+        self._limit = limit
+        self._after = after
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    def _with(self, **changes):
+        state = dict(filters=self._filters, order=self._order, limit=self._limit, after=self._after)
+        state.update(changes)
+        return Query(self._db, self._path, **state)
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            self._db.auto_ids += 1
+            doc_id = f"auto{self._db.auto_ids:04d}"
+        return DocumentRef(self._db, self._path + (doc_id,))
+
+    def where(self, field, op, value):
+        if op == "in":
+            assert len(value) <= IN_QUERY_LIMIT, "Firestore allows at most 30 values in an 'in' filter"
+        return self._with(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction=None):
+        return self._with(order=self._order + ((field, direction),))
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def start_after(self, cursor):
+        return self._with(after=cursor["__name__"] if isinstance(cursor, dict) else cursor.id)
+
+    def select(self, fields):
+        return self
+
+    def _matches(self, doc_id, data):
+        for field, op, expected in self._filters:
+            value = doc_id if field == "__name__" else lookup(data, field)
+            if op == "==" and value != expected:
+                return False
+            if op == "in" and value not in expected:
+                return False
+            if op in ("<", "<=", ">", ">=") and (value is None or not {
+                "<": value < expected, "<=": value <= expected, ">": value > expected, ">=": value >= expected,
+            }[op]):
+                return False
+        return True
+
+    def get(self):
+        self._db.queries.append(self._path[-1])
+        rows = [(p, d) for p, d in self._db.docs.items() if p[:-1] == self._path and self._matches(p[-1], d)]
+        rows.sort(key=lambda row: row[0][-1])
+        for field, direction in reversed(self._order):
+            if field != "__name__":
+                rows.sort(key=lambda row: lookup(row[1], field), reverse=direction == "DESCENDING")
+        if self._after is not None:
+            ids = [p[-1] for p, _ in rows]
+            rows = rows[ids.index(self._after) + 1:] if self._after in ids else \
+                [row for row in rows if row[0][-1] > self._after]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        self._db.reads.extend(p for p, _ in rows)
+        return [self._db.snapshot(DocumentRef(self._db, p)) for p, _ in rows]
+
+    def stream(self):
+        return iter(self.get())
+
+    def count(self, alias=None):
+        return CountQuery(self, alias)
+
+
+class CountQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self):
+        query = self._query
+        query._db.counts.append(query.id)
+        matches = [p for p, d in query._db.docs.items() if p[:-1] == query._path and query._matches(p[-1], d)]
+        return [[SimpleNamespace(alias=self._alias, value=len(matches))]]
+
+
+class WriteBatch:
+    """A batch or transaction: writes are buffered and applied on commit."""
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self._writes.append(lambda: ref.update(data))
+
+    def create(self, ref, data):
+        self._writes.append(lambda: ref.create(data))
+
+    def delete(self, ref):
+        self._writes.append(ref.delete)
+
+    def commit(self):
+        self._db.commits += 1
+        if self._db.fail_on_commit == self._db.commits:
+            raise RuntimeError("deadline exceeded")
+        assert len(self._writes) <= FIRESTORE_WRITE_LIMIT
+        self._db.commit_sizes.append(len(self._writes))
+        for write in self._writes:
+            write()
+        self._writes = []
+        return []
+
+
+class FakeDB:
+    def __init__(self):
+        self.docs = {}
+        self.versions = {}
+        self.auto_ids = 0
+        self.reads = []
+        self.queries = []
+        self.counts = []
+        self.get_all_calls = 0
+        self.transactions = 0
+        self.commits = 0
+        self.commit_sizes = []
+        self.fail_on_commit = None
+
+    def touch(self, path):
+        self.versions[path] = self.versions.get(path, 0) + 1
+
+    def snapshot(self, ref):
+        return Snapshot(ref, self.docs.get(ref.path), self.versions.get(ref.path, 0))
+
+    def collection(self, *path):
+        return Query(self, tuple(path))
+
+    def get_all(self, refs, transaction=None, field_paths=None):
+        self.get_all_calls += 1
+        return [self.snapshot(ref) for ref in refs]
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self):
+        self.transactions += 1
+        return WriteBatch(self)
+
+    def write_option(self, **kwargs):
+        return kwargs
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDB()
+
+
+@pytest.fixture
+def fake_firestore():
+    return SimpleNamespace(
+        Increment=Increment,
+        ArrayUnion=ArrayUnion,
+        DELETE_FIELD=DELETE_FIELD,
+        SERVER_TIMESTAMP=SERVER_TIMESTAMP,
+        transactional=transactional,
+    )
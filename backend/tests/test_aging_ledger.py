@@ -0,0 +1,104 @@
+from datetime import date
+
+from backend.services import aging_ledger
+
+
+def _invoice(amount_due, due_date, status="SENT", client_id="client-1", invoice_type="FINAL"):
+    return {
+        "type": invoice_type,
+        "status": status,
+        "clientId": client_id,
+        "dueDate": due_date,
+        "totals": {"amountDue": amount_due},
+    }
+
+
+def _apply(aggregate, delta):
+    for key in ("dueHistogram", "partyBalances"):
+        for k, v in delta[key].items():
+            aggregate.setdefault(key, {})[k] = aggregate.get(key, {}).get(k, 0.0) + v
+    aggregate["outstanding"] = aggregate.get("outstanding", 0.0) + delta["outstanding"]
+    aggregate["openCount"] = aggregate.get("openCount", 0) + delta["openCount"]
+    return aggregate
+
+
+def test_send_pay_and_cancel_transitions_net_to_zero():
+    draft = _invoice(1000.0, "2025-01-10T00:00:00+00:00", status="DRAFT")
+    sent = {**draft, "status": "SENT"}
+    partial = {**sent, "status": "PARTIAL", "totals": {"amountDue": 400.0}}
+    paid = {**sent, "status": "PAID", "totals": {"amountDue": 0.0}}
+
+    aggregate = {}
+    _apply(aggregate, aging_ledger.transition_delta(aging_ledger.AR_LEDGER, draft, sent))
+    assert aggregate["dueHistogram"] == {"2025-01-10": 1000.0}
+    assert aggregate["openCount"] == 1
+
+    _apply(aggregate, aging_ledger.transition_delta(aging_ledger.AR_LEDGER, sent, partial))
+    assert aggregate["dueHistogram"]["2025-01-10"] == 400.0
+    assert aggregate["openCount"] == 1
+
+    _apply(aggregate, aging_ledger.transition_delta(aging_ledger.AR_LEDGER, partial, paid))
+    assert abs(aggregate["dueHistogram"]["2025-01-10"]) < 0.005
+    assert aggregate["openCount"] == 0
+
+
+def test_budget_and_draft_invoices_do_not_contribute():
+    budget = _invoice(500.0, "2025-01-10", invoice_type="BUDGET")
+    draft = _invoice(500.0, "2025-01-10", status="DRAFT")
+    assert aging_ledger.open_balance(aging_ledger.AR_LEDGER, budget) == 0.0
+    assert aging_ledger.open_balance(aging_ledger.AR_LEDGER, draft) == 0.0
+    assert aging_ledger.transition_delta(aging_ledger.AR_LEDGER, None, draft)["openCount"] == 0
+
+
+def test_snapshot_shifts_buckets_with_as_of_date():
+    aggregate = {
+        "dueHistogram": {
+            "2025-03-01": 100.0,   # not yet due on 2025-02-25
+            "2025-02-20": 200.0,   # 5 days overdue
+            "2025-01-01": 300.0,   # 55 days overdue
+            "2024-10-01": 400.0,   # 147 days overdue
+            aging_ledger.NO_DUE_DATE: 50.0,
+        },
+        "partyBalances": {"client-1": 700.0, "client-2": 350.0},
+        "openCount": 5,
+    }
+
+    snapshot = aging_ledger.snapshot_from_aggregate(aggregate, date(2025, 2, 25))
+    assert snapshot["buckets"] == {"0-15": 200.0, "16-30": 0.0, "31-60": 300.0, "61-90": 0.0, "90+": 400.0}
+    assert snapshot["current"] == 150.0
+    assert snapshot["dueNext7Days"] == 100.0
+    assert snapshot["outstanding"] == 1050.0
+
+    later = aging_ledger.snapshot_from_aggregate(aggregate, date(2025, 3, 20))
+    assert later["buckets"]["0-15"] == 0.0
+    assert later["buckets"]["16-30"] == 300.0
+    assert later["buckets"]["61-90"] == 300.0
+
+    assert aging_ledger.top_parties(snapshot, limit=1) == [("client-1", 700.0)]
+
+
+def test_ap_ledger_uses_vendor_and_bill_statuses():
+    scheduled = {"status": "SCHEDULED", "vendorId": "v-1", "dueDate": "2025-01-05", "totals": {"amountDue": 80.0}}
+    cancelled = {**scheduled, "status": "CANCELLED"}
+    delta = aging_ledger.transition_delta(aging_ledger.AP_LEDGER, None, scheduled)
+    assert delta["partyBalances"] == {"v-1": 80.0}
+    delta = aging_ledger.transition_delta(aging_ledger.AP_LEDGER, scheduled, cancelled)
+    assert delta["dueHistogram"] == {"2025-01-05": -80.0}
+
+
+def test_snapshot_rebuilds_a_ledger_that_only_holds_post_deploy_increments(monkeypatch, fake_db, fake_firestore):
+    monkeypatch.setattr(aging_ledger, "firestore", fake_firestore)
+    db = fake_db
+    invoices = ("organizations", "org-1", "invoices")
+    db.docs[invoices + ("i1",)] = _invoice(100.0, "2025-01-01")
+    db.docs[invoices + ("i2",)] = _invoice(50.0, "2025-03-01", client_id="client-2")
+    # A payment recorded after deploy created the aggregate with just its own delta.
+    db.docs[("organizations", "org-1", "aggregates", aging_ledger.AR_LEDGER)] = {
+        "dueHistogram": {"2025-03-01": 50.0}, "outstanding": 50.0, "openCount": 1}
+
+    snapshot = aging_ledger.get_aging_snapshot(db, "org-1", aging_ledger.AR_LEDGER, "2025-03-15")
+
+    assert snapshot["outstanding"] == 150.0 and snapshot["openCount"] == 2
+    assert snapshot["buckets"]["61-90"] == 100.0
+    aging_ledger.get_aging_snapshot(db, "org-1", aging_ledger.AR_LEDGER, "2025-03-15")
+    assert db.queries == ["invoices"]
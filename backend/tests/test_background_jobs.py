@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.services import background_jobs
+
+
+@pytest.fixture
+def db(monkeypatch, fake_db, fake_firestore):
+    monkeypatch.setattr(background_jobs, "firestore", fake_firestore)
+    return fake_db
+
+
+def test_only_failed_or_orphaned_jobs_resume():
+    now = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+    assert background_jobs.is_resumable({"status": "FAILED"}, now)
+    assert not background_jobs.is_resumable({"status": "COMPLETED"}, now)
+    assert not background_jobs.is_resumable({"status": "RUNNING", "heartbeatAt": now - timedelta(seconds=30)}, now)
+    assert background_jobs.is_resumable({"status": "RUNNING", "heartbeatAt": now - timedelta(minutes=5)}, now)
+    # A freshly queued job may still be starting in the background; only an old one is orphaned.
+    assert not background_jobs.is_resumable({"status": "QUEUED", "createdAt": now - timedelta(seconds=5)}, now)
+    assert background_jobs.is_resumable({"status": "QUEUED", "createdAt": now - timedelta(minutes=5)}, now)
+
+
+def test_a_job_is_claimed_by_one_runner_at_a_time(db):
+    ref = db.collection("jobs").document("j1")
+    db.docs[ref.path] = {"status": "QUEUED", "createdAt": datetime.now(timezone.utc)}
+
+    first, job = background_jobs.claim(db, ref)
+    assert job["status"] == "RUNNING" and db.docs[ref.path]["runnerId"] == first
+    # Already running with a fresh heartbeat: neither a second start nor a resume gets it
+    assert background_jobs.claim(db, ref) is None
+    assert background_jobs.claim(db, ref, resume=True) is None
+
+    db.docs[ref.path]["status"] = "FAILED"
+    second, _ = background_jobs.claim(db, ref, resume=True)
+    assert second != first
+    assert background_jobs.claim(db, ref, resume=True) is None
+
+    background_jobs.update_as_runner(db, ref, second, {"cursor": "c2"})
+    with pytest.raises(background_jobs.ClaimLost):
+        background_jobs.update_as_runner(db, ref, first, {"cursor": "c1"})
+    assert db.docs[ref.path]["cursor"] == "c2"
+    assert background_jobs.claim(db, db.collection("jobs").document("missing"), resume=True) is None
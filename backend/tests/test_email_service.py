@@ -0,0 +1,69 @@
+import io
+
+from backend.utils.email_service import EmailService, EmailQueue, InMemoryTransport, OutboundEmail
+
+
+CLIENT = {"profile": {"name": "Asha", "email": "asha@example.com"}}
+INVOICE = {
+    "number": "INV-2025-0007",
+    "issueDate": "2025-03-01T00:00:00+00:00",
+    "dueDate": "2025-03-15T00:00:00+00:00",
+    "currency": "INR",
+    "totals": {"grandTotal": 1500.0, "amountDue": 1500.0},
+}
+
+
+class _FlakyTransport(InMemoryTransport):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send_batch(self, emails):
+        if self.failures:
+            self.failures -= 1
+            return [RuntimeError("provider unavailable")] * len(emails)
+        return super().send_batch(emails)
+
+
+def test_invoice_email_is_queued_and_delivered_with_attachment():
+    transport = InMemoryTransport()
+    service = EmailService(transport=transport, workers=2)
+
+    assert service.send_invoice_email(INVOICE, CLIENT, io.BytesIO(b"%PDF-1.4"), {"name": "Studio"}) is True
+    assert service.flush(timeout=5)
+
+    [email] = transport.sent
+    assert email.to == "asha@example.com"
+    assert email.subject == "Invoice INV-2025-0007 from Studio"
+    assert "INV-2025-0007" in email.html and "₹1,500.00" in email.html
+    assert email.attachments[0][0] == "Invoice-INV-2025-0007.pdf"
+
+
+def test_missing_client_email_or_transport_is_not_queued(monkeypatch):
+    assert EmailService(transport=InMemoryTransport()).send_invoice_email(INVOICE, {"profile": {}}) is False
+
+    monkeypatch.delenv("SENDGRID_API_KEY", raising=False)
+    monkeypatch.delenv("EMAIL_TRANSPORT", raising=False)
+    assert EmailService().send_quote_email(INVOICE, CLIENT) is False
+
+
+def test_client_messages_are_html_escaped():
+    transport = InMemoryTransport()
+    service = EmailService(transport=transport)
+
+    service.send_invoice_message_notification(INVOICE, CLIENT, "<script>alert(1)</script>")
+    service.flush(timeout=5)
+
+    assert "<script>" not in transport.sent[0].html
+    assert "&lt;script&gt;" in transport.sent[0].html
+
+
+def test_queue_retries_failed_batches():
+    transport = _FlakyTransport(failures=1)
+    outbox = EmailQueue(transport, workers=1, base_delay=0.01)
+
+    outbox.enqueue(OutboundEmail(to="a@example.com", subject="s", html="h", from_email="f"))
+
+    assert outbox.flush(timeout=5)
+    assert len(transport.sent) == 1
+    assert outbox.stats["retried"] == 1 and outbox.stats["sent"] == 1
@@ -0,0 +1,48 @@
+import csv
+import io
+from datetime import datetime, timezone
+
+from openpyxl import load_workbook
+
+from backend.utils import exports
+
+
+class _Snap:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+def test_paginate_walks_pages_with_cursor(fake_db):
+    for i in range(7):
+        fake_db.docs[("docs", f"d{i}")] = {"n": i}
+    query = fake_db.collection("docs").order_by("__name__")
+
+    ids = [s.id for s in exports.paginate(query, page_size=3)]
+
+    assert ids == [f"d{i}" for i in range(7)]
+    assert fake_db.queries == ["docs"] * 3 and len(fake_db.reads) == 7
+
+
+def test_csv_stream_chunks_and_skips(monkeypatch):
+    monkeypatch.setattr(exports, "CSV_CHUNK_BYTES", 32)
+    snaps = [_Snap(f"d{i}", {"n": i, "at": datetime(2025, 1, i + 1, tzinfo=timezone.utc)}) for i in range(5)]
+
+    rows = exports.project_rows(snaps, lambda doc_id, d: None if d["n"] == 2 else [doc_id, d["n"], d["at"], None])
+    chunks = list(exports.iter_csv(["id", "n", "at", "note"], rows))
+
+    assert len(chunks) > 1
+    parsed = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert parsed[0] == ["id", "n", "at", "note"]
+    assert [r[0] for r in parsed[1:]] == ["d0", "d1", "d3", "d4"]
+    assert parsed[1][2] == "2025-01-01T00:00:00+00:00" and parsed[1][3] == ""
+
+
+def test_xlsx_stream_round_trips():
+    data = b"".join(exports.iter_xlsx(["id", "amount"], iter([["a", 1.5], ["b", 2]]), "Bills"))
+
+    sheet = load_workbook(io.BytesIO(data))["Bills"]
+    assert [list(r) for r in sheet.iter_rows(values_only=True)] == [["id", "amount"], ["a", 1.5], ["b", 2]]
@@ -0,0 +1,60 @@
+import io
+import random
+
+import imagehash
+import numpy as np
+from PIL import Image, ImageDraw
+
+from backend.services import fast_forensics
+from backend.services.advanced_verification_service import advanced_verification_service
+
+
+def _receipt(width, height, seed):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, width, height // 8], fill=(rng.randrange(256), 60, 160))
+    for row in range(height // 6, height, max(20, height // 40)):
+        x = rng.randrange(20, width // 3)
+        draw.rectangle([x, row, x + rng.randrange(width // 6, width // 2), row + height // 80], fill=(25, 25, 25))
+    return image
+
+
+def _jpeg(image, quality=88):
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def test_resample_matches_pillow_lanczos_exactly():
+    rng = np.random.default_rng(5)
+    for height, width in [(1365, 1024), (77, 130), (32, 32), (9, 9)]:
+        gray = rng.integers(0, 256, size=(height, width), dtype=np.uint8)
+        for out_h, out_w in [(32, 32), (8, 9)]:
+            expected = np.asarray(Image.fromarray(gray).resize((out_w, out_h), Image.LANCZOS))
+            assert np.array_equal(fast_forensics.resample(gray.astype(np.float64), out_h, out_w), expected)
+
+
+def test_hashes_are_bit_identical_to_imagehash_on_the_same_image():
+    for seed in range(6):
+        gray = _receipt(1024, 1400 + seed * 37, seed).convert("L")
+        assert fast_forensics.hashes_from_gray(np.asarray(gray)) == {
+            "phash": str(imagehash.phash(gray)),
+            "dhash": str(imagehash.dhash(gray)),
+        }
+
+
+def test_fast_analysis_is_threshold_equivalent_to_reference():
+    thresholds = advanced_verification_service.thresholds
+    for seed in range(3):
+        data = _jpeg(_receipt(2400, 3200, seed))
+        reference = advanced_verification_service.comprehensive_image_analysis(data)
+        fast = fast_forensics.fast_image_analysis(data)
+
+        assert set(fast) == set(reference)
+        assert set(fast["timings_ms"]) == set(reference["timings_ms"])
+        phash_distance, dhash_distance, ela_delta = fast_forensics.compare(reference, fast)
+        assert phash_distance < thresholds["PHASH_TEMPLATE"] // 2
+        assert dhash_distance < thresholds["DHASH_EXACT"]
+        assert abs(ela_delta) < 5
+        assert fast["ela_analysis"]["is_manipulated"] == reference["ela_analysis"]["is_manipulated"]
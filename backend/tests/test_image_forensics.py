@@ -0,0 +1,65 @@
+import asyncio
+import io
+
+import imagehash
+import pytest
+from PIL import Image, ImageDraw
+
+from backend.services import image_forensics
+from backend.services.advanced_verification_service import advanced_verification_service
+
+
+def _receipt_jpeg(width=1200, height=1800):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(0, height, 60):
+        draw.rectangle([40, row + 10, 40 + (row * 7) % (width - 80), row + 40], fill=(30, 30, 30))
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def test_pipeline_hashes_match_per_step_path_and_reports_stages():
+    data = _receipt_jpeg()
+    result = advanced_verification_service.comprehensive_image_analysis(data)
+
+    resized, _ = advanced_verification_service.preprocess_image(data)
+    assert result["perceptual_hashes"] == {"phash": str(imagehash.phash(resized)), "dhash": str(imagehash.dhash(resized))}
+    assert result["ela_analysis"] == advanced_verification_service.perform_ela_analysis(resized)
+    assert set(result["timings_ms"]) == {"decode_resize", "hashes", "ela", "total"}
+
+
+def test_analyze_runs_in_worker_and_adds_queue_timings(monkeypatch):
+    monkeypatch.setenv("RECEIPT_FORENSICS_IMPL", "reference")
+    data = _receipt_jpeg(400, 600)
+    try:
+        result = asyncio.run(image_forensics.analyze(data))
+    finally:
+        image_forensics.shutdown()
+    assert result["perceptual_hashes"] == advanced_verification_service.comprehensive_image_analysis(data)["perceptual_hashes"]
+    assert {"queue", "pool", "total"} <= set(result["timings_ms"])
+
+
+def test_back_pressure_rejects_when_all_slots_are_taken(monkeypatch):
+    monkeypatch.setenv("RECEIPT_FORENSICS_WORKERS", "1")
+    monkeypatch.setenv("RECEIPT_FORENSICS_QUEUE", "1")
+    release = None
+
+    async def slow_run(image_bytes):
+        await release.wait()
+        return {"timings_ms": {}}
+
+    monkeypatch.setattr(image_forensics, "_run", slow_run)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        running = [asyncio.create_task(image_forensics.analyze(b"x")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(image_forensics.ForensicsBusyError):
+            await image_forensics.analyze(b"x", wait_seconds=0.05)
+        release.set()
+        return await asyncio.gather(*running)
+
+    results = asyncio.run(scenario())
+    assert len(results) == 2 and all("queue" in r["timings_ms"] for r in results)
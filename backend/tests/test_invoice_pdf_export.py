@@ -0,0 +1,44 @@
+import asyncio
+import io
+import zipfile
+
+from backend.services import invoice_pdf_export
+
+
+class _Snap:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+def test_zip_is_streamed_entry_by_entry(monkeypatch):
+    pages = [
+        [_Snap("a", {"number": "INV-1", "clientId": "c1"}), _Snap("b", {"number": "INV-1", "clientId": "c1"})],
+        [_Snap("c", {"clientId": "c2"})],
+    ]
+    rendered = []
+
+    async def fake_render(invoice, client, org):
+        rendered.append((invoice.get("number"), client.get("name")))
+        return b"%PDF-" + (invoice.get("number") or "draft").encode()
+
+    monkeypatch.setattr(invoice_pdf_export, "_pages", lambda *args: iter(pages))
+    monkeypatch.setattr(invoice_pdf_export, "_load_org", lambda db, org_id: {"name": "Studio"})
+    monkeypatch.setattr(invoice_pdf_export, "_load_clients",
+                        lambda db, org_id, invoices: {"c1": {"name": "Asha"}, "c2": {"name": "Ravi"}})
+    monkeypatch.setattr(invoice_pdf_export, "render_invoice_pdf", fake_render)
+
+    async def collect():
+        return [chunk async for chunk in invoice_pdf_export.stream_export_zip(None, "org", {})]
+
+    chunks = asyncio.run(collect())
+
+    assert len(chunks) >= 3
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.namelist() == ["Invoice-INV-1.pdf", "Invoice-INV-1-b.pdf", "Invoice-c.pdf"]
+    assert archive.read("Invoice-c.pdf") == b"%PDF-draft"
+    assert rendered[2] == (None, "Ravi")
+
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.services import llm_client
+
+
+class _Provider:
+    """Stands in for ``_post``: per-model latency and a script of failures."""
+
+    def __init__(self, latency=None, failures=None):
+        self.latency = latency or {}
+        self.failures = failures or {}
+        self.calls = []
+        self.cancelled = []
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, body, timeout):
+        model = body["model"]
+        self.calls.append(model)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            delay = self.latency.get(model, 0.01)
+            await asyncio.sleep(min(delay, timeout))
+            if delay > timeout:
+                raise llm_client._RetryableError("timed out")
+            script = self.failures.get(model) or []
+            if script:
+                raise script.pop(0)
+            return {"model": model, "choices": [{"message": {"content": f"from {model}"}}],
+                    "usage": {"prompt_tokens": 12, "completion_tokens": 5}}
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_BACKOFF_SECONDS", "0.01")
+    monkeypatch.delenv("LLM_HEDGE_MODEL", raising=False)
+    provider = _Provider()
+    monkeypatch.setattr(llm_client, "_post", provider)
+    llm_client.reset_metrics()
+    yield provider
+    llm_client.reset_metrics()
+
+
+def _chat(*calls):
+    async def run():
+        try:
+            return await asyncio.gather(*calls, return_exceptions=True)
+        finally:
+            await llm_client.close()
+    return asyncio.run(run())
+
+
+def test_retries_transient_errors_bounds_concurrency_and_records_tokens(provider, monkeypatch):
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "2")
+    provider.failures["m"] = [llm_client._RetryableError("HTTP 503", 503)]
+    results = _chat(*(llm_client.chat([{"role": "user", "content": "hi"}], model="m") for _ in range(5)))
+
+    assert all(r.content == "from m" for r in results)
+    assert sorted(r.attempts for r in results) == [1, 1, 1, 1, 2]
+    assert provider.peak <= 2
+    stats = llm_client.metrics_snapshot()["m"]
+    assert stats["calls"] == 5 and stats["errors"] == 0 and stats["retries"] == 1
+    assert stats["promptTokens"] == 60 and stats["completionTokens"] == 25
+
+    provider.failures["m"] = [llm_client.LLMError("bad request", 400)]
+    [error] = _chat(llm_client.chat([{"role": "user", "content": "hi"}], model="m"))
+    assert isinstance(error, llm_client.LLMError) and error.status == 400
+    assert provider.calls.count("m") == 7  # client errors are not retried
+
+
+def test_slow_primary_is_hedged_and_deadline_is_enforced(provider):
+    provider.latency = {"slow": 1.0, "fast": 0.01}
+    [result] = _chat(llm_client.chat([{"role": "user", "content": "hi"}], model="slow",
+                                     hedge_model="fast", hedge_after=0.05, deadline=2))
+    assert result.content == "from fast" and result.hedged
+    assert provider.cancelled == ["slow"]
+
+    provider.failures["slow-fail"] = [llm_client.LLMError("unsupported", 400)]
+    [result] = _chat(llm_client.chat([{"role": "user", "content": "hi"}], model="slow-fail",
+                                     hedge_model="fast", hedge_after=5, deadline=2))
+    assert result.model == "fast"
+
+    started = time.perf_counter()
+    [error] = _chat(llm_client.chat([{"role": "user", "content": "hi"}], model="slow", deadline=0.2))
+    assert isinstance(error, llm_client.LLMError)
+    assert time.perf_counter() - started < 0.6
+    # The cancelled hedge loser is not counted as an error; the timed-out call is
+    assert llm_client.metrics_snapshot()["slow"]["errors"] == 1
@@ -0,0 +1,95 @@
+import json
+import time
+
+import pytest
+
+from backend.services import ocr_cache, ocr_service as ocr_module
+
+
+class _Response:
+    ok = True
+    status_code = 200
+
+    def __init__(self, content):
+        self._content = content
+
+    def json(self):
+        return {"choices": [{"message": {"content": self._content}}]}
+
+
+class _Session:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        return _Response(self.content)
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("OCR_CACHE_BACKEND", "disk")
+    monkeypatch.setenv("OCR_CACHE_DIR", str(tmp_path))
+    ocr_cache.reset_ocr_cache()
+    yield ocr_cache.get_ocr_cache()
+    ocr_cache.reset_ocr_cache()
+
+
+def _service(monkeypatch, content):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    service = ocr_module.ReceiptOCRService()
+    service.session = _Session(content)
+    return service
+
+
+def test_key_covers_image_model_and_prompt():
+    base = ocr_cache.ocr_cache_key(b"img", "model-a", "v1")
+    assert base == ocr_cache.ocr_cache_key(b"img", "model-a", "v1")
+    assert len({base,
+                ocr_cache.ocr_cache_key(b"img2", "model-a", "v1"),
+                ocr_cache.ocr_cache_key(b"img", "model-b", "v1"),
+                ocr_cache.ocr_cache_key(b"img", "model-a", "v2")}) == 4
+
+
+def test_repeat_extraction_is_served_from_cache(disk_cache, monkeypatch):
+    service = _service(monkeypatch, json.dumps({"provider": "Ola", "rideId": "CRN1", "amount": 120}))
+
+    first = service.process_receipt(b"receipt-bytes")
+    second = service.process_receipt(b"receipt-bytes")
+
+    assert service.session.calls == 1
+    assert first["cached"] is False and second["cached"] is True
+    assert second["data"] == first["data"] and second["provider"] == "Ola"
+
+    service.model = "another/model"
+    service.process_receipt(b"receipt-bytes")
+    assert service.session.calls == 2
+
+
+def test_failures_are_not_cached(disk_cache, monkeypatch):
+    service = _service(monkeypatch, "not json")
+    assert service.process_receipt(b"bad")["success"] is False
+    assert service.process_receipt(b"bad")["success"] is False
+    assert service.session.calls == 2
+
+
+def test_disk_cache_evicts_lru_and_expires(tmp_path):
+    cache = ocr_cache.DiskOCRCache(str(tmp_path), max_entries=2, ttl_seconds=3600)
+    cache.put("a", {"v": 1}, "m", "p")
+    cache.put("b", {"v": 2}, "m", "p")
+    assert cache.get("a") == {"v": 1}  # "b" is now least recently used
+    cache.put("c", {"v": 3}, "m", "p")
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1} and cache.get("c") == {"v": 3}
+
+    reopened = ocr_cache.DiskOCRCache(str(tmp_path), max_entries=2, ttl_seconds=3600)
+    assert reopened.get("c") == {"v": 3}
+
+    stale = ocr_cache.DiskOCRCache(str(tmp_path), max_entries=2, ttl_seconds=3600)
+    path = tmp_path / "a.json"
+    entry = json.loads(path.read_text())
+    entry["storedAt"] = time.time() - 7200
+    path.write_text(json.dumps(entry))
+    assert stale.get("a") is None
+    assert not path.exists()
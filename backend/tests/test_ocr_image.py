@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from backend.services import ocr_image
+
+
+def _photo(orientation=None):
+    """A white receipt on a dark, slightly noisy table, 3000x4000."""
+    rng = np.random.default_rng(1)
+    table = rng.integers(40, 70, size=(4000, 3000, 3), dtype=np.uint8)
+    image = Image.fromarray(table)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([900, 700, 2100, 3300], fill=(245, 245, 240))
+    for row in range(800, 3200, 70):
+        draw.rectangle([980, row, 980 + (row * 13) % 900 + 100, row + 30], fill=(20, 20, 20))
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buf, "JPEG", quality=92, exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def test_photo_is_cropped_downscaled_and_grayscale():
+    data = _photo()
+    result = ocr_image.compact_for_ocr(data)
+
+    assert result.compacted and result.cropped
+    assert result.mime_type == "image/jpeg"
+    assert len(result.data) < len(data) / 4
+    image = Image.open(io.BytesIO(result.data))
+    assert image.mode == "L"
+    assert max(image.size) <= 2000
+    # Receipt is 1200x2600 of a 3000x4000 frame; the crop keeps it plus a small margin.
+    assert 0.4 < image.size[0] / image.size[1] < 0.55
+
+
+def test_exif_rotation_is_applied(monkeypatch):
+    monkeypatch.setenv("OCR_IMAGE_FORMAT", "webp")
+    result = ocr_image.compact_for_ocr(_photo(orientation=6))
+    image = Image.open(io.BytesIO(result.data))
+    assert result.mime_type == "image/webp"
+    assert image.size[0] > image.size[1]  # portrait receipt turned landscape by the EXIF tag
+
+
+def test_small_or_undecodable_uploads_are_sent_as_is():
+    screenshot = Image.new("RGB", (300, 500), "white")
+    ImageDraw.Draw(screenshot).rectangle([0, 0, 300, 500], outline="black")
+    buf = io.BytesIO()
+    screenshot.save(buf, "PNG")
+    png = buf.getvalue()
+
+    result = ocr_image.compact_for_ocr(png)
+    assert not result.compacted and result.data == png and result.mime_type == "image/png"
+
+    garbage = ocr_image.compact_for_ocr(b"not an image")
+    assert garbage.data == b"not an image" and not garbage.compacted
+
+
+def test_profile_tracks_settings(monkeypatch):
+    before = ocr_image.compaction_profile()
+    monkeypatch.setenv("OCR_MAX_SIDE", "1200")
+    assert ocr_image.compaction_profile() != before
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from backend.services import payroll_analytics, salary_run_metrics
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    payroll_analytics.clear_snapshot_cache()
+    yield
+    payroll_analytics.clear_snapshot_cache()
+
+
+def _payslip(user, month, net, status="PAID", year=2025):
+    return {"userId": user, "userName": user.upper(), "period": {"year": year, "month": month}, "status": status,
+            "grossAmount": net + 100, "totalDeductions": 50, "totalTax": 50, "netPay": net}
+
+
+def _seed(db, payslips):
+    by_run = {}
+    for i, payslip in enumerate(payslips):
+        run_id = payroll_analytics.run_id_for(payslip["period"]["year"], payslip["period"]["month"])
+        payslip["runId"] = run_id
+        db.docs[("organizations", "org-1", "payslips", f"p{i}")] = payslip
+        by_run.setdefault(run_id, []).append(payslip)
+    for run_id, run_payslips in by_run.items():
+        db.docs[("organizations", "org-1", "salaryRuns", run_id)] = {
+            "status": "PAID", "updatedAt": "t0", **salary_run_metrics.summarize(run_payslips)
+        }
+
+
+def test_period_window_crosses_year_boundaries():
+    assert payroll_analytics.period_window(2025, 2, 4) == [(2024, 11), (2024, 12), (2025, 1), (2025, 2)]
+
+
+def test_trends_and_summaries_read_only_run_documents(fake_db):
+    db = fake_db
+    _seed(db, [_payslip("a", 1, 1000), _payslip("b", 1, 3000), _payslip("a", 2, 1000, status="PUBLISHED"),
+               _payslip("b", 2, 500, status="VOID"), _payslip("a", 12, 800, year=2024)])
+
+    trends = payroll_analytics.salary_trends(db, "org-1", payroll_analytics.period_window(2025, 3, 4))
+    annual = payroll_analytics.annual_summary(db, "org-1", 2025)
+    period = payroll_analytics.period_summary(db, "org-1", 2025, 2)
+
+    assert db.queries == []
+    assert [(t["month"], t["totalPayout"], t["employeeCount"]) for t in trends] == [(12, 800, 1), (1, 4000, 2), (2, 1000, 1), (3, 0, 0)]
+    assert trends[1]["averageSalary"] == 2000
+    assert [m["month"] for m in annual["monthlyBreakdown"]] == [1, 2]
+    assert annual["annualTotals"]["totalNet"] == 5000 and annual["annualTotals"]["countPaid"] == 2
+    assert period == {"totalGross": 1100, "totalDeductions": 50, "totalTax": 50, "totalNet": 1000,
+                      "countTotal": 1, "countPaid": 0, "countUnpaid": 1}
+
+
+def test_snapshot_group_bys_match_python_loops():
+    rng = np.random.default_rng(7)
+    payslips = [_payslip(f"u{rng.integers(40)}", int(rng.integers(1, 13)), float(rng.integers(500, 5000)),
+                         status=str(rng.choice(["PAID", "PUBLISHED", "VOID"])))
+                for _ in range(2000)]
+    snapshot = payroll_analytics.build_snapshot(2025, payslips)
+    live = [p for p in payslips if p["status"] != "VOID"]
+
+    totals = payroll_analytics.monthly_totals(snapshot)
+    for month in range(1, 13):
+        in_month = [p for p in live if p["period"]["month"] == month]
+        assert totals["net"][month] == pytest.approx(sum(p["netPay"] for p in in_month))
+        assert totals["paid"][month] == sum(p["status"] == "PAID" for p in in_month)
+
+    trends = {t["userId"]: t for t in payroll_analytics.employee_trends(snapshot)}
+    for user, trend in trends.items():
+        assert trend["totalNet"] == pytest.approx(sum(p["netPay"] for p in live if p["userId"] == user))
+
+    percentiles = payroll_analytics.net_percentiles(snapshot, (50,))
+    assert percentiles["p50"] == pytest.approx(np.median([p["netPay"] for p in live]))
+
+
+def test_year_snapshot_is_cached_until_a_run_changes(fake_db):
+    db = fake_db
+    _seed(db, [_payslip("a", 1, 1000), _payslip("b", 2, 2000)])
+
+    first = payroll_analytics.year_snapshot(db, "org-1", 2025)
+    again = payroll_analytics.year_snapshot(db, "org-1", 2025)
+    assert again is first and db.queries == ["payslips"]
+
+    db.docs[("organizations", "org-1", "salaryRuns", "run_2025_02")]["updatedAt"] = "t1"
+    rebuilt = payroll_analytics.year_snapshot(db, "org-1", 2025)
+    assert rebuilt is not first and db.queries == ["payslips", "payslips"]
@@ -0,0 +1,61 @@
+import pytest
+
+from backend.services import payslip_summaries
+
+
+@pytest.fixture(autouse=True)
+def _fake_firestore(monkeypatch, fake_firestore):
+    monkeypatch.setattr(payslip_summaries, "firestore", fake_firestore)
+
+
+def _payslip(status, month, net=1000, year=2025):
+    return {"userId": "u1", "status": status, "period": {"year": year, "month": month}, "number": f"PAY{month}",
+            "grossAmount": net + 200, "totalDeductions": 100, "totalTax": 100, "netPay": net, "currency": "INR"}
+
+
+def test_publishing_adds_item_and_ytd_and_voiding_removes_them(fake_firestore):
+    increment = fake_firestore.Increment
+    draft = _payslip("DRAFT", 3)
+    assert payslip_summaries.summary_update("p1", draft, {**draft, "status": "DRAFT"}) is None
+
+    published = payslip_summaries.summary_update("p1", draft, _payslip("PUBLISHED", 3))
+    assert published["items"]["p1"]["status"] == "PUBLISHED"
+    assert published["ytd"] == {"2025": {"gross": increment(1200), "deductions": increment(100), "tax": increment(100),
+                                         "net": increment(1000), "count": increment(1)}}
+
+    voided = payslip_summaries.summary_update("p1", _payslip("PAID", 3), _payslip("VOID", 3))
+    assert voided["items"]["p1"] is fake_firestore.DELETE_FIELD
+    assert voided["ytd"]["2025"]["net"] == increment(-1000)
+
+
+def test_read_summary_rebuilds_missing_document_then_reads_it_once(fake_db):
+    db = fake_db
+    for i, (status, month) in enumerate([("PAID", 1), ("PUBLISHED", 2), ("DRAFT", 3), ("PAID", 12)]):
+        db.docs[("organizations", "org-1", "payslips", f"p{i}")] = _payslip(status, month, year=2024 if month == 12 else 2025)
+
+    summary = payslip_summaries.read_summary(db, "org-1", "u1", year=2025)
+
+    assert [item["id"] for item in summary["payslips"]] == ["p1", "p0", "p3"]
+    assert summary["latest"]["id"] == "p1"
+    assert summary["ytd"] == {"year": 2025, "gross": 2400, "deductions": 200, "tax": 200, "net": 2000, "count": 2}
+
+    payslip_summaries.read_summary(db, "org-1", "u1", year=2025)
+    assert db.queries == ["payslips"]
+
+
+def test_summary_created_by_an_incremental_write_is_rebuilt_on_first_read(fake_db):
+    db = fake_db
+    db.docs[("organizations", "org-1", "payslips", "p0")] = _payslip("PAID", 1)
+    db.docs[("organizations", "org-1", "payslips", "p1")] = _payslip("PUBLISHED", 2)
+    # The first publish after deploy merges just the new payslip into a fresh document.
+    db.docs[("organizations", "org-1", "payslipSummaries", "u1")] = {
+        "userId": "u1", "items": {"p1": payslip_summaries.list_item("p1", _payslip("PUBLISHED", 2))},
+        "ytd": {"2025": {"gross": 1200, "deductions": 100, "tax": 100, "net": 1000, "count": 1}},
+    }
+
+    summary = payslip_summaries.read_summary(db, "org-1", "u1", year=2025)
+
+    assert [item["id"] for item in summary["payslips"]] == ["p1", "p0"]
+    assert summary["ytd"]["count"] == 2 and summary["ytd"]["net"] == 2000
+    payslip_summaries.read_summary(db, "org-1", "u1", year=2025)
+    assert db.queries == ["payslips"]
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timezone
+
+from backend.utils import pdf_cache
+from backend.utils.pdf_cache import PDFCache, pdf_cache_key
+
+
+INVOICE = {
+    "number": "INV-1",
+    "issueDate": datetime(2025, 3, 1, tzinfo=timezone.utc),
+    "dueDate": "2025-03-15T00:00:00+00:00",
+    "items": [{"desc": "Shoot", "qty": 1, "unitPrice": 1000.0, "taxRatePct": 18, "id": "x"}],
+    "totals": {"subTotal": 1000.0, "taxTotal": 180.0, "grandTotal": 1180.0},
+    "status": "SENT",
+    "updatedAt": datetime(2025, 3, 2, tzinfo=timezone.utc),
+}
+CLIENT = {"profile": {"name": "Asha", "email": "asha@example.com"}, "lastLogin": "2025-03-05"}
+ORG = {"name": "Studio", "plan": "pro"}
+
+
+def test_key_ignores_fields_the_pdf_does_not_show():
+    key = pdf_cache_key("invoice", INVOICE, CLIENT, ORG)
+
+    touched = {**INVOICE, "status": "PARTIAL", "updatedAt": datetime(2025, 4, 1, tzinfo=timezone.utc)}
+    assert pdf_cache_key("invoice", touched, {**CLIENT, "lastLogin": "x"}, {**ORG, "plan": "free"}) == key
+
+    assert pdf_cache_key("invoice", {**INVOICE, "notes": "Thanks"}, CLIENT, ORG) != key
+    assert pdf_cache_key("quote", INVOICE, CLIENT, ORG) != key
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = PDFCache(str(tmp_path), max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    assert cache.get("a") == b"1234"  # "b" is now least recently used
+
+    cache.put("c", b"9999")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234" and cache.get("c") == b"9999"
+    assert PDFCache(str(tmp_path), max_bytes=10).get("c") == b"9999"
+
+
+def test_render_pdf_serves_repeat_downloads_from_cache(tmp_path, monkeypatch):
+    renders = []
+
+    async def fake_render(kind, doc, client, org):
+        renders.append(doc["number"])
+        await asyncio.sleep(0.01)
+        return b"%PDF-" + doc["number"].encode()
+
+    monkeypatch.setattr(pdf_cache, "_cache", PDFCache(str(tmp_path), max_bytes=1024))
+    monkeypatch.setattr(pdf_cache, "_render", fake_render)
+
+    async def download_twice_concurrently_then_again():
+        first = await asyncio.gather(*(pdf_cache.render_invoice_pdf(INVOICE, CLIENT, ORG) for _ in range(3)))
+        return first + [await pdf_cache.render_invoice_pdf(INVOICE, CLIENT, ORG)]
+
+    results = asyncio.run(download_twice_concurrently_then_again())
+
+    assert results == [b"%PDF-INV-1"] * 4
+    assert renders == ["INV-1"]
+
+
+def test_worker_renders_projected_inputs():
+    doc, client, org = pdf_cache.render_inputs(INVOICE, CLIENT, ORG)
+    data = pdf_cache._render_in_worker("invoice", doc, client, org)
+    assert data.startswith(b"%PDF")
@@ -0,0 +1,79 @@
+import asyncio
+
+from backend.routers import period_close
+
+ORG = ("organizations", "org-1")
+
+
+def _seed(db):
+    invoices, bills, payslips, payments = (ORG + (name,) for name in ("invoices", "bills", "payslips", "payments"))
+    db.docs[invoices + ("i1",)] = {"status": "DRAFT", "issueDate": "2025-03-05T00:00:00+00:00"}
+    db.docs[invoices + ("i2",)] = {"status": "DRAFT", "issueDate": "2025-03-31T23:59:59+00:00"}
+    db.docs[invoices + ("i3",)] = {"status": "DRAFT", "issueDate": "2025-02-28T00:00:00+00:00"}
+    db.docs[invoices + ("i4",)] = {"status": "DRAFT"}
+    db.docs[invoices + ("i5",)] = {"status": "SENT", "issueDate": "2025-03-10T00:00:00+00:00"}
+    db.docs[bills + ("b1",)] = {"status": "DRAFT", "issueDate": "2025-04-01T00:00:00+00:00"}
+    db.docs[bills + ("b2",)] = {"status": "APPROVED", "issueDate": "2025-03-02T00:00:00+00:00"}
+    db.docs[payslips + ("p1",)] = {"status": "DRAFT", "period": {"year": 2025, "month": 3}}
+    db.docs[payslips + ("p2",)] = {"status": "PUBLISHED", "period": {"year": 2025, "month": 3}}
+    db.docs[payslips + ("p3",)] = {"status": "PAID", "period": {"year": 2025, "month": 3}}
+    db.docs[payslips + ("p4",)] = {"status": "PUBLISHED", "period": {"year": 2025, "month": 4}}
+    db.docs[payments + ("m1",)] = {"status": "UNAPPLIED", "paidAt": "2025-03-01T00:00:00+00:00"}
+    db.docs[payments + ("m2",)] = {"status": "UNAPPLIED", "paidAt": "2025-04-01T00:00:00+00:00"}
+    db.docs[payments + ("m3",)] = {"status": "APPLIED", "paidAt": "2025-03-15T00:00:00+00:00"}
+
+
+def _streamed_checks(db, year, month):
+    """The pre-close checks as they were computed before counts: stream each status and filter dates in Python."""
+    start_dt, end_dt = period_close.get_period_date_range(year, month)
+    start_iso, end_iso = start_dt.isoformat(), end_dt.isoformat()
+
+    def in_period(collection, status, field):
+        docs = db.collection(*ORG, collection).where("status", "==", status).get()
+        return sum(start_iso <= doc.to_dict().get(field, "") < end_iso for doc in docs)
+
+    unpaid = len(db.collection(*ORG, "payslips").where("period.year", "==", year).where(
+        "period.month", "==", month).where("status", "in", ["DRAFT", "PUBLISHED"]).get())
+    counts = [
+        ("draft_invoices", "Draft invoices in period", in_period("invoices", "DRAFT", "issueDate"),
+         "draft invoices found", "No draft invoices"),
+        ("draft_bills", "Draft bills in period", in_period("bills", "DRAFT", "issueDate"),
+         "draft bills found", "No draft bills"),
+        ("unpaid_payslips", "Unpaid payslips for period", unpaid, "unpaid payslips found", "All payslips paid"),
+        ("unapplied_payments", "Unapplied client receipts in period",
+         in_period("payments", "UNAPPLIED", "paidAt"), "unapplied payments found", "No unapplied payments"),
+    ]
+    return [
+        period_close.PeriodCheck(key=key, label=label, passed=count == 0,
+                                 details=f"{count} {found}" if count > 0 else passed, count=count)
+        for key, label, count, found, passed in counts
+    ]
+
+
+def test_count_checks_match_the_streamed_checks(fake_db):
+    _seed(fake_db)
+
+    for month in (2, 3, 4, 5):
+        fake_db.queries.clear()
+        checks = asyncio.run(period_close.run_period_checks(fake_db, "org-1", 2025, month))
+
+        assert fake_db.queries == []  # counted server-side; no documents are streamed
+        assert checks == _streamed_checks(fake_db, 2025, month)
+
+    march = {check.key: check for check in asyncio.run(period_close.run_period_checks(fake_db, "org-1", 2025, 3))}
+    assert [key for key, check in march.items() if not check.passed] == [
+        "draft_invoices", "unpaid_payslips", "unapplied_payments"]
+    assert march["draft_invoices"].details == "2 draft invoices found"
+    assert march["draft_bills"].passed and march["draft_bills"].details == "No draft bills"
+
+
+def test_failed_count_is_reported_as_a_failing_check():
+    class _Broken:
+        def count(self, alias=None):
+            raise RuntimeError("missing composite index")
+
+    check = period_close._run_count_check("draft_bills", "Draft bills in period", _Broken(),
+                                          "{count} draft bills found", "No draft bills")
+
+    assert not check.passed and check.count is None
+    assert check.details == "Error checking draft bills in period"
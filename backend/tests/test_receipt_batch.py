@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services import receipt_batch, receipt_index, receipt_verification
+
+
+# bytes -> (phash, dhash, OCR ride ID or None for an OCR failure)
+FILES = {
+    b"photo-a": ("00000000000000ff", "ff00000000000000", "CRN1"),
+    b"photo-a-recompressed": ("00000000000000fe", "ff00000000000001", "CRN1"),
+    b"photo-b": ("ffffffffffff0000", "0000ffffffffffff", "CRN1"),
+    b"photo-c": ("0f0f0f0f0f0f0f0f", "f0f0f0f0f0f0f0f0", "OLD9"),
+    b"photo-bad": ("3333333333333333", "cccccccccccccccc", None),
+    b"already-uploaded": ("5555555555555555", "aaaaaaaaaaaaaaaa", "NEW5"),
+}
+
+
+class _OCR:
+    def __init__(self):
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def process_receipt(self, image_bytes):
+        with self._lock:
+            self.calls.append(image_bytes)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        ride_id = FILES[image_bytes][2]
+        if ride_id is None:
+            return {"success": False, "error": "timeout", "data": {}}
+        return {"success": True, "data": {"provider": "Uber", "rideId": ride_id, "amount": 300, "date": "2025-11-25"}}
+
+
+class _RecordingQueue:
+    def __init__(self):
+        self.jobs = []
+
+    async def submit(self, job):
+        self.jobs.append(job)
+
+
+@pytest.fixture
+def env(monkeypatch, fake_db, fake_firestore):
+    db = fake_db
+    ocr = _OCR()
+
+    async def analyze(image_bytes, wait_seconds=None):
+        phash, dhash, _ = FILES[image_bytes]
+        return {"perceptual_hashes": {"phash": phash, "dhash": dhash},
+                "ela_analysis": {"manipulation_score": 5.0, "is_manipulated": False},
+                "timings_ms": {"total": 1.0}}
+
+    monkeypatch.setattr(receipt_index, "firestore", fake_firestore)
+    monkeypatch.setattr(receipt_batch.image_forensics, "analyze", analyze)
+    monkeypatch.setattr(receipt_batch, "ocr_service", ocr)
+    monkeypatch.setattr(receipt_verification, "store_image", lambda *args: None)
+    monkeypatch.setenv("RECEIPT_BATCH_OCR_CONCURRENCY", "2")
+
+    receipts = ("organizations", "org-1", "receipts")
+    db.docs[receipts + ("old-1",)] = {
+        "extractedData": {"rideId": "OLD9"}, "createdAt": "2025-11-01", "submittedByName": "Earlier",
+        "image_fingerprints": {"perceptual_hashes": {"phash": "9999999999999999"}},
+    }
+    db.docs[receipts + ("old-2",)] = {
+        "fileHash": hashlib.sha256(b"already-uploaded").hexdigest(), "status": "VERIFIED", "createdAt": "2025-11-02",
+    }
+    receipt_index.clear_cache()
+    yield SimpleNamespace(db=db, ocr=ocr)
+    receipt_index.clear_cache()
+
+
+def _run(db, names, queue):
+    files = [receipt_batch.BatchFile(index=i, filename=f"{i}.jpg", content_type="image/jpeg", data=data)
+             for i, data in enumerate(names)]
+    return asyncio.run(receipt_batch.verify_batch(
+        db, "org-1", files, event_id="ev-1", user_id="u1", user_name="Crew", team_members=[], queue=queue,
+    ))
+
+
+def test_batch_dedupes_shares_lookups_and_matches_sequential_verdicts(env):
+    queue = _RecordingQueue()
+    uploads = [b"photo-a", b"photo-a", b"photo-a-recompressed", b"photo-b", b"photo-c", b"already-uploaded",
+               b"photo-bad"]
+    result = _run(env.db, uploads, queue)
+    verdicts = result["results"]
+
+    assert [v["status"] for v in verdicts] == ["success", "duplicate", "duplicate", "success", "success",
+                                               "duplicate", "queued"]
+    assert verdicts[1]["duplicateOfFile"] == 0 and verdicts[2]["duplicateOfFile"] == 0
+    assert verdicts[5]["verification"]["duplicateOf"]["receipt_id"] == "old-2"
+    # photo-b reuses photo-a's ride ID: rejected as if it had been uploaded after it
+    assert verdicts[3]["verification"]["duplicateOf"]["receipt_id"] == verdicts[0]["receiptId"]
+    assert verdicts[3]["verification"]["decision"] != "AUTO_APPROVE"
+    assert verdicts[4]["verification"]["duplicateOf"]["receipt_id"] == "old-1"
+    assert verdicts[0]["verification"]["isDuplicate"] is False
+
+    # OCR only for distinct photos, never more than the configured concurrency
+    assert sorted(env.ocr.calls) == [b"photo-a", b"photo-b", b"photo-bad", b"photo-c"]
+    assert env.ocr.peak <= 2
+    # Besides the one-off index backfill, one SHA-256 query and one get_all for every file's
+    # duplicate candidates; the other two get_alls are add_receipt checking the owners of the
+    # reused ride IDs (CRN1, OLD9)
+    assert env.db.queries.count("receipts") == 2 and env.db.get_all_calls == 3
+
+    saved = env.db.docs[("organizations", "org-1", "receipts", verdicts[0]["receiptId"])]
+    assert saved["verificationState"] == "DONE" and saved["submittedByName"] == "Crew"
+    assert receipt_index.find_ride_id(env.db, "org-1", "crn1") == verdicts[0]["receiptId"]
+
+    queued = env.db.docs[("organizations", "org-1", "receipts", verdicts[6]["receiptId"])]
+    assert queued["verificationState"] == "QUEUED"
+    assert [job.receipt_id for job in queue.jobs] == [verdicts[6]["receiptId"]]
+    assert result["summary"] == {"success": 3, "duplicate": 3, "queued": 1}
+
+
+def test_oversized_batch_is_rejected(env, monkeypatch):
+    monkeypatch.setenv("RECEIPT_BATCH_MAX_FILES", "2")
+    with pytest.raises(receipt_batch.BatchTooLargeError):
+        _run(env.db, [b"photo-a", b"photo-b", b"photo-c"], _RecordingQueue())
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from backend.services import receipt_index
+from backend.services.advanced_verification_service import advanced_verification_service
+
+
+@pytest.fixture(autouse=True)
+def _fake_firestore(monkeypatch, fake_firestore):
+    monkeypatch.setattr(receipt_index, "firestore", fake_firestore)
+    receipt_index.clear_cache()
+    yield
+    receipt_index.clear_cache()
+
+
+def _receipt(db, receipt_id, phash, ride_id=None, created_at="2025-01-01"):
+    db.docs[("organizations", "org-1", "receipts", receipt_id)] = {
+        "extractedData": {"rideId": ride_id} if ride_id else {},
+        "image_fingerprints": {"perceptual_hashes": {"phash": phash}},
+        "submittedByName": "Member",
+        "createdAt": created_at,
+    }
+
+
+def test_bk_tree_matches_brute_force():
+    rng = random.Random(3)
+    values = [rng.getrandbits(64) for _ in range(3000)]
+    # Near-copies of a few hashes so there is something to find.
+    values += [v ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for v in values[:50]]
+    tree = receipt_index.BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+
+    for probe in values[:60]:
+        expected = sorted(i for i, v in enumerate(values) if receipt_index.hamming(probe, v) <= 11)
+        assert sorted(i for i, _ in tree.search(probe, 11)) == expected
+
+
+def test_legacy_org_is_backfilled_once_then_served_from_indexes(fake_db):
+    db = fake_db
+    _receipt(db, "old", "ffff0000ffff0000", ride_id=" RIDE-9 ", created_at="2024-01-01")
+    _receipt(db, "newer", "0f0f0f0f0f0f0f0f", ride_id="ride-9", created_at="2025-01-01")
+
+    assert receipt_index.find_ride_id(db, "org-1", "ride-9") is None  # not indexed yet
+    similar = receipt_index.find_similar(db, "org-1", "ffff0000ffff0001")
+    assert similar == [("old", 1)]
+    assert receipt_index.find_ride_id(db, "org-1", "Ride-9") == "old"
+
+    receipt_index.find_similar(db, "org-1", "ffff0000ffff0001")
+    assert db.queries.count("receipts") == 1
+
+
+def test_added_receipts_are_found_without_reloading_the_tree(fake_db):
+    db = fake_db
+    receipt_index.find_similar(db, "org-1", "00000000000000ff")  # empty org: creates the index
+
+    _receipt(db, "r1", "00000000000000ff", ride_id="abc")
+    receipt_index.add_receipt(db, "org-1", "r1", "abc", "00000000000000ff")
+    _receipt(db, "r2", "00000000000000fe", ride_id="abc")
+    receipt_index.add_receipt(db, "org-1", "r2", "ABC", "00000000000000fe")
+
+    db.reads.clear()
+    assert receipt_index.find_similar(db, "org-1", "00000000000000ff") == [("r1", 0), ("r2", 1)]
+    assert db.reads == [("organizations", "org-1", "receiptHashIndex", "meta")]
+    assert receipt_index.find_ride_id(db, "org-1", "abc") == "r1"
+
+
+def test_duplicate_detection_on_indexed_candidates(fake_db):
+    db = fake_db
+    _receipt(db, "r1", "00000000000000ff", ride_id="ride-1")
+    _receipt(db, "r2", "ffffffffffffff00")
+    receipt_index.backfill(db, "org-1")
+
+    candidates = [receipt_index.find_ride_id(db, "org-1", "RIDE-1")]
+    candidates += [rid for rid, _ in receipt_index.find_similar(db, "org-1", "00000000000000f0")]
+    existing = list(receipt_index.load_receipts(db, "org-1", filter(None, candidates)).values())
+
+    matches = advanced_verification_service.find_duplicate_receipts({"phash": "00000000000000f0"}, "ride-1", existing)
+    assert [(m["type"], m["receipt_id"]) for m in matches] == [("EXACT_ID_MATCH", "r1")]
+
+
+def test_search_radius_follows_the_template_threshold(monkeypatch, fake_db):
+    db = fake_db
+    _receipt(db, "r1", "0000000000000fff")
+    receipt_index.backfill(db, "org-1")
+
+    # Distance 12 is not a template match at the default threshold of 12 ...
+    assert receipt_index.find_similar(db, "org-1", "0000000000000000") == []
+    # ... but is once the threshold is raised, without touching the index
+    monkeypatch.setitem(advanced_verification_service.thresholds, "PHASH_TEMPLATE", 13)
+    assert receipt_index.find_similar(db, "org-1", "0000000000000000") == [("r1", 12)]
@@ -0,0 +1,120 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.services import background_jobs, receipt_rescore, receipt_stats
+from backend.services.advanced_verification_service import advanced_verification_service
+
+
+def test_bulk_scorer_matches_the_per_receipt_scorer():
+    cases = list(itertools.product([0, 70, 71, 95], [True, False], [True, False], [None, "r-first"]))
+    bulk = advanced_verification_service.calculate_risk_scores_bulk(
+        [c[0] for c in cases], [c[1] for c in cases], [c[2] for c in cases], [c[3] for c in cases]
+    )
+    for (ela, has_amount, has_ride, duplicate_of), result in zip(cases, bulk):
+        duplicates = [{"type": "EXACT_ID_MATCH", "receipt_id": duplicate_of}] if duplicate_of else []
+        expected = advanced_verification_service.calculate_comprehensive_risk_score(
+            {"ela_analysis": {"manipulation_score": ela}},
+            {"data": {"amount": 100 if has_amount else None, "rideId": "X" if has_ride else None}},
+            duplicates, None,
+        )
+        assert result == expected
+
+    stricter = advanced_verification_service.calculate_risk_scores_bulk([65], [True], [True], [None], {"ELA_HIGH": 60})
+    assert stricter[0]["decision"] == "MANUAL_REVIEW" and stricter[0]["risk_score"] == 40
+
+
+def _receipt(status, ela, ride_id, risk=0, issues=None, **extra):
+    return {"status": status, "riskScore": risk, "issues": issues or [], "eventId": "ev-1", "amountValue": 100.0,
+            "extractedData": {"amount": 100, "rideId": ride_id},
+            "image_fingerprints": {"ela_analysis": {"manipulation_score": ela}}, **extra}
+
+
+@pytest.fixture
+def db(monkeypatch, fake_db, fake_firestore):
+    monkeypatch.setattr(receipt_rescore, "firestore", fake_firestore)
+    monkeypatch.setattr(background_jobs, "firestore", fake_firestore)
+    transitions = []
+    monkeypatch.setattr(receipt_stats, "record_transition", lambda db, org, before, after: transitions.append(
+        (before["status"], after["status"])))
+    db = fake_db
+    db.transitions = transitions
+    receipts = ("organizations", "org-1", "receipts")
+    db.docs[receipts + ("r1",)] = _receipt("VERIFIED", 65, "A1", verificationState="DONE",
+                                           verificationResult={"verification": {"decision": "AUTO_APPROVE"}})
+    db.docs[receipts + ("r2",)] = _receipt("REJECT", 10, "A1", risk=100,
+                                           issues=["Duplicate Ride ID found (Receipt r1)"])
+    db.docs[receipts + ("r3",)] = _receipt("VERIFIED", 90, "B2", adminDecision={"decision": "APPROVED"})
+    db.docs[receipts + ("r4",)] = _receipt("PENDING", 90, None, verificationState="QUEUED")
+    db.docs[receipts + ("r5",)] = _receipt("VERIFIED", 50, "C3")
+    db.docs[receipts + ("r6",)] = _receipt("REJECT", 0, None, risk=100, duplicateOf={"type": "EXACT_FILE_MATCH"})
+    for ride_id, owner in (("a1", "r1"), ("b2", "r3"), ("c3", "r5")):
+        db.docs[("organizations", "org-1", "receiptRideIds", ride_id)] = {"rideId": ride_id, "receiptId": owner}
+    return db
+
+
+def test_job_checkpoints_resumes_and_reports_changed_decisions(db):
+    job = receipt_rescore.create_rescore_job(db, "org-1", {"ELA_HIGH": 60}, False, {"uid": "admin"})
+    db.fail_on_commit = 3  # claimed, then dies writing the second page
+
+    asyncio.run(receipt_rescore.run_rescore_job(db, "org-1", job["id"], page_size=2))
+    state = receipt_rescore.get_rescore_job(db, "org-1", job["id"])
+    assert state["status"] == "FAILED" and state["cursor"] == "r2" and state["processed"] == 2
+
+    db.fail_on_commit = None
+    runner_id = receipt_rescore.resume_rescore_job(db, "org-1", job["id"])
+    assert runner_id and receipt_rescore.resume_rescore_job(db, "org-1", job["id"]) is None
+    asyncio.run(receipt_rescore.run_rescore_job(db, "org-1", job["id"], runner_id=runner_id, page_size=2))
+    state = receipt_rescore.get_rescore_job(db, "org-1", job["id"])
+    assert state["status"] == "COMPLETED" and state["processed"] == 6 and state["skipped"] == 3
+    assert state["changed"] == 1 and state["transitions"] == {"VERIFIED->MANUAL_REVIEW": 1}
+
+    r1 = db.docs[("organizations", "org-1", "receipts", "r1")]
+    assert r1["status"] == "MANUAL_REVIEW" and r1["riskScore"] == 40 and r1["rescoreJobId"] == job["id"]
+    assert r1["verificationResult"]["verification"]["decision"] == "MANUAL_REVIEW"
+    # Human decisions and in-flight verifications are left alone
+    assert db.docs[("organizations", "org-1", "receipts", "r3")]["status"] == "VERIFIED"
+    assert db.transitions == [("VERIFIED", "MANUAL_REVIEW")]
+
+    rows = list(receipt_rescore.report_rows(db, "org-1", job["id"]))
+    assert rows == [["r1", "VERIFIED", "MANUAL_REVIEW", 0, 40, "",
+                     "High likelihood of digital manipulation (Photoshop)."]]
+
+
+def test_dry_run_reports_without_writing(db):
+    job = receipt_rescore.create_rescore_job(db, "org-1", {"REVIEW_SCORE": 100}, True, {"uid": "admin"})
+    asyncio.run(receipt_rescore.run_rescore_job(db, "org-1", job["id"]))
+
+    state = receipt_rescore.get_rescore_job(db, "org-1", job["id"])
+    assert state["status"] == "COMPLETED" and state["changed"] == 0
+    assert db.docs[("organizations", "org-1", "receipts", "r1")]["status"] == "VERIFIED"
+
+    strict = receipt_rescore.create_rescore_job(db, "org-1", {"ELA_HIGH": 40}, True, {"uid": "admin"})
+    asyncio.run(receipt_rescore.run_rescore_job(db, "org-1", strict["id"]))
+    assert receipt_rescore.get_rescore_job(db, "org-1", strict["id"])["changed"] == 2
+    assert db.docs[("organizations", "org-1", "receipts", "r5")]["status"] == "VERIFIED"
+    assert db.transitions == []
+
+    with pytest.raises(ValueError):
+        receipt_rescore.create_rescore_job(db, "org-1", {"PHASH_TEMPLATE": 8}, True, {"uid": "admin"})
+
+
+def test_superseded_runner_stops_without_applying_its_page(db):
+    job = receipt_rescore.create_rescore_job(db, "org-1", {"ELA_HIGH": 60}, False, {"uid": "admin"})
+    job_path = ("organizations", "org-1", "receiptRescoreJobs", job["id"])
+    db.docs[job_path].update({"status": "RUNNING", "runnerId": "slow-worker",
+                             "heartbeatAt": datetime.now(timezone.utc) - timedelta(minutes=5)})
+
+    # The slow worker's heartbeat looks stale, so the job is resumed under a new runner
+    runner_id = receipt_rescore.resume_rescore_job(db, "org-1", job["id"])
+    asyncio.run(receipt_rescore.run_rescore_job(db, "org-1", job["id"], runner_id="slow-worker"))
+
+    state = receipt_rescore.get_rescore_job(db, "org-1", job["id"])
+    assert state["status"] == "RUNNING" and state["runnerId"] == runner_id and state["processed"] == 0
+    assert db.docs[("organizations", "org-1", "receipts", "r1")]["status"] == "VERIFIED"
+
+    asyncio.run(receipt_rescore.run_rescore_job(db, "org-1", job["id"], runner_id=runner_id))
+    assert receipt_rescore.get_rescore_job(db, "org-1", job["id"])["status"] == "COMPLETED"
+    assert db.transitions == [("VERIFIED", "MANUAL_REVIEW")]
@@ -0,0 +1,62 @@
+from backend.schemas.receipt_schema import VerificationStatus
+from backend.services import receipt_stats
+
+
+def _apply(aggregates, deltas):
+    for scope, delta in deltas.items():
+        aggregate = aggregates.setdefault(scope, {"totalReceipts": 0, "totalAmount": 0.0, "statusCounts": {}})
+        aggregate["totalReceipts"] += delta["totalReceipts"]
+        aggregate["totalAmount"] += delta["totalAmount"]
+        for bucket, count in delta["statusCounts"].items():
+            aggregate["statusCounts"][bucket] = aggregate["statusCounts"].get(bucket, 0) + count
+    return aggregates
+
+
+def test_upload_verify_review_and_delete_net_to_zero():
+    pending = {"eventId": "ev-1", "status": "PENDING", "extractedData": {}}
+    verified = {**pending, "status": "VERIFIED", "extractedData": {"amount": "$1,250.50"},
+                "amountValue": receipt_stats.normalize_amount("$1,250.50")}
+    rejected = {**verified, "status": VerificationStatus.REJECTED}
+
+    aggregates = _apply({}, receipt_stats.transition_delta(None, pending))
+    assert aggregates[""]["totalReceipts"] == 1 and aggregates["ev-1"]["statusCounts"] == {"pending": 1}
+
+    _apply(aggregates, receipt_stats.transition_delta(pending, verified))
+    assert aggregates[""]["totalReceipts"] == 1
+    assert aggregates[""]["totalAmount"] == 1250.5
+    assert aggregates["ev-1"]["statusCounts"] == {"pending": 0, "verified": 1}
+
+    _apply(aggregates, receipt_stats.transition_delta(verified, rejected))
+    assert aggregates[""]["statusCounts"]["rejected"] == 1 and aggregates[""]["statusCounts"]["verified"] == 0
+
+    _apply(aggregates, receipt_stats.transition_delta(rejected, None))
+    for scope in ("", "ev-1"):
+        assert aggregates[scope]["totalReceipts"] == 0 and abs(aggregates[scope]["totalAmount"]) < 0.005
+        assert not any(aggregates[scope]["statusCounts"].values())
+
+
+def test_unchanged_counters_produce_no_writes():
+    doc = {"eventId": "ev-1", "status": "MEDIUM_RISK", "amountValue": 40.0}
+    assert receipt_stats.transition_delta(doc, {**doc, "verificationNotes": "checked"}) == {}
+    assert receipt_stats.status_bucket("MEDIUM_RISK") == "needs_review"
+    assert receipt_stats.normalize_amount("n/a") == 0.0
+
+
+def test_first_summary_rebuilds_counters_and_backfills_created_at(monkeypatch, fake_db, fake_firestore):
+    monkeypatch.setattr(receipt_stats, "firestore", fake_firestore)
+    db = fake_db
+    receipts = ("organizations", "org-1", "receipts")
+    db.docs[receipts + ("r1",)] = {"eventId": "ev-1", "status": "AUTO_APPROVED", "upload_timestamp": "2025-01-01",
+                                   "extractedData": {"amount": "1,000"}}
+    db.docs[receipts + ("r2",)] = {"eventId": "ev-2", "status": "FLAGGED", "createdAt": "2025-01-02",
+                                   "amountValue": 250.25}
+    db.docs[receipts + ("r3",)] = {"status": "REJECTED", "createdAt": "2025-01-03", "extractedData": {}}
+    # Increments from a write before the first read must not stop the backfill.
+    db.docs[("organizations", "org-1", "aggregates", "receipts")] = {"totalReceipts": 1, "totalAmount": 5.0}
+
+    summary = receipt_stats.get_summary(db, "org-1")
+    assert summary == {"totalReceipts": 3, "totalAmount": 1250.25,
+                       "statusCounts": {"pending": 0, "verified": 1, "rejected": 1, "needs_review": 1}}
+    assert receipt_stats.get_summary(db, "org-1", "ev-2")["statusCounts"]["needs_review"] == 1
+    assert db.docs[receipts + ("r1",)]["createdAt"] == "2025-01-01"
+    assert receipt_stats.rebuild(db, "org-1")["drift"] == 0
@@ -0,0 +1,240 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services import receipt_index, receipt_verification
+
+
+class _FlakyOCR:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def process_receipt(self, image_bytes):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return {"success": False, "error": "timeout", "data": {"rideId": None, "amount": None}}
+        return {"success": True, "provider": "Ola", "data": {"provider": "Ola", "rideId": "CRN77", "amount": 240,
+                                                             "date": "2025-11-25", "time": "14:30"}}
+
+
+@pytest.fixture
+def env(monkeypatch, fake_db, fake_firestore):
+    db = fake_db
+    ocr = _FlakyOCR()
+
+    async def analyze(image_bytes, wait_seconds=None):
+        return {"perceptual_hashes": {"phash": "00000000000000ff", "dhash": "ff00000000000000"},
+                "ela_analysis": {"manipulation_score": 5.0, "is_manipulated": False},
+                "timings_ms": {"total": 1.0}}
+
+    monkeypatch.setattr(receipt_index, "firestore", fake_firestore)
+    monkeypatch.setattr(receipt_verification.image_forensics, "analyze", analyze)
+    monkeypatch.setattr(receipt_verification, "ocr_service", ocr)
+    receipt_index.clear_cache()
+    yield SimpleNamespace(db=db, ocr=ocr)
+    receipt_index.clear_cache()
+
+
+def _accept(db, receipt_id="r1"):
+    ref = db.collection("organizations", "org-1", "receipts").document(receipt_id)
+    ref.set(receipt_verification.pending_receipt(
+        receipt_id, event_id="ev-1", file_hash="abc", user_id="u1", user_name="Member",
+        filename="ride.jpg", file_size=3, team_members=[], image_path=None,
+    ))
+    return receipt_verification.VerificationJob(org_id="org-1", receipt_id=receipt_id, image_bytes=b"img")
+
+
+def _queue(db, cls=receipt_verification.VerificationQueue, **options):
+    async def runner(job):
+        return await receipt_verification.verify_receipt(db, job)
+
+    async def on_failure(job, error):
+        await receipt_verification.mark_failed(db, job, error)
+
+    return cls(runner, on_failure, base_delay=0, **options)
+
+
+def _doc(db, receipt_id="r1"):
+    return db.docs[("organizations", "org-1", "receipts", receipt_id)]
+
+
+def test_inline_queue_verifies_and_status_returns_the_upload_payload(env):
+    async def scenario():
+        queue = _queue(env.db, receipt_verification.InlineVerificationQueue)
+        job = _accept(env.db)
+        pending = await receipt_verification.wait_for_status(env.db, "org-1", "r1", 0, queue)
+        await queue.submit(job)
+        return pending, await receipt_verification.wait_for_status(env.db, "org-1", "r1", 0, queue)
+
+    pending, view = asyncio.run(scenario())
+    assert pending["state"] == "QUEUED" and pending["status"] == "PENDING"
+    doc = _doc(env.db)
+    assert doc["verificationState"] == "DONE" and doc["verificationAttempts"] == 1
+    assert doc["extractedData"]["rideId"] == "CRN77" and doc["submittedByName"] == "Member"
+    assert view["state"] == "DONE"
+    assert view["verification"]["extractedData"]["timestamp"] == "2025-11-25 14:30"
+    assert view["verification"]["isDuplicate"] is False
+    assert receipt_index.find_ride_id(env.db, "org-1", "crn77") == "r1"
+
+
+def test_worker_pool_retries_transient_failures(env):
+    env.ocr.failures = 2
+
+    async def scenario():
+        queue = _queue(env.db, workers=2)
+        await queue.submit(_accept(env.db))
+        assert await queue.drain(timeout=5)
+        queue.close()
+        return queue.stats
+
+    stats = asyncio.run(scenario())
+    assert stats["retried"] == 2 and stats["done"] == 1
+    assert _doc(env.db)["verificationState"] == "DONE" and _doc(env.db)["verificationAttempts"] == 3
+
+
+def test_exhausted_job_is_left_pending_for_review(env):
+    env.ocr.failures = 10
+
+    async def scenario():
+        queue = _queue(env.db, receipt_verification.InlineVerificationQueue, max_attempts=2)
+        await queue.submit(_accept(env.db))
+        return queue.stats
+
+    stats = asyncio.run(scenario())
+    doc = _doc(env.db)
+    assert stats["failed"] == 1 and env.ocr.calls == 2
+    assert doc["status"] == "PENDING" and doc["verificationState"] == "FAILED"
+    assert "OCR Failed" in doc["verificationError"]
+    assert receipt_verification.status_view("r1", doc)["error"] == doc["verificationError"]
+
+
+def test_backlog_is_bounded_and_long_poll_wakes_on_completion(env):
+    release = None
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+
+        async def slow_runner(job):
+            await release.wait()
+            await receipt_verification.verify_receipt(env.db, job)
+
+        async def on_failure(job, error):
+            pass
+
+        queue = receipt_verification.VerificationQueue(slow_runner, on_failure, workers=1, max_pending=1, base_delay=0)
+        await queue.submit(_accept(env.db, "r1"))
+        with pytest.raises(receipt_verification.QueueFullError):
+            await queue.submit(_accept(env.db, "r2"))
+
+        waiter = asyncio.create_task(receipt_verification.wait_for_status(env.db, "org-1", "r1", 5, queue))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        release.set()
+        view = await asyncio.wait_for(waiter, 2)
+        queue.close()
+        return view
+
+    assert asyncio.run(scenario())["state"] == "DONE"
+
+
+def test_only_one_of_two_queued_jobs_for_a_receipt_runs(env):
+    async def scenario():
+        queue = _queue(env.db, receipt_verification.InlineVerificationQueue)
+        local = _accept(env.db)
+        # Another instance's recovery sweep re-queued the receipt while it waited in our backlog
+        recovered = receipt_verification.VerificationJob(org_id="org-1", receipt_id="r1", image_bytes=b"img")
+        await queue.submit(recovered)
+        await queue.submit(local)
+        return queue.stats
+
+    stats = asyncio.run(scenario())
+    assert env.ocr.calls == 1 and stats["done"] == 2
+    assert _doc(env.db)["verificationState"] == "DONE"
+
+
+def test_losing_the_claim_race_skips_verification(env, monkeypatch):
+    job = _accept(env.db)
+    ref = env.db.collection("organizations", "org-1", "receipts").document("r1")
+
+    def get_then_lose():
+        snapshot = ref.get()
+        # A second instance claims the receipt between our read and our claim
+        ref.update({"verificationState": "PROCESSING", "verificationClaim": "other"})
+        return snapshot
+
+    racing = SimpleNamespace(get=get_then_lose, update=ref.update)
+    monkeypatch.setattr(receipt_verification, "_receipt_ref", lambda db, org_id, receipt_id: racing)
+
+    assert asyncio.run(receipt_verification.verify_receipt(env.db, job)) is None
+    assert env.ocr.calls == 0 and _doc(env.db)["verificationClaim"] == "other"
+
+
+class _StaleReceipts:
+    """collection_group('receipts') returning receipts whose verification is past STALE_AFTER_SECONDS."""
+
+    def __init__(self, receipt_ids):
+        self.claimed = []
+        self._snapshots = [self._snapshot(receipt_id) for receipt_id in receipt_ids]
+
+    def _snapshot(self, receipt_id):
+        org = SimpleNamespace(id="org-1")
+        reference = SimpleNamespace(parent=SimpleNamespace(parent=org),
+                                    update=lambda data, option=None: self.claimed.append(receipt_id))
+        return SimpleNamespace(id=receipt_id, reference=reference, update_time="t0",
+                               to_dict=lambda: {"verificationState": "PROCESSING", "imagePath": f"{receipt_id}.jpg"})
+
+    def collection_group(self, name):
+        return self
+
+    def where(self, *args):
+        return self
+
+    def stream(self):
+        return iter(self._snapshots)
+
+    def write_option(self, **kwargs):
+        return kwargs
+
+
+def test_recovery_sweep_skips_local_jobs_stops_at_capacity_and_repeats(monkeypatch):
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def blocked(job):
+            await gate.wait()
+
+        async def on_failure(job, error):
+            pass
+
+        queue = receipt_verification.VerificationQueue(blocked, on_failure, workers=1, max_pending=2, base_delay=0)
+        await queue.submit(receipt_verification.VerificationJob(org_id="org-1", receipt_id="r1"))
+        receipt_verification.set_queue(queue)
+        db = _StaleReceipts(["r1", "r2", "r3"])
+        recovered = await receipt_verification.recover_stale_jobs(db)
+        gate.set()
+        await queue.drain(1)
+        receipt_verification.shutdown()
+        return recovered, db.claimed
+
+    recovered, claimed = asyncio.run(scenario())
+    # r1 is still in this queue; r3 stays claimed as QUEUED for the next sweep once the queue is full
+    assert claimed == ["r2", "r3"] and recovered == 1
+
+    sweeps = []
+
+    async def sweep(db=None):
+        sweeps.append(db)
+        return 0
+
+    async def periodic():
+        receipt_verification.start_recovery()
+        await asyncio.sleep(0.05)
+        receipt_verification.shutdown()
+
+    monkeypatch.setattr(receipt_verification, "recover_stale_jobs", sweep)
+    monkeypatch.setenv("RECEIPT_VERIFY_RECOVERY_INTERVAL", "0.01")
+    asyncio.run(periodic())
+    assert len(sweeps) >= 2
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from backend.services import reminder_pipeline
+
+
+NOW = datetime(2025, 3, 20, 9, 30, tzinfo=timezone.utc)
+
+
+def _invoice(amount_due=500.0, client_id="client-1", **extra):
+    return {"clientId": client_id, "totals": {"amountDue": amount_due}, "dueDate": "2025-03-10T00:00:00+00:00", **extra}
+
+
+class _FlakySender:
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def deliver(self, message):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return message
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_select_candidates_skips_paid_reminded_and_duplicates():
+    rows = [
+        ("overdue_1", "inv-1", _invoice()),
+        ("overdue_7", "inv-1", _invoice()),
+        ("overdue_1", "inv-2", _invoice(amount_due=0)),
+        ("overdue_1", "inv-3", _invoice(lastReminderAt=datetime(2025, 3, 20, 1, 0, tzinfo=timezone.utc))),
+        ("due_soon", "inv-4", _invoice(lastReminderAt="2025-03-19T23:00:00+00:00")),
+        ("due_soon", "inv-5", _invoice(client_id=None)),
+    ]
+
+    tasks = reminder_pipeline.select_candidates(rows, NOW)
+
+    assert [(t.invoice_id, t.reminder_type) for t in tasks] == [("inv-1", "overdue_1"), ("inv-4", "due_soon")]
+
+
+def test_deliver_retries_transient_errors_only():
+    limiter = reminder_pipeline.RateLimiter(rate_per_second=0)
+
+    sender = _FlakySender([_HTTPError(503), _HTTPError(429)])
+    attempts, error = asyncio.run(reminder_pipeline.deliver_with_retry(sender, "msg", limiter, base_delay=0))
+    assert (attempts, error) == (3, None)
+
+    sender = _FlakySender([_HTTPError(400)])
+    attempts, error = asyncio.run(reminder_pipeline.deliver_with_retry(sender, "msg", limiter, base_delay=0))
+    assert attempts == 1 and error == "HTTP 400"
+    assert sender.calls == 1
+
+    sender = _FlakySender([ConnectionResetError("reset"), TimeoutError("timed out")])
+    attempts, error = asyncio.run(reminder_pipeline.deliver_with_retry(sender, "msg", limiter, base_delay=0))
+    assert (attempts, error) == (3, None)
+
+    # A missing transport will not fix itself; it is not retried
+    sender = _FlakySender([RuntimeError("Email transport not configured")])
+    attempts, error = asyncio.run(reminder_pipeline.deliver_with_retry(sender, "msg", limiter, base_delay=0))
+    assert attempts == 1 and sender.calls == 1
+
+
+def test_rate_limiter_spaces_concurrent_callers():
+    limiter = reminder_pipeline.RateLimiter(rate_per_second=50)
+
+    async def burst():
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+        return time.monotonic() - start
+
+    # Six acquisitions at 50/s need at least five 20ms gaps.
+    assert asyncio.run(burst()) >= 0.09
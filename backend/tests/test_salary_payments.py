@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services import payslip_summaries, salary_payments, salary_run_metrics
+
+
+@pytest.fixture
+def db(monkeypatch, fake_db, fake_firestore):
+    monkeypatch.setattr(salary_payments, "firestore", fake_firestore)
+    monkeypatch.setattr(payslip_summaries, "firestore", fake_firestore)
+    monkeypatch.setattr(salary_run_metrics, "firestore", fake_firestore)
+    return fake_db
+
+
+RUN = ("organizations", "org-1", "salaryRuns", "run_2025_03")
+PAYMENT = SimpleNamespace(method="BANK", reference="NEFT-1", paidAt="2025-03-31T00:00:00Z", remarks=None, idempotencyKey="key-1")
+
+
+def _seed(db, count, status="PUBLISHED"):
+    payslips = []
+    for i in range(count):
+        payslip = {"runId": "run_2025_03", "userId": f"u{i}", "status": status, "grossAmount": 1200,
+                   "totalDeductions": 100, "totalTax": 100, "netPay": 1000}
+        db.docs[("organizations", "org-1", "payslips", f"p{i}")] = payslip
+        payslips.append(payslip)
+    db.docs[RUN] = {"status": "PUBLISHED", **salary_run_metrics.summarize(payslips)}
+
+
+def _run(db, **kwargs):
+    return asyncio.run(salary_payments.pay_payslips(db, "org-1", PAYMENT, "admin", **kwargs))
+
+
+def test_plan_chunks_respects_write_limit_including_run_increments():
+    pairs = [(f"p{i}", f"run{i % 3}") for i in range(10)]
+    chunks = salary_payments.plan_chunks(pairs, write_limit=12)
+    # Three payslips (9 writes) plus up to three run increments per chunk.
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    assert [pid for chunk in chunks for pid in chunk] == [pid for pid, _ in pairs]
+
+
+def test_paying_a_run_uses_a_handful_of_commits(db):
+    _seed(db, 600)
+
+    result = _run(db, run_id="run_2025_03")
+
+    assert len(result.processed) == 600 and result.commits == 4
+    assert sorted(db.commit_sizes) == [307, 499, 499, 499]
+    payments = [p for p in db.docs if p[:3] == ("organizations", "org-1", "salaryPayments")]
+    assert len(payments) == 600
+    run = db.docs[RUN]
+    assert run["counts"]["paid"] == 600 and run["counts"]["published"] == 0
+    assert run["summary"]["countPaid"] == 600 and run["totals"]["net"] == 600000
+    assert salary_run_metrics.verify_run_metrics(db, "org-1", "run_2025_03")["consistent"]
+
+
+def test_retry_with_same_idempotency_key_writes_nothing(db):
+    _seed(db, 5)
+    _run(db, payslip_ids=["p0", "p1", "p2"])
+    db.commit_sizes.clear()
+
+    retry = _run(db, payslip_ids=["p0", "p1", "p2", "p3", "missing"])
+
+    assert retry.already_processed == ["p0", "p1", "p2"]
+    assert retry.processed == ["p3"]
+    assert retry.skipped == [{"id": "missing", "reason": "Payslip not found"}]
+    assert db.docs[RUN]["counts"]["paid"] == 4
+    assert db.commit_sizes == [4]
+    summary = db.docs[("organizations", "org-1", "payslipSummaries", "u3")]
+    assert summary["items"]["p3"]["status"] == "PAID" and "ytd" not in summary
+
+
+def test_other_statuses_are_skipped(db):
+    _seed(db, 2, status="DRAFT")
+    result = _run(db, payslip_ids=["p0", "p1"])
+    assert result.processed == [] and result.commits == 0
+    assert {s["reason"] for s in result.skipped} == {"Not in PUBLISHED status"}
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from backend.services import salary_run_generation
+
+
+def _payslips(db):
+    return [d for p, d in db.docs.items() if p[:3] == ("organizations", "org-1", "payslips")]
+
+
+def _seed(db, count):
+    for i in range(count):
+        uid = f"uid-{i}"
+        db.docs[("organizations", "org-1", "team", uid)] = {"name": f"Member {i}", "availability": True}
+        if i % 10:
+            db.docs[("organizations", "org-1", "salaryProfiles", uid)] = {
+                "baseSalary": 1000,
+                "allowances": [{"key": "hra", "label": "HRA", "amount": 200}],
+                "deductions": [{"key": "pf", "label": "PF", "amount": 100}],
+                "tax": {"mode": "PERCENT", "value": 10},
+            }
+
+
+def test_build_payslips_computes_lines_and_run_totals():
+    members = [
+        ("a", {"name": "A"}),
+        ("b", {"name": "B", "exitDate": "2025-01-15T00:00:00Z"}),
+        ("c", {"name": "C"}),
+    ]
+    profiles = {
+        "a": {"baseSalary": 1000, "allowances": [{"amount": 500}], "deductions": [{"amount": 100}],
+              "tax": {"mode": "PERCENT", "value": 10}},
+        "b": {"baseSalary": 999},
+    }
+
+    draft = salary_run_generation.build_payslips("org-1", "run_2025_03", 2025, 3, members, profiles, "admin", "now")
+
+    [payslip] = draft.payslips
+    assert (payslip["grossAmount"], payslip["totalDeductions"], payslip["totalTax"], payslip["netPay"]) == (1500, 100, 140, 1260)
+    assert (draft.skipped_exited, draft.skipped_no_profile) == (1, 1)
+    assert draft.totals() == {"gross": 1500, "deductions": 100, "tax": 140, "net": 1260}
+
+
+def test_generate_run_reads_profiles_in_chunks_and_writes_in_batches(fake_db):
+    db = fake_db
+    _seed(db, 1000)
+
+    started = time.perf_counter()
+    result = asyncio.run(salary_run_generation.generate_run_payslips(db, "org-1", "run_2025_03", 2025, 3, "admin"))
+    elapsed = time.perf_counter() - started
+
+    assert result["written"] == 900
+    assert db.get_all_calls == 4
+    assert sorted(db.commit_sizes) == [400, 500]
+    payslips = _payslips(db)
+    assert len(payslips) == 900 and all(p["id"] for p in payslips)
+    assert result["draft"].totals()["net"] == 900 * 990
+    assert elapsed < 5
+
+
+def test_dry_run_writes_nothing(fake_db):
+    db = fake_db
+    _seed(db, 20)
+
+    result = asyncio.run(salary_run_generation.generate_run_payslips(db, "org-1", "run_2025_03", 2025, 3, "admin", dry_run=True))
+
+    assert result["written"] == 0
+    assert len(result["draft"].payslips) == 18
+    assert db.commit_sizes == [] and _payslips(db) == []
@@ -0,0 +1,97 @@
+import pytest
+
+from backend.services import salary_run_metrics
+
+
+@pytest.fixture
+def db(monkeypatch, fake_db, fake_firestore):
+    monkeypatch.setattr(salary_run_metrics, "firestore", fake_firestore)
+    return fake_db
+
+
+RUN = ("organizations", "org-1", "salaryRuns", "run_2025_03")
+
+
+def _payslip(status, net=1000.0):
+    return {"runId": "run_2025_03", "status": status, "grossAmount": net + 200, "totalDeductions": 100,
+            "totalTax": 100, "netPay": net}
+
+
+def _seed(db, statuses):
+    payslips = {}
+    for i, status in enumerate(statuses):
+        payslips[f"p{i}"] = _payslip(status)
+        db.docs[("organizations", "org-1", "payslips", f"p{i}")] = payslips[f"p{i}"]
+    db.docs[RUN] = {"status": "PUBLISHED", **salary_run_metrics.summarize(payslips.values())}
+
+
+def test_contribution_delta_moves_payslip_between_buckets():
+    delta = salary_run_metrics.metrics_delta(_payslip("PUBLISHED"), _payslip("PAID"))
+    assert delta == {"counts.published": -1, "counts.paid": 1, "summary.countPaid": 1, "summary.countUnpaid": -1}
+
+    voided = salary_run_metrics.metrics_delta(_payslip("DRAFT"), _payslip("VOID"))
+    assert voided["counts.total"] == -1 and voided["totals.net"] == -1000
+    assert "summary.countTotal" not in voided
+
+
+def test_paying_payslips_increments_run_without_rereading_the_run(db):
+    _seed(db, ["PUBLISHED"] * 50)
+    db.reads.clear()
+
+    for i in range(50):
+        salary_run_metrics.update_payslip_with_metrics(db, "org-1", f"p{i}", lambda current: {"status": "PAID"})
+
+    # One read per payslip transaction; the run's payslips are never re-scanned.
+    assert db.reads == [("organizations", "org-1", "payslips", f"p{i}") for i in range(50)]
+    run = db.docs[RUN]
+    assert run["counts"] == {"drafted": 0, "published": 0, "paid": 50, "total": 50}
+    assert run["summary"]["countPaid"] == 50 and run["summary"]["countUnpaid"] == 0
+    assert salary_run_metrics.verify_run_metrics(db, "org-1", "run_2025_03")["consistent"]
+
+
+def test_noop_update_writes_nothing(db):
+    _seed(db, ["PAID"])
+    before, after = salary_run_metrics.update_payslip_with_metrics(db, "org-1", "p0", lambda current: None)
+    assert before["status"] == "PAID" and after is None
+    assert salary_run_metrics.update_payslip_with_metrics(db, "org-1", "missing", lambda current: {}) == (None, None)
+
+
+def test_verify_reports_and_repairs_drift(db):
+    _seed(db, ["PUBLISHED", "PAID", "VOID"])
+    db.docs[RUN]["totals"]["net"] = 5.0
+    db.docs[RUN]["counts"]["paid"] = 7
+
+    report = salary_run_metrics.verify_run_metrics(db, "org-1", "run_2025_03")
+    assert not report["consistent"] and not report["repaired"]
+    assert report["drift"]["totals.net"] == {"stored": 5.0, "actual": 2000.0, "diff": 1995.0}
+    assert report["drift"]["counts.paid"]["actual"] == 1
+
+    repaired = salary_run_metrics.verify_run_metrics(db, "org-1", "run_2025_03", repair=True)
+    assert repaired["repaired"]
+    assert salary_run_metrics.verify_run_metrics(db, "org-1", "run_2025_03")["consistent"]
+
+
+def test_ensure_run_metrics_backfills_legacy_runs(db):
+    _seed(db, ["DRAFT", "DRAFT"])
+    db.docs[RUN] = {"status": "DRAFT", "counts": {"drafted": 2, "published": 0, "paid": 0}}
+
+    salary_run_metrics.ensure_run_metrics(db, "org-1", "run_2025_03")
+
+    assert salary_run_metrics.has_metrics(db.docs[RUN])
+    assert db.docs[RUN]["summary"]["countTotal"] == 2
+
+
+def test_ensure_run_metrics_recomputes_runs_from_an_older_version(db):
+    _seed(db, ["PUBLISHED", "VOID"])
+    # Summarised before voided payslips stopped carrying money
+    stale = salary_run_metrics.summarize([])
+    stale.pop("metricsVersion")
+    stale["totals"]["net"] = 2000.0
+    db.docs[RUN] = {"status": "PUBLISHED", **stale}
+    assert not salary_run_metrics.has_metrics(db.docs[RUN])
+
+    salary_run_metrics.ensure_run_metrics(db, "org-1", "run_2025_03")
+
+    assert db.docs[RUN]["metricsVersion"] == salary_run_metrics.METRICS_VERSION
+    assert db.docs[RUN]["totals"]["net"] == 1000.0
+    assert salary_run_metrics.verify_run_metrics(db, "org-1", "run_2025_03")["consistent"]
@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+from backend.services import sequence_allocator
+
+
+@pytest.fixture
+def db(monkeypatch, fake_db, fake_firestore):
+    monkeypatch.setattr(sequence_allocator, "firestore", fake_firestore)
+    monkeypatch.setattr(sequence_allocator, "_allocator", sequence_allocator.SequenceAllocator(lease_size=5))
+    return fake_db
+
+
+def _counter(db, doc_type="INVOICE", year=2025):
+    return db.docs[("organizations", "org-1", "numberSequences", f"{doc_type}_{year}")]
+
+
+def _leases(db, doc_type="INVOICE", year=2025):
+    prefix = ("organizations", "org-1", "numberSequences", f"{doc_type}_{year}", "leases")
+    return [d for p, d in db.docs.items() if p[:-1] == prefix]
+
+
+def test_numbers_come_from_one_leased_block(db):
+    numbers = [sequence_allocator.next_number(db, "org-1", "INVOICE", 2025) for _ in range(7)]
+
+    assert numbers == [f"INV-2025-{n:04d}" for n in range(1, 8)]
+    # Seven numbers with a lease size of five cost two leases and closing the used-up one, not seven transactions.
+    assert db.transactions == 3
+    assert _counter(db)["next"] == 11
+    assert sorted((l["start"], l["end"]) for l in _leases(db)) == [(1, 6), (6, 11)]
+
+    report = sequence_allocator.lease_report(db, "org-1", "INVOICE", 2025)
+    assert [l["start"] for l in report["unreleasedLeases"]] == [6]
+    assert report["unusedNumbers"] == []
+    assert report["leases"][0]["releasedAt"] is not None and report["leases"][0]["unused"] == []
+
+
+def test_new_counter_is_seeded_from_legacy_counters(db):
+    db.docs[("organizations", "org-1", "numberSequences", "INV_2025")] = {"next": 12}
+    db.docs[("organizations", "org-1", "sequences", "invoice_2025")] = {"next": 40}
+    db.docs[("organizations", "org-1", "numberSequences", "BILL")] = {"2025": 7}
+    db.docs[("organizations", "org-1")] = {"numberSequences": {"payslip_2025": 3}}
+
+    assert sequence_allocator.next_number(db, "org-1", "INVOICE", 2025) == "INV-2025-0040"
+    assert sequence_allocator.next_number(db, "org-1", "BILL", 2025) == "BILL-2025-0008"
+    assert sequence_allocator.next_number(db, "org-1", "PAYSLIP", 2025) == "PAY-2025-0004"
+    assert sequence_allocator.next_number(db, "org-1", "QUOTE", 2025) == "QUO-2025-0001"
+
+
+def test_counter_from_the_old_allocator_still_picks_up_higher_legacy_counters(db):
+    # allocate_sequence_number created INVOICE_2025 before the leased allocator existed.
+    db.docs[("organizations", "org-1", "numberSequences", "INVOICE_2025")] = {"next": 5}
+    db.docs[("organizations", "org-1", "numberSequences", "INV_2025")] = {"next": 21}
+
+    assert sequence_allocator.next_number(db, "org-1", "INVOICE", 2025) == "INV-2025-0021"
+    assert _counter(db)["seededFrom"] == 21
+
+    # Once seeded, the legacy counters are no longer consulted.
+    db.docs[("organizations", "org-1", "numberSequences", "INV_2025")] = {"next": 90}
+    sequence_allocator.release_leases()
+    assert sequence_allocator.next_number(db, "org-1", "INVOICE", 2025) == "INV-2025-0022"
+
+
+def test_reserved_block_stays_open_until_closed_and_records_what_was_not_used(db):
+    sequence_allocator.next_number(db, "org-1", "PAYSLIP", 2025)
+
+    lease = sequence_allocator.reserve_block(db, "org-1", "PAYSLIP", 2025, 3, purpose="salaryRun:r1")
+
+    assert (lease.next, lease.end) == (6, 9)
+    assert _counter(db, "PAYSLIP")["next"] == 9
+    report = sequence_allocator.lease_report(db, "org-1", "PAYSLIP", 2025)
+    assert [l["start"] for l in report["unreleasedLeases"]] == [1, 6]
+
+    # The write of PAY-2025-0007 failed; a later lease means the number cannot go back.
+    sequence_allocator.lease_range(db, "org-1", "PAYSLIP", 2025, 2)
+    sequence_allocator.close_block(db, "org-1", "PAYSLIP", 2025, lease, used=[6, 8])
+
+    report = sequence_allocator.lease_report(db, "org-1", "PAYSLIP", 2025)
+    assert report["unusedNumbers"] == [7]
+    assert [l["start"] for l in report["unreleasedLeases"]] == [1, 9]
+    assert sequence_allocator.reserve_block(db, "org-1", "PAYSLIP", 2025, 0) is None
+
+
+def test_unused_block_tail_goes_back_to_the_counter(db):
+    lease = sequence_allocator.reserve_block(db, "org-1", "PAYSLIP", 2025, 4, purpose="salaryRun:r1")
+    sequence_allocator.close_block(db, "org-1", "PAYSLIP", 2025, lease, used=[1, 2])
+
+    assert _counter(db, "PAYSLIP")["next"] == 3
+    assert sequence_allocator.lease_report(db, "org-1", "PAYSLIP", 2025)["unusedNumbers"] == []
+
+
+def test_concurrent_callers_never_share_a_number(db):
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(20):
+            number = sequence_allocator.next_number(db, "org-1", "BILL", 2025)
+            with lock:
+                results.append(number)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == len(set(results)) == 80
+
+
+def test_idempotent_allocation_is_a_single_read_on_retry(db):
+    first = sequence_allocator.allocate_idempotent(db, "org-1", "INVOICE", 2025, "key-1")
+    db.reads.clear()
+    again = sequence_allocator.allocate_idempotent(db, "org-1", "INVOICE", 2025, "key-1")
+
+    assert first.is_new and not again.is_new
+    assert (again.number, again.sequence) == (first.number, first.sequence)
+    assert db.reads == [("organizations", "org-1", "sequenceAllocations", "INVOICE_2025_key-1")]
+
+    # Keys that are not valid document IDs are hashed.
+    odd = sequence_allocator.allocate_idempotent(db, "org-1", "INVOICE", 2025, "a/b c")
+    assert odd.sequence == first.sequence + 1
+
+
+def test_release_returns_tail_only_when_lease_is_at_the_tip(db):
+    for _ in range(2):
+        sequence_allocator.next_number(db, "org-1", "INVOICE", 2025)
+    sequence_allocator.release_leases()
+
+    assert _counter(db)["next"] == 3
+    [lease] = _leases(db)
+    assert lease["returnedFrom"] == 3 and lease["releasedAt"] is not None
+
+    # Another worker leases past us; our unused tail becomes an audited gap instead.
+    sequence_allocator.next_number(db, "org-1", "INVOICE", 2025)
+    sequence_allocator.lease_range(db, "org-1", "INVOICE", 2025, 5)
+    sequence_allocator.release_leases()
+
+    report = sequence_allocator.lease_report(db, "org-1", "INVOICE", 2025)
+    assert report["unusedNumbers"] == [4, 5, 6, 7]
+    assert [l["start"] for l in report["unreleasedLeases"]] == [8]
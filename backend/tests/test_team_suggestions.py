@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.services import team_suggestions
+
+
+TEAM = [{"userId": "u1", "name": "Asha", "skills": ["Photography"]},
+        {"userId": "u2", "name": "Ravi", "skills": ["Videography"]}]
+RULES = {"reasoning": "rules", "suggestions": [{"userId": "u1", "name": "Asha", "role": "Lead Photographer"}]}
+AI = {"reasoning": "ai", "suggestions": [{"userId": "u2", "name": "Ravi", "role": "Director"},
+                                         {"userId": "gone", "name": "Left", "role": "Editor"}]}
+
+
+async def _llm(delay, result=AI, error=None):
+    await asyncio.sleep(delay)
+    if error:
+        raise error
+    return result
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(team_suggestions, "POLL_INTERVAL_SECONDS", 0.01)
+
+
+def test_slow_ai_returns_rules_within_deadline_then_upgrades(fake_db):
+    db = fake_db
+
+    async def run():
+        started = time.perf_counter()
+        result, source, upgrade_id = await team_suggestions.race(
+            db, "org-1", "ev-1", RULES, _llm(0.3), TEAM, deadline=0.05)
+        elapsed = time.perf_counter() - started
+        pending = await team_suggestions.wait_for_upgrade(db, "org-1", upgrade_id, 0)
+        upgrade = await team_suggestions.wait_for_upgrade(db, "org-1", upgrade_id, 2)
+        return result, source, upgrade_id, elapsed, pending, upgrade
+
+    result, source, upgrade_id, elapsed, pending, upgrade = asyncio.run(run())
+    assert source == "rules" and result is RULES and upgrade_id
+    assert elapsed < 0.2
+    assert pending["status"] == team_suggestions.PENDING and pending["eventId"] == "ev-1"
+    assert upgrade["status"] == team_suggestions.READY
+    # Members who are no longer available are dropped; skills come from our team data
+    assert upgrade["ai_suggestions"]["suggestions"] == [
+        {"userId": "u2", "name": "Ravi", "role": "Director", "skills": ["Videography"]}]
+
+
+def test_fast_ai_wins_and_failures_fall_back_to_rules(fake_db):
+    db = fake_db
+
+    async def run():
+        return [
+            await team_suggestions.race(db, "org-1", "ev-1", RULES, _llm(0), TEAM, deadline=1),
+            await team_suggestions.race(db, "org-1", "ev-1", RULES, _llm(0, error=RuntimeError("429")), TEAM,
+                                        deadline=1),
+            await team_suggestions.race(db, "org-1", "ev-1", RULES, _llm(0, {"suggestions": [{"userId": "x"}]}),
+                                        TEAM, deadline=1),
+            await team_suggestions.race(db, "org-1", "ev-1", RULES, None, TEAM, deadline=1),
+        ]
+
+    ai, failed, unusable, unconfigured = asyncio.run(run())
+    assert ai[1] == "ai" and ai[0]["suggestions"][0]["userId"] == "u2" and ai[2] is None
+    for result, source, upgrade_id in (failed, unusable, unconfigured):
+        assert (result, source, upgrade_id) == (RULES, "rules", None)
+    assert db.docs == {}
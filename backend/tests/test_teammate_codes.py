@@ -186,6 +186,27 @@ class FakeTransaction:
         self._base_versions.clear()
 
 
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestoreClient"):
+        self._client = client
+        self._writes = []
+
+    def set(self, doc_ref: FakeDocumentRef, data: Dict, merge: bool = False, **kwargs):
+        self._writes.append((doc_ref, data, merge))
+
+    def create(self, doc_ref: FakeDocumentRef, data: Dict):
+        self._writes.append((doc_ref, data, None))
+
+    def commit(self):
+        self._client.batch_commits += 1
+        for doc_ref, data, merge in self._writes:
+            if merge is None and self._client._exists.get(doc_ref._path, False):
+                raise g_exceptions.AlreadyExists(f"{'/'.join(doc_ref._path)} already exists")
+        for doc_ref, data, merge in self._writes:
+            doc_ref.set(data, merge=bool(merge))
+        return []
+
+
 class FakeFirestoreClient:
     def __init__(self):
         self._documents: Dict[Tuple[str, ...], Dict] = {}
@@ -193,6 +214,13 @@ class FakeFirestoreClient:
         self._versions: Dict[Tuple[str, ...], int] = {}
         self._auto_counter = 0
         self._abort_plan: list[bool] = []
+        self.batch_commits = 0
+
+    def get_all(self, refs, transaction: Optional[FakeTransaction] = None):
+        return [ref.get(transaction=transaction) for ref in refs]
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
 
     def _generate_id(self) -> str:
         self._auto_counter += 1
@@ -367,6 +395,70 @@ async def test_integration_allocates_one_thousand_codes_with_stable_latency(fake
         assert p95 < 15, f"p95 latency too high for {role}: {p95}ms"
 
 
+@pytest.mark.asyncio
+async def test_bulk_allocation_reserves_blocks_per_role(fake_firestore):
+    _seed_org(fake_firestore, "ASTR", "org-1")
+    client = fake_firestore.client()
+    client.seed_document(("indexes", "teammateCodes", "codes", "ASTR-EDITOR-00002"), {"orgId": "org-1", "number": 2})
+    members = [(f"uid-{i}", "editor" if i % 3 else "qa") for i in range(400)]
+
+    result = await teammate_codes.allocate_teammate_codes_bulk(fake_firestore, "astr", members, "org-1", base_delay=0.001)
+
+    assert result.attempts == 1
+    assert result.latency_ms >= result.reserve_latency_ms
+    assert [a.teammate_uid for a in result.assignments] == [uid for uid, _ in members]
+    assert all(a.status == "assigned" for a in result.assignments)
+    editor_numbers = [a.number for a in result.assignments if a.role == "EDITOR"]
+    assert 2 not in editor_numbers
+    assert sorted(editor_numbers) == [1] + list(range(3, 3 + len(editor_numbers) - 1))
+    assert len({a.code for a in result.assignments}) == 400
+    # 400 assignments x 3 writes fit in three batches of at most 500 writes.
+    assert client.batch_commits == 3
+
+    exists, counter = client.get_document(("organizations", "org-1", "counters", "teammates", "roles", "QA"))
+    assert exists and counter["next"] == 135
+    exists, member = client.get_document(("organizations", "org-1", "team", "uid-1"))
+    assert member["employeeCode"] == "ASTR-EDITOR-00001"
+
+    single = await teammate_codes.allocate_teammate_code(fake_firestore, "ASTR", "QA", "org-1", None, base_delay=0.001)
+    assert single.number == 135
+
+
+@pytest.mark.asyncio
+async def test_bulk_allocation_retries_aborted_reservation(fake_firestore):
+    _seed_org(fake_firestore, "ASTR", "org-1")
+    fake_firestore.client().plan_abort([True, False])
+
+    result = await teammate_codes.allocate_teammate_codes_bulk(
+        fake_firestore, "ASTR", [("uid-1", "EDITOR"), ("uid-2", "EDITOR")], "org-1", base_delay=0.001
+    )
+
+    assert result.attempts == 2
+    assert [a.code for a in result.assignments] == ["ASTR-EDITOR-00001", "ASTR-EDITOR-00002"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_allocation_does_not_overwrite_a_code_claimed_after_reservation(fake_firestore, monkeypatch):
+    _seed_org(fake_firestore, "ASTR", "org-1")
+    client = fake_firestore.client()
+    commit_chunk = teammate_codes._commit_chunk
+
+    def claim_then_commit(db, *args):
+        client.seed_document(("indexes", "teammateCodes", "codes", "ASTR-EDITOR-00001"), {"orgId": "org-1", "uid": "other"})
+        return commit_chunk(db, *args)
+
+    monkeypatch.setattr(teammate_codes, "_commit_chunk", claim_then_commit)
+    result = await teammate_codes.allocate_teammate_codes_bulk(
+        fake_firestore, "ASTR", [("uid-1", "EDITOR"), ("uid-2", "EDITOR")], "org-1", base_delay=0.001
+    )
+
+    assert [a.status for a in result.assignments] == ["failed", "failed"]
+    _, index = client.get_document(("indexes", "teammateCodes", "codes", "ASTR-EDITOR-00001"))
+    assert index["uid"] == "other"
+    exists, _ = client.get_document(("organizations", "org-1", "team", "uid-2"))
+    assert not exists
+
+
 def _build_test_app():
     app = FastAPI()
     app.include_router(team.router)
@@ -436,6 +528,7 @@ def test_bulk_assign_endpoint_allocates_codes(test_client, fake_firestore):
     assert payload["results"] == [
         {"teammateUid": "uid-123", "status": "assigned", "code": "ASTR-EDITOR-00001", "role": "EDITOR", "number": 1}
     ]
+    assert payload["latencyMs"] >= 0
 
     exists, team_member = fake_firestore.client().get_document(("organizations", "org-1", "team", "uid-123"))
     assert exists
@@ -1,20 +1,239 @@
 """
 Email notification utilities for AR module
+
+Templates live in ``utils/email_templates`` and are compiled once by a shared
+jinja2 Environment. ``send_*`` methods render the message and hand it to an
+outbound queue drained by a small worker pool, so request handlers return
+without waiting on the provider. The transport is SendGrid in production;
+``EMAIL_TRANSPORT=memory`` or ``EMAIL_TRANSPORT=file`` swap in stand-ins for
+tests and local development.
 """
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition, Email
 import os
 import base64
-from jinja2 import Template
+import json
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from datetime import datetime
 import pytz
-from typing import Optional
+from typing import List, Optional, Tuple
+from uuid import uuid4
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'email_templates')
+
+# One Environment per process; jinja caches each compiled template after first use.
+template_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+)
+
+
+@dataclass
+class OutboundEmail:
+    to: str
+    subject: str
+    html: str
+    from_email: str
+    kind: str = "generic"
+    # (filename, base64 content, mime type)
+    attachments: List[Tuple[str, str, str]] = field(default_factory=list)
+    attempts: int = 0
+
+
+class SendGridTransport:
+    name = "sendgrid"
+
+    def __init__(self, api_key):
+        self.client = SendGridAPIClient(api_key=api_key)
+
+    def _to_mail(self, email: OutboundEmail):
+        message = Mail(
+            from_email=Email(email.from_email),
+            to_emails=email.to,
+            subject=email.subject,
+            html_content=email.html
+        )
+        for filename, content, mime_type in email.attachments:
+            message.add_attachment(Attachment(
+                FileContent(content),
+                FileName(filename),
+                FileType(mime_type),
+                Disposition("attachment")
+            ))
+        return message
+
+    def send(self, email: OutboundEmail):
+        return self.client.send(self._to_mail(email))
+
+    def send_batch(self, emails: List[OutboundEmail]) -> List[Optional[Exception]]:
+        # Each message has its own body, so a batch shares the HTTP client rather than one API call.
+        results = []
+        for email in emails:
+            try:
+                self.send(email)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class InMemoryTransport:
+    """Collects messages in a list; used by tests."""
+    name = "memory"
 
-class EmailService:
     def __init__(self):
+        self.sent: List[OutboundEmail] = []
+        self._lock = threading.Lock()
+
+    def send(self, email: OutboundEmail):
+        with self._lock:
+            self.sent.append(email)
+        return email
+
+    def send_batch(self, emails: List[OutboundEmail]) -> List[Optional[Exception]]:
+        with self._lock:
+            self.sent.extend(emails)
+        return [None] * len(emails)
+
+
+class FileTransport:
+    """Writes each message as JSON into a directory; used for local development."""
+    name = "file"
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, email: OutboundEmail):
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{email.kind}-{uuid4().hex[:8]}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(email), f, ensure_ascii=False, indent=2)
+        return path
+
+    def send_batch(self, emails: List[OutboundEmail]) -> List[Optional[Exception]]:
+        results = []
+        for email in emails:
+            try:
+                self.send(email)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def transport_from_env(sendgrid_api_key=None):
+    """Pick the transport from EMAIL_TRANSPORT (sendgrid | memory | file); None when unconfigured."""
+    kind = os.getenv('EMAIL_TRANSPORT', 'sendgrid').lower()
+    if kind == 'memory':
+        return InMemoryTransport()
+    if kind == 'file':
+        return FileTransport(os.getenv('EMAIL_OUTBOX_DIR', 'email_outbox'))
+    return SendGridTransport(sendgrid_api_key) if sendgrid_api_key else None
+
+
+class EmailQueue:
+    """
+    Outbound queue drained by a pool of daemon threads.
+
+    Workers pull up to ``batch_size`` messages (waiting at most ``batch_wait``
+    seconds to fill a batch) and hand them to the transport together. Failed
+    messages are re-queued with exponential backoff and jitter until
+    ``max_attempts`` is reached.
+    """
+
+    def __init__(self, transport, workers=4, batch_size=20, batch_wait=0.05, max_attempts=3, base_delay=1.0):
+        self.transport = transport
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.stats = {'queued': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        self._queue = queue.Queue()
+        self._threads = []
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._idle:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"email-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, email: OutboundEmail):
+        self._ensure_workers()
+        with self._idle:
+            self._pending += 1
+            self.stats['queued'] += 1
+        self._queue.put(email)
+
+    def flush(self, timeout=None) -> bool:
+        """Block until every queued message is delivered or dropped; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _settle(self, key):
+        with self._idle:
+            self.stats[key] += 1
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self.transport.send_batch(batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            for email, error in zip(batch, results):
+                if error is None:
+                    self._settle('sent')
+                    continue
+                email.attempts += 1
+                if email.attempts >= self.max_attempts:
+                    print(f"Error sending {email.kind} email to {email.to}: {str(error)}")
+                    self._settle('failed')
+                    continue
+                delay = self.base_delay * (2 ** (email.attempts - 1))
+                with self._idle:
+                    self.stats['retried'] += 1
+                timer = threading.Timer(delay + random.uniform(0, delay), self._queue.put, args=(email,))
+                timer.daemon = True
+                timer.start()
+
+
+class EmailService:
+    def __init__(self, transport=None, workers=None):
         self.sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
         self.from_email = os.getenv('FROM_EMAIL', 'noreply@autostudioflow.com')
-        self.sg = SendGridAPIClient(api_key=self.sendgrid_api_key) if self.sendgrid_api_key else None
+        self.transport = transport if transport is not None else transport_from_env(self.sendgrid_api_key)
+        workers = workers or int(os.getenv('EMAIL_QUEUE_WORKERS', '4'))
+        self.outbox = EmailQueue(self.transport, workers=workers) if self.transport else None
 
     def format_currency(self, amount, currency='INR'):
         """Format currency amount"""
@@ -34,84 +253,55 @@ class EmailService:
                 date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
             else:
                 date_obj = date_str
-            
+
             # Convert to IST
             ist = pytz.timezone('Asia/Kolkata')
             if date_obj.tzinfo is None:
                 date_obj = pytz.utc.localize(date_obj)
             date_obj = date_obj.astimezone(ist)
-            
+
             return date_obj.strftime('%d %B %Y')
         except:
             return str(date_str)
 
-    def send_invoice_email(self, invoice_data, client_data, pdf_buffer=None, org_data=None):
-        """Send invoice via email"""
-        if not self.sg:
-            print("SendGrid not configured. Email not sent.")
-            return False
+    def render(self, template_name, **context):
+        """Render a precompiled template from utils/email_templates"""
+        return template_env.get_template(template_name).render(**context)
 
-        client_email = client_data.get('profile', {}).get('email')
-        if not client_email:
+    def _generated_at(self):
+        return datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%d %B %Y at %I:%M %p IST')
+
+    def _pdf_attachment(self, pdf_buffer, filename):
+        pdf_buffer.seek(0)
+        return (filename, base64.b64encode(pdf_buffer.read()).decode(), "application/pdf")
+
+    def _submit(self, email: Optional[OutboundEmail]):
+        """Queue a rendered message; returns once it is accepted, not delivered"""
+        if email is None:
             print("Client email not found. Email not sent.")
             return False
+        if not self.outbox:
+            print("Email transport not configured. Email not sent.")
+            return False
+        self.outbox.enqueue(email)
+        return True
 
-        # Email template
-        template = Template("""
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .header { background-color: #2196F3; color: white; padding: 20px; text-align: center; }
-                .content { padding: 20px; }
-                .invoice-details { background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 20px 0; }
-                .footer { background-color: #f9f9f9; padding: 15px; text-align: center; font-size: 12px; }
-                .button { display: inline-block; padding: 10px 20px; background-color: #2196F3; color: white; text-decoration: none; border-radius: 5px; }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>{{ org_name }}</h1>
-                <h2>Invoice {{ invoice_number }}</h2>
-            </div>
-            
-            <div class="content">
-                <p>Dear {{ client_name }},</p>
-                
-                <p>Please find attached your invoice for the services provided. Here are the details:</p>
-                
-                <div class="invoice-details">
-                    <strong>Invoice #:</strong> {{ invoice_number }}<br>
-                    <strong>Issue Date:</strong> {{ issue_date }}<br>
-                    <strong>Due Date:</strong> {{ due_date }}<br>
-                    <strong>Amount:</strong> {{ amount }}<br>
-                    {% if amount_due != amount %}
-                    <strong>Amount Due:</strong> {{ amount_due }}<br>
-                    {% endif %}
-                </div>
-                
-                {% if notes %}
-                <p><strong>Notes:</strong></p>
-                <p>{{ notes }}</p>
-                {% endif %}
-                
-                <p>Please ensure payment is made by the due date. If you have any questions about this invoice, please don't hesitate to contact us.</p>
-                
-                <p>Thank you for your business!</p>
-                
-                <p>Best regards,<br>
-                {{ org_name }} Team</p>
-            </div>
-            
-            <div class="footer">
-                <p>This is an automated email. Please do not reply to this email.</p>
-                <p>Generated on {{ generated_at }}</p>
-            </div>
-        </body>
-        </html>
-        """)
+    def deliver(self, email: OutboundEmail):
+        """Send one message synchronously, bypassing the queue; raises on transport errors so callers can retry"""
+        if not self.transport:
+            raise RuntimeError("Email transport not configured")
+        return self.transport.send(email)
+
+    def flush(self, timeout=None):
+        """Wait for queued messages to drain (used on shutdown and in tests)"""
+        return self.outbox.flush(timeout) if self.outbox else True
+
+    def build_invoice_email(self, invoice_data, client_data, pdf_buffer=None, org_data=None):
+        """Render an invoice message, or return None when the client has no email"""
+        client_email = client_data.get('profile', {}).get('email')
+        if not client_email:
+            return None
 
-        # Prepare template data
         org_name = org_data.get('name', 'AUTOSTUDIOFLOW') if org_data else 'AUTOSTUDIOFLOW'
         template_data = {
             'org_name': org_name,
@@ -122,108 +312,30 @@ class EmailService:
             'amount': self.format_currency(invoice_data.get('totals', {}).get('grandTotal', 0), invoice_data.get('currency', 'INR')),
             'amount_due': self.format_currency(invoice_data.get('totals', {}).get('amountDue', 0), invoice_data.get('currency', 'INR')),
             'notes': invoice_data.get('notes', ''),
-            'generated_at': datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%d %B %Y at %I:%M %p IST')
+            'generated_at': self._generated_at()
         }
 
-        # Create email
-        subject = f"Invoice {invoice_data.get('number', '')} from {org_name}"
-        html_content = template.render(**template_data)
-        
-        message = Mail(
+        email = OutboundEmail(
+            to=client_email,
+            subject=f"Invoice {invoice_data.get('number', '')} from {org_name}",
+            html=self.render('invoice.html', **template_data),
             from_email=self.from_email,
-            to_emails=client_email,
-            subject=subject,
-            html_content=html_content
+            kind='invoice'
         )
-
-        # Attach PDF if provided
         if pdf_buffer:
-            pdf_buffer.seek(0)
-            encoded_file = base64.b64encode(pdf_buffer.read()).decode()
-            
-            attachment = Attachment(
-                FileContent(encoded_file),
-                FileName(f"Invoice-{invoice_data.get('number', 'DRAFT')}.pdf"),
-                FileType("application/pdf"),
-                Disposition("attachment")
-            )
-            message.attachment = attachment
+            email.attachments.append(self._pdf_attachment(pdf_buffer, f"Invoice-{invoice_data.get('number', 'DRAFT')}.pdf"))
+        return email
 
-        try:
-            response = self.sg.send(message)
-            print(f"Email sent successfully. Status code: {response.status_code}")
-            return True
-        except Exception as e:
-            print(f"Error sending email: {str(e)}")
-            return False
-
-    def send_quote_email(self, quote_data, client_data, pdf_buffer=None, org_data=None):
-        """Send quote via email"""
-        if not self.sg:
-            print("SendGrid not configured. Email not sent.")
-            return False
+    def send_invoice_email(self, invoice_data, client_data, pdf_buffer=None, org_data=None):
+        """Queue invoice email"""
+        return self._submit(self.build_invoice_email(invoice_data, client_data, pdf_buffer, org_data))
 
+    def build_quote_email(self, quote_data, client_data, pdf_buffer=None, org_data=None):
+        """Render a quote message, or return None when the client has no email"""
         client_email = client_data.get('profile', {}).get('email')
         if not client_email:
-            print("Client email not found. Email not sent.")
-            return False
+            return None
 
-        # Email template
-        template = Template("""
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .header { background-color: #4CAF50; color: white; padding: 20px; text-align: center; }
-                .content { padding: 20px; }
-                .quote-details { background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 20px 0; }
-                .footer { background-color: #f9f9f9; padding: 15px; text-align: center; font-size: 12px; }
-                .button { display: inline-block; padding: 10px 20px; background-color: #4CAF50; color: white; text-decoration: none; border-radius: 5px; }
-                .warning { background-color: #fff3cd; border: 1px solid #ffeaa7; padding: 10px; border-radius: 5px; margin: 15px 0; }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>{{ org_name }}</h1>
-                <h2>Quotation {{ quote_number }}</h2>
-            </div>
-            
-            <div class="content">
-                <p>Dear {{ client_name }},</p>
-                
-                <p>Thank you for your interest in our services. Please find attached our detailed quotation.</p>
-                
-                <div class="quote-details">
-                    <strong>Quote #:</strong> {{ quote_number }}<br>
-                    <strong>Issue Date:</strong> {{ issue_date }}<br>
-                    <strong>Valid Until:</strong> {{ valid_until }}<br>
-                    <strong>Total Amount:</strong> {{ amount }}<br>
-                </div>
-                
-                <div class="warning">
-                    <strong>⏰ Important:</strong> This quotation is valid until {{ valid_until }}. Please respond before the expiry date to secure these prices.
-                </div>
-                
-                {% if notes %}
-                <p><strong>Additional Information:</strong></p>
-                <p>{{ notes }}</p>
-                {% endif %}
-                
-                <p>We look forward to working with you. If you have any questions or would like to proceed with this quotation, please don't hesitate to contact us.</p>
-                
-                <p>Best regards,<br>
-                {{ org_name }} Team</p>
-            </div>
-            
-            <div class="footer">
-                <p>This is an automated email. Please do not reply to this email.</p>
-                <p>Generated on {{ generated_at }}</p>
-            </div>
-        </body>
-        </html>
-        """)
-
-        # Prepare template data
         org_name = org_data.get('name', 'AUTOSTUDIOFLOW') if org_data else 'AUTOSTUDIOFLOW'
         template_data = {
             'org_name': org_name,
@@ -233,51 +345,29 @@ class EmailService:
             'valid_until': self.format_date(quote_data.get('validUntil')),
             'amount': self.format_currency(quote_data.get('totals', {}).get('grandTotal', 0), quote_data.get('currency', 'INR')),
             'notes': quote_data.get('notes', ''),
-            'generated_at': datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%d %B %Y at %I:%M %p IST')
+            'generated_at': self._generated_at()
         }
 
-        # Create email
-        subject = f"Quotation {quote_data.get('number', '')} from {org_name}"
-        html_content = template.render(**template_data)
-        
-        message = Mail(
+        email = OutboundEmail(
+            to=client_email,
+            subject=f"Quotation {quote_data.get('number', '')} from {org_name}",
+            html=self.render('quote.html', **template_data),
             from_email=self.from_email,
-            to_emails=client_email,
-            subject=subject,
-            html_content=html_content
+            kind='quote'
         )
-
-        # Attach PDF if provided
         if pdf_buffer:
-            pdf_buffer.seek(0)
-            encoded_file = base64.b64encode(pdf_buffer.read()).decode()
-            
-            attachment = Attachment(
-                FileContent(encoded_file),
-                FileName(f"Quote-{quote_data.get('number', 'DRAFT')}.pdf"),
-                FileType("application/pdf"),
-                Disposition("attachment")
-            )
-            message.attachment = attachment
-
-        try:
-            response = self.sg.send(message)
-            print(f"Email sent successfully. Status code: {response.status_code}")
-            return True
-        except Exception as e:
-            print(f"Error sending email: {str(e)}")
-            return False
+            email.attachments.append(self._pdf_attachment(pdf_buffer, f"Quote-{quote_data.get('number', 'DRAFT')}.pdf"))
+        return email
 
-    def send_payment_reminder(self, invoice_data, client_data, reminder_type='due_soon', org_data=None):
-        """Send payment reminder email"""
-        if not self.sg:
-            print("SendGrid not configured. Email not sent.")
-            return False
+    def send_quote_email(self, quote_data, client_data, pdf_buffer=None, org_data=None):
+        """Queue quote email"""
+        return self._submit(self.build_quote_email(quote_data, client_data, pdf_buffer, org_data))
 
+    def build_payment_reminder(self, invoice_data, client_data, reminder_type='due_soon', org_data=None):
+        """Render a payment reminder message, or return None when the client has no email"""
         client_email = client_data.get('profile', {}).get('email')
         if not client_email:
-            print("Client email not found. Email not sent.")
-            return False
+            return None
 
         # Different templates based on reminder type
         if reminder_type == 'due_soon':  # T-3 days
@@ -296,72 +386,11 @@ class EmailService:
             message_tone = "This is an urgent reminder that"
             urgency_class = "urgent"
 
-        template = Template("""
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .header { background-color: {{ header_color }}; color: white; padding: 20px; text-align: center; }
-                .content { padding: 20px; }
-                .invoice-details { background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 20px 0; }
-                .footer { background-color: #f9f9f9; padding: 15px; text-align: center; font-size: 12px; }
-                .info { background-color: #e3f2fd; border-left: 4px solid #2196f3; padding: 10px; margin: 15px 0; }
-                .warning { background-color: #fff3cd; border-left: 4px solid #ff9800; padding: 10px; margin: 15px 0; }
-                .urgent { background-color: #ffebee; border-left: 4px solid #f44336; padding: 10px; margin: 15px 0; }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>{{ org_name }}</h1>
-                <h2>{{ subject_prefix }}</h2>
-            </div>
-            
-            <div class="content">
-                <p>Dear {{ client_name }},</p>
-                
-                <p>{{ message_tone }} invoice {{ invoice_number }} for {{ amount_due }} {% if reminder_type == 'due_soon' %}is due on {{ due_date }}{% else %}was due on {{ due_date }}{% endif %}.</p>
-                
-                <div class="invoice-details">
-                    <strong>Invoice #:</strong> {{ invoice_number }}<br>
-                    <strong>Original Amount:</strong> {{ original_amount }}<br>
-                    <strong>Amount Due:</strong> {{ amount_due }}<br>
-                    <strong>Due Date:</strong> {{ due_date }}<br>
-                    {% if days_overdue > 0 %}
-                    <strong>Days Overdue:</strong> {{ days_overdue }}<br>
-                    {% endif %}
-                </div>
-                
-                <div class="{{ urgency_class }}">
-                    {% if reminder_type == 'due_soon' %}
-                    <strong>📅 Reminder:</strong> Payment is due in {{ days_until_due }} days. Please ensure payment is made by the due date to avoid any inconvenience.
-                    {% elif reminder_type == 'overdue_1' %}
-                    <strong>⚠️ Overdue Notice:</strong> This invoice is now {{ days_overdue }} day(s) overdue. Please arrange payment at your earliest convenience.
-                    {% else %}
-                    <strong>🚨 Urgent Action Required:</strong> This invoice is significantly overdue ({{ days_overdue }} days). Please contact us immediately to discuss payment arrangements.
-                    {% endif %}
-                </div>
-                
-                <p>If you have already made this payment, please ignore this reminder. If you have any questions or need to discuss payment arrangements, please don't hesitate to contact us.</p>
-                
-                <p>Thank you for your prompt attention to this matter.</p>
-                
-                <p>Best regards,<br>
-                {{ org_name }} Team</p>
-            </div>
-            
-            <div class="footer">
-                <p>This is an automated reminder. For any queries, please contact us using the details above.</p>
-                <p>Generated on {{ generated_at }}</p>
-            </div>
-        </body>
-        </html>
-        """)
-
         # Calculate days overdue/until due
         due_date = datetime.fromisoformat(invoice_data.get('dueDate').replace('Z', '+00:00'))
         now = datetime.now(pytz.UTC)
         days_diff = (now - due_date).days
-        
+
         # Prepare template data
         org_name = org_data.get('name', 'AUTOSTUDIOFLOW') if org_data else 'AUTOSTUDIOFLOW'
         template_data = {
@@ -378,179 +407,76 @@ class EmailService:
             'header_color': header_color,
             'message_tone': message_tone,
             'urgency_class': urgency_class,
-            'generated_at': datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%d %B %Y at %I:%M %p IST')
+            'generated_at': self._generated_at()
         }
 
-        # Create email
-        subject = f"{subject_prefix}: Invoice {invoice_data.get('number', '')} - {org_name}"
-        html_content = template.render(**template_data)
-        
-        message = Mail(
+        return OutboundEmail(
+            to=client_email,
+            subject=f"{subject_prefix}: Invoice {invoice_data.get('number', '')} - {org_name}",
+            html=self.render('payment_reminder.html', **template_data),
             from_email=self.from_email,
-            to_emails=client_email,
-            subject=subject,
-            html_content=html_content
+            kind='payment_reminder'
         )
 
-        try:
-            response = self.sg.send(message)
-            print(f"Reminder email sent successfully. Status code: {response.status_code}")
-            return True
-        except Exception as e:
-            print(f"Error sending reminder email: {str(e)}")
-            return False
+    def send_payment_reminder(self, invoice_data, client_data, reminder_type='due_soon', org_data=None):
+        """Queue payment reminder email"""
+        return self._submit(self.build_payment_reminder(invoice_data, client_data, reminder_type, org_data))
 
     def send_client_reply_notification(self, invoice_data, client_data, message, admin_email, org_data=None):
-        """Send notification to admin when client replies to invoice"""
-        if not self.sg:
-            print("SendGrid not configured. Email not sent.")
-            return False
-
+        """Queue notification to admin when client replies to invoice"""
         org_name = org_data.get('name', 'AutoStudioFlow') if org_data else 'AutoStudioFlow'
-        client_name = client_data.get('profile', {}).get('name', 'Client')
         invoice_number = invoice_data.get('number', 'DRAFT')
 
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .header {{ background-color: #2196F3; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .message-box {{ background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 20px 0; border-left: 4px solid #2196F3; }}
-                .footer {{ background-color: #f9f9f9; padding: 15px; text-align: center; font-size: 12px; }}
-                .info {{ background-color: #e3f2fd; padding: 10px; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>{org_name}</h1>
-                <h2>Client Response - Invoice {invoice_number}</h2>
-            </div>
-            
-            <div class="content">
-                <div class="info">
-                    <p><strong>📧 New client response received</strong></p>
-                    <p><strong>Client:</strong> {client_name}</p>
-                    <p><strong>Invoice:</strong> {invoice_number}</p>
-                    <p><strong>Amount Due:</strong> {self._format_currency(invoice_data.get('totals', {}).get('amountDue', 0))}</p>
-                </div>
-                
-                <h3>Client Message:</h3>
-                <div class="message-box">
-                    <p>{message}</p>
-                </div>
-                
-                <p>Please log into the admin panel to view the complete communication thread and respond if necessary.</p>
-                
-                <p>This is an automated notification from {org_name}.</p>
-            </div>
-            
-            <div class="footer">
-                <p>Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-            </div>
-        </body>
-        </html>
-        """
-
-        message = Mail(
-            from_email=Email(self.from_email),
-            to_emails=admin_email,
-            subject=f"Client Response - Invoice {invoice_number}",
-            html_content=html_content
+        html_content = self.render(
+            'client_reply_notification.html',
+            org_name=org_name,
+            client_name=client_data.get('profile', {}).get('name', 'Client'),
+            invoice_number=invoice_number,
+            amount_due=self._format_currency(invoice_data.get('totals', {}).get('amountDue', 0)),
+            message=message,
+            generated_at=datetime.now().strftime('%B %d, %Y at %I:%M %p')
         )
 
-        try:
-            response = self.sg.send(message)
-            print(f"Client reply notification sent successfully. Status code: {response.status_code}")
-            return True
-        except Exception as e:
-            print(f"Error sending client reply notification: {str(e)}")
-            return False
+        return self._submit(OutboundEmail(
+            to=admin_email,
+            subject=f"Client Response - Invoice {invoice_number}",
+            html=html_content,
+            from_email=self.from_email,
+            kind='client_reply'
+        ))
 
     def send_invoice_message_notification(self, invoice_data, client_data, message, org_data=None):
-        """Send message notification to client from admin/accountant"""
-        if not self.sg:
-            print("SendGrid not configured. Email not sent.")
-            return False
-
+        """Queue message notification to client from admin/accountant"""
         client_email = client_data.get('profile', {}).get('email')
         if not client_email:
             print("Client email not found. Email not sent.")
             return False
 
         org_name = org_data.get('name', 'AutoStudioFlow') if org_data else 'AutoStudioFlow'
-        client_name = client_data.get('profile', {}).get('name', 'Valued Client')
         invoice_number = invoice_data.get('number', 'DRAFT')
 
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .header {{ background-color: #2196F3; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .message-box {{ background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 20px 0; border-left: 4px solid #2196F3; }}
-                .footer {{ background-color: #f9f9f9; padding: 15px; text-align: center; font-size: 12px; }}
-                .info {{ background-color: #e3f2fd; padding: 10px; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>{org_name}</h1>
-                <h2>Message About Invoice {invoice_number}</h2>
-            </div>
-            
-            <div class="content">
-                <p>Dear {client_name},</p>
-                
-                <p>We have sent you a message regarding Invoice {invoice_number}:</p>
-                
-                <div class="message-box">
-                    <p>{message}</p>
-                </div>
-                
-                <div class="info">
-                    <p><strong>Invoice Details:</strong></p>
-                    <p><strong>Invoice #:</strong> {invoice_number}</p>
-                    <p><strong>Amount Due:</strong> {self._format_currency(invoice_data.get('totals', {}).get('amountDue', 0))}</p>
-                    <p><strong>Due Date:</strong> {invoice_data.get('dueDate', 'Not set')}</p>
-                </div>
-                
-                <p>You can reply to this message and view your complete invoice history by logging into your client portal.</p>
-                
-                <p>If you have any questions or concerns, please don't hesitate to reach out to us.</p>
-                
-                <p>Best regards,<br>
-                {org_name} Team</p>
-            </div>
-            
-            <div class="footer">
-                <p>This is an automated email. You can reply to this invoice through your client portal.</p>
-                <p>Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-            </div>
-        </body>
-        </html>
-        """
-
-        message = Mail(
-            from_email=Email(self.from_email),
-            to_emails=client_email,
-            subject=f"Message About Invoice {invoice_number} - {org_name}",
-            html_content=html_content
+        html_content = self.render(
+            'invoice_message.html',
+            org_name=org_name,
+            client_name=client_data.get('profile', {}).get('name', 'Valued Client'),
+            invoice_number=invoice_number,
+            amount_due=self._format_currency(invoice_data.get('totals', {}).get('amountDue', 0)),
+            due_date=invoice_data.get('dueDate', 'Not set'),
+            message=message,
+            generated_at=datetime.now().strftime('%B %d, %Y at %I:%M %p')
         )
 
-        try:
-            response = self.sg.send(message)
-            print(f"Invoice message notification sent successfully. Status code: {response.status_code}")
-            return True
-        except Exception as e:
-            print(f"Error sending invoice message notification: {str(e)}")
-            return False
+        return self._submit(OutboundEmail(
+            to=client_email,
+            subject=f"Message About Invoice {invoice_number} - {org_name}",
+            html=html_content,
+            from_email=self.from_email,
+            kind='invoice_message'
+        ))
 
     def _format_currency(self, amount):
         """Helper method to format currency"""
         return f"₹{amount:,.2f}"
-        
+
 # Global email service instance
 email_service = EmailService()
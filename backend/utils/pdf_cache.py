@@ -0,0 +1,237 @@
+"""
+Content-addressed cache and process-pool rendering for invoice/quote PDFs.
+
+The cache key is a SHA-256 over exactly the fields ``PDFGenerator`` reads from
+the document, client and org (plus ``PDF_LAYOUT_VERSION``), so unrelated
+writes such as activity timestamps or status changes do not invalidate a
+rendered PDF while any visible change does. Rendered bytes are stored as files
+in ``PDF_CACHE_DIR`` and evicted least-recently-used once the directory grows
+past ``PDF_CACHE_MAX_MB``.
+
+Rendering happens in a ``ProcessPoolExecutor`` so reportlab never runs on the
+event loop or holds the GIL of the API process. Concurrent requests for the
+same key share one render.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever PDFGenerator's layout changes so stale renders are not served.
+PDF_LAYOUT_VERSION = 1
+
+_DOCUMENT_FIELDS = ("number", "issueDate", "dueDate", "validUntil", "currency", "totals", "shipping", "notes")
+_ITEM_FIELDS = ("desc", "qty", "unitPrice", "taxRatePct")
+_CLIENT_PROFILE_FIELDS = ("name", "email", "billingAddress")
+_ORG_FIELDS = ("name", "address", "phone", "email")
+
+
+def _plain(value: Any) -> Any:
+    """JSON/pickle-safe copy; Firestore timestamps become ISO strings, which format_date accepts."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def render_inputs(document: Dict[str, Any], client: Optional[Dict[str, Any]], org: Optional[Dict[str, Any]]):
+    """Project the inputs down to the fields the PDF shows."""
+    document = document or {}
+    doc = {k: _plain(document[k]) for k in _DOCUMENT_FIELDS if k in document}
+    doc["items"] = [
+        {k: _plain(item[k]) for k in _ITEM_FIELDS if k in item}
+        for item in document.get("items", []) or []
+    ]
+    profile = (client or {}).get("profile", {}) or {}
+    client_view = {"profile": {k: _plain(profile[k]) for k in _CLIENT_PROFILE_FIELDS if k in profile}}
+    org_view = {k: _plain(org[k]) for k in _ORG_FIELDS if k in (org or {})}
+    return doc, client_view, org_view
+
+
+def pdf_cache_key(kind: str, document, client, org) -> str:
+    doc, client_view, org_view = render_inputs(document, client, org)
+    payload = json.dumps(
+        {"v": PDF_LAYOUT_VERSION, "kind": kind, "doc": doc, "client": client_view, "org": org_view},
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PDFCache:
+    """Directory-backed LRU of rendered PDFs keyed by content hash."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Failed to cache PDF {key}: {e}")
+            return
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            evicted = []
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+
+# --- Process pool rendering ---
+
+_worker_generator = None
+
+
+def _render_in_worker(kind: str, doc, client, org) -> bytes:
+    """Runs inside a pool process; the PDFGenerator (and its styles) is built once per process."""
+    global _worker_generator
+    if _worker_generator is None:
+        from .pdf_generator import PDFGenerator
+        _worker_generator = PDFGenerator()
+    if kind == "quote":
+        buffer = _worker_generator.generate_quote_pdf(doc, client, org)
+    else:
+        buffer = _worker_generator.generate_invoice_pdf(doc, client, org)
+    return buffer.getvalue()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_cache: Optional[PDFCache] = None
+_inflight: Dict[str, "asyncio.Future"] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def get_pdf_cache() -> PDFCache:
+    global _cache
+    if _cache is None:
+        directory = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "autostudioflow-pdf-cache"))
+        max_mb = int(os.getenv("PDF_CACHE_MAX_MB", "256"))
+        _cache = PDFCache(directory, max_mb * 1024 * 1024)
+    return _cache
+
+
+async def _render(kind: str, doc, client, org) -> bytes:
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), _render_in_worker, kind, doc, client, org)
+    except BrokenProcessPool:
+        # A crashed worker poisons the pool; rebuild it and render this one in a thread.
+        logger.warning("PDF render pool broken; recreating")
+        _reset_pool()
+        return await asyncio.to_thread(_render_in_worker, kind, doc, client, org)
+
+
+async def render_pdf(kind: str, document, client, org) -> bytes:
+    """Return PDF bytes for an invoice or quote, from cache when the visible content is unchanged."""
+    key = pdf_cache_key(kind, document, client, org)
+    cache = get_pdf_cache()
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        doc, client_view, org_view = render_inputs(document, client, org)
+        data = await _render(kind, doc, client_view, org_view)
+        await asyncio.to_thread(cache.put, key, data)
+        future.set_result(data)
+        return data
+    except Exception as e:
+        future.set_exception(e)
+        # Mark retrieved so waiters-less failures do not log "exception never retrieved".
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def render_invoice_pdf(invoice_data, client_data, org_data=None) -> bytes:
+    return await render_pdf("invoice", invoice_data, client_data, org_data)
+
+
+async def render_quote_pdf(quote_data, client_data, org_data=None) -> bytes:
+    return await render_pdf("quote", quote_data, client_data, org_data)
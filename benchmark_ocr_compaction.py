@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Measure pre-OCR image compaction against OCR accuracy on a fixture set.
+
+Usage:
+    python benchmark_ocr_compaction.py --fixtures path/to/receipts          # sizes only
+    python benchmark_ocr_compaction.py --fixtures path/to/receipts --ocr    # also call the model
+
+The fixture directory holds receipt images. An image may have a sidecar
+``<name>.json`` with the expected fields, e.g.
+``{"rideId": "CRN123", "amount": 250, "date": "2025-11-25"}``.
+
+Without ``--ocr`` the script reports raw and compacted payload sizes and the
+compaction time. With ``--ocr`` (needs OPENROUTER_API_KEY) every image is
+sent twice, raw and compacted, bypassing the OCR cache. It then reports request
+latency, timeouts, and how many expected fields each variant extracted
+correctly. Try different OCR_MAX_SIDE / OCR_IMAGE_QUALITY / OCR_GRAYSCALE /
+OCR_IMAGE_FORMAT values and compare.
+"""
+
+import argparse
+import base64
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from backend.services.ocr_image import compact_for_ocr, compaction_profile  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _normalize(value):
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return text
+
+
+def _score(expected, extracted):
+    fields = [f for f in expected if expected[f] is not None]
+    correct = sum(1 for f in fields if _normalize(extracted.get(f)) == _normalize(expected[f]))
+    return correct, len(fields)
+
+
+def _ocr(service, data, compact):
+    started = time.perf_counter()
+    result = service.process_receipt(data, use_cache=False, compact=compact)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", required=True, help="directory of receipt images (+ optional .json sidecars)")
+    parser.add_argument("--ocr", action="store_true", help="run OCR on raw and compacted images")
+    args = parser.parse_args()
+
+    images = [p for p in sorted(Path(args.fixtures).iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES]
+    if not images:
+        print("No images found")
+        return 1
+
+    service = None
+    if args.ocr:
+        from backend.services.ocr_service import ocr_service
+        service = ocr_service
+
+    print(f"profile {compaction_profile()}  images {len(images)}")
+    raw_sizes, sent_sizes, compaction_ms = [], [], []
+    stats = {variant: {"latency": [], "correct": 0, "fields": 0, "failed": 0} for variant in ("raw", "compacted")}
+
+    for path in images:
+        data = path.read_bytes()
+        compacted = compact_for_ocr(data)
+        raw_sizes.append(len(base64.b64encode(data)))
+        sent_sizes.append(len(base64.b64encode(compacted.data)))
+        compaction_ms.append(compacted.latency_ms)
+        line = (f"{path.name:32s} {len(data) / 1024:8.1f}KB -> {len(compacted.data) / 1024:8.1f}KB  "
+                f"{compacted.width}x{compacted.height} cropped={compacted.cropped}")
+
+        if service is not None:
+            sidecar = path.with_suffix(".json")
+            expected = json.loads(sidecar.read_text()) if sidecar.exists() else {}
+            for variant, compact in (("raw", False), ("compacted", True)):
+                result, latency = _ocr(service, data, compact)
+                bucket = stats[variant]
+                bucket["latency"].append(latency)
+                if not result.get("success"):
+                    bucket["failed"] += 1
+                correct, fields = _score(expected, result.get("data") or {})
+                bucket["correct"] += correct
+                bucket["fields"] += fields
+                line += f"  {variant} {latency:7.0f}ms {correct}/{fields}"
+        print(line)
+
+    print(f"base64 payload   raw mean {statistics.mean(raw_sizes) / 1024:8.1f}KB  "
+          f"compacted mean {statistics.mean(sent_sizes) / 1024:8.1f}KB  "
+          f"({100 * sum(sent_sizes) / sum(raw_sizes):.1f}% of raw)")
+    print(f"compaction time  mean {statistics.mean(compaction_ms):.1f}ms  max {max(compaction_ms):.1f}ms")
+    if service is not None:
+        for variant, bucket in stats.items():
+            accuracy = 100 * bucket["correct"] / bucket["fields"] if bucket["fields"] else float("nan")
+            print(f"{variant:10s} latency mean {statistics.mean(bucket['latency']):7.0f}ms  "
+                  f"max {max(bucket['latency']):7.0f}ms  failures {bucket['failed']}  "
+                  f"field accuracy {accuracy:.1f}% ({bucket['correct']}/{bucket['fields']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
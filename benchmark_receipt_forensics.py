@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark the NumPy receipt forensics fast path against the reference
+PIL/imagehash pipeline.
+
+Usage:
+    python benchmark_receipt_forensics.py --corpus path/to/receipts
+    python benchmark_receipt_forensics.py --synthetic 20
+
+For every image it reports the per-stage timings of both paths, the pHash and
+dHash Hamming distances between them, and the ELA score delta. A threshold
+flip is counted when the two paths disagree on ``is_manipulated``, on the
+pHash template check or on the dHash exact-copy check.
+"""
+
+import argparse
+import io
+import random
+import statistics
+import sys
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.append(str(Path(__file__).parent))
+
+from backend.services import fast_forensics  # noqa: E402
+from backend.services.advanced_verification_service import advanced_verification_service  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def synthetic_receipts(count, seed=7):
+    """Phone-sized JPEG receipts: a coloured app header, then rows of text-like bars."""
+    rng = random.Random(seed)
+    for index in range(count):
+        width, height = rng.choice([(3024, 4032), (2268, 4032), (1080, 2340), (1500, 2000)])
+        image = Image.new("RGB", (width, height), (250, 250, 248))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, 0, width, height // 7], fill=(rng.randrange(256), rng.randrange(256), 200))
+        for row in range(height // 5, height - 60, max(24, height // 45)):
+            x = rng.randrange(30, width // 4)
+            draw.rectangle([x, row, x + rng.randrange(width // 8, width // 2), row + height // 90], fill=(30, 30, 30))
+        buf = io.BytesIO()
+        image.save(buf, "JPEG", quality=rng.choice([75, 85, 92]))
+        yield f"synthetic-{index:03d}.jpg", buf.getvalue()
+
+
+def corpus_receipts(directory):
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            yield path.name, path.read_bytes()
+
+
+def _summary(values):
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return f"mean {statistics.mean(ordered):8.2f}  p50 {statistics.median(ordered):8.2f}  p95 {p95:8.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of receipt images")
+    parser.add_argument("--synthetic", type=int, default=12, help="synthetic receipts to generate when no corpus is given")
+    parser.add_argument("--verbose", action="store_true", help="print one line per image")
+    args = parser.parse_args()
+
+    receipts = corpus_receipts(args.corpus) if args.corpus else synthetic_receipts(args.synthetic)
+    thresholds = advanced_verification_service.thresholds
+    stages = ("decode_resize", "hashes", "ela", "total")
+    timings = {"reference": {s: [] for s in stages}, "fast": {s: [] for s in stages}}
+    phash_distances, dhash_distances, ela_deltas = [], [], []
+    flips = 0
+
+    for name, data in receipts:
+        reference = advanced_verification_service.comprehensive_image_analysis(data)
+        fast = fast_forensics.fast_image_analysis(data)
+        for stage in stages:
+            timings["reference"][stage].append(reference["timings_ms"][stage])
+            timings["fast"][stage].append(fast["timings_ms"][stage])
+
+        phash_distance, dhash_distance, ela_delta = fast_forensics.compare(reference, fast)
+        phash_distances.append(phash_distance)
+        dhash_distances.append(dhash_distance)
+        ela_deltas.append(ela_delta)
+        if (phash_distance >= thresholds["PHASH_TEMPLATE"] or dhash_distance >= thresholds["DHASH_EXACT"]
+                or fast["ela_analysis"]["is_manipulated"] != reference["ela_analysis"]["is_manipulated"]):
+            flips += 1
+        if args.verbose:
+            print(f"{name:32s} ref {reference['timings_ms']['total']:8.2f}ms  fast {fast['timings_ms']['total']:8.2f}ms  "
+                  f"phash {phash_distance:2d}  dhash {dhash_distance:2d}  ela {ela_delta:+.2f}")
+
+    if not phash_distances:
+        print("No images found")
+        return 1
+
+    print(f"{len(phash_distances)} receipts")
+    for stage in stages:
+        print(f"{stage:14s} reference {_summary(timings['reference'][stage])}")
+        print(f"{'':14s} fast      {_summary(timings['fast'][stage])}")
+    speedup = statistics.mean(timings["reference"]["total"]) / max(statistics.mean(timings["fast"]["total"]), 1e-9)
+    print(f"speedup        {speedup:.2f}x")
+    print(f"pHash distance max {max(phash_distances)}  mean {statistics.mean(phash_distances):.2f}")
+    print(f"dHash distance max {max(dhash_distances)}  mean {statistics.mean(dhash_distances):.2f}")
+    print(f"ELA delta      max {max(abs(d) for d in ela_deltas):.2f}  mean {statistics.mean(ela_deltas):+.2f}")
+    print(f"threshold flips {flips}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -48,6 +48,9 @@ import { useAuth } from '../contexts/AuthContext';
 import { auth } from '../firebase';
 import toast from 'react-hot-toast';
 
+// Longest the uploader waits for background verification before reporting it as pending.
+const MAX_VERIFICATION_WAIT_MS = 2 * 60 * 1000;
+
 const CabReceiptUploader = ({ eventId, eventData, onUploadSuccess }) => {
     const { user } = useAuth();
     const theme = useTheme();
@@ -212,7 +215,29 @@ const CabReceiptUploader = ({ eventId, eventData, onUploadSuccess }) => {
             setUploadProgress(100);
 
             if (response.ok) {
-                const result = await response.json();
+                let result = await response.json();
+                if (result.status === 'queued') {
+                    // Verification runs in the background; long-poll until it settles.
+                    result = await waitForVerification(result.receiptId, idToken);
+                    if (result.state === 'FAILED') {
+                        toast.error(`Receipt saved but could not be verified automatically (${result.error || 'unknown error'}). It will be reviewed manually.`, { icon: '⚠️', duration: 6000 });
+                        setUploadStage('');
+                        setUploadProgress(0);
+                        fetchReceipts();
+                        return;
+                    }
+                    if (result.state !== 'DONE') {
+                        toast.success('Receipt saved. Verification is still pending; check your receipts list for the result.', { icon: '⏳', duration: 6000 });
+                        setFile(null);
+                        setPreview(null);
+                        setSelectedTeamMembers([]);
+                        setNotes('');
+                        setUploadStage('');
+                        setUploadProgress(0);
+                        fetchReceipts();
+                        return;
+                    }
+                }
                 setVerificationResult(result.verification);
                 
                 // Check for duplicate first
@@ -270,6 +295,25 @@ const CabReceiptUploader = ({ eventId, eventData, onUploadSuccess }) => {
         }
     };
 
+    const waitForVerification = async (receiptId, idToken) => {
+        // Stop waiting after a bounded time; the receipt stays saved and is verified later.
+        const deadline = Date.now() + MAX_VERIFICATION_WAIT_MS;
+        while (Date.now() < deadline) {
+            const wait = Math.max(1, Math.min(20, Math.ceil((deadline - Date.now()) / 1000)));
+            const response = await fetch(`/api/receipts/${receiptId}/status?wait=${wait}`, {
+                headers: { 'Authorization': `Bearer ${idToken}` }
+            });
+            if (!response.ok) {
+                throw new Error(`Status check failed with status ${response.status}`);
+            }
+            const status = await response.json();
+            if (status.state === 'DONE' || status.state === 'FAILED') {
+                return status;
+            }
+        }
+        return { state: 'PENDING', receiptId };
+    };
+
     const getRiskLevelColor = (riskLevel) => {
         switch (riskLevel) {
             case 'LOW_RISK': return theme.palette.success.main;
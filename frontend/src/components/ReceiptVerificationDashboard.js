@@ -63,6 +63,7 @@ const ReceiptVerificationDashboard = () => {
     const { user } = useAuth();
     const [loading, setLoading] = useState(true);
     const [receipts, setReceipts] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [dashboardSummary, setDashboardSummary] = useState(null);
     const [selectedReceipt, setSelectedReceipt] = useState(null);
     const [detailsOpen, setDetailsOpen] = useState(false);
@@ -99,8 +100,8 @@ const ReceiptVerificationDashboard = () => {
         }
     };
 
-    // Fetch receipts with filters
-    const fetchReceipts = async () => {
+    // Fetch receipts with filters; pass a cursor to append the next page
+    const fetchReceipts = async (cursor = null) => {
         setLoading(true);
         try {
             const idToken = await auth.currentUser.getIdToken();
@@ -108,6 +109,7 @@ const ReceiptVerificationDashboard = () => {
             
             if (filters.status) queryParams.append('status', filters.status);
             if (filters.eventId) queryParams.append('eventId', filters.eventId);
+            if (cursor) queryParams.append('cursor', cursor);
             
             const response = await fetch(`/api/receipts/?${queryParams.toString()}`, {
                 headers: {
@@ -134,7 +136,8 @@ const ReceiptVerificationDashboard = () => {
                     );
                 }
                 
-                setReceipts(filteredReceipts);
+                setReceipts(prev => cursor ? [...prev, ...filteredReceipts] : filteredReceipts);
+                setNextCursor(data.nextCursor || null);
             }
         } catch (error) {
             console.error('Error fetching receipts:', error);
@@ -630,6 +633,13 @@ const ReceiptVerificationDashboard = () => {
                             </Table>
                         </TableContainer>
                     )}
+                    {nextCursor && !loading && (
+                        <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+                            <Button variant="outlined" onClick={() => fetchReceipts(nextCursor)}>
+                                Load more
+                            </Button>
+                        </Box>
+                    )}
                 </CardContent>
             </Card>
 
@@ -84,13 +84,14 @@ const MyPayslips = () => {
             setError('');
             
             const idToken = await auth.currentUser.getIdToken();
-            const response = await fetch('/api/salaries/my-payslips', {
+            // The summary document carries the list entries, so the screen loads in one read
+            const response = await fetch('/api/salaries/my-payslips/summary', {
                 headers: { 'Authorization': `Bearer ${idToken}` }
             });
             
             if (response.ok) {
                 const data = await response.json();
-                setPayslips(data);
+                setPayslips(data.payslips || []);
             } else {
                 const errorData = await response.json();
                 throw new Error(errorData.detail || 'Failed to fetch payslips');
@@ -70,14 +70,14 @@ const SalaryRunsTable = ({ runs, onSelect, onRefresh }) => {
             });
             
             if (response.ok) {
-                const data = await response.json();
-                
-                // Create a blob and download it
-                const blob = new Blob([data.content], { type: 'text/csv' });
+                // The export is streamed as a CSV attachment
+                const blob = await response.blob();
+                const disposition = response.headers.get('Content-Disposition') || '';
+                const match = disposition.match(/filename="?([^";]+)"?/);
                 const url = window.URL.createObjectURL(blob);
                 const a = document.createElement('a');
                 a.href = url;
-                a.download = data.filename;
+                a.download = match ? match[1] : `payslips_${runId}.csv`;
                 document.body.appendChild(a);
                 a.click();
                 window.URL.revokeObjectURL(url);
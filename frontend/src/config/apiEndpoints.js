@@ -263,8 +263,10 @@ export const API_ENDPOINTS = {
     RECEIPTS: {
       LIST: '/api/receipts/',
       UPLOAD: '/api/receipts/upload',
+      UPLOAD_BATCH: '/api/receipts/upload/batch',
       EVENT: (eventId) => `/api/receipts/event/${eventId}`,
       VERIFY: (id) => `/api/receipts/${id}/verify`,
+      STATUS: (id) => `/api/receipts/${id}/status`,
       DASHBOARD_SUMMARY: '/api/receipts/dashboard/summary',
       ADMIN_ANALYSIS: (id) => `/api/receipts/${id}/admin/analysis`,
       ADMIN_AI_QUEUE: '/api/receipts/admin/ai-queue',
@@ -293,6 +295,7 @@ export const API_ENDPOINTS = {
       PAYSLIP_PAYMENT: (payslipId) => `/api/salaries/payslips/${payslipId}/payment`,
       PAYSLIP_VOID: (payslipId) => `/api/salaries/payslips/${payslipId}/void`,
       MY_PAYSLIPS: '/api/salaries/my-payslips',
+      MY_PAYSLIPS_SUMMARY: '/api/salaries/my-payslips/summary',
     },
     
     // Period Close
@@ -297,7 +297,17 @@ const ClientWorkspacePage = () => {
         try {
             const data = await callApi(`/events/${eventId}/suggest-team?client_id=${clientId}`, 'GET');
             setAiSuggestions(prev => ({ ...prev, [eventId]: data.ai_suggestions }));
-            console.log(`[AI Suggest] Successfully fetched suggestions for event ${eventId}`, data.ai_suggestions);
+            console.log(`[AI Suggest] Successfully fetched ${data.source} suggestions for event ${eventId}`, data.ai_suggestions);
+            if (data.upgradeId) {
+                // The AI missed the deadline; swap in its answer if it arrives shortly
+                callApi(`/events/${eventId}/suggest-team/upgrades/${data.upgradeId}?wait=20`, 'GET')
+                    .then(upgrade => {
+                        if (upgrade?.status === 'READY' && upgrade.ai_suggestions) {
+                            setAiSuggestions(prev => ({ ...prev, [eventId]: upgrade.ai_suggestions }));
+                        }
+                    })
+                    .catch(error => console.warn(`[AI Suggest] Upgrade check failed for event ${eventId}:`, error));
+            }
         } catch (error) {
             console.error(`[AI Suggest] Error for event ${eventId}:`, error);
             const errorMessage = error.message || 'Failed to get AI suggestions';
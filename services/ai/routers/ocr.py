@@ -8,6 +8,7 @@ from typing import Optional, List
 from datetime import datetime
 from pydantic import BaseModel
 import base64
+import hashlib
 import httpx
 
 import sys
@@ -16,11 +17,22 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 
 from shared.firebase_client import get_db, Collections
 from shared.auth import get_current_user
-from shared.redis_client import cache
+from shared.redis_client import cache, redis_client
 
 
 router = APIRouter()
 
+# Extractions are content-addressed: same bytes, model and prompt -> same result.
+# Entries expire after the TTL; Redis runs with allkeys-lru and a maxmemory cap
+# (docker-compose.yml), and the in-memory fallback is LRU-bounded as well.
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+def _ocr_cache_key(image_data: bytes, model: str, prompt: str) -> str:
+    image_digest = hashlib.sha256(image_data).hexdigest()
+    prompt_version = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+    return "ocr:" + hashlib.sha256(f"{image_digest}:{model}:{prompt_version}".encode()).hexdigest()
+
 
 # ============ SCHEMAS ============
 
@@ -51,12 +63,6 @@ async def extract_text(
     import time
     start_time = time.time()
     
-    try:
-        from gemini_client import get_gemini_client
-        client = get_gemini_client()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI client initialization failed: {str(e)}")
-    
     # Get image data
     if request.image_base64:
         image_data = base64.b64decode(request.image_base64)
@@ -125,24 +131,49 @@ async def extract_text(
         prompt += "\n\nReturn the result as JSON with 'raw_text' and 'structured_data' fields."
     
     try:
-        result = await client.analyze_image(
-            image_data=image_data,
-            prompt=prompt,
-            task_type="complex_ocr" if request.document_type in ["contract", "invoice"] else "ocr"
-        )
+        from gemini_client import ModelTier, get_gemini_client
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI client initialization failed: {str(e)}")
+    
+    # Vision requests always go to the PRO tier (see GeminiClient.analyze_image)
+    cache_key = _ocr_cache_key(image_data, ModelTier.PRO.value, prompt)
+    cached = redis_client.get_json(cache_key)
+    
+    try:
+        if cached is not None:
+            result = {"model_used": cached.get("model_used")}
+            raw_text = cached.get("raw_text", "")
+            structured_data = cached.get("structured_data")
+        else:
+            try:
+                client = get_gemini_client()
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"AI client initialization failed: {str(e)}")
+            
+            result = await client.analyze_image(
+                image_data=image_data,
+                prompt=prompt,
+                task_type="complex_ocr" if request.document_type in ["contract", "invoice"] else "ocr"
+            )
+            
+            # Parse response
+            import json
+            try:
+                parsed = json.loads(result["text"])
+                raw_text = parsed.get("raw_text", result["text"])
+                structured_data = parsed.get("structured_data")
+            except json.JSONDecodeError:
+                raw_text = result["text"]
+                structured_data = None
+            
+            redis_client.set_json(cache_key, {
+                "raw_text": raw_text,
+                "structured_data": structured_data,
+                "model_used": result.get("model_used"),
+            }, OCR_CACHE_TTL)
         
         processing_time = int((time.time() - start_time) * 1000)
         
-        # Parse response
-        import json
-        try:
-            parsed = json.loads(result["text"])
-            raw_text = parsed.get("raw_text", result["text"])
-            structured_data = parsed.get("structured_data")
-        except json.JSONDecodeError:
-            raw_text = result["text"]
-            structured_data = None
-        
         # Store OCR result
         db = get_db()
         ocr_record = {
@@ -152,6 +183,7 @@ async def extract_text(
             "structured_data": structured_data,
             "model_used": result.get("model_used"),
             "processing_time_ms": processing_time,
+            "cached": cached is not None,
             "created_at": datetime.utcnow().isoformat(),
             "created_by": current_user["user_id"]
         }
@@ -166,9 +198,12 @@ async def extract_text(
             "confidence": 0.95,  # Gemini doesn't provide confidence scores
             "document_type": request.document_type,
             "processing_time_ms": processing_time,
-            "model_used": result.get("model_used")
+            "model_used": result.get("model_used"),
+            "cached": cached is not None
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
 
@@ -9,6 +9,7 @@ import logging
 from functools import wraps
 from typing import Optional, Any, Callable
 import hashlib
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
@@ -22,11 +23,15 @@ except ImportError:
 
 
 class InMemoryCache:
-    """Simple in-memory cache fallback when Redis is not available"""
+    """
+    Simple in-memory cache fallback when Redis is not available.
+    Holds at most IN_MEMORY_CACHE_MAX_ENTRIES keys, evicting the least recently used.
+    """
     
-    def __init__(self):
-        self._cache = {}
+    def __init__(self, max_entries: Optional[int] = None):
+        self._cache = OrderedDict()
         self._ttls = {}
+        self.max_entries = max_entries or int(os.getenv("IN_MEMORY_CACHE_MAX_ENTRIES", "10000"))
     
     def get(self, key: str) -> Optional[str]:
         import time
@@ -35,14 +40,21 @@ class InMemoryCache:
                 del self._cache[key]
                 del self._ttls[key]
                 return None
+            self._cache.move_to_end(key)
             return self._cache[key]
         return None
     
     def set(self, key: str, value: str, ex: int = None):
         import time
         self._cache[key] = value
+        self._cache.move_to_end(key)
         if ex:
             self._ttls[key] = time.time() + ex
+        else:
+            self._ttls.pop(key, None)
+        while len(self._cache) > self.max_entries:
+            evicted, _ = self._cache.popitem(last=False)
+            self._ttls.pop(evicted, None)
     
     def delete(self, key: str):
         self._cache.pop(key, None)